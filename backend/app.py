@@ -1,20 +1,54 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse, Response, FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import uvicorn
 from pathlib import Path
 import logging
 import json
 import time
+import asyncio
+import hashlib
+import shutil
+import threading
+import uuid
+import zipfile
+from collections import defaultdict
 
 from services.epub_parser import EpubParser
 from services.epub_lazy_parser import EpubLazyParser
 from services.txt_parser import TxtParser
 from services.tts_engine import get_tts_engine
-from database import init_db
+from services.audio_cache import AudioCache
+from services.audio_variants import (
+    negotiate_variant, media_type_for, ffmpeg_available, VariantUnavailable, VARIANT_SOURCE
+)
+from services.http_range import range_file_response, range_response, IMMUTABLE_CACHE_CONTROL
+from services.epub_assets import EpubAssetStore, AssetNotFound, ASSET_CACHE_CONTROL
+from services.spine_layout import chapter_entry
+from services.chapter_cache import chapter_cache_from_env, encode_json
+from services.chapter_html import (
+    render_chapter_html, render_text_html, asset_url_for, RENDER_VERSION as CHAPTER_HTML_VERSION
+)
+from services.tts_timings import TIMINGS_SUFFIX
+from services.tts_scheduler import get_tts_scheduler, QueueTimeout, PRIORITY_ORDER, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from services.tts_prefetch import SpeculativePrefetcher, prefetch_window_from_env
+from services.tts_session import TTSSession, SessionError, DEFAULT_WINDOW as SESSION_WINDOW
+from services.chapter_segments import ChapterSegmentIndex, SegmentRangeError, StaleSegmentError
+from services.bulk_import import BulkImporter, ImportRootError, resolve_import_directory
+from services.book_ids import claim_book_id
+from services.cover_search import (
+    get_cover_search, match_many, batch_concurrency_from_env, LookupFailed
+)
+from services.cover_atlas import CoverAtlas, AtlasUnavailable, ATLAS_FORMATS
+from services.cover_store import (
+    CoverStore, CoverError, externalize_book_cover, is_versioned_name, media_type_for_name
+)
+from services.http_sessions import get_http_sessions
+from services.job_queue import get_job_queue, PRIORITY_NORMAL, PRIORITY_BULK
+from services.audiobook_export import AudiobookExporter, export_id as make_export_id
+from database import init_db, get_session, Book
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -48,11 +82,14 @@ for directory in REQUIRED_DIRS:
     directory.mkdir(parents=True, exist_ok=True)
     logger.info(f"✅ 目录已就绪: {directory}")
 
-# 挂载音频静态文件目录
-app.mount("/audio", StaticFiles(directory="data/audio"), name="audio")
-# 挂载封面静态文件目录
+# 音频文件由 /audio/{name} 路由提供 (支持 Range、条件请求和转码版本)
+AUDIO_DIR = Path("data/audio")
+# 封面原图与缩略图由 /covers/{name} 路由提供
 COVERS_DIR = Path("data/covers")
-app.mount("/covers", StaticFiles(directory="data/covers"), name="covers")
+cover_store = CoverStore(COVERS_DIR)
+# 书架封面图集 (一页最多 MAX_ATLAS_PAGE 本)
+cover_atlas = CoverAtlas(COVERS_DIR / "atlas")
+MAX_ATLAS_PAGE = 100
 
 # 初始化数据库
 @app.on_event("startup")
@@ -60,23 +97,40 @@ async def startup_event():
     logger.info("🚀 启动BookRe后端服务...")
     init_db()
     
-    # 启动后台清理任务 (每10分钟清理一次，保留最近30分钟的音频)
-    import asyncio
-    async def cleanup_loop():
+    # 创建共享的上游 HTTP 会话 (连接复用)
+    await get_http_sessions().start()
+    
+    # 启动音频缓存索引落盘任务 (淘汰由缓存按容量上限自行完成)
+    async def cache_flush_loop():
         while True:
             try:
-                await asyncio.sleep(600) # 等待10分钟
-                logger.info("🧹 执行定时期音频清理...")
-                engine = get_tts_engine()
-                # 清理超过 0.5 小时 (30分钟) 的文件
-                engine.cleanup_old_audio_files(max_age_hours=0.5)
+                await asyncio.sleep(60)
+                get_tts_engine().cache.flush()
+                # 封面查询缓存写入只标记变化，这里合并落盘
+                await asyncio.to_thread(get_cover_search().cache.flush)
             except Exception as e:
-                logger.error(f"清理任务异常: {e}")
-                await asyncio.sleep(60) # 出错后短暂停顿
+                logger.error(f"缓存索引落盘异常: {e}")
 
-    asyncio.create_task(cleanup_loop())
+    asyncio.create_task(cache_flush_loop())
+    
+    # 启动后台任务队列 (会恢复上次被中断的任务)
+    job_queue = get_job_queue()
+    job_queue.register("eager_parse", eager_parse_job)
+    job_queue.register("reindex", reindex_job)
+    job_queue.register("cover_fetch", cover_fetch_job)
+    job_queue.register("cover_batch", cover_batch_job)
+    job_queue.register("tts_prerender", tts_prerender_job)
+    job_queue.register("audiobook_export", audiobook_export_job)
+    job_queue.start()
     logger.info("✅ 数据库初始化完成 & 清理任务已启动")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_job_queue().stop()
+    get_tts_engine().cache.flush()
+    get_cover_search().cache.flush()
+    await get_http_sessions().close()
+
 @app.get("/")
 async def root():
     return {
@@ -85,27 +139,52 @@ async def root():
         "endpoints": ["/api/books", "/api/parse", "/api/voice"]
     }
 
+async def spool_upload(file: UploadFile, target: Path) -> int:
+    """分块写入上传文件，避免整个文件进入内存"""
+    total_size = 0
+    with open(target, "wb") as f:
+        while chunk := await file.read(1024 * 1024):  # 1MB chunks
+            f.write(chunk)
+            total_size += len(chunk)
+    return total_size
+
 @app.post("/api/parse/epub")
-async def parse_epub(file: UploadFile = File(...)):
-    """解析EPUB文件"""
+async def parse_epub(file: UploadFile = File(...), stream: bool = False):
+    """
+    解析EPUB文件
+    - stream=true 时以 NDJSON 逐行返回：先元数据，再每章一行，最后 done
+      (章节总数以 done 的 total_chapters 为准，元数据中的 spine_items 含之后被跳过的空章节)
+    """
+    temp_path = Path(f"temp/{int(time.time() * 1000)}_{Path(file.filename).name}")
+    temp_path.parent.mkdir(exist_ok=True)
+    
     try:
-        temp_path = Path(f"temp/{file.filename}")
-        temp_path.parent.mkdir(exist_ok=True)
-        
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        parser = EpubParser(str(temp_path))
-        result = parser.parse()
-        
-        temp_path.unlink()
+        await spool_upload(file, temp_path)
+    except Exception as e:
+        temp_path.unlink(missing_ok=True)
+        logger.error(f"EPUB上传失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"解析失败: {str(e)}")
+    
+    if stream:
+        return StreamingResponse(stream_epub_ndjson(temp_path), media_type="application/x-ndjson")
+    
+    try:
+        result = await asyncio.to_thread(EpubParser(str(temp_path)).parse)
         
         return JSONResponse(content=result)
     
     except Exception as e:
         logger.error(f"EPUB解析错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"解析失败: {str(e)}")
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+def stream_epub_ndjson(temp_path: Path):
+    """逐章产出 NDJSON 行 (与整本解析同一套章节)，结束后删除临时文件"""
+    try:
+        yield from EpubParser(str(temp_path)).iter_ndjson()
+    finally:
+        temp_path.unlink(missing_ok=True)
 
 @app.post("/api/parse/txt")
 async def parse_txt(file: UploadFile = File(...)):
@@ -142,13 +221,23 @@ BOOKS_DATA_DIR.mkdir(parents=True, exist_ok=True)
 UPLOADS_DIR = Path("data/uploads")
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
+# 有声书导出目录
+EXPORTS_DIR = Path("data/exports")
+EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+
 # ============ 懒解析上传接口 (秒开体验) ============
 
 def save_book_json(book_id: str, data: dict):
-    """保存书籍JSON"""
+    """保存书籍JSON (先写同目录下的临时文件再替换，读取方不会看到写了一半的文件)"""
     file_path = BOOKS_DATA_DIR / f"{book_id}.json"
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    tmp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 def load_book_json(book_id: str) -> dict:
     """加载书籍JSON"""
@@ -158,35 +247,144 @@ def load_book_json(book_id: str) -> dict:
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-async def process_chapters_background(book_id: str):
-    """后台任务：逐章解析内容"""
+# 每本书一把锁：读-改-写书籍 JSON 时持有，避免并发写入互相覆盖
+_book_json_locks = defaultdict(threading.Lock)
+
+def update_book_json(book_id: str, mutate, create: bool = False) -> Optional[dict]:
+    """
+    在锁内重新读取最新的书籍 JSON，原地修改后写回
+    书籍不存在时返回 None；create=True 时从空字典开始并新建
+    """
+    with _book_json_locks[book_id]:
+        data = load_book_json(book_id)
+        if data is None:
+            if not create:
+                return None
+            data = {}
+        mutate(data)
+        save_book_json(book_id, data)
+        return data
+
+def merge_parsed_chapter(data: dict, index: int, chapter: dict):
+    """把解析得到的一章写回最新的书籍数据 (目录已被重建、章节对不上时跳过)"""
+    chapters = data.get('chapters', [])
+    if index < len(chapters) and chapters[index].get('id') == chapter.get('id'):
+        chapters[index] = {**chapters[index], **chapter}
+
+def load_chapter_text(book_data: dict, index: int) -> str:
+    """读取章节正文：已解析的直接返回，否则从原始 EPUB 按需解析 (不写回 JSON)"""
+    chapter = book_data['chapters'][index]
+    if chapter.get('content') is not None:
+        return chapter['content']
+    
+    file_path = book_data.get('originalFilePath')
+    if not file_path or not Path(file_path).exists():
+        return ''
+    parsed = EpubLazyParser(file_path).parse_single_chapter(index, chapter)
+    return parsed['content'] if parsed else ''
+
+def book_content_signature(book_data: dict) -> str:
+    """
+    书籍内容签名：原始文件、文件哈希和章节目录 (没有文件哈希的旧数据再加上章节正文)
+    阅读进度、封面、解析状态、懒解析写回的正文等都不影响签名
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([book_data.get('originalFilePath'), book_data.get('fileHash')]).encode('utf-8'))
+    for chapter in book_data.get('chapters', []):
+        fields = [chapter.get(key) for key in ('id', 'href', 'hrefs', 'range')]
+        if not book_data.get('fileHash'):
+            fields.append(chapter.get('content'))
+        digest.update(json.dumps(fields, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+# book_id -> (JSON 修改时间, 内容签名)；修改时间只用来判断是否需要重新计算签名
+_book_versions = {}
+
+def book_json_version(book_id: str):
+    """书籍内容版本，用于判断章节分段索引、资源路径是否过期 (进度同步不会让它变化)"""
+    try:
+        mtime = (BOOKS_DATA_DIR / f"{book_id}.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        _book_versions.pop(book_id, None)
+        return None
+    cached = _book_versions.get(book_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
     try:
         book_data = load_book_json(book_id)
-        if not book_data:
-            return
-        
-        file_path = book_data.get('originalFilePath')
-        if not file_path or not Path(file_path).exists():
-            return
-        
-        logger.info(f"📖 后台解析开始: {book_data.get('title')}")
-        parser = EpubLazyParser(file_path)
-        
-        for i, chapter in enumerate(book_data.get('chapters', [])):
-            if chapter.get('content') is None:
-                parsed = parser.parse_single_chapter(i)
-                if parsed:
-                    book_data['chapters'][i] = parsed
-                    # 每解析5章保存一次
-                    if i % 5 == 0:
-                        save_book_json(book_id, book_data)
-        
-        book_data['parsing_status'] = 'completed'
-        save_book_json(book_id, book_data)
-        logger.info(f"✅ 后台解析完成: {book_data.get('title')}")
-        
+    except ValueError:
+        # 正在写入的 JSON 读不完整：当作已过期，下次再算
+        return None
+    if book_data is None:
+        return None
+    version = book_content_signature(book_data)
+    _book_versions[book_id] = (mtime, version)
+    return version
+
+def load_chapter_text_by_id(book_id: str, index: int):
+    book_data = load_book_json(book_id)
+    if not book_data or index < 0 or index >= len(book_data.get('chapters', [])):
+        return None
+    return load_chapter_text(book_data, index)
+
+# 热门章节的序列化响应 (按字节预算淘汰)
+chapter_cache = chapter_cache_from_env()
+
+# 章节朗读分段索引 (按引用合成、预测性预取共用同一切分，保证缓存命中)
+chapter_segment_index = ChapterSegmentIndex(book_json_version, load_chapter_text_by_id)
+
+def load_tts_segments(book_id: str, index: int) -> list:
+    """章节各朗读段的文本"""
+    segments = chapter_segment_index.get(book_id, index)
+    return [text for _, _, text in segments.segments] if segments else []
+
+def book_archive_path(book_id: str):
+    """书籍保存的原始 EPUB 路径 (TXT 或没有原始文件时为 None)"""
+    book_data = load_book_json(book_id)
+    if not book_data or book_data.get('format') != 'epub':
+        return None
+    return book_data.get('originalFilePath')
+
+# EPUB 内嵌资源 (图片/样式/字体) 直接从原始文件读取
+epub_assets = EpubAssetStore(book_json_version, book_archive_path)
+
+# 按设备朗读位置预合成后续段
+tts_prefetcher = SpeculativePrefetcher(
+    lambda *args, **kwargs: get_tts_engine().synthesize(*args, **kwargs),
+    load_tts_segments,
+    window=prefetch_window_from_env()
+)
+
+def register_catalog_entry(book_data: dict):
+    """登记到数据库书目 (用于批量导入按内容哈希去重)"""
+    session = get_session()
+    try:
+        session.add(Book(
+            title=book_data['title'],
+            author=book_data['author'],
+            file_path=book_data['originalFilePath'],
+            file_hash=book_data.get('fileHash'),
+            total_pages=book_data['totalPages'],
+            format=book_data['format']
+        ))
+        session.commit()
     except Exception as e:
-        logger.error(f"❌ 后台解析失败: {e}")
+        session.rollback()
+        logger.warning(f"书目登记失败: {e}")
+    finally:
+        session.close()
+
+def unregister_catalog_entry(original_path: str):
+    """从数据库书目中移除"""
+    session = get_session()
+    try:
+        session.query(Book).filter(Book.file_path == original_path).delete()
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"书目移除失败: {e}")
+    finally:
+        session.close()
 
 @app.post("/api/books/upload")
 async def upload_book_lazy(
@@ -198,20 +396,21 @@ async def upload_book_lazy(
     - 只解析元数据，绝不读取正文
     - 秒级返回
     """
-    book_id = str(int(time.time() * 1000))
     file_ext = file.filename.split('.')[-1].lower()
     
     if file_ext not in ['epub', 'txt']:
         raise HTTPException(400, f"不支持的格式: {file_ext}")
     
     try:
-        # 1. 分块写入文件，防止24MB文件导致内存溢出
-        original_path = UPLOADS_DIR / f"{book_id}.{file_ext}"
+        # 1. 分块写入文件，防止24MB文件导致内存溢出 (ID 与批量导入共用分配器，不会撞号)
+        book_id, original_path = claim_book_id(UPLOADS_DIR, BOOKS_DATA_DIR, file_ext)
         total_size = 0
+        file_hash = hashlib.sha256()
         
         with open(original_path, "wb") as f:
             while chunk := await file.read(1024 * 1024):  # 1MB chunks
                 f.write(chunk)
+                file_hash.update(chunk)
                 total_size += len(chunk)
         
         logger.info(f"📤 文件已保存: {original_path} ({total_size/1024/1024:.2f}MB)")
@@ -233,23 +432,14 @@ async def upload_book_lazy(
                 content = f.read()
             metadata = txt_parser.parse(content)
         
-        # 3. 构建精简的书籍数据 (chapters.content 绝对为 None)
-        chapters_meta = []
-        for ch in metadata.get('chapters', []):
-            chapters_meta.append({
-                'index': ch.get('index', 0),
-                'id': ch.get('id', ''),
-                'title': ch.get('title', f'章节'),
-                'href': ch.get('href', ''),
-                'content': None,  # !! 关键：绝对为 None，不占空间
-                'word_count': 0
-            })
+        # 3. 构建精简的书籍数据 (chapters.content 绝对为 None，不占空间)
+        chapters_meta = [chapter_entry(ch) for ch in metadata.get('chapters', [])]
         
         book_data = {
             'id': book_id,
             'title': metadata.get('title', file.filename),
             'author': metadata.get('author', '未知作者'),
-            'cover': metadata.get('cover'),  # 封面可能较大，但已限制500KB
+            'cover': None,
             'format': file_ext,
             'chapters': chapters_meta,  # 只有目录，无内容
             'totalPages': len(chapters_meta),
@@ -259,11 +449,22 @@ async def upload_book_lazy(
             'createdAt': __import__('datetime').datetime.now().isoformat(),
             'lastReadAt': __import__('datetime').datetime.now().isoformat(),
             'originalFilePath': str(original_path),
+            'fileHash': file_hash.hexdigest(),
             'parsing_status': 'lazy'  # 标记为懒加载模式
         }
         
+        # 封面只提取一次，JSON 中只保存缩略图 URL
+        if file_ext == 'epub':
+            cover_image = parser.read_cover(metadata.get('cover_href'))
+            if cover_image:
+                try:
+                    book_data.update(cover_store.save(book_id, cover_image))
+                except CoverError as e:
+                    logger.warning(f"⚠️ 封面无法处理: {e}")
+        
         # 4. 保存精简JSON (应该只有几KB)
         save_book_json(book_id, book_data)
+        register_catalog_entry(book_data)
         
         # 计算JSON大小
         json_path = BOOKS_DATA_DIR / f"{book_id}.json"
@@ -277,6 +478,7 @@ async def upload_book_lazy(
             "title": book_data['title'],
             "author": book_data['author'],
             "cover": book_data['cover'],
+            "covers": book_data.get('covers'),
             "total_chapters": len(chapters_meta)
         }
         
@@ -286,12 +488,110 @@ async def upload_book_lazy(
         traceback.print_exc()
         raise HTTPException(500, f"上传失败: {str(e)}")
 
+@app.post("/api/books/import")
+async def bulk_import_books(
+    file: Optional[UploadFile] = File(None),
+    directory: Optional[str] = Form(None)
+):
+    """
+    批量导入 - 服务器目录 (限 BULK_IMPORT_ROOT 之下) 或上传的 ZIP 压缩包
+    - 元数据在进程池中并行解析
+    - 按内容哈希去重
+    - 以 NDJSON 流式返回进度
+    """
+    importer = BulkImporter(BOOKS_DATA_DIR, UPLOADS_DIR, cover_store=cover_store)
+    staging_dir = None
+
+    if file is not None:
+        staging_dir = Path(f"temp/import_{int(time.time() * 1000)}")
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        archive_path = staging_dir / "upload.zip"
+        # 从接收上传开始，任何失败都要清理暂存目录；成功后由 progress_stream 负责清理
+        try:
+            await spool_upload(file, archive_path)
+            paths = await asyncio.to_thread(BulkImporter.extract_archive, archive_path, staging_dir / "books")
+        except zipfile.BadZipFile:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise HTTPException(400, "不是有效的 ZIP 压缩包")
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        finally:
+            archive_path.unlink(missing_ok=True)
+    elif directory:
+        # 只允许导入 BULK_IMPORT_ROOT 之下的目录 (directory 为相对该根目录的路径)
+        try:
+            source_dir = resolve_import_directory(directory)
+        except ImportRootError as e:
+            raise HTTPException(400, str(e))
+        paths = await asyncio.to_thread(BulkImporter.collect_directory, source_dir)
+    else:
+        raise HTTPException(400, "需要提供 file 或 directory")
+
+    logger.info(f"📦 批量导入开始: {len(paths)} 个文件")
+
+    def progress_stream():
+        try:
+            for event in importer.run(paths, move=staging_dir is not None):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"❌ 批量导入失败: {e}")
+            yield json.dumps({"event": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            if staging_dir is not None:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+    return StreamingResponse(progress_stream(), media_type="application/x-ndjson")
+
+@app.get("/api/books/{book_id}/chapter/{index}/segments")
+async def get_chapter_segments(book_id: str, index: int):
+    """
+    章节的朗读分段 - 段 id 可直接用于按引用合成；段号即预取窗口的位置
+    start / end 为段在章节正文中的字符位置
+    """
+    segments = await asyncio.to_thread(chapter_segment_index.get, book_id, index)
+    if segments is None:
+        raise HTTPException(404, "书籍或章节不存在")
+    return {
+        "book_id": book_id,
+        "chapter": index,
+        "sentence_count": len(segments.sentences),
+        "segments": [segments.describe(i) for i in range(len(segments.segments))]
+    }
+
+# 富文本缓存在章节 JSON 中的字段 (纯文本请求不返回)
+CHAPTER_HTML_FIELDS = ('html', 'html_styles', 'html_version')
+
+def render_book_chapter_html(book_id: str, book_data: dict, index: int) -> dict:
+    """单章富文本：EPUB 从原文清理并改写资源链接，其他格式按段落生成"""
+    file_path = book_data.get('originalFilePath')
+    if book_data.get('format') == 'epub' and file_path and Path(file_path).exists():
+        source = EpubLazyParser(file_path).read_chapter_source(index, book_data['chapters'])
+        if source:
+            parts, spine = source
+            # 合并的章节由多个文件组成：逐个改写 (相对链接的基准不同) 后拼接
+            rendered = [render_chapter_html(raw_html, chapter_path, asset_url_for(book_id), spine, index)
+                        for chapter_path, raw_html in parts]
+            styles = list(dict.fromkeys(url for r in rendered for url in r['styles']))
+            return {'html': ''.join(r['html'] for r in rendered), 'styles': styles, 'version': CHAPTER_HTML_VERSION}
+    return render_text_html(book_data['chapters'][index].get('content') or '')
+
 @app.get("/api/books/{book_id}/chapter/{index}")
-async def get_chapter_content(book_id: str, index: int):
+async def get_chapter_content(book_id: str, index: int, format: str = "text"):
     """
     获取章节内容 - 按需解析
     如果后台还没解析到，实时解析该章节
+    format=html 时附带富文本 (清理、压缩、资源链接指向 /asset/)，
+    第一次请求时生成并写回章节 JSON，之后直接返回
+    序列化好的响应进入热门章节缓存，命中时不再读取书籍 JSON
     """
+    if format not in ("text", "html"):
+        raise HTTPException(400, "format 只能是 text 或 html")
+    
+    cached = chapter_cache.get(book_id, index, format)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+    
     book_data = load_book_json(book_id)
     if not book_data:
         raise HTTPException(404, "书籍不存在")
@@ -301,82 +601,171 @@ async def get_chapter_content(book_id: str, index: int):
         raise HTTPException(404, "章节不存在")
     
     chapter = chapters[index]
+    changed = False
     
     # 如果内容为空，实时解析
     if chapter.get('content') is None:
         file_path = book_data.get('originalFilePath')
+        parsed = None
         if file_path and Path(file_path).exists():
             parser = EpubLazyParser(file_path)
-            parsed = parser.parse_single_chapter(index)
-            
-            if parsed:
-                # 更新缓存
-                book_data['chapters'][index] = parsed
-                save_book_json(book_id, book_data)
-                return parsed
+            parsed = parser.parse_single_chapter(index, chapter)
         
-        # 解析失败返回空章节
-        return {
-            'index': index,
-            'title': chapter.get('title', f'第 {index + 1} 章'),
-            'content': '章节内容加载失败',
-            'word_count': 0
-        }
+        if not parsed:
+            # 解析失败返回空章节
+            return {
+                'index': index,
+                'title': chapter.get('title', f'第 {index + 1} 章'),
+                'content': '章节内容加载失败',
+                'word_count': 0
+            }
+        
+        # 更新缓存 (保留目录中的切分/合并信息)
+        chapter = book_data['chapters'][index] = {**chapter, **parsed}
+        changed = True
+    
+    if format == "html" and chapter.get('html_version') != CHAPTER_HTML_VERSION:
+        rendered = await asyncio.to_thread(render_book_chapter_html, book_id, book_data, index)
+        chapter['html'] = rendered['html']
+        chapter['html_styles'] = rendered['styles']
+        chapter['html_version'] = rendered['version']
+        changed = True
+    
+    if changed:
+        # 只写回这一章，进度等其他字段以磁盘上的最新内容为准
+        update_book_json(book_id, lambda data: merge_parsed_chapter(data, index, chapter))
+    
+    if format == "text":
+        chapter = {key: value for key, value in chapter.items() if key not in CHAPTER_HTML_FIELDS}
+    body = encode_json(chapter)
+    chapter_cache.put(book_id, index, format, body)
+    return Response(body, media_type="application/json")
+
+def collect_books(deviceId: Optional[str] = None) -> list:
+    """所有书籍的元数据，按书架顺序 (最近阅读在前)"""
+    books = []
+    for file_path in BOOKS_DATA_DIR.glob("*.json"):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                
+                # 旧数据中的内联封面在第一次列出时转存为文件
+                if data.get('id') and externalize_book_cover(cover_store, data['id'], data):
+                    fields = {key: data.get(key) for key in ('cover', 'covers')}
+                    update_book_json(data['id'], lambda latest: latest.update(fields))
+                
+                # 构建返回数据
+                book_meta = {
+                    'id': data.get('id'),
+                    'title': data.get('title'),
+                    'author': data.get('author'),
+                    'cover': data.get('cover'),
+                    'covers': data.get('covers'),
+                    'format': data.get('format'),
+                    'totalPages': data.get('totalPages'),
+                    'createdAt': data.get('createdAt'),
+                    'filePath': data.get('filePath')
+                }
+                
+                # 如果提供了 deviceId，返回该设备的进度
+                if deviceId and 'devices' in data:
+                    device_data = data['devices'].get(deviceId, {})
+                    book_meta.update({
+                        'progress': device_data.get('progress', 0),
+                        'currentPage': device_data.get('currentPage', 0),
+                        'currentChapter': device_data.get('currentChapter', 0),
+                        'lastReadAt': device_data.get('lastReadAt', data.get('createdAt'))
+                    })
+                else:
+                    # 兼容旧数据或无设备ID的情况
+                    book_meta.update({
+                        'progress': data.get('progress', 0),
+                        'currentPage': data.get('currentPage', 0),
+                        'currentChapter': data.get('currentChapter', 0),
+                        'lastReadAt': data.get('lastReadAt', data.get('createdAt'))
+                    })
+                
+                books.append(book_meta)
+        except Exception as e:
+            logger.warning(f"读取书籍文件失败 {file_path}: {e}")
+    
+    # 按时间倒序排序
+    books.sort(key=lambda x: x.get("lastReadAt") or x.get("createdAt") or "", reverse=True)
+    return books
+
+@app.api_route("/api/books/{book_id}/asset/{path:path}", methods=["GET", "HEAD"])
+async def get_book_asset(book_id: str, path: str, request: Request):
+    """
+    EPUB 内嵌资源 (path 为 ZIP 内路径，如 OEBPS/images/fig1.jpg)
+    直接从原始 EPUB 流式读取，支持 Range 和 ETag 条件请求
+    """
+    try:
+        archive, asset = await asyncio.to_thread(epub_assets.get, book_id, path)
+    except AssetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
-    return chapter
+    headers = {"X-Content-Type-Options": "nosniff"}
+    if asset.active:
+        # 书中的 XHTML/SVG 可能带脚本，直接打开时放进沙箱
+        headers["Content-Security-Policy"] = "sandbox; default-src 'none'; img-src data: 'self'; style-src 'unsafe-inline' 'self'"
+    return range_response(
+        request, asset.size, asset.etag, asset.media_type,
+        lambda start, length: epub_assets.iter_range(archive, asset, start, length),
+        last_modified=asset.last_modified, cache_control=ASSET_CACHE_CONTROL, extra_headers=headers
+    )
 
 @app.get("/api/books")
-async def list_books(deviceId: Optional[str] = None):
-    """列出所有书籍 (仅元数据)"""
+async def list_books(response: Response, deviceId: Optional[str] = None, offset: int = 0,
+                     limit: Optional[int] = None):
+    """列出所有书籍 (仅元数据)；指定 offset/limit 时分页，总数在 X-Total-Count 头中"""
     try:
-        import json
-        books = []
-        for file_path in BOOKS_DATA_DIR.glob("*.json"):
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    
-                    # 构建返回数据
-                    book_meta = {
-                        'id': data.get('id'),
-                        'title': data.get('title'),
-                        'author': data.get('author'),
-                        'cover': data.get('cover'),
-                        'format': data.get('format'),
-                        'totalPages': data.get('totalPages'),
-                        'createdAt': data.get('createdAt'),
-                        'filePath': data.get('filePath')
-                    }
-                    
-                    # 如果提供了 deviceId，返回该设备的进度
-                    if deviceId and 'devices' in data:
-                        device_data = data['devices'].get(deviceId, {})
-                        book_meta.update({
-                            'progress': device_data.get('progress', 0),
-                            'currentPage': device_data.get('currentPage', 0),
-                            'currentChapter': device_data.get('currentChapter', 0),
-                            'lastReadAt': device_data.get('lastReadAt', data.get('createdAt'))
-                        })
-                    else:
-                        # 兼容旧数据或无设备ID的情况
-                        book_meta.update({
-                            'progress': data.get('progress', 0),
-                            'currentPage': data.get('currentPage', 0),
-                            'currentChapter': data.get('currentChapter', 0),
-                            'lastReadAt': data.get('lastReadAt', data.get('createdAt'))
-                        })
-                    
-                    books.append(book_meta)
-            except Exception as e:
-                logger.warning(f"读取书籍文件失败 {file_path}: {e}")
-        
-        # 按时间倒序排序
-        books.sort(key=lambda x: x.get("lastReadAt", x.get("createdAt", "")), reverse=True)
+        books = collect_books(deviceId)
+        if offset or limit is not None:
+            response.headers["X-Total-Count"] = str(len(books))
+            offset = max(offset, 0)
+            books = books[offset:offset + max(limit, 0) if limit is not None else None]
         return books
     except Exception as e:
         logger.error(f"获取书籍列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/books/covers/atlas")
+async def get_cover_atlas(deviceId: Optional[str] = None, offset: int = 0, limit: int = 50,
+                          format: str = "webp"):
+    """
+    书架一页书籍 + 这些书的封面图集
+    客户端用 atlas.tiles 中的坐标作为背景位置显示封面，一次请求代替逐本请求封面
+    """
+    if format not in ATLAS_FORMATS:
+        raise HTTPException(status_code=400, detail=f"未知的图集格式: {format}")
+    offset = max(offset, 0)
+    limit = max(1, min(limit, MAX_ATLAS_PAGE))
+    books = await asyncio.to_thread(collect_books, deviceId)
+    page = books[offset:offset + limit]
+    
+    covers = []
+    for book in page:
+        path = cover_store.thumbnail_path(book)
+        if path:
+            covers.append((str(book['id']), path))
+    
+    atlas = None
+    if covers:
+        try:
+            built = await asyncio.to_thread(cover_atlas.get, covers, format)
+        except AtlasUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        atlas = {"url": f"/api/books/covers/atlas/{built.pop('name')}", **built}
+    return {"total": len(books), "offset": offset, "limit": limit, "books": page, "atlas": atlas}
+
+@app.api_route("/api/books/covers/atlas/{name}", methods=["GET", "HEAD"])
+async def get_cover_atlas_image(name: str, request: Request):
+    """封面图集图片 (按封面集合的哈希命名，内容不会变)"""
+    path = cover_atlas.resolve(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Atlas not found")
+    return range_file_response(request, path, cover_atlas.media_type(name), cache_control=IMMUTABLE_CACHE_CONTROL)
+
 @app.post("/api/books/save")
 async def save_book(request: Request):
     """保存书籍数据到后端文件"""
@@ -387,38 +776,29 @@ async def save_book(request: Request):
         if not book_id:
             raise HTTPException(status_code=400, detail="Missing book ID")
         
-        file_path = BOOKS_DATA_DIR / f"{book_id}.json"
-        
-        # 处理封面图片 (Base64 -> File)
+        # 处理封面图片 (Base64 -> 原图 + 缩略图文件)
         cover_data = data.get("cover")
         if cover_data and cover_data.startswith("data:image"):
             try:
-                import base64
-                # 提取 base64 数据
-                header, encoded = cover_data.split(",", 1)
-                file_ext = "jpg"
-                if "png" in header:
-                    file_ext = "png"
-                
-                # 保存为文件
-                cover_filename = f"{book_id}.{file_ext}"
-                cover_path = COVERS_DIR / cover_filename
-                
-                with open(cover_path, "wb") as f:
-                    f.write(base64.b64decode(encoded))
-                
-                # 更新数据中的 cover 字段为 URL
-                data["cover"] = f"/covers/{cover_filename}"
-                logger.info(f"封面已转存: {cover_filename}")
+                data.update(await asyncio.to_thread(cover_store.save_data_uri, book_id, cover_data))
             except Exception as e:
                 logger.error(f"封面转存失败: {e}")
                 # 失败时保留原 Base64，避免数据丢失
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        def replace(existing: dict):
+            # 客户端回存的数据不含缩略图列表时沿用已有的
+            if (cover_data and not cover_data.startswith("data:image") and "covers" not in data
+                    and existing.get("covers") and existing.get("cover") == cover_data.split("?", 1)[0]):
+                data["covers"] = existing["covers"]
+            existing.clear()
+            existing.update(data)
+
+        await asyncio.to_thread(update_book_json, book_id, replace, create=True)
+        # 重新保存的书籍章节可能变化
+        chapter_cache.invalidate(book_id)
             
         logger.info(f"书籍已保存: {book_id}")
-        return {"status": "success", "message": "Book saved", "cover": data.get("cover")}
+        return {"status": "success", "message": "Book saved", "cover": data.get("cover"), "covers": data.get("covers")}
     except Exception as e:
         logger.error(f"保存书籍失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -444,7 +824,12 @@ async def load_book(book_id: str, deviceId: str = None):
             book_data["currentChapter"] = device_progress.get("currentChapter", 0)
             book_data["lastReadAt"] = device_progress.get("lastReadAt")
             logger.info(f"已加载设备进度: {deviceId} -> {book_data['currentPage']}页")
-            
+        
+        # 章节富文本缓存只通过章节接口 (format=html) 返回
+        book_data["chapters"] = [
+            {key: value for key, value in chapter.items() if key not in CHAPTER_HTML_FIELDS}
+            for chapter in book_data.get("chapters", [])
+        ]
         return book_data
     except Exception as e:
         logger.error(f"加载书籍失败: {str(e)}")
@@ -456,7 +841,13 @@ async def delete_book(book_id: str):
     try:
         file_path = BOOKS_DATA_DIR / f"{book_id}.json"
         if file_path.exists():
+            with open(file_path, "r", encoding="utf-8") as f:
+                original_path = json.load(f).get("originalFilePath")
+            if original_path:
+                unregister_catalog_entry(original_path)
             file_path.unlink()
+            cover_store.remove(book_id)
+            chapter_cache.invalidate(book_id)
             logger.info(f"书籍已删除: {book_id}")
             
         return {"status": "success", "message": "Book deleted"}
@@ -476,37 +867,36 @@ async def update_book_metadata(book_id: str, request: Request):
         
         logger.info(f"📝 进度更新请求: book={book_id}, device={device_id}, data={updates}")
         
-        file_path = BOOKS_DATA_DIR / f"{book_id}.json"
-        if not file_path.exists():
+        def apply_updates(data):
+            if device_id:
+                # 多设备模式：更新特定设备的进度
+                if 'devices' not in data:
+                    data['devices'] = {}
+                
+                if device_id not in data['devices']:
+                    data['devices'][device_id] = {}
+                
+                # 只更新进度相关字段
+                progress_fields = ['progress', 'currentPage', 'currentChapter', 'lastReadAt']
+                for field in progress_fields:
+                    if field in updates:
+                        data['devices'][device_id][field] = updates[field]
+            else:
+                # 兼容旧版：直接更新根字段
+                if 'chapters' in updates:
+                    del updates['chapters']
+                data.update(updates)
+        
+        # 与章节解析共用同一把锁，在最新内容上修改
+        if update_book_json(book_id, apply_updates) is None:
             logger.warning(f"⚠️ 书籍不存在: {book_id}")
             raise HTTPException(status_code=404, detail="Book not found")
-            
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
         
         if device_id:
-            # 多设备模式：更新特定设备的进度
-            if 'devices' not in data:
-                data['devices'] = {}
-            
-            if device_id not in data['devices']:
-                data['devices'][device_id] = {}
-            
-            # 只更新进度相关字段
-            progress_fields = ['progress', 'currentPage', 'currentChapter', 'lastReadAt']
-            for field in progress_fields:
-                if field in updates:
-                    data['devices'][device_id][field] = updates[field]
-            
             logger.info(f"✅ 设备 {device_id} 进度已更新: page={updates.get('currentPage')}")
-        else:
-            # 兼容旧版：直接更新根字段
-            if 'chapters' in updates:
-                del updates['chapters']
-            data.update(updates)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            
+            if isinstance(updates.get('currentChapter'), int):
+                tts_prefetcher.on_progress(device_id, book_id, updates['currentChapter'])
         
         logger.info(f"✅ 进度保存成功: {book_id}")
         return {
@@ -529,83 +919,120 @@ async def update_book_metadata(book_id: str, request: Request):
 
 @app.post("/api/books/{book_id}/cover")
 async def upload_cover(book_id: str, file: UploadFile = File(...)):
-    """手动上传封面"""
+    """手动上传封面 (保存原图并生成缩略图)"""
     try:
         # 验证文件类型
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="只允许上传图片文件")
             
-        file_ext = file.filename.split(".")[-1].lower()
-        if file_ext not in ["jpg", "jpeg", "png", "webp"]:
-            file_ext = "jpg" # 默认
-            
-        cover_filename = f"{book_id}.{file_ext}"
-        cover_path = COVERS_DIR / cover_filename
-        
-        # 保存文件
-        with open(cover_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-            
-        # 更新书籍 JSON
-        import json
-        json_path = BOOKS_DATA_DIR / f"{book_id}.json"
-        if json_path.exists():
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            data["cover"] = f"/covers/{cover_filename}"
+        content = await file.read()
+        try:
+            fields = await asyncio.to_thread(cover_store.save, book_id, content)
+        except CoverError as e:
+            raise HTTPException(status_code=400, detail=str(e))
             
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+        # 只写入封面字段 (在最新的书籍 JSON 上修改，不覆盖期间的进度更新)
+        await asyncio.to_thread(update_book_json, book_id, lambda data: data.update(fields))
         
-        return {"status": "success", "url": f"/covers/{cover_filename}"}
+        return {"status": "success", "url": fields["cover"], "covers": fields["covers"]}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"上传封面失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def match_cover_for_book(book_id: str) -> dict:
+    """在线匹配封面并保存，返回 {url, covers, source}；未找到时返回 None"""
+    data = await asyncio.to_thread(load_book_json, book_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+        
+    # 只在开头读取书名和作者；等待网络期间书籍 JSON 可能被进度同步改写
+    title = data.get("title", "")
+    author = data.get("author", "")
+    
+    # 搜索封面 URL (查询结果有持久化缓存)
+    search = get_cover_search()
+    try:
+        found = await search.lookup(title, author)
+    except LookupFailed as e:
+        raise HTTPException(status_code=502, detail=f"封面搜索失败: {e}")
+    if not found:
+        return None
+    cover_url = found["url"]
+        
+    # 下载图片
+    image_data = await search.download(cover_url)
+    if not image_data:
+        search.forget(title, author)
+        raise HTTPException(status_code=500, detail="封面下载失败")
+        
+    # 保存原图并生成缩略图
+    try:
+        fields = await asyncio.to_thread(cover_store.save, book_id, image_data)
+    except CoverError as e:
+        search.forget(title, author)
+        raise HTTPException(status_code=502, detail=f"封面图片无效: {e}")
+        
+    # 只写入封面字段
+    if await asyncio.to_thread(update_book_json, book_id, lambda d: d.update(fields)) is None:
+        # 匹配期间书籍已被删除
+        await asyncio.to_thread(cover_store.remove, book_id)
+        raise HTTPException(status_code=404, detail="Book not found")
+        
+    return {"url": fields["cover"], "covers": fields["covers"], "source": cover_url}
+
+def books_without_cover() -> List[str]:
+    """书库中没有封面的书籍 id"""
+    book_ids = []
+    for file_path in BOOKS_DATA_DIR.glob("*.json"):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取书籍文件失败 {file_path}: {e}")
+            continue
+        if data.get("id") and not data.get("cover"):
+            book_ids.append(str(data["id"]))
+    return book_ids
+
+class CoverBatchRequest(BaseModel):
+    book_ids: Optional[List[str]] = None  # 省略时为所有没有封面的书
+    concurrency: Optional[int] = None
+
+@app.post("/api/books/covers/auto")
+async def auto_match_all_covers(request: CoverBatchRequest = None):
+    """为整个书库批量匹配网络封面 (后台任务，可用 /api/jobs/{id} 查询进度)"""
+    request = request or CoverBatchRequest()
+    book_ids = request.book_ids if request.book_ids is not None else await asyncio.to_thread(books_without_cover)
+    if not book_ids:
+        return {"job_id": None, "books": 0}
+    payload = {"book_ids": book_ids}
+    if request.concurrency:
+        payload["concurrency"] = max(1, min(request.concurrency, 16))
+    job_id = get_job_queue().enqueue("cover_batch", payload, priority=PRIORITY_BULK)
+    return {"job_id": job_id, "books": len(book_ids)}
+
+@app.get("/api/books/chapters/cache/stats")
+async def get_chapter_cache_stats():
+    """热门章节缓存统计 (条目数、字节数、命中率、淘汰数)"""
+    return chapter_cache.stats()
+
+@app.get("/api/books/covers/stats")
+async def cover_search_stats():
+    """封面查询缓存命中情况、各主机请求数和限速等待时间"""
+    return get_cover_search().stats()
+
 @app.post("/api/books/{book_id}/cover/auto")
 async def auto_match_cover(book_id: str):
     """自动匹配网络封面"""
     try:
-        import json
-        from services.cover_search import search_cover_online, download_image
-        
-        # 读取书籍信息
-        file_path = BOOKS_DATA_DIR / f"{book_id}.json"
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="Book not found")
-            
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            
-        title = data.get("title", "")
-        author = data.get("author", "")
-        
-        # 搜索封面 URL
-        cover_url = await search_cover_online(title, author)
-        if not cover_url:
+        matched = await match_cover_for_book(book_id)
+        if not matched:
             raise HTTPException(status_code=404, detail="未找到匹配的封面")
             
-        # 下载图片
-        image_data = await download_image(cover_url)
-        if not image_data:
-            raise HTTPException(status_code=500, detail="封面下载失败")
-            
-        # 保存文件
-        cover_filename = f"{book_id}.jpg"
-        cover_path = COVERS_DIR / cover_filename
-        
-        with open(cover_path, "wb") as f:
-            f.write(image_data)
-            
-        # 更新 JSON
-        data["cover"] = f"/covers/{cover_filename}"
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            
-        return {"status": "success", "url": data["cover"], "source": cover_url}
+        return {"status": "success", **matched}
         
     except HTTPException:
         raise
@@ -613,6 +1040,17 @@ async def auto_match_cover(book_id: str):
         logger.error(f"自动匹配封面失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.api_route("/covers/{name}", methods=["GET", "HEAD"])
+async def get_cover(name: str, request: Request):
+    """封面原图与缩略图 - 文件名带内容哈希的版本可长期缓存"""
+    path = cover_store.resolve(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Cover not found")
+    return range_file_response(
+        request, path, media_type_for_name(name),
+        cache_control=IMMUTABLE_CACHE_CONTROL if is_versioned_name(name) else "no-cache"
+    )
+
 # TTS相关端点
 @app.get("/api/voice/list")
 async def list_voices():
@@ -624,6 +1062,113 @@ async def list_voices():
         logger.error(f"获取语音列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/voice/cache/stats")
+async def voice_cache_stats():
+    """音频缓存统计 (命中率、容量、淘汰次数) 及进行中请求合并情况"""
+    engine = get_tts_engine()
+    return {**engine.cache.stats(), 'inflight': engine.flights.stats()}
+
+@app.api_route("/audio/{name}", methods=["GET", "HEAD"])
+async def get_audio(name: str, request: Request, variant: Optional[str] = None):
+    """
+    缓存音频下载 - 支持 Range (拖动/续传)、ETag 条件请求
+    variant 参数或 Accept 头可选择低码率版本 (opus-24 / opus-32 / mp3-32)
+    """
+    path = AUDIO_DIR / name
+    if "/" in name or "\\" in name or name.startswith(".") or not path.is_file():
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    try:
+        chosen = negotiate_variant(variant, request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    key = AudioCache.key_from_name(name)
+    if key is None:
+        chosen = VARIANT_SOURCE
+    if chosen != VARIANT_SOURCE:
+        try:
+            path = await get_tts_engine().variants.ensure(key, chosen)
+        except VariantUnavailable as e:
+            logger.warning(f"{e}，返回源 MP3")
+            chosen = VARIANT_SOURCE
+    
+    return range_file_response(
+        request, path, media_type_for(chosen),
+        # 缓存文件按内容寻址，内容不会变
+        cache_control=IMMUTABLE_CACHE_CONTROL if key else "no-cache",
+        extra_headers={"X-Audio-Variant": chosen, "Vary": "Accept"}
+    )
+
+@app.get("/api/voice/timings/{name}")
+async def get_audio_timings(name: str, request: Request):
+    """
+    缓存音频的词/句时间轴 (name 为音频文件名)
+    只有 Edge-TTS 合成的音频有时间轴；字节偏移只适用于源 MP3
+    """
+    key = AudioCache.key_from_name(name)
+    path = get_tts_engine().cache.sidecar(key, TIMINGS_SUFFIX) if key else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Timings not found")
+    return range_file_response(request, path, "application/json", cache_control=IMMUTABLE_CACHE_CONTROL)
+
+@app.post("/api/voice/timings")
+async def find_audio_timings(request: Request):
+    """按合成参数查找时间轴 (用于流式合成后补取)"""
+    data = await request.json()
+    path = get_tts_engine().find_timings(
+        data.get("text", ""),
+        data.get("voice_model", "zh-CN-XiaoxiaoNeural"),
+        data.get("rate", "+0%"),
+        data.get("volume", "+0%")
+    )
+    if not path:
+        raise HTTPException(status_code=404, detail="Timings not found")
+    return FileResponse(path, media_type="application/json")
+
+@app.get("/api/voice/backends")
+async def voice_backend_stats():
+    """各 TTS 后端的熔断状态、首字节延迟分位数、错误率和对冲次数"""
+    return get_tts_engine().router.stats()
+
+@app.get("/api/voice/scheduler/stats")
+async def voice_scheduler_stats():
+    """TTS 调度统计 (并发占用、各优先级排队深度、等待时间分位数、超时/取消次数)"""
+    return get_tts_scheduler().stats()
+
+@app.get("/api/voice/prefetch/stats")
+async def voice_prefetch_stats():
+    """预测性预取统计 (各设备的窗口位置、已预取段数、跳转次数)"""
+    return tts_prefetcher.stats()
+
+def parse_tts_priority(data: dict) -> str:
+    """读取请求中的优先级 (interactive / prefetch / batch)"""
+    priority = data.get("priority", PRIORITY_INTERACTIVE)
+    if priority not in PRIORITY_ORDER:
+        raise HTTPException(status_code=400, detail=f"未知的优先级: {priority}")
+    return priority
+
+async def prime_audio_stream(chunks):
+    """
+    先取到第一块音频再开始响应：排队超时、上游失败等首字节前的错误
+    可以返回正常的 HTTP 状态码，而不是一个空的 200 音频流
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    
+    async def relay():
+        try:
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await chunks.aclose()
+    
+    return relay()
+
 @app.post("/api/voice/synthesize")
 async def synthesize_voice(request: Request):
     """
@@ -647,13 +1192,19 @@ async def synthesize_voice(request: Request):
         rate = data.get("rate", "+0%")
         volume = data.get("volume", "+0%")
         stream = data.get("stream", True)
+        priority = parse_tts_priority(data)
+        device_id = data.get("device_id")
+        try:
+            variant = negotiate_variant(data.get("variant"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         logger.info(f"===== 提取的参数 =====")
         logger.info(f"text 长度: {len(text)}")
         logger.info(f"text 预览: {text[:100]}")
         logger.info(f"voice_model: {voice_model}")
         logger.info(f"rate: {rate}")
-        logger.info(f"stream: {stream}")
+        logger.info(f"stream: {stream}, priority: {priority}")
         
         if not text:
             raise HTTPException(status_code=400, detail="文本不能为空")
@@ -662,17 +1213,44 @@ async def synthesize_voice(request: Request):
         
         engine = get_tts_engine()
         
+        # 按章节分段朗读时带上位置，后台预合成后续段
+        if device_id and data.get("book_id") is not None and data.get("segment") is not None:
+            try:
+                tts_prefetcher.update(device_id, str(data["book_id"]), int(data.get("chapter", 0)),
+                                      int(data["segment"]), voice_model, rate, volume)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="chapter / segment 必须是整数")
+        
         if stream:
             logger.info("使用流式合成")
+            chunks = engine.stream_synthesize(text, voice_model, rate, volume,
+                                              priority=priority, device_id=device_id)
+            if variant != VARIANT_SOURCE:
+                if ffmpeg_available():
+                    chunks = engine.variants.transcode_stream(chunks, variant)
+                else:
+                    logger.warning("未安装 ffmpeg，返回源 MP3")
+                    variant = VARIANT_SOURCE
             return StreamingResponse(
-                engine.stream_synthesize(text, voice_model, rate, volume),
-                media_type="audio/mpeg"
+                await prime_audio_stream(chunks),
+                media_type=media_type_for(variant),
+                headers={"X-Audio-Variant": variant}
             )
         else:
             logger.info("使用文件合成")
-            output_path = await engine.synthesize(text, voice_model, rate, volume)
-            return {"audio_url": f"/audio/{output_path.name}"}
+            output_path = await engine.synthesize(text, voice_model, rate, volume,
+                                                  priority=priority, device_id=device_id)
+            audio_url = f"/audio/{output_path.name}"
+            if variant != VARIANT_SOURCE:
+                audio_url += f"?variant={variant}"
+            result = {"audio_url": audio_url}
+            key = AudioCache.key_from_name(output_path.name)
+            if key and engine.cache.sidecar(key, TIMINGS_SUFFIX):
+                result["timings_url"] = f"/api/voice/timings/{output_path.name}"
+            return result
             
+    except QueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except json.JSONDecodeError as e:
         logger.error(f"JSON 解析失败: {str(e)}")
         raise HTTPException(status_code=400, detail=f"无效的 JSON: {str(e)}")
@@ -682,6 +1260,367 @@ async def synthesize_voice(request: Request):
         logger.error(f"语音合成失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.websocket("/api/voice/ws")
+async def voice_session(websocket: WebSocket, device_id: Optional[str] = None, window: int = SESSION_WINDOW):
+    """
+    朗读会话 - 客户端按段入队，服务端按顺序推送音频帧；
+    翻页/停止时取消的段会中止上游合成并释放名额 (协议见 services/tts_session.py)
+    """
+    await websocket.accept()
+    session = TTSSession(get_tts_engine(), device_id, websocket.send_json, websocket.send_bytes,
+                         window=max(0, min(window, 8)))
+    session.start()
+    logger.info(f"🔌 朗读会话已连接: device={device_id}")
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                await session.handle(json.loads(raw))
+            except json.JSONDecodeError:
+                await session.send({"type": "error", "detail": "无效的 JSON 消息"})
+            except SessionError as e:
+                await session.send({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+        logger.info(f"🔌 朗读会话已断开: device={device_id}, 统计: {session.stats}")
+
+@app.post("/api/voice/synthesize/chapter")
+async def synthesize_chapter(request: Request):
+    """
+    整章/整段朗读 - 按句子分段并发合成，按顺序流式返回
+    可选参数 window 控制同时合成的段数
+    """
+    try:
+        data = await request.json()
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"无效的 JSON: {str(e)}")
+    
+    text = data.get("text", "")
+    if not text:
+        raise HTTPException(status_code=400, detail="文本不能为空")
+    
+    window = max(1, min(int(data.get("window", 3)), 8))
+    priority = parse_tts_priority(data)
+    logger.info(f"整章合成: {len(text)} 字, 窗口 {window}")
+    
+    engine = get_tts_engine()
+    try:
+        chunks = await prime_audio_stream(engine.stream_synthesize_chapter(
+            text,
+            data.get("voice_model", "zh-CN-XiaoxiaoNeural"),
+            data.get("rate", "+0%"),
+            data.get("volume", "+0%"),
+            window=window,
+            priority=priority,
+            device_id=data.get("device_id")
+        ))
+    except QueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return StreamingResponse(chunks, media_type="audio/mpeg")
+
+@app.post("/api/voice/synthesize/ref")
+async def synthesize_by_reference(request: Request):
+    """
+    按引用合成 - 只传书籍、章节和范围，由服务端从章节正文取文本
+    范围三选一: sentences [start, end) 句子序号 / chars [start, end) 字符位置 / segment_ids 段 id 列表
+    范围按整章的确定性切分扩展到整段：不同设备、不同分页得到相同的段和缓存键
+    stream=true (默认) 按顺序流式返回音频；stream=false 返回各段的音频地址
+    """
+    try:
+        data = await request.json()
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"无效的 JSON: {str(e)}")
+    
+    book_id = data.get("book_id")
+    try:
+        chapter = int(data.get("chapter"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="chapter 必须是整数")
+    if not book_id:
+        raise HTTPException(status_code=400, detail="缺少 book_id")
+    
+    segments = await asyncio.to_thread(chapter_segment_index.get, str(book_id), chapter)
+    if segments is None:
+        raise HTTPException(status_code=404, detail="书籍或章节不存在")
+    try:
+        indexes = segments.resolve(sentences=data.get("sentences"), chars=data.get("chars"),
+                                   segment_ids=data.get("segment_ids"))
+    except StaleSegmentError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SegmentRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    voice_model = data.get("voice_model", "zh-CN-XiaoxiaoNeural")
+    rate = data.get("rate", "+0%")
+    volume = data.get("volume", "+0%")
+    priority = parse_tts_priority(data)
+    device_id = data.get("device_id")
+    try:
+        variant = negotiate_variant(data.get("variant"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    texts = [segments.text(i) for i in indexes]
+    logger.info(f"📖 按引用合成: {book_id} 第{chapter}章 段 {indexes[0]}-{indexes[-1]} ({sum(map(len, texts))} 字)")
+    
+    if device_id:
+        tts_prefetcher.update(device_id, str(book_id), chapter, indexes[-1], voice_model, rate, volume)
+    
+    engine = get_tts_engine()
+    try:
+        if data.get("stream", True):
+            chunks = engine.stream_synthesize_segments(texts, voice_model, rate, volume, priority=priority,
+                                                       device_id=device_id, batch=False)
+            if variant != VARIANT_SOURCE:
+                if ffmpeg_available():
+                    chunks = engine.variants.transcode_stream(chunks, variant)
+                else:
+                    logger.warning("未安装 ffmpeg，返回源 MP3")
+                    variant = VARIANT_SOURCE
+            return StreamingResponse(
+                await prime_audio_stream(chunks),
+                media_type=media_type_for(variant),
+                headers={
+                    "X-Audio-Variant": variant,
+                    "X-Segment-Ids": ",".join(segments.ids[i] for i in indexes),
+                    "X-Char-Range": f"{segments.segments[indexes[0]][0]}-{segments.segments[indexes[-1]][1]}"
+                }
+            )
+        
+        paths = await asyncio.gather(*(
+            engine.synthesize(text, voice_model, rate, volume, priority=priority, device_id=device_id)
+            for text in texts
+        ))
+    except QueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        logger.error(f"按引用合成失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    results = []
+    for index, path in zip(indexes, paths):
+        item = segments.describe(index)
+        del item["text"]
+        item["audio_url"] = f"/audio/{path.name}" + (f"?variant={variant}" if variant != VARIANT_SOURCE else "")
+        key = AudioCache.key_from_name(path.name)
+        if key and engine.cache.sidecar(key, TIMINGS_SUFFIX):
+            item["timings_url"] = f"/api/voice/timings/{path.name}"
+        results.append(item)
+    return {"book_id": book_id, "chapter": chapter, "segments": results}
+
+# ============ 后台任务 ============
+
+async def eager_parse_job(ctx):
+    """后台任务：逐章解析内容 (断点续跑)"""
+    book_id = ctx.payload["book_id"]
+    book_data = load_book_json(book_id)
+    if not book_data:
+        raise ValueError(f"书籍不存在: {book_id}")
+    
+    file_path = book_data.get('originalFilePath')
+    if not file_path or not Path(file_path).exists():
+        raise ValueError(f"原始文件不存在: {file_path}")
+    
+    logger.info(f"📖 后台解析开始: {book_data.get('title')} (从第 {ctx.checkpoint.get('next_index', 0)} 章)")
+    parser = EpubLazyParser(file_path)
+    chapters = book_data.get('chapters', [])
+    parsed_batch = {}
+    
+    def merge_batch(data):
+        for index, chapter in parsed_batch.items():
+            merge_parsed_chapter(data, index, chapter)
+    
+    for i in range(ctx.checkpoint.get('next_index', 0), len(chapters)):
+        if chapters[i].get('content') is None:
+            parsed = await asyncio.to_thread(parser.parse_single_chapter, i, chapters[i])
+            if parsed:
+                parsed_batch[i] = {**chapters[i], **parsed}
+        # 每解析5章保存一次：重新读取最新 JSON，只合并本批章节，不覆盖期间的进度更新
+        if i % 5 == 4:
+            await asyncio.to_thread(update_book_json, book_id, merge_batch)
+            parsed_batch.clear()
+            ctx.save_checkpoint({'next_index': i + 1}, progress=(i + 1) / len(chapters))
+    
+    def finish(data):
+        merge_batch(data)
+        data['parsing_status'] = 'completed'
+    
+    await asyncio.to_thread(update_book_json, book_id, finish)
+    logger.info(f"✅ 后台解析完成: {book_data.get('title')}")
+    return {"chapters": len(chapters)}
+
+async def reindex_job(ctx):
+    """后台任务：重新建立目录索引 (章节内容回到懒加载)"""
+    book_id = ctx.payload["book_id"]
+    book_data = load_book_json(book_id)
+    if not book_data:
+        raise ValueError(f"书籍不存在: {book_id}")
+    
+    file_path = book_data.get('originalFilePath')
+    if book_data.get('format') != 'epub' or not file_path or not Path(file_path).exists():
+        raise ValueError("只有保留原始文件的 EPUB 可以重建索引")
+    
+    metadata = await asyncio.to_thread(EpubLazyParser(file_path).parse_metadata_only)
+    chapters = [chapter_entry(ch) for ch in metadata['chapters']]
+    
+    def apply_index(data: dict):
+        data['chapters'] = chapters
+        data['totalPages'] = len(chapters)
+        data['parsing_status'] = 'lazy'
+    
+    if await asyncio.to_thread(update_book_json, book_id, apply_index) is None:
+        raise ValueError(f"书籍不存在: {book_id}")
+    chapter_cache.invalidate(book_id)
+    return {"chapters": len(chapters)}
+
+async def cover_fetch_job(ctx):
+    """后台任务：在线匹配封面"""
+    matched = await match_cover_for_book(ctx.payload["book_id"])
+    return matched or {"url": None}
+
+# 批量匹配封面的断点保存间隔
+COVER_BATCH_CHECKPOINT_BOOKS = 20
+COVER_BATCH_CHECKPOINT_SECONDS = 5
+
+async def cover_batch_job(ctx):
+    """后台任务：批量匹配封面 (断点记录已处理的书，重启后跳过)"""
+    book_ids = ctx.payload["book_ids"]
+    results = dict(ctx.checkpoint.get("results", {}))
+    pending = [book_id for book_id in book_ids if book_id not in results]
+    last_saved = {"count": len(results), "at": time.monotonic()}
+    
+    def save_checkpoint():
+        ctx.save_checkpoint({"results": results}, progress=len(results) / len(book_ids))
+        last_saved.update(count=len(results), at=time.monotonic())
+    
+    def on_result(book_id, status, detail):
+        results[book_id] = status
+        if status == "failed":
+            logger.warning(f"⚠️ 书籍 {book_id} 封面匹配失败: {detail}")
+        # 断点每 N 本或每隔几秒保存一次，不逐本写库
+        if (len(results) - last_saved["count"] >= COVER_BATCH_CHECKPOINT_BOOKS
+                or time.monotonic() - last_saved["at"] >= COVER_BATCH_CHECKPOINT_SECONDS):
+            save_checkpoint()
+    
+    try:
+        await match_many(pending, match_cover_for_book,
+                         concurrency=ctx.payload.get("concurrency") or batch_concurrency_from_env(),
+                         on_result=on_result)
+    finally:
+        await asyncio.to_thread(save_checkpoint)
+        await asyncio.to_thread(get_cover_search().cache.flush)
+    summary = {"total": len(book_ids)}
+    for status in ("matched", "missed", "failed"):
+        summary[status] = sum(1 for s in results.values() if s == status)
+    logger.info(f"🖼️ 批量匹配封面完成: {summary}")
+    return summary
+
+async def tts_prerender_job(ctx):
+    """后台任务：预先合成一组文本的语音 (结果进入音频缓存)"""
+    texts = ctx.payload["texts"]
+    voice_model = ctx.payload.get("voice_model", "zh-CN-XiaoxiaoNeural")
+    rate = ctx.payload.get("rate", "+0%")
+    volume = ctx.payload.get("volume", "+0%")
+    engine = get_tts_engine()
+    
+    files = ctx.checkpoint.get('files', [])
+    for i in range(len(files), len(texts)):
+        output_path = await engine.synthesize(texts[i], voice_model, rate, volume, priority=PRIORITY_BATCH)
+        files.append(output_path.name)
+        ctx.save_checkpoint({'files': files}, progress=(i + 1) / len(texts))
+    
+    return {"audio_urls": [f"/audio/{name}" for name in files]}
+
+async def audiobook_export_job(ctx):
+    """后台任务：整本书导出为有声书 (已完成的章节不会重新合成)"""
+    book_id = ctx.payload["book_id"]
+    book_data = load_book_json(book_id)
+    if not book_data:
+        raise ValueError(f"书籍不存在: {book_id}")
+    
+    voice_model = ctx.payload.get("voice_model", "zh-CN-XiaoxiaoNeural")
+    rate = ctx.payload.get("rate", "+0%")
+    volume = ctx.payload.get("volume", "+0%")
+    fmt = ctx.payload.get("format", "mp3")
+    export_id = make_export_id(voice_model, rate, volume, fmt)
+    engine = get_tts_engine()
+    chapters = book_data.get('chapters', [])
+    
+    exporter = AudiobookExporter(
+        work_dir=EXPORTS_DIR / book_id / export_id,
+        title=book_data.get('title', book_id),
+        author=book_data.get('author', ''),
+        chapter_titles=[ch.get('title', f'第 {i + 1} 章') for i, ch in enumerate(chapters)],
+        load_chapter_text=lambda index: load_chapter_text(book_data, index),
+        synthesize=lambda text: engine.synthesize(text, voice_model, rate, volume, priority=PRIORITY_BATCH),
+        fmt=fmt
+    )
+    result = await exporter.run(
+        on_progress=lambda done: ctx.save_checkpoint({'completed': done}, progress=len(done) / max(len(chapters), 1))
+    )
+    return {
+        "download_url": f"/api/books/{book_id}/export/audio/{export_id}",
+        "duration_ms": result["duration_ms"],
+        "chapters": len(result["chapters"])
+    }
+
+class AudiobookExportRequest(BaseModel):
+    voice_model: str = "zh-CN-XiaoxiaoNeural"
+    rate: str = "+0%"
+    volume: str = "+0%"
+    format: str = "mp3"
+
+@app.post("/api/books/{book_id}/export/audio")
+async def export_audiobook(book_id: str, request: AudiobookExportRequest):
+    """提交有声书导出任务 (MP3 或 M4B，带章节标记)"""
+    if not (BOOKS_DATA_DIR / f"{book_id}.json").exists():
+        raise HTTPException(status_code=404, detail="Book not found")
+    if request.format not in ("mp3", "m4b"):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {request.format}")
+    
+    job_id = get_job_queue().enqueue("audiobook_export", {"book_id": book_id, **request.dict()},
+                                     priority=PRIORITY_BULK, max_attempts=5)
+    export_id = make_export_id(request.voice_model, request.rate, request.volume, request.format)
+    return {"job_id": job_id, "export_id": export_id}
+
+@app.get("/api/books/{book_id}/export/audio/{export_id}")
+async def download_audiobook(book_id: str, export_id: str):
+    """下载已导出的有声书"""
+    work_dir = EXPORTS_DIR / Path(book_id).name / Path(export_id).name
+    # chapters.json 在最后写入，作为导出完成的标志
+    if not (work_dir / "chapters.json").exists():
+        raise HTTPException(status_code=404, detail="导出文件不存在或尚未完成")
+    for fmt, media_type in (("m4b", "audio/mp4"), ("mp3", "audio/mpeg")):
+        output_path = work_dir / f"audiobook.{fmt}"
+        if output_path.exists():
+            book_data = load_book_json(book_id) or {}
+            filename = f"{book_data.get('title', book_id)}.{fmt}"
+            return FileResponse(output_path, media_type=media_type, filename=filename)
+    raise HTTPException(status_code=404, detail="导出文件不存在或尚未完成")
+
+class JobRequest(BaseModel):
+    kind: str
+    payload: dict = {}
+    priority: int = PRIORITY_NORMAL
+
+@app.post("/api/jobs")
+async def create_job(request: JobRequest):
+    """提交后台任务"""
+    try:
+        job_id = get_job_queue().enqueue(request.kind, request.payload, request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: int):
+    """查询后台任务状态"""
+    job = get_job_queue().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTTP 会话复用基准测试 - 本地桩服务，无需网络
+对比「每次请求新建 ClientSession」(旧实现) 与「共享会话池」在并发负载下的单请求延迟
+用法: python bench_http_sessions.py [--requests 2000] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from services.http_sessions import HttpSessionPool
+
+PAYLOAD = b"\x00" * 8192
+
+
+async def start_stub_server():
+    """模拟 EasyVoice：收到请求后立即返回一小段音频"""
+    async def generate(request):
+        await request.read()
+        return web.Response(body=PAYLOAD, content_type="audio/mpeg")
+
+    app = web.Application()
+    app.router.add_post("/api/v1/tts/generateJson", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/v1/tts/generateJson"
+
+
+async def request_new_session(url: str) -> float:
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async with session.post(url, json={"data": [{"text": "测试"}]}) as resp:
+            await resp.read()
+    return time.perf_counter() - start
+
+
+async def request_pooled(pool: HttpSessionPool, url: str) -> float:
+    start = time.perf_counter()
+    async with pool.get("easyvoice").post(url, json={"data": [{"text": "测试"}]}) as resp:
+        await resp.read()
+    return time.perf_counter() - start
+
+
+async def run_load(fn, total: int, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            return await fn()
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one() for _ in range(total)))
+    return sorted(latencies), time.perf_counter() - start
+
+
+def report(name: str, latencies, elapsed: float):
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{name:<12} 平均 {statistics.mean(latencies) * 1000:7.2f}ms  "
+          f"p50 {pct(0.50):7.2f}ms  p95 {pct(0.95):7.2f}ms  p99 {pct(0.99):7.2f}ms  "
+          f"吞吐 {len(latencies) / elapsed:8.1f} req/s")
+    return statistics.mean(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="HTTP 会话复用基准测试")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    runner, url = await start_stub_server()
+    pool = HttpSessionPool()
+    try:
+        print(f"请求数 {args.requests}, 并发 {args.concurrency}\n")
+        new_lat, new_elapsed = await run_load(lambda: request_new_session(url), args.requests, args.concurrency)
+        pooled_lat, pooled_elapsed = await run_load(lambda: request_pooled(pool, url), args.requests, args.concurrency)
+
+        new_mean = report("每次新建会话", new_lat, new_elapsed)
+        pooled_mean = report("共享会话池", pooled_lat, pooled_elapsed)
+        print(f"\n单请求平均延迟降低 {(1 - pooled_mean / new_mean) * 100:.1f}%")
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
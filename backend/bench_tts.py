@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+TTS 压测 - 按目标并发请求 /api/voice/synthesize，统计首字节延迟、总耗时、吞吐和错误
+配合本地桩服务 (stub_tts_server.py) 可以在无网络环境下对比 TTS 相关改动:
+
+  python stub_tts_server.py --port 3900 --profile normal
+  EASYVOICE_API_URL=http://127.0.0.1:3900/api/v1/tts/generateJson \\
+  EDGE_TTS_STUB_URL=http://127.0.0.1:3900/edge/stream python app.py
+  python bench_tts.py --requests 200 --concurrency 16
+
+默认每个请求的文本都不同 (不命中缓存)；--repeat 让所有请求使用同一段文本，测缓存/合并效果
+用法: python bench_tts.py [--url http://127.0.0.1:8000] [--requests 200] [--concurrency 16]
+                          [--mode stream|file] [--priority interactive] [--repeat]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+import aiohttp
+
+SAMPLE_TEXT = "夜色渐深，街道上的行人越来越少。她把书合上，望着窗外的灯火，想起了很久以前的那个夏天。"
+
+
+class Result:
+    def __init__(self):
+        self.ttfb = None
+        self.total = None
+        self.size = 0
+        self.error = None
+
+
+async def request_stream(session: aiohttp.ClientSession, url: str, payload: dict) -> Result:
+    result = Result()
+    start = time.perf_counter()
+    async with session.post(f"{url}/api/voice/synthesize", json={**payload, "stream": True}) as resp:
+        if resp.status != 200:
+            result.error = f"HTTP {resp.status}"
+            return result
+        async for chunk in resp.content.iter_any():
+            if result.ttfb is None:
+                result.ttfb = time.perf_counter() - start
+            result.size += len(chunk)
+    result.total = time.perf_counter() - start
+    if result.size == 0:
+        result.error = "空音频"
+    return result
+
+
+async def request_file(session: aiohttp.ClientSession, url: str, payload: dict) -> Result:
+    """非流式：等合成完成拿到 audio_url，再下载音频；首字节按音频首块计"""
+    result = Result()
+    start = time.perf_counter()
+    async with session.post(f"{url}/api/voice/synthesize", json={**payload, "stream": False}) as resp:
+        if resp.status != 200:
+            result.error = f"HTTP {resp.status}"
+            return result
+        audio_url = (await resp.json())["audio_url"]
+    async with session.get(f"{url}{audio_url}") as resp:
+        if resp.status != 200:
+            result.error = f"下载 HTTP {resp.status}"
+            return result
+        async for chunk in resp.content.iter_any():
+            if result.ttfb is None:
+                result.ttfb = time.perf_counter() - start
+            result.size += len(chunk)
+    result.total = time.perf_counter() - start
+    return result
+
+
+async def run_load(args) -> tuple:
+    slots = asyncio.Semaphore(args.concurrency)
+    fn = request_stream if args.mode == "stream" else request_file
+    run_id = uuid.uuid4().hex[:8]
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        async def one(i: int) -> Result:
+            text = SAMPLE_TEXT if args.repeat else f"{SAMPLE_TEXT} 第{run_id}-{i}段。"
+            payload = {"text": text, "voice_model": args.voice, "priority": args.priority,
+                       "device_id": f"bench-{i % args.devices}"}
+            async with slots:
+                try:
+                    return await fn(session, args.url, payload)
+                except asyncio.TimeoutError:
+                    result = Result()
+                    result.error = "超时"
+                    return result
+                except aiohttp.ClientError as e:
+                    result = Result()
+                    result.error = type(e).__name__
+                    return result
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        return results, time.perf_counter() - start
+
+
+def percentiles(values) -> str:
+    if not values:
+        return "-"
+    values = sorted(values)
+
+    def pct(p):
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    return "  ".join(f"p{int(p * 100)} {pct(p):8.1f}ms" for p in (0.50, 0.90, 0.95, 0.99))
+
+
+def report(results, elapsed: float):
+    ok = [r for r in results if r.error is None]
+    errors = Counter(r.error for r in results if r.error is not None)
+    audio_bytes = sum(r.size for r in ok)
+
+    print(f"完成 {len(ok)}/{len(results)}，耗时 {elapsed:.2f}s")
+    print(f"首字节   {percentiles([r.ttfb for r in ok if r.ttfb is not None])}")
+    print(f"总耗时   {percentiles([r.total for r in ok])}")
+    print(f"吞吐     {len(ok) / elapsed:.1f} req/s，音频 {audio_bytes / 1024 / elapsed:.1f} KB/s")
+    print(f"错误率   {(len(results) - len(ok)) / len(results) * 100:.1f}%")
+    for kind, count in errors.most_common():
+        print(f"  {kind:<16} {count}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="TTS 压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="后端地址")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=["stream", "file"], default="stream")
+    parser.add_argument("--priority", choices=["interactive", "prefetch", "batch"], default="interactive")
+    parser.add_argument("--voice", default="zh-CN-XiaoxiaoNeural")
+    parser.add_argument("--devices", type=int, default=4, help="模拟的设备数 (按设备限流)")
+    parser.add_argument("--repeat", action="store_true", help="所有请求使用同一段文本")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    print(f"{args.url}  请求数 {args.requests}, 并发 {args.concurrency}, 模式 {args.mode}, "
+          f"优先级 {args.priority}\n")
+    results, elapsed = await run_load(args)
+    report(results, elapsed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
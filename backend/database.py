@@ -63,6 +63,27 @@ class Setting(Base):
     value = Column(Text)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+class Job(Base):
+    """后台任务表"""
+    __tablename__ = 'jobs'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    dedupe_key = Column(String(255), index=True)
+    status = Column(String(20), default='pending', index=True)  # pending, running, completed, failed
+    priority = Column(Integer, default=50)  # 数值越小越优先
+    payload = Column(Text)  # JSON
+    checkpoint = Column(Text)  # JSON，中断后据此续跑
+    progress = Column(Float, default=0.0)
+    result = Column(Text)  # JSON
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = Column(DateTime)
+
 # 数据库初始化
 def init_db():
     """初始化数据库"""
@@ -0,0 +1,63 @@
+"""
+批量导入命令：将目录或 ZIP 压缩包中的 EPUB/TXT 导入书库
+用法: python import_books.py <目录或zip> [--workers N]
+"""
+import argparse
+import logging
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from database import init_db
+from services.bulk_import import BulkImporter
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+BOOKS_DATA_DIR = Path('data/books')
+UPLOADS_DIR = Path('data/uploads')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量导入书籍')
+    parser.add_argument('source', help='书籍目录或 ZIP 压缩包')
+    parser.add_argument('--workers', type=int, default=None, help='解析进程数 (默认 CPU 核数)')
+    args = parser.parse_args()
+
+    BOOKS_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    init_db()
+
+    source = Path(args.source)
+    importer = BulkImporter(BOOKS_DATA_DIR, UPLOADS_DIR, workers=args.workers)
+    staging_dir = None
+
+    if source.is_dir():
+        paths = BulkImporter.collect_directory(source)
+    elif source.suffix.lower() == '.zip':
+        staging_dir = Path(f'temp/import_{int(time.time() * 1000)}')
+        paths = BulkImporter.extract_archive(source, staging_dir)
+    else:
+        logger.error(f'❌ 不支持的来源: {source}')
+        sys.exit(1)
+
+    try:
+        for event in importer.run(paths, move=staging_dir is not None):
+            if event['event'] == 'file':
+                mark = {'indexed': '✅', 'duplicate': '⏭️ ', 'failed': '❌'}[event['status']]
+                detail = f" ({event['error']})" if event.get('error') else ''
+                logger.info(f"{mark} [{event['done']}/{event['total']}] {event['file']}{detail}")
+            elif event['event'] == 'done':
+                logger.info(
+                    f"\n🎉 导入完成: 新增 {event['imported']} 本, 重复 {event['duplicates']} 本, "
+                    f"失败 {event['failed']} 本, 用时 {event['elapsed']}s"
+                )
+    finally:
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
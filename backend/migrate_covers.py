@@ -0,0 +1,75 @@
+"""
+数据迁移脚本：把书籍 JSON 中的内联封面 (data:image base64) 转存为封面文件并生成缩略图
+只有原图的旧封面 (/covers/{id}.jpg) 也会补齐缩略图
+JSON 只在封面文件写好之后才改写，原图不会丢失
+
+用法: python migrate_covers.py [--dry-run]
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from services.cover_store import CoverStore, externalize_book_cover, pillow_available
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path('data/books')
+COVERS_DIR = Path('data/covers')
+
+
+def migrate_covers(dry_run: bool = False):
+    """迁移所有书籍的封面"""
+    if not DATA_DIR.exists():
+        logger.error(f"❌ 数据目录不存在: {DATA_DIR}")
+        return
+    if not pillow_available():
+        logger.warning('⚠️ 未安装 Pillow，只转存原图，不生成缩略图 (pip install Pillow)')
+
+    store = CoverStore(COVERS_DIR)
+    migrated_count = 0
+    bytes_before = bytes_after = 0
+
+    for file_path in sorted(DATA_DIR.glob('*.json')):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            cover = data.get('cover') or ''
+            book_id = data.get('id') or file_path.stem
+            if data.get('covers') or not cover:
+                continue
+            if dry_run:
+                if cover.startswith('data:image') or store.local_original(cover):
+                    logger.info(f'🔍 待迁移: {data.get("title", file_path.name)} ({len(cover) / 1024:.0f}KB)')
+                    migrated_count += 1
+                continue
+
+            if not externalize_book_cover(store, str(book_id), data):
+                continue
+
+            bytes_before += len(cover)
+            bytes_after += len(json.dumps({'cover': data.get('cover'), 'covers': data.get('covers')}))
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+            logger.info(f'✅ 迁移成功: {data.get("title", file_path.name)}')
+            migrated_count += 1
+
+        except Exception as e:
+            logger.error(f'❌ 迁移失败 {file_path}: {e}')
+
+    if dry_run:
+        logger.info(f'\n🔍 共 {migrated_count} 本书需要迁移 (未做任何修改)')
+        return
+    logger.info(f'\n🎉 迁移完成！共迁移 {migrated_count} 本书')
+    logger.info(f'📉 封面字段: {bytes_before / 1024:.0f}KB -> {bytes_after / 1024:.0f}KB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把内联封面转存为文件并生成缩略图')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要迁移的书籍')
+    args = parser.parse_args()
+    migrate_covers(args.dry_run)
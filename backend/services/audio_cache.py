@@ -0,0 +1,303 @@
+"""
+TTS 音频缓存 - 内容寻址 + 容量上限 + LRU 淘汰
+- 缓存键是规范化文本、语音、语速、音量和后端的完整 SHA-256
+- 索引 (访问时间、命中次数) 保存在缓存目录的 JSON 文件中，定期落盘
+- 目录本身是权威数据：索引里缺失的文件会被丢弃，索引外的缓存文件会被收编
+- 总大小超过预算时按最近访问时间淘汰
+- 附属文件 (转码版本、时间轴等) 与源音频同名不同后缀，计入同一条目，一起淘汰
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_CACHE_FILE_RE = re.compile(r'^tts_([0-9a-f]{64})\.mp3$')
+_SIDECAR_FILE_RE = re.compile(r'^tts_([0-9a-f]{64})\.([a-z0-9-]+\.[a-z0-9]+)$')
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：统一 Unicode 形式并折叠空白，避免排版差异导致缓存未命中"""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class CacheWriter:
+    """
+    音频缓存写入器
+    先写入临时文件，只有正常退出 with 块时才原子地替换为正式缓存文件；
+    出错或被取消时删除临时文件，半成品永远不会被当作缓存读到
+    """
+
+    def __init__(self, path: Path, on_commit: Optional[Callable[[int], None]] = None):
+        self.path = path
+        self.tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.part")
+        self.size = 0
+        self._on_commit = on_commit
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.tmp_path, "wb")
+        return self
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+            if self._on_commit:
+                self._on_commit(self.size)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+        return False
+
+
+class AudioCache:
+    """按字节预算管理的 LRU 音频缓存"""
+
+    INDEX_NAME = 'cache_index.json'
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        # key -> {'size', 'last_access', 'hits', 'sidecars'}，按访问时间从旧到新排列
+        # size 包含附属文件，sidecars 是 {后缀: 大小}
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.total_bytes = 0
+        self._dirty = False
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._load()
+
+    # ============ 键与路径 ============
+
+    @staticmethod
+    def make_key(text: str, voice: str, rate: str, volume: str, backend: str) -> str:
+        """完整内容哈希作为缓存键"""
+        material = '\x1f'.join([normalize_text(text), voice, rate, volume, backend])
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"tts_{key}.mp3"
+
+    def sidecar_path(self, key: str, suffix: str) -> Path:
+        return self.cache_dir / f"tts_{key}.{suffix}"
+
+    @staticmethod
+    def key_from_name(name: str) -> Optional[str]:
+        """从源音频文件名取出缓存键"""
+        match = _CACHE_FILE_RE.match(name)
+        return match.group(1) if match else None
+
+    # ============ 读写 ============
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """命中时更新访问时间并返回文件路径"""
+        return self.lookup_any([key])
+
+    def lookup_any(self, keys: List[str]) -> Optional[Path]:
+        """按顺序查找多个候选键 (如不同后端)，整体只计一次命中或未命中"""
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            path = self.path_for(key)
+            if not path.exists():
+                # 文件被外部删除
+                self._drop(key)
+                continue
+            entry['last_access'] = time.time()
+            entry['hits'] += 1
+            self._entries.move_to_end(key)
+            self._dirty = True
+            self.hits += 1
+            return path
+
+        self.misses += 1
+        return None
+
+    def sidecar(self, key: str, suffix: str) -> Optional[Path]:
+        """查找已登记的附属文件，命中时刷新源音频的访问时间"""
+        entry = self._entries.get(key)
+        if entry is None or suffix not in entry.get('sidecars', {}):
+            return None
+        path = self.sidecar_path(key, suffix)
+        if not path.exists():
+            size = entry['sidecars'].pop(suffix)
+            entry['size'] -= size
+            self.total_bytes -= size
+            self._dirty = True
+            return None
+        entry['last_access'] = time.time()
+        self._entries.move_to_end(key)
+        self._dirty = True
+        return path
+
+    def writer(self, key: str) -> CacheWriter:
+        """获取写入器，成功提交后登记并按预算淘汰"""
+        return CacheWriter(self.path_for(key), on_commit=lambda size: self._commit(key, size))
+
+    def sidecar_writer(self, key: str, suffix: str) -> CacheWriter:
+        """获取附属文件写入器，提交后计入源音频条目"""
+        return CacheWriter(self.sidecar_path(key, suffix),
+                           on_commit=lambda size: self._commit_sidecar(key, suffix, size))
+
+    def _commit(self, key: str, size: int):
+        if key in self._entries:
+            # 源音频被重新生成，旧的附属文件不再对应
+            self._remove_sidecars(key)
+            self.total_bytes -= self._entries[key]['size']
+        self._entries[key] = {'size': size, 'last_access': time.time(), 'hits': 0, 'sidecars': {}}
+        self._entries.move_to_end(key)
+        self.total_bytes += size
+        self._dirty = True
+        self._evict(keep=key)
+
+    def _commit_sidecar(self, key: str, suffix: str, size: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            # 源音频在生成附属文件期间被淘汰
+            self.sidecar_path(key, suffix).unlink(missing_ok=True)
+            return
+        sidecars = entry.setdefault('sidecars', {})
+        old = sidecars.get(suffix, 0)
+        sidecars[suffix] = size
+        entry['size'] += size - old
+        self.total_bytes += size - old
+        self._dirty = True
+        self._evict(keep=key)
+
+    def _remove_sidecars(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        for suffix, size in entry.get('sidecars', {}).items():
+            self.sidecar_path(key, suffix).unlink(missing_ok=True)
+            entry['size'] -= size
+            self.total_bytes -= size
+        entry['sidecars'] = {}
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry['size']
+            self._dirty = True
+
+    def _evict(self, keep: Optional[str] = None):
+        """淘汰最久未访问的条目直到满足预算 (刚写入的条目除外)"""
+        freed = 0
+        evicted = 0
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            size = self._entries[key]['size']
+            self._remove_sidecars(key)
+            self.path_for(key).unlink(missing_ok=True)
+            self._drop(key)
+            freed += size
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"🧹 缓存淘汰 {evicted} 个音频，释放 {freed/1024/1024:.2f} MB")
+
+    # ============ 索引持久化 ============
+
+    def _load(self):
+        """读取索引并与目录内容对齐"""
+        index = {}
+        index_path = self.cache_dir / self.INDEX_NAME
+        if index_path.exists():
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f).get('entries', {})
+            except Exception as e:
+                logger.warning(f"缓存索引损坏，将重建: {e}")
+
+        now = time.time()
+        found = {}
+        sidecars = []
+        for path in self.cache_dir.iterdir():
+            if path.name.endswith('.part'):
+                # 崩溃遗留的未完成临时文件
+                path.unlink(missing_ok=True)
+                continue
+            match = _CACHE_FILE_RE.match(path.name)
+            if not match:
+                sidecar = _SIDECAR_FILE_RE.match(path.name)
+                if sidecar:
+                    sidecars.append((sidecar.group(1), sidecar.group(2), path))
+                elif path.name.startswith('tts_') and path.suffix == '.mp3':
+                    # 旧版截断 md5 命名的缓存，新键永远不会命中
+                    path.unlink(missing_ok=True)
+                continue
+            key = match.group(1)
+            stat = path.stat()
+            entry = index.get(key, {})
+            found[key] = {
+                'size': stat.st_size,
+                'last_access': entry.get('last_access', min(stat.st_mtime, now)),
+                'hits': entry.get('hits', 0),
+                'sidecars': {}
+            }
+
+        for key, suffix, path in sidecars:
+            if key not in found:
+                # 源音频已不存在
+                path.unlink(missing_ok=True)
+                continue
+            size = path.stat().st_size
+            found[key]['sidecars'][suffix] = size
+            found[key]['size'] += size
+
+        for key, entry in sorted(found.items(), key=lambda kv: kv[1]['last_access']):
+            self._entries[key] = entry
+            self.total_bytes += entry['size']
+
+        self._evict()
+        self._dirty = True
+        self.flush()
+        logger.info(f"🎵 音频缓存: {len(self._entries)} 个文件, "
+                    f"{self.total_bytes/1024/1024:.1f}/{self.max_bytes/1024/1024:.0f} MB")
+
+    def flush(self):
+        """把索引原子地写回磁盘 (只在有变化时)"""
+        if not self._dirty:
+            return
+        index_path = self.cache_dir / self.INDEX_NAME
+        tmp_path = index_path.with_name(f"{self.INDEX_NAME}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': dict(self._entries)}, f)
+        os.replace(tmp_path, index_path)
+        self._dirty = False
+
+    # ============ 统计 ============
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions
+        }
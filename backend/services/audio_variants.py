@@ -0,0 +1,158 @@
+"""
+音频转码版本 - 面向流量敏感的客户端提供低码率 Opus / MP3
+- 每个版本只转码一次，作为附属文件存在源音频旁边，随源音频一起淘汰
+- 流式合成时可以边合成边转码 (ffmpeg 管道)
+- 需要系统安装 ffmpeg；没有 ffmpeg 时只提供源 MP3
+"""
+import asyncio
+import logging
+import shutil
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from services.audio_cache import AudioCache
+
+logger = logging.getLogger(__name__)
+
+VARIANT_SOURCE = 'source'
+
+# 语音内容单声道即可；Opus 在 24-32kbps 下的清晰度已接近源 MP3
+AUDIO_VARIANTS = {
+    'opus-24': {'ext': 'ogg', 'media_type': 'audio/ogg',
+                'args': ['-c:a', 'libopus', '-b:a', '24k', '-ac', '1', '-application', 'voip', '-f', 'ogg']},
+    'opus-32': {'ext': 'ogg', 'media_type': 'audio/ogg',
+                'args': ['-c:a', 'libopus', '-b:a', '32k', '-ac', '1', '-application', 'voip', '-f', 'ogg']},
+    'mp3-32': {'ext': 'mp3', 'media_type': 'audio/mpeg',
+               'args': ['-c:a', 'libmp3lame', '-b:a', '32k', '-ac', '1', '-f', 'mp3']},
+}
+
+READ_CHUNK_SIZE = 16 * 1024
+
+
+class VariantUnavailable(Exception):
+    """无法生成转码版本 (未安装 ffmpeg)"""
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+def media_type_for(variant: str) -> str:
+    if variant == VARIANT_SOURCE:
+        return 'audio/mpeg'
+    return AUDIO_VARIANTS[variant]['media_type']
+
+
+def negotiate_variant(requested: Optional[str], accept: str = '') -> str:
+    """
+    选择输出版本：显式参数优先；否则客户端 Accept 明确偏好 Ogg/Opus 时给 opus-32
+    未知的版本名抛 ValueError
+    """
+    if requested:
+        if requested != VARIANT_SOURCE and requested not in AUDIO_VARIANTS:
+            raise ValueError(f"未知的音频格式: {requested}")
+        return requested
+
+    preferences = {}
+    for item in (accept or '').split(','):
+        parts = [p.strip() for p in item.split(';')]
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        preferences[parts[0].lower()] = q
+
+    opus_q = max(preferences.get('audio/ogg', 0), preferences.get('audio/opus', 0))
+    mpeg_q = preferences.get('audio/mpeg', preferences.get('audio/*', preferences.get('*/*', 0)))
+    return 'opus-32' if opus_q > mpeg_q else VARIANT_SOURCE
+
+
+def variant_suffix(variant: str) -> str:
+    return f"{variant}.{AUDIO_VARIANTS[variant]['ext']}"
+
+
+class AudioTranscoder:
+    """按需生成并缓存转码版本；相同版本的并发请求只转码一次"""
+
+    def __init__(self, cache: AudioCache):
+        self.cache = cache
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def ensure(self, key: str, variant: str) -> Path:
+        """返回转码版本的路径，不存在时生成"""
+        suffix = variant_suffix(variant)
+        cached = self.cache.sidecar(key, suffix)
+        if cached:
+            return cached
+        if not ffmpeg_available():
+            raise VariantUnavailable('转码需要安装 ffmpeg')
+
+        pending_key = f"{key}.{suffix}"
+        task = self._pending.get(pending_key)
+        if task is None:
+            task = asyncio.create_task(self._transcode_file(key, variant))
+            self._pending[pending_key] = task
+            task.add_done_callback(lambda _: self._pending.pop(pending_key, None))
+        return await asyncio.shield(task)
+
+    async def _transcode_file(self, key: str, variant: str) -> Path:
+        source = self.cache.path_for(key)
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-loglevel', 'error', '-i', str(source), *AUDIO_VARIANTS[variant]['args'], 'pipe:1',
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        # stderr 与 stdout 同时读取：ffmpeg 写满 stderr 管道时不会卡住
+        stderr_task = asyncio.create_task(proc.stderr.read())
+        try:
+            with self.cache.sidecar_writer(key, variant_suffix(variant)) as writer:
+                while chunk := await proc.stdout.read(READ_CHUNK_SIZE):
+                    writer.write(chunk)
+                stderr = await stderr_task
+                if await proc.wait() != 0 or writer.size == 0:
+                    raise RuntimeError(f"ffmpeg 转码失败: {stderr.decode(errors='ignore')[:200]}")
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            stderr_task.cancel()
+            await asyncio.gather(stderr_task, return_exceptions=True)
+
+        logger.info(f"🎚️ 已生成 {variant} 版本: {source.name} ({writer.size} bytes)")
+        return writer.path
+
+    async def transcode_stream(self, chunks: AsyncIterator[bytes], variant: str) -> AsyncIterator[bytes]:
+        """边接收源 MP3 边转码输出 (不缓存，源 MP3 本身仍会进入缓存)"""
+        if not ffmpeg_available():
+            raise VariantUnavailable('转码需要安装 ffmpeg')
+
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-loglevel', 'error', '-f', 'mp3', '-i', 'pipe:0', *AUDIO_VARIANTS[variant]['args'], 'pipe:1',
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+
+        async def feed():
+            try:
+                async for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            finally:
+                proc.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while chunk := await proc.stdout.read(READ_CHUNK_SIZE):
+                yield chunk
+            await feeder
+            if await proc.wait() != 0:
+                raise RuntimeError(f"ffmpeg 转码失败 ({variant})")
+        finally:
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
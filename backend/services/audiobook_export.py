@@ -0,0 +1,225 @@
+"""
+整本书导出为有声书
+- 按章节懒加载正文，分段后以有限并发合成 (复用 TTS 缓存)
+- MP3 帧直接拼接，不重新编码；写入 ID3v2 CHAP/CTOC 章节标记
+- 每章合成结果单独落盘，中断后从已完成的章节继续
+- M4B 需要系统安装 ffmpeg (AAC 必须重新编码)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.audio_cache import CacheWriter
+from services.text_segmenter import split_segments
+
+logger = logging.getLogger(__name__)
+
+# MP3 帧头查表 (只处理 Layer III)
+_BITRATES = {
+    'v1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'v2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def strip_id3(data: bytes) -> bytes:
+    """去掉 ID3v2 头和 ID3v1 尾，只保留 MP3 帧，便于直接拼接"""
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        if data[5] & 0x10:
+            size += 10  # footer
+        data = data[10 + size:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def mp3_duration(data: bytes) -> float:
+    """扫描 MP3 帧头计算时长 (秒)"""
+    data = strip_id3(data)
+    pos = 0
+    samples = 0.0
+    while pos + 4 <= len(data):
+        b1, b2 = data[pos + 1], data[pos + 2]
+        version = (b1 >> 3) & 0x03
+        layer = (b1 >> 1) & 0x03
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x03
+        if (data[pos] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or layer != 1
+                or bitrate_index in (0, 15) or rate_index == 3):
+            pos += 1  # 重新同步
+            continue
+
+        sample_rate = _SAMPLE_RATES[version][rate_index]
+        padding = (b2 >> 1) & 0x01
+        if version == 3:
+            bitrate = _BITRATES['v1'][bitrate_index] * 1000
+            frame_len = 144 * bitrate // sample_rate + padding
+            frame_samples = 1152
+        else:
+            bitrate = _BITRATES['v2'][bitrate_index] * 1000
+            frame_len = 72 * bitrate // sample_rate + padding
+            frame_samples = 576
+
+        samples += frame_samples / sample_rate
+        pos += frame_len
+    return samples
+
+
+def _syncsafe(n: int) -> bytes:
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def _frame(frame_id: str, payload: bytes) -> bytes:
+    return frame_id.encode('ascii') + _syncsafe(len(payload)) + b'\x00\x00' + payload
+
+
+def _text_frame(frame_id: str, text: str) -> bytes:
+    return _frame(frame_id, b'\x03' + text.encode('utf-8'))
+
+
+def build_chapter_tag(title: str, author: str, chapters: List[Dict]) -> bytes:
+    """
+    生成 ID3v2.4 标签：书名、作者 + 每章一个 CHAP 帧 + 一个顶层 CTOC 目录
+    chapters: [{'title', 'start_ms', 'end_ms'}]
+    """
+    frames = [_text_frame('TIT2', title), _text_frame('TPE1', author)]
+
+    element_ids = []
+    for i, ch in enumerate(chapters):
+        element_id = f'ch{i}'.encode('ascii')
+        element_ids.append(element_id)
+        frames.append(_frame('CHAP',
+                             element_id + b'\x00'
+                             + struct.pack('>IIII', ch['start_ms'], ch['end_ms'], 0xFFFFFFFF, 0xFFFFFFFF)
+                             + _text_frame('TIT2', ch['title'])))
+
+    # CTOC 的条目数只有 1 字节，超过 255 章时目录只列前 255 章 (CHAP 帧不受影响)
+    listed = element_ids[:255]
+    frames.append(_frame('CTOC',
+                         b'toc\x00' + b'\x03' + bytes([len(listed)])
+                         + b''.join(eid + b'\x00' for eid in listed)))
+
+    body = b''.join(frames)
+    return b'ID3\x04\x00\x00' + _syncsafe(len(body)) + body
+
+
+def export_id(voice: str, rate: str, volume: str, fmt: str) -> str:
+    """同一本书、同一组语音参数的导出共享工作目录，便于续跑"""
+    return hashlib.sha256(f"{voice}\x1f{rate}\x1f{volume}\x1f{fmt}".encode()).hexdigest()[:16]
+
+
+class AudiobookExporter:
+    """有声书导出器，合成函数可替换 (测试时使用本地桩)"""
+
+    def __init__(self, work_dir: Path, title: str, author: str, chapter_titles: List[str],
+                 load_chapter_text: Callable[[int], Optional[str]],
+                 synthesize: Callable[[str], Awaitable[Path]],
+                 concurrency: int = 4, fmt: str = 'mp3'):
+        self.work_dir = Path(work_dir)
+        self.chapters_dir = self.work_dir / 'chapters'
+        self.chapters_dir.mkdir(parents=True, exist_ok=True)
+        self.title = title
+        self.author = author
+        self.chapter_titles = chapter_titles
+        self.load_chapter_text = load_chapter_text
+        self.synthesize = synthesize
+        self.fmt = fmt
+        self._segment_slots = asyncio.Semaphore(concurrency)
+        # 同时最多处理两章，避免一次性把全书正文读进内存
+        self._chapter_slots = asyncio.Semaphore(2)
+
+    def chapter_path(self, index: int) -> Path:
+        return self.chapters_dir / f"{index:05d}.mp3"
+
+    @property
+    def output_path(self) -> Path:
+        return self.work_dir / f"audiobook.{self.fmt}"
+
+    def completed_chapters(self) -> List[int]:
+        return [i for i in range(len(self.chapter_titles)) if self.chapter_path(i).exists()]
+
+    async def _synthesize_segment(self, text: str) -> bytes:
+        async with self._segment_slots:
+            path = await self.synthesize(text)
+        return strip_id3(path.read_bytes())
+
+    async def _export_chapter(self, index: int):
+        async with self._chapter_slots:
+            text = await asyncio.to_thread(self.load_chapter_text, index)
+            segments = split_segments(text or '')
+            parts = await asyncio.gather(*(self._synthesize_segment(s) for s in segments))
+            with CacheWriter(self.chapter_path(index)) as writer:
+                for part in parts:
+                    writer.write(part)
+
+    async def run(self, on_progress: Optional[Callable[[List[int]], None]] = None) -> Dict:
+        """导出全书；已存在的章节文件直接复用"""
+        total = len(self.chapter_titles)
+        done = self.completed_chapters()
+        todo = sorted(set(range(total)) - set(done))
+        logger.info(f"🎧 有声书导出: {self.title} ({len(done)}/{total} 章已完成)")
+
+        async def export_and_report(index: int):
+            await self._export_chapter(index)
+            done.append(index)
+            if on_progress:
+                on_progress(sorted(done))
+
+        # 某章失败时让其他章节先完成并落盘，下次续跑时少做重复工作
+        results = await asyncio.gather(*(export_and_report(i) for i in todo), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+        return await asyncio.to_thread(self._assemble)
+
+    def _assemble(self) -> Dict:
+        """拼接章节并写入章节标记"""
+        markers = []
+        position_ms = 0
+        for i, title in enumerate(self.chapter_titles):
+            duration_ms = int(round(mp3_duration(self.chapter_path(i).read_bytes()) * 1000))
+            markers.append({'index': i, 'title': title, 'start_ms': position_ms,
+                            'end_ms': position_ms + duration_ms})
+            position_ms += duration_ms
+
+        mp3_path = self.work_dir / 'audiobook.mp3'
+        with CacheWriter(mp3_path) as writer:
+            writer.write(build_chapter_tag(self.title, self.author, markers))
+            for i in range(len(self.chapter_titles)):
+                with open(self.chapter_path(i), 'rb') as f:
+                    while chunk := f.read(1024 * 1024):
+                        writer.write(chunk)
+
+        if self.fmt == 'm4b':
+            self._convert_m4b(mp3_path, markers)
+
+        with open(self.work_dir / 'chapters.json', 'w', encoding='utf-8') as f:
+            json.dump(markers, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"✅ 有声书导出完成: {self.output_path} ({position_ms / 1000:.0f}s)")
+        return {'path': str(self.output_path), 'duration_ms': position_ms, 'chapters': markers}
+
+    def _convert_m4b(self, mp3_path: Path, markers: List[Dict]):
+        """用 ffmpeg 转为带章节的 M4B"""
+        if not shutil.which('ffmpeg'):
+            raise RuntimeError('导出 M4B 需要安装 ffmpeg')
+
+        metadata_path = self.work_dir / 'ffmetadata.txt'
+        lines = [';FFMETADATA1', f'title={self.title}', f'artist={self.author}']
+        for m in markers:
+            lines += ['[CHAPTER]', 'TIMEBASE=1/1000', f"START={m['start_ms']}",
+                      f"END={m['end_ms']}", f"title={m['title']}"]
+        metadata_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+        tmp_path = self.output_path.with_suffix('.tmp.m4b')
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', str(mp3_path), '-i', str(metadata_path),
+                        '-map_metadata', '1', '-map', '0:a', '-c:a', 'aac', '-b:a', '64k', str(tmp_path)],
+                       check=True)
+        tmp_path.replace(self.output_path)
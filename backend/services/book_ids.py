@@ -0,0 +1,43 @@
+"""
+书籍 ID 分配 - 上传与批量导入共用
+- ID 仍是毫秒时间戳 (前端按数字解析)，进程内保证单调递增
+- 以 O_EXCL 创建原始文件占住 ID，已有同号原始文件或书籍 JSON 时顺延，
+  并发上传、并发导入 (含多进程) 都不会拿到同一个 ID
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Tuple
+
+BOOK_EXTS = ('epub', 'txt')
+
+_lock = threading.Lock()
+_last_id = 0
+
+
+def _next_candidate() -> int:
+    global _last_id
+    with _lock:
+        _last_id = max(_last_id + 1, int(time.time() * 1000))
+        return _last_id
+
+
+def claim_book_id(uploads_dir: Path, books_dir: Path, ext: str) -> Tuple[str, Path]:
+    """
+    分配一个未被占用的书籍 ID，并创建空的原始文件占位
+    返回 (book_id, 原始文件路径)；调用方写入失败时负责删除占位文件
+    """
+    uploads_dir, books_dir = Path(uploads_dir), Path(books_dir)
+    while True:
+        book_id = str(_next_candidate())
+        if (books_dir / f"{book_id}.json").exists() or any(
+                (uploads_dir / f"{book_id}.{other}").exists() for other in BOOK_EXTS if other != ext):
+            continue
+        path = uploads_dir / f"{book_id}.{ext}"
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return book_id, path
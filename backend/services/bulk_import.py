@@ -0,0 +1,291 @@
+"""
+批量导入 - 一次性导入整个目录或压缩包中的 EPUB/TXT
+元数据解析在进程池中并行执行，按内容哈希去重，
+所有新书在同一个数据库事务中登记到书目
+服务器目录导入限定在 BULK_IMPORT_ROOT 之下
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from services.book_ids import claim_book_id
+from services.cover_store import CoverStore, CoverError
+from services.epub_lazy_parser import EpubLazyParser
+from services.spine_layout import chapter_entry
+from services.txt_parser import TxtParser
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTS = ('epub', 'txt')
+
+
+def file_sha256(path: str) -> str:
+    """分块计算文件内容哈希"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_book_file(path: str) -> Dict:
+    """
+    在子进程中运行：计算内容哈希并解析元数据
+    EPUB 只读目录结构；TXT 没有懒加载读取器，章节正文随索引一起保存
+    """
+    ext = path.rsplit('.', 1)[-1].lower()
+    result = {'path': path, 'ext': ext, 'hash': None, 'error': None}
+
+    try:
+        result['hash'] = file_sha256(path)
+
+        if ext == 'epub':
+            parser = EpubLazyParser(path)
+            metadata = parser.parse_metadata_only()
+            if not metadata['chapters']:
+                raise ValueError('未找到章节')
+            result.update({
+                'title': metadata['title'],
+                'author': metadata['author'],
+                'cover_image': parser.read_cover(metadata['cover_href']),
+                'chapters': [chapter_entry(ch) for ch in metadata['chapters']]
+            })
+        else:
+            with open(path, 'rb') as f:
+                parsed = TxtParser().parse(f.read())
+            if not parsed.get('success'):
+                raise ValueError(parsed.get('error', 'TXT 解析失败'))
+            result.update({
+                'title': parsed['metadata']['title'],
+                'author': parsed['metadata']['author'],
+                'cover_image': None,
+                'chapters': [{
+                    'index': i,
+                    'id': f'txt_{i}',
+                    'title': ch['title'],
+                    'href': '',
+                    'content': ch['content'],
+                    'word_count': ch['word_count']
+                } for i, ch in enumerate(parsed['chapters'])]
+            })
+    except Exception as e:
+        result['error'] = str(e)
+
+    return result
+
+
+class BulkImporter:
+    """批量导入器：收集源文件 -> 并行索引 -> 去重 -> 单事务登记"""
+
+    def __init__(self, books_dir: Path, uploads_dir: Path, workers: Optional[int] = None,
+                 cover_store: Optional[CoverStore] = None, session_factory: Optional[Callable] = None):
+        self.books_dir = Path(books_dir)
+        self.uploads_dir = Path(uploads_dir)
+        self.workers = workers or os.cpu_count() or 2
+        self.cover_store = cover_store
+        if session_factory is None:
+            from database import get_session as session_factory
+        self.session_factory = session_factory
+
+    @staticmethod
+    def collect_directory(directory: Path) -> List[Path]:
+        """递归收集目录下所有支持的书籍文件"""
+        return sorted(
+            p for p in Path(directory).rglob('*')
+            if p.is_file() and p.suffix.lower().lstrip('.') in SUPPORTED_EXTS
+        )
+
+    @staticmethod
+    def extract_archive(archive_path: Path, staging_dir: Path) -> List[Path]:
+        """
+        从 ZIP 中解出书籍文件到暂存目录
+        成员按序号重命名，避免路径穿越和重名覆盖
+        """
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        extracted = []
+        with zipfile.ZipFile(archive_path, 'r') as zf:
+            for i, info in enumerate(zf.infolist()):
+                if info.is_dir():
+                    continue
+                ext = info.filename.rsplit('.', 1)[-1].lower()
+                if ext not in SUPPORTED_EXTS:
+                    continue
+                stem = Path(info.filename).stem[:80] or 'book'
+                target = staging_dir / f"{i:05d}_{stem}.{ext}"
+                with zf.open(info) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                extracted.append(target)
+        return extracted
+
+    def _known_hashes(self, session) -> Set[str]:
+        from database import Book
+        return {h for (h,) in session.query(Book.file_hash).filter(Book.file_hash.isnot(None))}
+
+    def run(self, paths: List[Path], move: bool = False) -> Iterator[Dict]:
+        """
+        执行导入，逐条产出进度事件 (可直接序列化为 NDJSON)
+        move=True 时源文件被移动而不是复制 (用于已解压的暂存文件)
+        每本书索引完成后立即写入原始文件、封面和 JSON，只留下待登记的书目行，
+        最后在一个事务中提交；中途失败 (或客户端断开) 时删除已写入的文件
+        """
+        from database import Book
+
+        started = time.time()
+        total = len(paths)
+        yield {'event': 'start', 'total': total, 'workers': self.workers}
+
+        session = self.session_factory()
+        pool = None
+        written: List[Path] = []
+        covered: List[str] = []
+        try:
+            seen = self._known_hashes(session)
+            rows, book_ids = [], []
+            done = duplicates = failed = 0
+
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+            # 自己维护未完成集合：处理完的 future 随即丢弃，索引结果 (封面、TXT 正文) 不会积攒在内存里
+            pending = {pool.submit(index_book_file, str(p)): p for p in paths}
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done += 1
+                    source = pending.pop(future)
+                    try:
+                        indexed = future.result()
+                    except Exception as e:
+                        indexed = {'path': str(source), 'error': str(e)}
+
+                    if indexed.get('error'):
+                        failed += 1
+                        status = 'failed'
+                    elif indexed['hash'] in seen:
+                        duplicates += 1
+                        status = 'duplicate'
+                    else:
+                        seen.add(indexed['hash'])
+                        book_id, row = self._store(indexed, move, written, covered)
+                        rows.append(Book(**row))
+                        book_ids.append(book_id)
+                        status = 'indexed'
+
+                    event = {'event': 'file', 'file': source.name, 'status': status,
+                             'done': done, 'total': total}
+                    if indexed.get('error'):
+                        event['error'] = indexed['error']
+                    del future, indexed
+                    yield event
+            pool.shutdown()
+
+            yield {'event': 'registering', 'count': len(rows)}
+            session.add_all(rows)
+            session.commit()
+            logger.info(f"📚 批量导入完成: {len(book_ids)} 本")
+
+            yield {
+                'event': 'done',
+                'imported': len(book_ids),
+                'duplicates': duplicates,
+                'failed': failed,
+                'book_ids': book_ids,
+                'elapsed': round(time.time() - started, 2)
+            }
+        except BaseException:
+            # 包括 GeneratorExit：流被中途关闭时同样撤销
+            # 先取消排队中的文件，不等整批索引跑完 (正在执行的每个进程最多再处理完一个文件)
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            session.rollback()
+            for path in written:
+                path.unlink(missing_ok=True)
+            for book_id in covered:
+                self.cover_store.remove(book_id)
+            raise
+        finally:
+            session.close()
+
+    def _store(self, indexed: Dict, move: bool, written: List[Path], covered: List[str]):
+        """
+        写入一本书的原始文件、封面和书籍 JSON，返回 (book_id, 书目行字段)
+        写入的路径和封面记入 written / covered，失败时由 run 统一撤销
+        """
+        ext = indexed['ext']
+        book_id, original_path = claim_book_id(self.uploads_dir, self.books_dir, ext)
+        written.append(original_path)
+        if move:
+            shutil.move(indexed['path'], original_path)
+        else:
+            shutil.copyfile(indexed['path'], original_path)
+
+        title = indexed['title']
+        if not title or title in ('Unknown', '未知书名'):
+            title = Path(indexed['path']).stem
+        chapters = indexed['chapters']
+        now = datetime.datetime.now().isoformat()
+
+        book_data = {
+            'id': book_id,
+            'title': title,
+            'author': indexed['author'],
+            'cover': None,
+            'format': ext,
+            'chapters': chapters,
+            'totalPages': len(chapters),
+            'progress': 0,
+            'currentPage': 0,
+            'currentChapter': 0,
+            'createdAt': now,
+            'lastReadAt': now,
+            'originalFilePath': str(original_path),
+            'fileHash': indexed['hash'],
+            'parsing_status': 'lazy' if ext == 'epub' else 'completed'
+        }
+        if self.cover_store and indexed.get('cover_image'):
+            try:
+                book_data.update(self.cover_store.save(book_id, indexed['cover_image']))
+                covered.append(book_id)
+            except CoverError as e:
+                logger.warning(f"⚠️ {title} 封面无法处理: {e}")
+
+        json_path = self.books_dir / f"{book_id}.json"
+        written.append(json_path)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(book_data, f, ensure_ascii=False, indent=2)
+
+        return book_id, {
+            'title': title,
+            'author': indexed['author'],
+            'file_path': str(original_path),
+            'file_hash': indexed['hash'],
+            'total_pages': len(chapters),
+            'format': ext
+        }
+
+
+class ImportRootError(ValueError):
+    pass
+
+
+def resolve_import_directory(directory: str, root: Optional[str] = None) -> Path:
+    """
+    服务器目录导入只允许 BULK_IMPORT_ROOT 之下的目录
+    未配置根目录时不接受目录导入；符号链接解析后再判断，防止 .. 或链接跳出
+    """
+    root = root if root is not None else os.environ.get('BULK_IMPORT_ROOT', '')
+    if not root:
+        raise ImportRootError('服务器未配置 BULK_IMPORT_ROOT，不支持目录导入')
+    base = Path(root).resolve()
+    target = (base / directory).resolve()
+    if not target.is_relative_to(base):
+        raise ImportRootError(f'目录不在导入根目录内: {directory}')
+    if not target.is_dir():
+        raise ImportRootError(f'目录不存在: {directory}')
+    return target
@@ -0,0 +1,89 @@
+"""
+热门章节缓存 - 按 (书籍, 章节, 格式) 保存已序列化好的章节响应
+- 命中时直接把字节写给客户端，不读书籍 JSON、不做 JSON 解析和序列化
+- 按响应的实际字节数计入总预算，超出时淘汰最久未用的章节
+- 书籍删除、重新保存 (重新上传) 或重建目录时按书籍失效；
+  进度同步只改阅读位置，不影响缓存
+- 预算可用环境变量 CHAPTER_CACHE_MAX_BYTES 配置，0 表示关闭
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def encode_json(payload) -> bytes:
+    """与 FastAPI JSONResponse 相同的序列化方式"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class ChapterCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # 单章超过总预算的 1/8 不缓存，避免一章挤掉整本书
+        self.max_entry_bytes = max_bytes // 8
+        self._entries: 'OrderedDict[Tuple[str, int, str], bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, book_id: str, index: int, fmt: str) -> Optional[bytes]:
+        key = (book_id, index, fmt)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, book_id: str, index: int, fmt: str, body: bytes) -> bool:
+        """缓存一章的响应字节；过大时不缓存，返回 False"""
+        if len(body) > self.max_entry_bytes:
+            return False
+        key = (book_id, index, fmt)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, book_id: str, index: Optional[int] = None):
+        """删除一本书 (或其中一章) 的所有格式"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == book_id and (index is None or k[1] == index)]:
+                self._bytes -= len(self._entries.pop(key))
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'books': len({k[0] for k in self._entries}),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def chapter_cache_from_env() -> ChapterCache:
+    return ChapterCache(int(os.environ.get('CHAPTER_CACHE_MAX_BYTES', str(DEFAULT_MAX_BYTES))))
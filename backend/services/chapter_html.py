@@ -0,0 +1,260 @@
+"""
+富文本章节 - 把 EPUB 章节的 XHTML 处理成可以直接插入阅读页的 HTML 片段
+- 清理：按白名单保留标签和属性 (不认识的标签去掉外壳、保留内容)，
+  脚本、表单、内嵌框架、SVG 动画、MathML 及其他带命名空间前缀的元素连同内容去掉，
+  链接只允许 http/https/mailto 和书内资源
+- 压缩：去掉注释，合并空白 (pre 内保持原样)，只保留 <body> 内容
+- 改写：相对的 src/href 指向 /api/books/{id}/asset/... (原始 EPUB 中的资源)，
+  指向其他章节的链接改成 data-chapter + 锚点，交给阅读页跳转
+- 结果带 RENDER_VERSION，清理规则变化后已缓存的章节会重新生成
+"""
+import html as html_lib
+import posixpath
+import re
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote, urlsplit
+
+from bs4 import BeautifulSoup, Comment, Declaration, Doctype, NavigableString, ProcessingInstruction
+
+from services.epub_assets import normalize_member
+
+RENDER_VERSION = 2
+
+# 允许的 HTML 标签；不在白名单的标签去掉外壳，内容按同样的规则处理
+ALLOWED_TAGS = {
+    'a', 'abbr', 'article', 'aside', 'b', 'bdi', 'bdo', 'blockquote', 'br', 'caption', 'cite', 'code',
+    'col', 'colgroup', 'dd', 'del', 'dfn', 'div', 'dl', 'dt', 'em', 'figcaption', 'figure', 'footer',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'main', 'mark',
+    'nav', 'ol', 'p', 'pre', 'q', 'rp', 'rt', 'ruby', 's', 'samp', 'section', 'small', 'span', 'strong',
+    'style', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'time', 'tr', 'u', 'ul',
+    'var', 'wbr',
+}
+# 只在 <svg> 内允许的标签 (插图、封面常用的静态图形)
+SVG_TAGS = {
+    'svg', 'g', 'image', 'rect', 'circle', 'ellipse', 'line', 'polyline', 'polygon', 'path',
+    'text', 'tspan', 'desc',
+}
+# 文档结构：保留用于定位 body，输出时只取 body 内容
+STRUCTURE_TAGS = {'html', 'head', 'body'}
+# 整个元素 (连同内容) 去掉；另外带命名空间前缀的元素 (m:math、epub:switch 等) 也整个去掉
+DROP_TAGS = {
+    'script', 'noscript', 'iframe', 'frame', 'frameset', 'noframes', 'object', 'embed', 'applet',
+    'form', 'input', 'button', 'select', 'textarea', 'option', 'base', 'meta', 'title', 'link',
+    'template', 'xmp', 'plaintext', 'noembed', 'math', 'foreignobject', 'use',
+    'animate', 'animatemotion', 'animatetransform', 'animatecolor', 'set', 'audio', 'video',
+    'source', 'track', 'canvas', 'dialog', 'slot',
+}
+
+GLOBAL_ATTRS = {'id', 'class', 'title', 'lang', 'xml:lang', 'dir', 'style', 'role', 'epub:type'}
+TAG_ATTRS = {
+    'a': {'href'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'blockquote': {'cite'},
+    'q': {'cite'},
+    'del': {'cite', 'datetime'},
+    'ins': {'cite', 'datetime'},
+    'time': {'datetime'},
+    'ol': {'start', 'type', 'reversed'},
+    'li': {'value'},
+    'td': {'colspan', 'rowspan', 'align', 'valign'},
+    'th': {'colspan', 'rowspan', 'align', 'valign', 'scope'},
+    'col': {'span', 'width'},
+    'colgroup': {'span', 'width'},
+    'svg': {'width', 'height', 'viewbox', 'preserveaspectratio', 'version'},
+    'image': {'xlink:href', 'href', 'x', 'y', 'width', 'height', 'preserveaspectratio', 'transform'},
+}
+_SVG_SHAPE_ATTRS = {
+    'x', 'y', 'dx', 'dy', 'cx', 'cy', 'r', 'rx', 'ry', 'x1', 'y1', 'x2', 'y2', 'width', 'height',
+    'points', 'd', 'fill', 'fill-rule', 'stroke', 'stroke-width', 'opacity', 'transform',
+    'font-size', 'font-family', 'text-anchor',
+}
+for _tag in SVG_TAGS - {'svg', 'image'}:
+    TAG_ATTRS[_tag] = _SVG_SHAPE_ATTRS
+URL_ATTRS = ('src', 'href', 'xlink:href', 'cite')
+SAFE_SCHEMES = {'http', 'https', 'mailto'}
+# 这些元素之间的空白不影响排版，直接去掉
+BLOCK_TAGS = {
+    'html', 'head', 'body', 'div', 'section', 'article', 'aside', 'header', 'footer', 'nav',
+    'p', 'blockquote', 'figure', 'figcaption', 'ul', 'ol', 'li', 'dl', 'dt', 'dd',
+    'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th', 'caption', 'colgroup', 'col',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'br', 'svg', 'pre', 'style',
+}
+PRESERVE_SPACE_TAGS = {'pre', 'code', 'style'}
+
+_WHITESPACE = re.compile(r'\s+')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)', re.IGNORECASE)
+_CSS_IMPORT = re.compile(r'@import[^;]*;?', re.IGNORECASE)
+_CSS_EXPRESSION = re.compile(r'expression\s*\(|javascript:|behavior\s*:|-moz-binding', re.IGNORECASE)
+
+
+def asset_url_for(book_id: str) -> Callable[[str], str]:
+    """ZIP 成员名 -> 该书的资源 URL"""
+    prefix = f"/api/books/{quote(book_id, safe='')}/asset/"
+    return lambda member: prefix + quote(member)
+
+
+class _Rewriter:
+    def __init__(self, chapter_path: str, asset_url: Optional[Callable[[str], str]],
+                 spine: Optional[Dict[str, int]], index: Optional[int]):
+        self.chapter_path = chapter_path
+        self.base_dir = posixpath.dirname(chapter_path)
+        self.asset_url = asset_url
+        self.spine = spine or {}
+        self.index = index if index is not None else self.spine.get(chapter_path)
+
+    def member(self, path: str) -> Optional[str]:
+        return normalize_member(posixpath.join(self.base_dir, path))
+
+    def url(self, value: str, allow_data_image: bool = False) -> Optional[str]:
+        """资源 URL：相对路径改写到资源接口，不安全的协议返回 None"""
+        value = value.strip()
+        parts = urlsplit(value)
+        if parts.scheme:
+            if parts.scheme.lower() in SAFE_SCHEMES:
+                return value
+            if allow_data_image and value[:11].lower() == 'data:image/' and 'svg' not in value[:20].lower():
+                return value
+            return None
+        if value.startswith('#') or value.startswith('//') or not parts.path or self.asset_url is None:
+            return value if not value.startswith('//') else None
+        name = self.member(parts.path)
+        if name is None:
+            return None
+        return self.asset_url(name) + (f"#{parts.fragment}" if parts.fragment else '')
+
+    def link(self, tag, value: str):
+        """<a href>：章节内锚点保持，其他章节 (含同一文件切分出的章节) 改成 data-chapter，其余按资源处理"""
+        parts = urlsplit(value.strip())
+        if not parts.scheme and self.spine and (parts.path or parts.fragment):
+            name = self.member(parts.path) if parts.path else self.chapter_path
+            target = self.spine.get(f"{name}#{parts.fragment}", self.spine.get(name))
+            if target is not None:
+                if target != self.index:
+                    tag['data-chapter'] = str(target)
+                tag['href'] = f"#{parts.fragment}" if parts.fragment else '#'
+                return
+        rewritten = self.url(value)
+        if rewritten is None:
+            del tag['href']
+        else:
+            tag['href'] = rewritten
+
+    def css(self, text: str) -> str:
+        text = _CSS_IMPORT.sub('', text)
+        text = _CSS_EXPRESSION.sub('', text)
+
+        def replace(match):
+            rewritten = self.url(match.group(2), allow_data_image=True)
+            return f'url("{rewritten}")' if rewritten else 'none'
+        return _CSS_URL.sub(replace, text)
+
+
+def _sanitize(soup: BeautifulSoup, rewriter: _Rewriter):
+    for node in soup.find_all(string=lambda s: isinstance(s, (Comment, Declaration, Doctype, ProcessingInstruction))):
+        node.extract()
+
+    for tag in soup.find_all(True):
+        if tag.decomposed:
+            continue
+        name = tag.name.lower()
+        in_svg = name != 'svg' and tag.find_parent('svg') is not None
+        if ':' in name or name in DROP_TAGS or (name == 'style' and in_svg):
+            # 外来命名空间的内容在浏览器重新解析时规则不同 (mXSS)，连同内容去掉
+            tag.decompose()
+            continue
+        if name in STRUCTURE_TAGS:
+            tag.attrs = {}
+            continue
+        if name not in ALLOWED_TAGS and not (name in SVG_TAGS and (in_svg or name == 'svg')):
+            tag.unwrap()
+            continue
+
+        allowed = GLOBAL_ATTRS | TAG_ATTRS.get(name, set())
+        for attr in list(tag.attrs):
+            if attr.lower() not in allowed:
+                del tag[attr]
+        for attr in URL_ATTRS:
+            if attr not in tag.attrs:
+                continue
+            value = tag[attr]
+            if isinstance(value, list):
+                value = ' '.join(value)
+            if name == 'a' and attr == 'href':
+                rewriter.link(tag, value)
+                continue
+            rewritten = rewriter.url(value, allow_data_image=attr != 'href')
+            if rewritten is None:
+                del tag[attr]
+            else:
+                tag[attr] = rewritten
+        if 'style' in tag.attrs:
+            tag['style'] = rewriter.css(tag['style'])
+        if name == 'style':
+            css = rewriter.css(tag.get_text())
+            if '<' in css:
+                # 样式表里不会出现 <，出现时多半是想跳出 <style> 的标签
+                tag.decompose()
+            else:
+                tag.string = css
+
+
+def _minify(root):
+    # 去掉注释等节点后相邻的文本先合并
+    root.smooth()
+    for node in list(root.find_all(string=True)):
+        if not isinstance(node, NavigableString):
+            continue
+        if any(parent.name in PRESERVE_SPACE_TAGS for parent in node.parents):
+            continue
+        text = _WHITESPACE.sub(' ', str(node))
+        if text == ' ' and node.parent is not None and node.parent.name in BLOCK_TAGS:
+            # 块级元素之间的换行缩进
+            prev, nxt = node.previous_sibling, node.next_sibling
+            if (prev is None or getattr(prev, 'name', None) in BLOCK_TAGS) and \
+                    (nxt is None or getattr(nxt, 'name', None) in BLOCK_TAGS):
+                node.extract()
+                continue
+        if text != str(node):
+            node.replace_with(text)
+
+
+def render_chapter_html(raw_html: str, chapter_path: str,
+                        asset_url: Optional[Callable[[str], str]] = None,
+                        spine: Optional[Dict[str, int]] = None, index: Optional[int] = None) -> Dict:
+    """
+    raw_html: 章节 XHTML 原文；chapter_path: 章节在 ZIP 中的路径 (相对链接以它为基准)
+    asset_url: ZIP 成员名 -> URL，省略时相对链接保持不变 (只清理和压缩)
+    spine: 各章节 ZIP 路径 (或 路径#锚点) -> 章节序号，用于改写章节间链接；index: 本章序号
+    返回 {'html': <body> 内的 HTML 片段, 'styles': [样式表 URL], 'version': RENDER_VERSION}
+    """
+    soup = BeautifulSoup(raw_html, 'html.parser')
+    rewriter = _Rewriter(normalize_member(chapter_path) or '', asset_url, spine, index)
+
+    styles: List[str] = []
+    for link in soup.find_all('link'):
+        rel = link.get('rel') or []
+        rel = rel if isinstance(rel, list) else rel.split()
+        href = link.get('href')
+        if href and 'stylesheet' in [r.lower() for r in rel]:
+            url = rewriter.url(href)
+            if url and url not in styles:
+                styles.append(url)
+
+    _sanitize(soup, rewriter)
+    body = soup.find('body') or soup
+    if body is not soup:
+        # <head> 中的内联样式挪到片段开头，其余 head 内容丢弃
+        head_styles = [tag.extract() for tag in soup.find_all('style') if tag.find_parent('body') is None]
+        for style in reversed(head_styles):
+            body.insert(0, style)
+    _minify(body)
+
+    html = body.decode_contents() if body is not soup else str(soup)
+    return {'html': html.strip(), 'styles': styles, 'version': RENDER_VERSION}
+
+
+def render_text_html(text: str) -> Dict:
+    """没有原始 EPUB 的书籍 (TXT 等)：每行一个段落"""
+    paragraphs = [line.strip() for line in (text or '').split('\n') if line.strip()]
+    return {'html': ''.join(f"<p>{html_lib.escape(line, quote=False)}</p>" for line in paragraphs),
+            'styles': [], 'version': RENDER_VERSION}
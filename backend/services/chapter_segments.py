@@ -0,0 +1,137 @@
+"""
+章节朗读分段索引 - 按引用合成 (书籍/章节/句子或字符范围) 使用
+- 整章做一次确定性切分，任何范围都映射到覆盖它的整段，
+  不同设备、不同分页请求同一位置时得到相同的段，缓存键一致
+- 段 id = "{章节}-{段号}-{段文本哈希前 8 位}"，书籍重新上传导致文本变化时旧 id 失效
+- 最近使用的章节索引保留在内存中，书籍 JSON 修改时间变化后重建
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+from services.text_segmenter import sentence_spans, split_segments_with_spans
+
+DEFAULT_MAX_CHAPTERS = 64
+# 单次按引用合成最多覆盖的段数
+MAX_SEGMENTS_PER_REQUEST = 50
+
+
+class SegmentRangeError(ValueError):
+    """范围无效或超出章节"""
+
+
+class StaleSegmentError(SegmentRangeError):
+    """段 id 与当前章节文本不符 (书籍已更新)"""
+
+
+def segment_digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]
+
+
+class ChapterSegments:
+    def __init__(self, chapter: int, text: str):
+        self.chapter = chapter
+        self.length = len(text)
+        self.sentences = sentence_spans(text)
+        self.segments = split_segments_with_spans(text)
+        self.ids = [f"{chapter}-{i}-{segment_digest(segment)}" for i, (_, _, segment) in enumerate(self.segments)]
+
+    def text(self, index: int) -> str:
+        return self.segments[index][2]
+
+    def resolve(self, sentences: Optional[Sequence[int]] = None, chars: Optional[Sequence[int]] = None,
+                segment_ids: Optional[Sequence[str]] = None) -> List[int]:
+        """
+        把请求的范围映射到覆盖它的段号 (按顺序)
+        sentences / chars 为 [start, end) 区间；segment_ids 为段 id 列表
+        """
+        if segment_ids is not None:
+            indexes = [self._index_of(segment_id) for segment_id in segment_ids]
+        elif sentences is not None:
+            start, end = self._bounds(sentences, len(self.sentences), '句子')
+            indexes = self._overlapping(self.sentences[start][0], self.sentences[end - 1][1])
+        elif chars is not None:
+            start, end = self._bounds(chars, self.length, '字符')
+            indexes = self._overlapping(start, end)
+        else:
+            raise SegmentRangeError('需要 sentences、chars 或 segment_ids')
+
+        if not indexes:
+            raise SegmentRangeError('范围内没有可朗读的文本')
+        if len(indexes) > MAX_SEGMENTS_PER_REQUEST:
+            raise SegmentRangeError(f'范围过大：{len(indexes)} 段，单次最多 {MAX_SEGMENTS_PER_REQUEST} 段')
+        return indexes
+
+    def _index_of(self, segment_id: str) -> int:
+        try:
+            chapter, index, _ = str(segment_id).split('-')
+            chapter, index = int(chapter), int(index)
+        except ValueError:
+            raise SegmentRangeError(f'无效的段 id: {segment_id}') from None
+        if chapter != self.chapter or not 0 <= index < len(self.segments):
+            raise SegmentRangeError(f'段 id 不属于本章: {segment_id}')
+        if self.ids[index] != segment_id:
+            raise StaleSegmentError(f'段 id 已过期 (章节内容已更新): {segment_id}')
+        return index
+
+    @staticmethod
+    def _bounds(bounds: Sequence[int], limit: int, name: str) -> Tuple[int, int]:
+        try:
+            start, end = (int(v) for v in bounds)
+        except (TypeError, ValueError):
+            raise SegmentRangeError(f'{name}范围必须是 [start, end]') from None
+        if not 0 <= start < end <= limit:
+            raise SegmentRangeError(f'{name}范围越界: [{start}, {end})，共 {limit}')
+        return start, end
+
+    def _overlapping(self, start: int, end: int) -> List[int]:
+        return [i for i, (seg_start, seg_end, _) in enumerate(self.segments) if seg_end > start and seg_start < end]
+
+    def describe(self, index: int) -> dict:
+        start, end, text = self.segments[index]
+        return {'id': self.ids[index], 'start': start, 'end': end, 'text': text}
+
+
+class ChapterSegmentIndex:
+    """
+    book_version: book_id -> 版本号 (如书籍内容签名)，书籍不存在时为 None
+    load_text: (book_id, chapter) -> 章节正文，章节不存在时为 None
+    命中且版本未变时不读取正文
+    """
+
+    def __init__(self, book_version: Callable[[str], Optional[Hashable]],
+                 load_text: Callable[[str, int], Optional[str]], max_chapters: int = DEFAULT_MAX_CHAPTERS):
+        self.book_version = book_version
+        self.load_text = load_text
+        self.max_chapters = max_chapters
+        self._cache: 'OrderedDict[Tuple[str, int], Tuple[Hashable, ChapterSegments]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, book_id: str, chapter: int) -> Optional[ChapterSegments]:
+        version = self.book_version(book_id)
+        if version is None:
+            self.invalidate(book_id)
+            return None
+        key = (book_id, chapter)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        text = self.load_text(book_id, chapter)
+        if text is None:
+            return None
+        segments = ChapterSegments(chapter, text)
+        with self._lock:
+            self._cache[key] = (version, segments)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_chapters:
+                self._cache.popitem(last=False)
+        return segments
+
+    def invalidate(self, book_id: str, chapter: Optional[int] = None):
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == book_id and (chapter is None or k[1] == chapter)]:
+                del self._cache[key]
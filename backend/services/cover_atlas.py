@@ -0,0 +1,148 @@
+"""
+书架封面图集 - 把一页书籍的封面缩略图拼成一张图，配合坐标表使用
+- 冷启动时书架一次请求拿到整页封面，代替几十个单独的封面请求
+- 图集按封面集合的哈希命名 (书籍 id + 封面文件名/大小/修改时间)：
+  任何一本书的封面变化都会得到新的哈希，旧图集不再被引用，按数量上限淘汰
+- 每格按 CSS object-fit: cover 的方式裁切填满
+- 需要 Pillow
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 书架格子约 180-220px 宽，按 240x360 拼图兼顾清晰度和体积
+DEFAULT_TILE = (240, 360)
+DEFAULT_COLUMNS = 10
+DEFAULT_MAX_ATLASES = 64
+ATLAS_FORMATS = {
+    'webp': {'pil': 'WEBP', 'media_type': 'image/webp', 'options': {'quality': 80, 'method': 4}},
+    'jpeg': {'pil': 'JPEG', 'media_type': 'image/jpeg', 'options': {'quality': 85, 'optimize': True}},
+}
+BACKGROUND = (241, 245, 249)
+
+
+class AtlasUnavailable(Exception):
+    """没有安装 Pillow，无法生成图集"""
+
+
+class CoverAtlas:
+    def __init__(self, atlas_dir: Path, tile: Tuple[int, int] = DEFAULT_TILE, columns: int = DEFAULT_COLUMNS,
+                 max_atlases: int = DEFAULT_MAX_ATLASES):
+        self.atlas_dir = Path(atlas_dir)
+        self.atlas_dir.mkdir(parents=True, exist_ok=True)
+        self.tile = tile
+        self.columns = columns
+        self.max_atlases = max_atlases
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def _digest(self, covers: Sequence[Tuple[str, Path]], fmt: str) -> str:
+        parts = []
+        for book_id, path in covers:
+            stat = path.stat()
+            parts.append([book_id, path.name, stat.st_size, stat.st_mtime_ns])
+        payload = json.dumps({'tile': self.tile, 'columns': self.columns, 'format': fmt, 'covers': parts})
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def layout(self, count: int) -> Tuple[int, int]:
+        columns = min(self.columns, max(count, 1))
+        rows = (count + columns - 1) // columns if count else 0
+        return columns, rows
+
+    def get(self, covers: Sequence[Tuple[str, Path]], fmt: str = 'webp') -> Dict:
+        """
+        covers: [(book_id, 封面缩略图路径)]，按书架顺序
+        返回 {name, width, height, tile, columns, tiles: {book_id: {x, y}}}；图集已存在时直接复用
+        """
+        if Image is None:
+            raise AtlasUnavailable('未安装 Pillow，无法生成封面图集')
+        if fmt not in ATLAS_FORMATS:
+            raise ValueError(f'未知的图集格式: {fmt}')
+
+        columns, rows = self.layout(len(covers))
+        width, height = self.tile
+        result = {
+            'name': f"{self._digest(covers, fmt)}.{fmt}",
+            'width': columns * width,
+            'height': rows * height,
+            'tile': {'width': width, 'height': height},
+            'columns': columns,
+            'tiles': {book_id: {'x': (i % columns) * width, 'y': (i // columns) * height}
+                      for i, (book_id, _) in enumerate(covers)},
+        }
+        path = self.atlas_dir / result['name']
+
+        # 相同图集并发请求时只生成一次
+        with self._lock:
+            building = self._building.setdefault(result['name'], threading.Lock())
+        with building:
+            if path.exists():
+                self.hits += 1
+                os.utime(path)
+            else:
+                self._build(covers, columns, rows, fmt, path)
+                self.builds += 1
+        with self._lock:
+            self._building.pop(result['name'], None)
+            self._prune()
+        return result
+
+    def _build(self, covers: Sequence[Tuple[str, Path]], columns: int, rows: int, fmt: str, path: Path):
+        width, height = self.tile
+        spec = ATLAS_FORMATS[fmt]
+        atlas = Image.new('RGB', (columns * width, max(rows, 1) * height), BACKGROUND)
+        for i, (book_id, cover_path) in enumerate(covers):
+            try:
+                with Image.open(cover_path) as image:
+                    image = image.convert('RGBA')
+                    tile = ImageOps.fit(image, self.tile, Image.LANCZOS)
+            except Exception as e:
+                logger.warning(f"⚠️ 书籍 {book_id} 封面无法读取，图集中留空: {e}")
+                continue
+            atlas.paste(tile, ((i % columns) * width, (i // columns) * height), tile)
+
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        atlas.save(tmp_path, spec['pil'], **spec['options'])
+        os.replace(tmp_path, path)
+        logger.info(f"🧩 封面图集已生成: {path.name} ({len(covers)} 本, {path.stat().st_size / 1024:.0f}KB)")
+
+    def _prune(self):
+        """只保留最近使用的 max_atlases 张图集"""
+        atlases = [p for p in self.atlas_dir.iterdir() if p.suffix.lstrip('.') in ATLAS_FORMATS]
+        if len(atlases) <= self.max_atlases:
+            return
+        atlases.sort(key=lambda p: p.stat().st_mtime)
+        for path in atlases[:len(atlases) - self.max_atlases]:
+            path.unlink(missing_ok=True)
+
+    def resolve(self, name: str) -> Optional[Path]:
+        if '/' in name or '\\' in name or name.startswith('.') or name.rsplit('.', 1)[-1] not in ATLAS_FORMATS:
+            return None
+        path = self.atlas_dir / name
+        return path if path.is_file() else None
+
+    @staticmethod
+    def media_type(name: str) -> str:
+        return ATLAS_FORMATS[name.rsplit('.', 1)[-1]]['media_type']
+
+    def stats(self) -> Dict:
+        atlases = [p for p in self.atlas_dir.iterdir() if p.suffix.lstrip('.') in ATLAS_FORMATS]
+        return {
+            'atlases': len(atlases),
+            'bytes': sum(p.stat().st_size for p in atlases),
+            'hits': self.hits,
+            'builds': self.builds,
+        }
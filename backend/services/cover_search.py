@@ -1,73 +1,417 @@
+"""
+在线封面搜索
+策略：优先 Google Books，失败后尝试 OpenLibrary
+- 查询结果按规范化的书名 + 作者持久化缓存：找到的封面缓存较久，没找到的缓存较短，
+  上游出错 (超时/5xx/限流) 不缓存
+- 每个上游主机单独限速，429 时按 Retry-After 暂停该主机
+- 各 API 地址可通过环境变量配置 (便于接入本地桩服务测试)
+- 批量匹配：有上限的并发，逐本报告进度
+"""
 import aiohttp
 import asyncio
-from typing import Optional
+import json
 import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from services.http_sessions import get_http_sessions
 
 logger = logging.getLogger(__name__)
 
-async def search_cover_online(title: str, author: str = "") -> Optional[str]:
+GOOGLE_BOOKS_URL = 'https://www.googleapis.com/books/v1/volumes'
+OPENLIBRARY_SEARCH_URL = 'https://openlibrary.org/search.json'
+OPENLIBRARY_COVERS_URL = 'https://covers.openlibrary.org/b/id'
+
+SOURCE_GOOGLE = 'google'
+SOURCE_OPENLIBRARY = 'openlibrary'
+
+DEFAULT_CACHE_PATH = Path('data/cover_lookup.json')
+# 找到的封面 30 天内不再查询；没找到的 1 天后重试 (书目数据会更新)
+DEFAULT_POSITIVE_TTL = 30 * 86400
+DEFAULT_NEGATIVE_TTL = 86400
+
+# 每秒请求数；OpenLibrary 要求批量调用方自行限速
+DEFAULT_HOST_RATES = {
+    'www.googleapis.com': 2.0,
+    'openlibrary.org': 1.0,
+    'covers.openlibrary.org': 2.0,
+}
+DEFAULT_RATE = 2.0
+DEFAULT_BATCH_CONCURRENCY = 4
+
+SEARCH_TIMEOUT = 5
+DOWNLOAD_TIMEOUT = 10
+
+
+class LookupFailed(Exception):
+    """上游出错，结果未知 (不写入缓存)"""
+
+
+def normalize_key(title: str, author: str = "") -> str:
     """
-    在线搜索书籍封面
-    策略：优先 Google Books，失败后尝试 OpenLibrary
+    缓存键：全角转半角、小写、去掉扩展名和括号内容、合并空白与标点
+    "三体（刘慈欣）.epub" 和 "三体" 得到相同的书名部分
     """
-    if not title:
-        return None
-        
-    # 清理标题 (去除扩展名等)
-    clean_title = title.replace(".epub", "").replace(".txt", "").split("(")[0].strip()
-    clean_author = author.replace("Unknown", "").strip() if author else ""
-    
-    logger.info(f"正在搜索封面: {clean_title} {clean_author}")
-    
-    async with aiohttp.ClientSession() as session:
-        # 1. 尝试 Google Books API
+    def clean(value: str) -> str:
+        value = unicodedata.normalize('NFKC', value or '').lower()
+        value = re.sub(r'\.(epub|txt)$', '', value.strip())
+        value = re.sub(r'[(\[【].*?[)\]】]', ' ', value)
+        value = re.sub(r'[\W_]+', ' ', value)
+        return value.strip()
+
+    author = clean(author)
+    if author in ('unknown', '未知作者'):
+        author = ''
+    return f"{clean(title)}|{author}"
+
+
+def clean_query(title: str, author: str = ""):
+    """用于 API 查询的书名和作者 (去除扩展名、括号后缀和占位作者)"""
+    clean_title = title.replace(".epub", "").replace(".txt", "").split("(")[0].split("（")[0].strip()
+    clean_author = (author or "").replace("Unknown", "").replace("未知作者", "").strip()
+    return clean_title, clean_author
+
+
+class CoverLookupCache:
+    """
+    key -> {'url': 封面 URL (没找到为 None), 'source', 'at': 写入时间}
+    写入只标记有变化，由 flush 定期/批量结束时原子地落盘 (可在线程中调用)，
+    加载时丢弃已过期的条目
+    """
+
+    def __init__(self, path: Path, positive_ttl: float = DEFAULT_POSITIVE_TTL,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL, clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._entries: Dict[str, Dict] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._load()
+
+    def _expired(self, entry: Dict) -> bool:
+        ttl = self.positive_ttl if entry.get('url') else self.negative_ttl
+        return self.clock() - entry.get('at', 0) >= ttl
+
+    def _load(self):
+        if not self.path.exists():
+            return
         try:
-            query = f"intitle:{clean_title}"
-            if clean_author:
-                query += f"+inauthor:{clean_author}"
-                
-            url = f"https://www.googleapis.com/books/v1/volumes?q={query}&maxResults=1"
-            async with session.get(url, timeout=5) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    if "items" in data and len(data["items"]) > 0:
-                        volume_info = data["items"][0].get("volumeInfo", {})
-                        image_links = volume_info.get("imageLinks", {})
-                        # 优先取大图
-                        cover_url = image_links.get("thumbnail") or image_links.get("smallThumbnail")
-                        if cover_url:
-                            # Google Books 返回的 URL 经常是 http，强制转 https
-                            return cover_url.replace("http://", "https://")
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('entries', {})
         except Exception as e:
-            logger.warning(f"Google Books 搜索失败: {e}")
+            logger.warning(f"封面查询缓存损坏，将重建: {e}")
+            return
+        self._entries = {k: v for k, v in entries.items() if not self._expired(v)}
 
-        # 2. 尝试 OpenLibrary API
+    def flush(self):
+        """把缓存原子地写回磁盘 (只在有变化时)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
         try:
-            query = f"title={clean_title}"
-            if clean_author:
-                query += f"&author={clean_author}"
-                
-            url = f"https://openlibrary.org/search.json?{query}&limit=1"
-            async with session.get(url, timeout=5) as resp:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            self._dirty = True
+            raise
+
+    def get(self, key: str) -> Optional[Dict]:
+        """未过期的条目；没有时为 None"""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry):
+            self.misses += 1
+            return None
+        if entry.get('url'):
+            self.hits += 1
+        else:
+            self.negative_hits += 1
+        return entry
+
+    def put(self, key: str, url: Optional[str], source: Optional[str] = None):
+        with self._lock:
+            self._entries[key] = {'url': url, 'source': source, 'at': self.clock()}
+            self._dirty = True
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+    def stats(self) -> Dict:
+        positive = sum(1 for e in self._entries.values() if e.get('url'))
+        return {
+            'entries': len(self._entries),
+            'positive': positive,
+            'negative': len(self._entries) - positive,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+        }
+
+
+class HostRateLimiter:
+    """按主机 (host:port) 限制请求速率；同一主机的请求排队依次放行"""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, default_rate: float = DEFAULT_RATE):
+        self.rates = dict(DEFAULT_HOST_RATES if rates is None else rates)
+        self.default_rate = default_rate
+        self._next: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.waited = 0.0
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).netloc
+
+    def _interval(self, host: str) -> float:
+        rate = self.rates.get(host, self.rates.get(host.split(':')[0], self.default_rate))
+        return 1.0 / rate if rate > 0 else 0.0
+
+    async def acquire(self, url: str):
+        host = self.host_of(url)
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            wait = self._next.get(host, 0.0) - now
+            if wait > 0:
+                self.waited += wait
+                await asyncio.sleep(wait)
+                now += wait
+            self._next[host] = now + self._interval(host)
+
+    def penalize(self, url: str, seconds: float):
+        """上游限流：该主机暂停 seconds 秒"""
+        host = self.host_of(url)
+        self._next[host] = max(self._next.get(host, 0.0), time.monotonic() + seconds)
+        logger.warning(f"⏳ {host} 限流，暂停 {seconds:.0f} 秒")
+
+
+def parse_host_rates(value: str) -> Dict[str, float]:
+    """"www.googleapis.com=2,openlibrary.org=1" -> {host: 每秒请求数}"""
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            host, rate = item.split('=', 1)
+            rates[host.strip()] = float(rate)
+    return rates
+
+
+class CoverSearch:
+    def __init__(self, cache: CoverLookupCache, limiter: Optional[HostRateLimiter] = None,
+                 google_url: str = GOOGLE_BOOKS_URL, openlibrary_url: str = OPENLIBRARY_SEARCH_URL,
+                 openlibrary_covers_url: str = OPENLIBRARY_COVERS_URL, session_name: str = 'covers'):
+        self.cache = cache
+        self.limiter = limiter or HostRateLimiter()
+        self.google_url = google_url
+        self.openlibrary_url = openlibrary_url
+        self.openlibrary_covers_url = openlibrary_covers_url.rstrip('/')
+        self.session_name = session_name
+        # 相同书名的并发查询只调用一次上游
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+
+    async def lookup(self, title: str, author: str = "") -> Optional[Dict]:
+        """
+        查找封面，返回 {url, source, cached}；确定没有封面时返回 None
+        上游出错且没有缓存时抛 LookupFailed
+        """
+        if not title:
+            return None
+        key = normalize_key(title, author)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return {'url': entry['url'], 'source': entry.get('source'), 'cached': True} if entry['url'] else None
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._search(key, title, author))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _search(self, key: str, title: str, author: str) -> Optional[Dict]:
+        clean_title, clean_author = clean_query(title, author)
+        logger.info(f"正在搜索封面: {clean_title} {clean_author}")
+
+        failures = []
+        for source, provider in ((SOURCE_GOOGLE, self._google), (SOURCE_OPENLIBRARY, self._openlibrary)):
+            try:
+                url = await provider(clean_title, clean_author)
+            except LookupFailed as e:
+                failures.append(f"{source}: {e}")
+                continue
+            if url:
+                self.cache.put(key, url, source)
+                return {'url': url, 'source': source, 'cached': False}
+
+        if failures:
+            # 结果未知，不缓存，下次重试
+            self.errors += 1
+            raise LookupFailed('; '.join(failures))
+        self.cache.put(key, None)
+        return None
+
+    async def _get_json(self, url: str, params: Dict) -> Dict:
+        await self.limiter.acquire(url)
+        host = self.limiter.host_of(url)
+        self.requests[host] = self.requests.get(host, 0) + 1
+        session = get_http_sessions().get(self.session_name)
+        try:
+            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=SEARCH_TIMEOUT)) as resp:
+                if resp.status == 429:
+                    self.limiter.penalize(url, float(resp.headers.get('Retry-After', '30') or 30))
+                    raise LookupFailed('限流 (429)')
+                if resp.status != 200:
+                    raise LookupFailed(f'HTTP {resp.status}')
+                return await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise LookupFailed(str(e) or type(e).__name__) from None
+
+    async def _google(self, title: str, author: str) -> Optional[str]:
+        query = f"intitle:{title}"
+        if author:
+            query += f" inauthor:{author}"
+        data = await self._get_json(self.google_url, {'q': query, 'maxResults': '1'})
+        for item in data.get('items') or []:
+            image_links = item.get('volumeInfo', {}).get('imageLinks', {})
+            # 优先取大图
+            cover_url = image_links.get('thumbnail') or image_links.get('smallThumbnail')
+            if cover_url:
+                # Google Books 返回的 URL 经常是 http，强制转 https (本地桩服务除外)
+                if self.google_url.startswith('https://'):
+                    cover_url = cover_url.replace('http://', 'https://')
+                return cover_url
+        return None
+
+    async def _openlibrary(self, title: str, author: str) -> Optional[str]:
+        params = {'title': title, 'limit': '1'}
+        if author:
+            params['author'] = author
+        data = await self._get_json(self.openlibrary_url, params)
+        for doc in data.get('docs') or []:
+            if doc.get('cover_i'):
+                return f"{self.openlibrary_covers_url}/{doc['cover_i']}-L.jpg"
+        return None
+
+    def forget(self, title: str, author: str = ""):
+        """缓存的封面地址已失效 (下载失败/不是图片)"""
+        self.cache.invalidate(normalize_key(title, author))
+
+    async def download(self, url: str) -> Optional[bytes]:
+        """下载图片数据"""
+        await self.limiter.acquire(url)
+        try:
+            session = get_http_sessions().get(self.session_name)
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as resp:
                 if resp.status == 200:
-                    data = await resp.json()
-                    if "docs" in data and len(data["docs"]) > 0:
-                        doc = data["docs"][0]
-                        cover_i = doc.get("cover_i")
-                        if cover_i:
-                            return f"https://covers.openlibrary.org/b/id/{cover_i}-L.jpg"
+                    return await resp.read()
+                if resp.status == 429:
+                    self.limiter.penalize(url, float(resp.headers.get('Retry-After', '30') or 30))
+                logger.error(f"图片下载失败 {url}: HTTP {resp.status}")
         except Exception as e:
-            logger.warning(f"OpenLibrary 搜索失败: {e}")
-            
-    return None
+            logger.error(f"图片下载失败 {url}: {e}")
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            'cache': self.cache.stats(),
+            'requests': dict(self.requests),
+            'errors': self.errors,
+            'rate_limit_wait': round(self.limiter.waited, 2),
+            'in_flight': len(self._inflight),
+        }
+
+
+async def match_many(book_ids: Iterable[str], match_one: Callable[[str], Awaitable[Optional[Dict]]],
+                     concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+                     on_result: Optional[Callable[[str, str, Optional[str]], None]] = None) -> Dict:
+    """
+    批量匹配封面：最多 concurrency 本同时进行 (各主机的速率另由限速器控制)
+    match_one 返回匹配结果或 None (没找到)；on_result(book_id, status, detail) 逐本回调
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    counts = {'matched': 0, 'missed': 0, 'failed': 0}
+
+    async def run(book_id: str):
+        async with semaphore:
+            try:
+                matched = await match_one(book_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                status, detail = 'failed', str(getattr(e, 'detail', None) or e)
+            else:
+                status, detail = ('matched', matched.get('url')) if matched else ('missed', None)
+        counts[status] += 1
+        if on_result:
+            on_result(book_id, status, detail)
+
+    book_ids: List[str] = list(book_ids)
+    await asyncio.gather(*(run(book_id) for book_id in book_ids))
+    return {'total': len(book_ids), **counts}
+
+
+def cover_search_from_env() -> CoverSearch:
+    cache = CoverLookupCache(
+        Path(os.environ.get('COVER_LOOKUP_CACHE', str(DEFAULT_CACHE_PATH))),
+        positive_ttl=float(os.environ.get('COVER_LOOKUP_POSITIVE_TTL', DEFAULT_POSITIVE_TTL)),
+        negative_ttl=float(os.environ.get('COVER_LOOKUP_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL)),
+    )
+    rates = {**DEFAULT_HOST_RATES, **parse_host_rates(os.environ.get('COVER_HOST_RATES', ''))}
+    return CoverSearch(
+        cache,
+        HostRateLimiter(rates, float(os.environ.get('COVER_DEFAULT_RATE', DEFAULT_RATE))),
+        google_url=os.environ.get('COVER_GOOGLE_BOOKS_URL', GOOGLE_BOOKS_URL),
+        openlibrary_url=os.environ.get('COVER_OPENLIBRARY_URL', OPENLIBRARY_SEARCH_URL),
+        openlibrary_covers_url=os.environ.get('COVER_OPENLIBRARY_COVERS_URL', OPENLIBRARY_COVERS_URL),
+    )
+
+
+def batch_concurrency_from_env() -> int:
+    return int(os.environ.get('COVER_BATCH_CONCURRENCY', str(DEFAULT_BATCH_CONCURRENCY)))
+
+
+# 全局实例
+_cover_search = None
+
+def get_cover_search() -> CoverSearch:
+    """获取封面搜索单例"""
+    global _cover_search
+    if _cover_search is None:
+        _cover_search = cover_search_from_env()
+    return _cover_search
+
+
+async def search_cover_online(title: str, author: str = "") -> Optional[str]:
+    """
+    在线搜索书籍封面 URL (带缓存)
+    没找到或上游出错时返回 None
+    """
+    try:
+        found = await get_cover_search().lookup(title, author)
+    except LookupFailed as e:
+        logger.warning(f"封面搜索失败: {e}")
+        return None
+    return found['url'] if found else None
+
 
 async def download_image(url: str) -> Optional[bytes]:
     """下载图片数据"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status == 200:
-                    return await resp.read()
-    except Exception as e:
-        logger.error(f"图片下载失败 {url}: {e}")
-    return None
+    return await get_cover_search().download(url)
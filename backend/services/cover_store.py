@@ -0,0 +1,242 @@
+"""
+封面衍生图 - 封面只提取一次保存为文件，并生成固定尺寸的缩略图
+- 原图按实际格式保存 (不再一律标成 jpeg)
+- list (书架网格) / detail (详情) 两种尺寸，各有 WebP 和 JPEG 两个版本
+- 文件名带内容哈希，URL 不变则内容不变，可长期缓存；更换封面时旧文件被删除
+- 书籍 JSON 只保存 URL：cover 为 list 尺寸 JPEG (所有客户端都能显示)，covers 为全部版本
+- 需要 Pillow；未安装时只保存原图，各尺寸都指向原图
+"""
+import base64
+import hashlib
+import io
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+COVERS_URL_PREFIX = '/covers'
+
+# 书架网格单元约 180-220px 宽，按 2 倍屏准备；详情页按 2 倍屏 400px 宽
+COVER_SIZES = {
+    'list': (360, 540),
+    'detail': (800, 1200),
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# 超过这个大小的原图不处理 (异常文件)
+MAX_COVER_BYTES = 20 * 1024 * 1024
+
+COVER_MEDIA_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+# {book_id}.{哈希}.{ext} 或 {book_id}.{哈希}.{尺寸}.{ext}
+_VERSIONED_NAME = re.compile(r'^[^.]+\.[0-9a-f]{12}(\.[a-z]+)?\.[a-z]+$')
+
+
+class CoverError(ValueError):
+    """不是可识别的图片"""
+
+
+def pillow_available() -> bool:
+    return Image is not None
+
+
+def sniff_image_format(data: bytes) -> Optional[str]:
+    """按文件头识别图片格式，返回扩展名"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def media_type_for_name(name: str) -> str:
+    return COVER_MEDIA_TYPES.get(name.rsplit('.', 1)[-1].lower(), 'application/octet-stream')
+
+
+def is_versioned_name(name: str) -> bool:
+    """带内容哈希的封面文件内容不会变"""
+    return bool(_VERSIONED_NAME.match(name))
+
+
+def decode_data_uri(value: str) -> bytes:
+    """data:image/...;base64,... -> 图片字节"""
+    try:
+        _, encoded = value.split(',', 1)
+        return base64.b64decode(encoded)
+    except ValueError as e:
+        raise CoverError(f'无效的 data URI: {e}') from None
+
+
+def data_uri(data: bytes, media_type: Optional[str] = None) -> str:
+    """按实际格式生成 data URI (只用于不落盘的解析接口)"""
+    media_type = media_type or COVER_MEDIA_TYPES.get(sniff_image_format(data) or '', 'image/jpeg')
+    return f"data:{media_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+class CoverStore:
+    def __init__(self, covers_dir: Path, url_prefix: str = COVERS_URL_PREFIX):
+        self.covers_dir = Path(covers_dir)
+        self.covers_dir.mkdir(parents=True, exist_ok=True)
+        self.url_prefix = url_prefix
+
+    def _url(self, path: Path) -> str:
+        return f"{self.url_prefix}/{path.name}"
+
+    def save(self, book_id: str, data: bytes) -> Dict:
+        """
+        保存封面原图并生成缩略图，返回要写入书籍 JSON 的字段 {cover, covers}
+        同一本书的旧封面文件会被删除
+        """
+        if not data:
+            raise CoverError('封面为空')
+        if len(data) > MAX_COVER_BYTES:
+            raise CoverError(f'封面过大: {len(data) / 1024 / 1024:.1f}MB')
+        ext = sniff_image_format(data)
+        if ext is None:
+            raise CoverError('无法识别的图片格式')
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem = f"{book_id}.{digest}"
+        original = self.covers_dir / f"{stem}.{ext}"
+        keep = {original}
+        original.write_bytes(data)
+
+        covers = {'original': self._url(original)}
+        derivatives = self._make_derivatives(data, stem) if pillow_available() else None
+        if derivatives:
+            for size, files in derivatives.items():
+                covers[size] = {fmt: self._url(path) for fmt, path in files.items()}
+                keep.update(files.values())
+        else:
+            # 没有 Pillow 或图片无法解码：各尺寸直接用原图
+            for size in COVER_SIZES:
+                covers[size] = {ext: covers['original']}
+
+        self._remove_stale(book_id, keep)
+        list_urls = covers['list']
+        cover = list_urls.get('jpeg') or covers['original']
+        logger.info(f"🖼️ 封面已保存: {book_id} ({len(data) / 1024:.0f}KB -> {original.name})")
+        return {'cover': cover, 'covers': covers}
+
+    def save_data_uri(self, book_id: str, value: str) -> Dict:
+        return self.save(book_id, decode_data_uri(value))
+
+    def _make_derivatives(self, data: bytes, stem: str) -> Optional[Dict[str, Dict[str, Path]]]:
+        result = {}
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image = ImageOps.exif_transpose(image)
+                image.load()
+            for size, box in COVER_SIZES.items():
+                thumb = image.copy()
+                thumb.thumbnail(box, Image.LANCZOS)
+                webp_path = self.covers_dir / f"{stem}.{size}.webp"
+                jpeg_path = self.covers_dir / f"{stem}.{size}.jpg"
+                self._to_webp(thumb).save(webp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+                self._to_rgb(thumb).save(jpeg_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                result[size] = {'webp': webp_path, 'jpeg': jpeg_path}
+        except Exception as e:
+            logger.warning(f"⚠️ 封面无法生成缩略图，只保存原图: {e}")
+            for files in result.values():
+                for path in files.values():
+                    path.unlink(missing_ok=True)
+            return None
+        return result
+
+    @staticmethod
+    def _to_webp(image):
+        if image.mode in ('RGB', 'RGBA'):
+            return image
+        return image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    @staticmethod
+    def _to_rgb(image):
+        """JPEG 没有透明通道：透明部分铺白底"""
+        if image.mode == 'RGB':
+            return image
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+
+    def files(self, book_id: str):
+        # 书籍 id 中不含点号，{book_id}.* 不会匹配到其他书
+        return [p for p in self.covers_dir.glob(f"{book_id}.*") if p.is_file()]
+
+    def _remove_stale(self, book_id: str, keep):
+        for path in self.files(book_id):
+            if path not in keep:
+                path.unlink(missing_ok=True)
+
+    def remove(self, book_id: str):
+        """删除书籍的全部封面文件"""
+        for path in self.files(book_id):
+            path.unlink(missing_ok=True)
+
+    def resolve(self, name: str) -> Optional[Path]:
+        """URL 中的文件名 -> 封面文件路径，不存在或不安全时为 None"""
+        if '/' in name or '\\' in name or name.startswith('.'):
+            return None
+        path = self.covers_dir / name
+        return path if path.is_file() else None
+
+    def thumbnail_path(self, book_data: Dict, size: str = 'list') -> Optional[Path]:
+        """书籍封面指定尺寸的本地文件；没有缩略图的旧封面用原图"""
+        urls = (book_data.get('covers') or {}).get(size) or {}
+        for url in list(urls.values()) + [book_data.get('cover')]:
+            path = self.local_original(url) if isinstance(url, str) else None
+            if path:
+                return path
+        return None
+
+    def local_original(self, url: str) -> Optional[Path]:
+        """/covers/xxx 形式的旧封面 URL -> 本地文件"""
+        if not url or not url.startswith(self.url_prefix + '/'):
+            return None
+        return self.resolve(url[len(self.url_prefix) + 1:].split('?', 1)[0])
+
+
+def externalize_book_cover(store: CoverStore, book_id: str, book_data: Dict) -> bool:
+    """
+    把书籍 JSON 中的内联封面 (data URI) 或只有原图的旧封面转成封面文件 + 缩略图
+    修改了 book_data 时返回 True
+    """
+    cover = book_data.get('cover')
+    if not cover or book_data.get('covers'):
+        return False
+    if cover.startswith('data:image'):
+        try:
+            fields = store.save_data_uri(book_id, cover)
+        except CoverError as e:
+            # 内联封面无法识别时留在 JSON 里只会拖慢书架接口
+            logger.warning(f"⚠️ 书籍 {book_id} 内联封面无法识别，已移除: {e}")
+            book_data['cover'] = None
+            return True
+    else:
+        original = store.local_original(cover)
+        if original is None:
+            return False
+        try:
+            fields = store.save(book_id, original.read_bytes())
+        except CoverError as e:
+            logger.warning(f"⚠️ 书籍 {book_id} 封面无法处理，保留原图: {e}")
+            return False
+    book_data.update(fields)
+    return True
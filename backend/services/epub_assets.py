@@ -0,0 +1,230 @@
+"""
+EPUB 内嵌资源 - 图片、样式、字体等直接从保存的 EPUB (ZIP) 中按需读取，不解压到磁盘
+- 成员路径相对于 ZIP 根目录 (与 OPF 清单中解析出的完整路径一致)，支持 URL 编码和 ./.. 片段
+- 内容类型优先取 OPF 清单中的 media-type，没有时按扩展名推断
+- 强 ETag 由成员的 CRC32 和大小构成，内容不变则 ETag 不变
+- 书籍对应的 EPUB 路径按书籍 JSON 的版本缓存，成员目录与清单按 EPUB 文件的修改时间缓存，
+  同一章的多张插图不会重复读取书籍 JSON 或解析 OPF
+- 按区间读取：未压缩的成员直接定位，压缩成员从头解压到起点 (只多读请求之前的部分)
+"""
+import datetime
+import mimetypes
+import os
+import posixpath
+import struct
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+
+READ_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_BOOKS = 32
+
+# 资源路径不带版本号，但同一本书的内容基本不会变；过期后用 ETag 重新验证
+ASSET_CACHE_CONTROL = "public, max-age=2592000"
+
+EXTRA_MEDIA_TYPES = {
+    '.xhtml': 'application/xhtml+xml',
+    '.html': 'text/html',
+    '.htm': 'text/html',
+    '.css': 'text/css',
+    '.svg': 'image/svg+xml',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.otf': 'font/otf',
+    '.ttf': 'font/ttf',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.ncx': 'application/x-dtbncx+xml',
+    '.opf': 'application/oebps-package+xml',
+    '.smil': 'application/smil+xml',
+    '.mp3': 'audio/mpeg',
+}
+
+# 可能带脚本的类型：在浏览器中直接打开时禁止执行
+ACTIVE_MEDIA_TYPES = ('application/xhtml+xml', 'text/html', 'image/svg+xml')
+
+_NS = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+}
+
+
+class AssetNotFound(Exception):
+    """书籍不是 EPUB、原始文件不存在或没有这个成员"""
+
+
+class EpubAsset(NamedTuple):
+    name: str
+    size: int
+    crc: int
+    media_type: str
+    date_time: Tuple[int, int, int, int, int, int]
+    # 未压缩 (ZIP_STORED) 的成员可以直接在 EPUB 文件中定位
+    stored: bool = False
+    header_offset: int = 0
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.crc:08x}-{self.size:x}"'
+
+    @property
+    def last_modified(self) -> Optional[float]:
+        try:
+            return datetime.datetime(*self.date_time).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def active(self) -> bool:
+        return self.media_type in ACTIVE_MEDIA_TYPES
+
+
+def normalize_member(path: str) -> Optional[str]:
+    """URL 中的成员路径 -> ZIP 成员名；越出根目录时为 None"""
+    path = unquote(path or '').replace('\\', '/')
+    normalized = posixpath.normpath('/' + path).lstrip('/')
+    if not normalized or normalized == '.':
+        return None
+    return normalized
+
+
+def guess_media_type(name: str) -> str:
+    ext = posixpath.splitext(name)[1].lower()
+    return EXTRA_MEDIA_TYPES.get(ext) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def read_manifest_types(zf: zipfile.ZipFile) -> Dict[str, str]:
+    """OPF 清单：ZIP 成员名 -> media-type"""
+    try:
+        container = ET.fromstring(zf.read('META-INF/container.xml'))
+        rootfile = container.find('.//container:rootfile', _NS)
+        opf_path = rootfile.get('full-path') if rootfile is not None else None
+        if not opf_path:
+            return {}
+        opf = ET.fromstring(zf.read(opf_path))
+    except (KeyError, ET.ParseError):
+        return {}
+
+    rootdir = posixpath.dirname(opf_path)
+    types = {}
+    for item in opf.findall('.//opf:manifest/opf:item', _NS):
+        href, media_type = item.get('href'), item.get('media-type')
+        if href and media_type:
+            name = normalize_member(posixpath.join(rootdir, href))
+            if name:
+                types[name] = media_type
+    return types
+
+
+def _read_chunks(f, length: int) -> Iterator[bytes]:
+    remaining = length
+    while remaining > 0:
+        chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+class _ArchiveIndex:
+    def __init__(self, version: Tuple[int, int], members: Dict[str, zipfile.ZipInfo], types: Dict[str, str]):
+        self.version = version
+        self.members = members
+        self.types = types
+
+
+class EpubAssetStore:
+    """
+    book_version: book_id -> 版本号 (如书籍内容签名)，书籍不存在时为 None
+    archive_path: book_id -> 原始 EPUB 路径，不是 EPUB 或没有原始文件时为 None
+    """
+
+    def __init__(self, book_version: Callable[[str], Optional[Hashable]],
+                 archive_path: Callable[[str], Optional[str]], max_books: int = DEFAULT_MAX_BOOKS):
+        self.book_version = book_version
+        self.archive_path = archive_path
+        self.max_books = max_books
+        self._paths: Dict[str, Tuple[Hashable, Optional[str]]] = {}
+        self._indexes: 'OrderedDict[str, _ArchiveIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _archive(self, book_id: str) -> Optional[str]:
+        version = self.book_version(book_id)
+        if version is None:
+            self._paths.pop(book_id, None)
+            return None
+        cached = self._paths.get(book_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        path = self.archive_path(book_id)
+        self._paths[book_id] = (version, path)
+        return path
+
+    def _index(self, path: str) -> _ArchiveIndex:
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached and cached.version == version:
+                self._indexes.move_to_end(path)
+                return cached
+
+        with zipfile.ZipFile(path, 'r') as zf:
+            members = {info.filename: info for info in zf.infolist() if not info.is_dir()}
+            index = _ArchiveIndex(version, members, read_manifest_types(zf))
+        with self._lock:
+            self._indexes[path] = index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_books:
+                self._indexes.popitem(last=False)
+        return index
+
+    def get(self, book_id: str, member: str) -> Tuple[str, EpubAsset]:
+        """返回 (EPUB 路径, 成员信息)；找不到时抛 AssetNotFound"""
+        path = self._archive(book_id)
+        if not path or not os.path.isfile(path):
+            raise AssetNotFound('书籍不存在或没有原始 EPUB 文件')
+        name = normalize_member(member)
+        if name is None:
+            raise AssetNotFound(f'无效的资源路径: {member}')
+        try:
+            index = self._index(path)
+        except zipfile.BadZipFile:
+            raise AssetNotFound('EPUB 文件已损坏') from None
+        info = index.members.get(name)
+        if info is None:
+            raise AssetNotFound(f'EPUB 中没有这个资源: {name}')
+        media_type = index.types.get(name) or guess_media_type(name)
+        stored = info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1
+        return path, EpubAsset(name, info.file_size, info.CRC, media_type, info.date_time,
+                               stored, info.header_offset)
+
+    @staticmethod
+    def iter_range(path: str, asset: EpubAsset, start: int, length: int) -> Iterator[bytes]:
+        """产出成员的 [start, start + length) 部分"""
+        if asset.stored:
+            with open(path, 'rb') as f:
+                # 本地文件头：30 字节固定部分 + 文件名 + 扩展字段，之后是成员数据
+                f.seek(asset.header_offset)
+                header = f.read(30)
+                if header[:4] != b'PK\x03\x04':
+                    raise zipfile.BadZipFile(f'成员头损坏: {asset.name}')
+                name_length, extra_length = struct.unpack('<HH', header[26:30])
+                f.seek(asset.header_offset + 30 + name_length + extra_length + start)
+                yield from _read_chunks(f, length)
+            return
+
+        with zipfile.ZipFile(path, 'r') as zf, zf.open(asset.name) as member:
+            if start:
+                member.seek(start)
+            yield from _read_chunks(member, length)
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._indexes.pop(path, None)
@@ -5,30 +5,125 @@ EPUB 极速元数据解析器 - 真正的懒加载
 """
 import zipfile
 import xml.etree.ElementTree as ET
-import base64
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from bs4 import BeautifulSoup
 
+from services.chapter_html import render_chapter_html
+from services.cover_store import MAX_COVER_BYTES
+from services.epub_assets import normalize_member
+from services.spine_layout import anchor_ranges, bounds_from_env, normalize_spine, slice_document
+
+
+DEFAULT_MEMBER_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class SplitMemberCache:
+    """
+    被切分的大 spine 项的解压原文及锚点分布，按 (EPUB 文件版本, 成员名) 缓存
+    - 读取其中任一虚拟章节、生成章节链接表时不必重新解压整个成员
+    - 按原文字节数计入预算，超出时淘汰最久未用的成员；预算可用 SPLIT_MEMBER_CACHE_BYTES 配置
+    - 文件版本为 (路径, 修改时间, 大小)，原始文件被替换后旧条目自然不再命中
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMBER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        # 单个成员超过预算的 1/4 不缓存
+        self.max_entry_bytes = max_bytes // 4
+        # (文件版本, 成员) -> [原文, {区间: 锚点表}]
+        self._entries: 'OrderedDict[Tuple, list]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, file_key: Tuple, zf: zipfile.ZipFile, member: str) -> bytes:
+        key = (file_key, member)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        raw = zf.read(member)
+        if len(raw) <= self.max_entry_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = [raw, {}]
+                    self._bytes += len(raw)
+                    while self._bytes > self.max_bytes:
+                        _, (evicted, _) = self._entries.popitem(last=False)
+                        self._bytes -= len(evicted)
+        return raw
+
+    def anchors(self, file_key: Tuple, zf: zipfile.ZipFile, member: str, ranges) -> Dict[str, int]:
+        """成员中各锚点落在第几个区间 (见 spine_layout.anchor_ranges)"""
+        key = (file_key, member)
+        ranges = tuple(tuple(r) for r in ranges)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and ranges in entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1][ranges]
+
+        anchors = anchor_ranges(self.read(file_key, zf, member), ranges)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1][ranges] = anchors
+        return anchors
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def member_cache_from_env() -> SplitMemberCache:
+    return SplitMemberCache(int(os.environ.get('SPLIT_MEMBER_CACHE_BYTES', str(DEFAULT_MEMBER_CACHE_BYTES))))
+
+
+# 全局缓存：解析器按请求创建，切分成员的原文在请求之间共用
+_member_cache = None
+
+def get_member_cache() -> SplitMemberCache:
+    global _member_cache
+    if _member_cache is None:
+        _member_cache = member_cache_from_env()
+    return _member_cache
+
 
 class EpubLazyParser:
     """真正的懒加载 EPUB 解析器 - 使用 zipfile 而非 ebooklib"""
     
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, max_chapter_bytes: Optional[int] = None,
+                 min_chapter_bytes: Optional[int] = None):
         self.file_path = file_path
         self._content_opf_path = None
         self._rootdir = ''
+        self._version = None
+        # 单章大小上限 / 小项合并下限 (见 spine_layout)
+        env_max, env_min = bounds_from_env()
+        self.max_chapter_bytes = max_chapter_bytes or env_max
+        self.min_chapter_bytes = min_chapter_bytes if min_chapter_bytes is not None else env_min
     
     def parse_metadata_only(self) -> Dict:
         """
         极速解析：只提取元数据和目录结构
-        绝对不读取正文内容，24MB文件 < 1秒
+        不读取正文内容 (只有超过单章上限的 spine 项会读出来找切分点)，24MB文件 < 1秒
         """
         metadata = {
             'title': 'Unknown',
             'author': 'Unknown',
+            'publisher': '',
             'cover': None,
+            'cover_href': None,
             'chapters': [],
             'total_chapters': 0,
             'parsing_status': 'pending'
@@ -37,27 +132,7 @@ class EpubLazyParser:
         try:
             with zipfile.ZipFile(self.file_path, 'r') as zf:
                 # 1. 找到 content.opf 的位置
-                container_path = 'META-INF/container.xml'
-                if container_path in zf.namelist():
-                    container_xml = zf.read(container_path).decode('utf-8')
-                    root = ET.fromstring(container_xml)
-                    
-                    # 查找 rootfile
-                    ns = {'container': 'urn:oasis:names:tc:opendocument:xmlns:container'}
-                    rootfile = root.find('.//container:rootfile', ns)
-                    if rootfile is not None:
-                        self._content_opf_path = rootfile.get('full-path')
-                        self._rootdir = os.path.dirname(self._content_opf_path)
-                
-                if not self._content_opf_path:
-                    # 如果没找到，尝试常见路径
-                    for possible in ['content.opf', 'OEBPS/content.opf', 'OPS/content.opf']:
-                        if possible in zf.namelist():
-                            self._content_opf_path = possible
-                            self._rootdir = os.path.dirname(possible)
-                            break
-                
-                if not self._content_opf_path:
+                if not self._locate_opf(zf):
                     print("❌ 找不到 content.opf")
                     return metadata
                 
@@ -81,30 +156,26 @@ class EpubLazyParser:
                 if creator_elem is not None and creator_elem.text:
                     metadata['author'] = creator_elem.text.strip()
                 
-                # 3. 提取封面 (只取小图)
+                publisher_elem = opf_root.find('.//dc:publisher', ns)
+                if publisher_elem is not None and publisher_elem.text:
+                    metadata['publisher'] = publisher_elem.text.strip()
+                
+                # 3. 定位封面 (只记录路径，图片由 read_cover 单独读取)
+                manifest = opf_root.find('.//opf:manifest', ns)
                 cover_id = None
                 for meta in opf_root.findall('.//opf:meta[@name="cover"]', ns):
                     cover_id = meta.get('content')
                     break
                 
-                if cover_id:
-                    manifest = opf_root.find('.//opf:manifest', ns)
-                    if manifest is not None:
-                        for item in manifest.findall('opf:item', ns):
-                            if item.get('id') == cover_id:
-                                cover_href = item.get('href')
-                                cover_path = os.path.join(self._rootdir, cover_href).replace('\\', '/')
-                                
-                                # 检查封面大小，超过500KB就跳过
-                                try:
-                                    info = zf.getinfo(cover_path)
-                                    if info.file_size < 500 * 1024:
-                                        cover_data = zf.read(cover_path)
-                                        cover_base64 = base64.b64encode(cover_data).decode('utf-8')
-                                        metadata['cover'] = f"data:image/jpeg;base64,{cover_base64}"
-                                except:
-                                    pass
-                                break
+                if manifest is not None:
+                    for item in manifest.findall('opf:item', ns):
+                        # EPUB2 用 meta name="cover"，EPUB3 用 properties="cover-image"
+                        if (cover_id and item.get('id') == cover_id) or \
+                                'cover-image' in (item.get('properties') or '').split():
+                            cover_href = item.get('href')
+                            if cover_href:
+                                metadata['cover_href'] = os.path.join(self._rootdir, cover_href).replace('\\', '/')
+                            break
                 
                 # 4. 提取章节列表 (只取 id 和标题，绝不读取内容)
                 spine = opf_root.find('.//opf:spine', ns)
@@ -119,21 +190,28 @@ class EpubLazyParser:
                         id_to_href[item_id] = item_href
                     
                     # 遍历 spine
-                    chapter_index = 0
+                    items = []
                     for itemref in spine.findall('opf:itemref', ns):
                         item_id = itemref.get('idref')
                         href = id_to_href.get(item_id, '')
-                        
                         if href:
-                            metadata['chapters'].append({
-                                'index': chapter_index,
-                                'id': item_id,
-                                'title': f'第 {chapter_index + 1} 章',  # 占位标题
-                                'href': href,
-                                'content': None,  # !! 关键：绝对为 None
-                                'word_count': 0
-                            })
-                            chapter_index += 1
+                            items.append({'id': item_id, 'href': href})
+                    
+                    # 按 ZIP 中记录的大小切分过大的项、合并过小的项 (只读取需要切分的项)
+                    names = set(zf.namelist())
+                    members = [self._chapter_member(names, item['href']) for item in items]
+                    sizes = [zf.getinfo(m).file_size if m else None for m in members]
+                    normalized = normalize_spine(items, sizes, lambda i: self._read_member(zf, members[i]),
+                                                 self.max_chapter_bytes, self.min_chapter_bytes)
+                    
+                    for chapter_index, ch in enumerate(normalized):
+                        metadata['chapters'].append({
+                            'index': chapter_index,
+                            'title': f'第 {chapter_index + 1} 章',  # 占位标题
+                            **ch,
+                            'content': None,  # !! 关键：绝对为 None
+                            'word_count': 0
+                        })
                 
                 metadata['total_chapters'] = len(metadata['chapters'])
                 
@@ -142,60 +220,206 @@ class EpubLazyParser:
         
         return metadata
     
-    def parse_single_chapter(self, index: int) -> Optional[Dict]:
+    def read_cover(self, cover_href: Optional[str] = None, max_bytes: int = MAX_COVER_BYTES) -> Optional[bytes]:
+        """
+        读取封面原图 (cover_href 为 parse_metadata_only 返回的路径，省略时重新定位)
+        没有封面或超过 max_bytes 时返回 None
+        """
+        if cover_href is None:
+            cover_href = self.parse_metadata_only().get('cover_href')
+        if not cover_href:
+            return None
+        try:
+            with zipfile.ZipFile(self.file_path, 'r') as zf:
+                info = zf.getinfo(cover_href)
+                if info.file_size > max_bytes:
+                    print(f"⚠️ 封面过大，跳过: {info.file_size / 1024 / 1024:.1f}MB")
+                    return None
+                return zf.read(info)
+        except (KeyError, zipfile.BadZipFile) as e:
+            print(f"⚠️ 封面读取失败: {e}")
+            return None
+    
+    def _locate_opf(self, zf: zipfile.ZipFile) -> Optional[str]:
+        """找到 content.opf 的位置 (章节 href 相对于它所在的目录)"""
+        if self._content_opf_path:
+            return self._content_opf_path
+        
+        container_path = 'META-INF/container.xml'
+        if container_path in zf.namelist():
+            container_xml = zf.read(container_path).decode('utf-8')
+            root = ET.fromstring(container_xml)
+            
+            # 查找 rootfile
+            ns = {'container': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+            rootfile = root.find('.//container:rootfile', ns)
+            if rootfile is not None:
+                self._content_opf_path = rootfile.get('full-path')
+                self._rootdir = os.path.dirname(self._content_opf_path)
+        
+        if not self._content_opf_path:
+            # 如果没找到，尝试常见路径
+            for possible in ['content.opf', 'OEBPS/content.opf', 'OPS/content.opf']:
+                if possible in zf.namelist():
+                    self._content_opf_path = possible
+                    self._rootdir = os.path.dirname(possible)
+                    break
+        
+        return self._content_opf_path
+    
+    def parse_single_chapter(self, index: int, chapter_info: Optional[Dict] = None) -> Optional[Dict]:
         """
         按需解析单个章节 - 只读取这一章的内容
         用于用户翻页时实时加载
+        chapter_info: 书籍 JSON 中保存的目录项 (以建索引时的章节划分为准)，省略时重新解析目录
         """
         try:
             with zipfile.ZipFile(self.file_path, 'r') as zf:
-                # 先获取章节信息
-                meta = self.parse_metadata_only()
-                if index >= len(meta['chapters']):
-                    return None
-                
-                chapter_info = meta['chapters'][index]
-                href = chapter_info.get('href', '')
-                
-                if not href:
-                    return None
-                
-                # 构建完整路径
-                chapter_path = os.path.join(self._rootdir, href).replace('\\', '/')
+                if chapter_info is None:
+                    # 先获取章节信息
+                    meta = self.parse_metadata_only()
+                    if index >= len(meta['chapters']):
+                        return None
+                    chapter_info = meta['chapters'][index]
+                else:
+                    self._locate_opf(zf)
                 
-                # 尝试多种可能的路径
-                possible_paths = [
-                    chapter_path,
-                    href,
-                    f"OEBPS/{href}",
-                    f"OPS/{href}"
-                ]
-                
-                content = None
-                for path in possible_paths:
-                    if path in zf.namelist():
-                        raw_content = zf.read(path).decode('utf-8', errors='ignore')
-                        soup = BeautifulSoup(raw_content, 'html.parser')
-                        content = soup.get_text(separator='\n', strip=True)
-                        
-                        # 提取标题
-                        title = chapter_info.get('title', f'第 {index + 1} 章')
-                        for tag in ['h1', 'h2', 'h3']:
-                            title_tag = soup.find(tag)
-                            if title_tag:
-                                title = title_tag.get_text(strip=True)
-                                break
-                        
-                        return {
-                            'index': index,
-                            'id': chapter_info.get('id'),
-                            'title': title,
-                            'content': content,
-                            'word_count': len(content) if content else 0
-                        }
-                
-                return None
+                return self._read_chapter(zf, chapter_info, index)
                 
         except Exception as e:
             print(f"❌ 章节 {index} 解析失败: {e}")
             return None
+    
+    def iter_chapters(self, include_html: bool = False) -> Iterator[Dict]:
+        """
+        按阅读顺序逐章产出内容，ZIP 只打开一次
+        每次只有一章的内容在内存中，用于流式输出
+        """
+        meta = self.parse_metadata_only()
+        with zipfile.ZipFile(self.file_path, 'r') as zf:
+            for index, chapter_info in enumerate(meta['chapters']):
+                try:
+                    chapter = self._read_chapter(zf, chapter_info, index, include_html)
+                except Exception as e:
+                    print(f"❌ 章节 {index} 解析失败: {e}")
+                    continue
+                if chapter:
+                    yield chapter
+    
+    def _read_chapter(self, zf: zipfile.ZipFile, chapter_info: Dict, index: int,
+                      include_html: bool = False) -> Optional[Dict]:
+        """从已打开的 ZIP 中读取并解析一章"""
+        parts = self._read_parts(zf, chapter_info)
+        if not parts:
+            return None
+        
+        soups = [BeautifulSoup(raw_content, 'html.parser') for _, raw_content in parts]
+        content = '\n'.join(filter(None, (soup.get_text(separator='\n', strip=True) for soup in soups)))
+        
+        # 提取标题：h1-h3，没有时用正文第一行 (太长的不算标题，保留原标题)
+        title = chapter_info.get('title', f'第 {index + 1} 章')
+        for tag in ['h1', 'h2', 'h3']:
+            title_tag = next(filter(None, (soup.find(tag) for soup in soups)), None)
+            if title_tag:
+                title = title_tag.get_text(strip=True)
+                break
+        else:
+            first_line = content.split('\n', 1)[0]
+            if first_line and len(first_line) < 50:
+                title = first_line
+        
+        chapter = {
+            'index': index,
+            'id': chapter_info.get('id'),
+            'title': title,
+            'content': content,
+            'word_count': len(content) if content else 0
+        }
+        if include_html:
+            chapter['html'] = ''.join(render_chapter_html(raw_content, path)['html'] for path, raw_content in parts)
+        return chapter
+    
+    def _read_parts(self, zf: zipfile.ZipFile, chapter_info: Dict, names=None) -> List[Tuple[str, str]]:
+        """
+        一章对应的 XHTML [(ZIP 路径, 原文)]
+        合并的章节有多个文件；切分出的虚拟章节只取字节区间内的 body 内容
+        """
+        names = names if names is not None else set(zf.namelist())
+        parts = []
+        for href in chapter_info.get('hrefs') or [chapter_info.get('href', '')]:
+            path = self._chapter_member(names, href)
+            if not path:
+                continue
+            if chapter_info.get('range'):
+                start, end = chapter_info['range']
+                raw = slice_document(self._read_member(zf, path), start, end)
+            else:
+                raw = zf.read(path)
+            parts.append((path, raw.decode('utf-8', errors='ignore')))
+        return parts
+    
+    def _file_key(self) -> Tuple:
+        """EPUB 文件版本 (切分成员缓存的键)"""
+        if self._version is None:
+            stat = os.stat(self.file_path)
+            self._version = (os.path.abspath(self.file_path), stat.st_mtime_ns, stat.st_size)
+        return self._version
+    
+    def _read_member(self, zf: zipfile.ZipFile, member: str) -> bytes:
+        """读取会被切分的大成员 (经缓存，同一文件的多个虚拟章节只解压一次)"""
+        return get_member_cache().read(self._file_key(), zf, member)
+    
+    def _chapter_member(self, names, href: str) -> Optional[str]:
+        """章节 href -> ZIP 中的成员名 (找不到时为 None)"""
+        if not href:
+            return None
+        
+        # 构建完整路径
+        chapter_path = os.path.join(self._rootdir, href).replace('\\', '/')
+        
+        # 尝试多种可能的路径
+        possible_paths = [
+            chapter_path,
+            href,
+            f"OEBPS/{href}",
+            f"OPS/{href}"
+        ]
+        for path in possible_paths:
+            if path in names:
+                return path
+        return None
+    
+    def read_chapter_source(self, index: int, chapters: Optional[List[Dict]] = None
+                            ) -> Optional[Tuple[List[Tuple[str, str]], Dict[str, int]]]:
+        """
+        读取单章 XHTML 原文，用于生成富文本
+        chapters: 书籍 JSON 中保存的目录，省略时重新解析目录
+        返回 ([(ZIP 路径, 原文)], {ZIP 路径 或 路径#锚点: 章节序号})；章节不存在时为 None
+        """
+        if chapters is None:
+            chapters = self.parse_metadata_only()['chapters']
+        if index < 0 or index >= len(chapters):
+            return None
+        with zipfile.ZipFile(self.file_path, 'r') as zf:
+            self._locate_opf(zf)
+            names = set(zf.namelist())
+            spine = {}
+            split = {}
+            for i, chapter_info in enumerate(chapters):
+                for href in chapter_info.get('hrefs') or [chapter_info.get('href', '')]:
+                    member = self._chapter_member(names, href)
+                    if member:
+                        spine.setdefault(normalize_member(member), i)
+                        if chapter_info.get('range'):
+                            split.setdefault(member, []).append((i, tuple(chapter_info['range'])))
+            
+            # 切分过的文件：锚点按字节区间对应到虚拟章节
+            for member, pieces in split.items():
+                anchors = get_member_cache().anchors(self._file_key(), zf, member, [r for _, r in pieces])
+                for anchor, n in anchors.items():
+                    spine[f"{normalize_member(member)}#{anchor}"] = pieces[n][0]
+            
+            parts = self._read_parts(zf, chapters[index], names)
+            if not parts:
+                return None
+            return parts, spine
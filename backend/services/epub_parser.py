@@ -1,161 +1,69 @@
-import os
-import base64
-import hashlib
-from typing import Dict, List, Optional
-from ebooklib import epub, ITEM_DOCUMENT
-from bs4 import BeautifulSoup
-# from services.cover_search import search_cover_online  # 暂时禁用
+"""
+EPUB 整本解析 - /api/parse/epub 使用
+基于懒加载解析器，章节模型 (目录归一化后的章节、跳过空章节、连续序号) 只有一套，
+整本返回和流式 (NDJSON) 返回的章节数与序号完全一致
+"""
+import json
+import logging
+from typing import Dict, Iterator
+
+from services.cover_store import data_uri
+from services.epub_lazy_parser import EpubLazyParser
+
+logger = logging.getLogger(__name__)
+
+# 正文少于这个字数的章节 (空白页、分隔页) 不返回
+MIN_CHAPTER_CHARS = 10
+
 
 class EpubParser:
     def __init__(self, file_path: str):
         self.file_path = file_path
-        try:
-            self.book = epub.read_epub(file_path)
-        except Exception as e:
-            print(f"EPUB读取失败: {str(e)}")
-            raise
+        self.lazy = EpubLazyParser(file_path)
 
-    def parse(self) -> Dict:
-        """解析EPUB文件"""
-        metadata = {
-            'title': 'Unknown',
-            'author': 'Unknown',
-            'publisher': '',
-            'cover': None,
-            'chapters': [],
-            'total_chapters': 0
+    def iter_events(self) -> Iterator[Dict]:
+        """
+        逐步产出解析结果：metadata -> 每章一个 chapter -> done
+        每次只有一章的内容在内存中；章节的 index 即它在整本结果中的位置
+        metadata 中的 spine_items 是跳过空章节前的章节数，实际章节数以 done 的 total_chapters 为准
+        """
+        metadata = self.lazy.parse_metadata_only()
+        cover_image = self.lazy.read_cover(metadata['cover_href'])
+        yield {
+            'type': 'metadata',
+            'title': metadata['title'],
+            'author': metadata['author'],
+            'publisher': metadata['publisher'],
+            'cover': data_uri(cover_image) if cover_image else None,
+            'spine_items': metadata['total_chapters']
         }
-        
+
+        count = 0
+        for chapter in self.lazy.iter_chapters(include_html=True):
+            if len(chapter['content'].strip()) < MIN_CHAPTER_CHARS:
+                continue
+            chapter['index'] = count
+            yield {'type': 'chapter', **chapter}
+            count += 1
+
+        yield {'type': 'done', 'total_chapters': count}
+
+    def iter_ndjson(self) -> Iterator[str]:
+        """iter_events 的 NDJSON 行；解析出错时最后一行为 {"type": "error"}"""
         try:
-            # 提取基础元数据
-            title = self.book.get_metadata('DC', 'title')
-            if title:
-                metadata['title'] = title[0][0]
-                
-            creator = self.book.get_metadata('DC', 'creator')
-            if creator:
-                metadata['author'] = creator[0][0]
-                
-            publisher = self.book.get_metadata('DC', 'publisher')
-            if publisher:
-                metadata['publisher'] = publisher[0][0]
-            
-            # 提取封面
-            metadata['cover'] = self._extract_cover(metadata['title'], metadata['author'])
-            
-            # 提取章节
-            metadata['chapters'] = self._extract_chapters()
-            metadata['total_chapters'] = len(metadata['chapters'])
-            
+            for event in self.iter_events():
+                yield json.dumps(event, ensure_ascii=False) + "\n"
         except Exception as e:
-            print(f"元数据提取警告: {str(e)}")
-        
-        return metadata
-    
-    def _extract_cover(self, title: str, author: str) -> Optional[str]:
-        """提取封面图片（Base64编码）"""
-        # 尝试从 EPUB 提取
-        try:
-            for item in self.book.get_items():
-                if item.get_type() == epub.ITEM_COVER:
-                    cover_data = item.get_content()
-                    cover_base64 = base64.b64encode(cover_data).decode('utf-8')
-                    return f"data:image/jpeg;base64,{cover_base64}"
-            
-            for item in self.book.get_items():
-                if item.get_type() == epub.ITEM_IMAGE and 'cover' in item.get_name().lower():
-                    cover_data = item.get_content()
-                    cover_base64 = base64.b64encode(cover_data).decode('utf-8')
-                    return f"data:image/jpeg;base64,{cover_base64}"
-        except:
-            pass
-            
-        # 在线搜索暂时禁用
-        return None
-    
-    def _extract_chapters(self) -> List[Dict]:
-        """提取章节内容"""
-        chapters = []
-        
-        # 获取书籍的 spine (阅读顺序)
-        for item_id in self.book.spine:
-            try:
-                item = self.book.get_item_with_id(item_id[0])
-                if not item:
-                    continue
-                    
-                # 解析HTML内容
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
-                
-                # 提取文本
-                text = soup.get_text(separator='\n', strip=True)
-                
-                # 跳过空章节
-                if not text or len(text.strip()) < 10:
-                    continue
-                
-                # 尝试提取章节标题
-                chapter_title = self._extract_chapter_title(soup)
-                
-                chapters.append({
-                    'title': chapter_title,
-                    'content': text,
-                    'html': str(soup),  # 保留原始HTML用于富文本显示
-                    'word_count': len(text)
-                })
-            
-            except Exception as e:
-                print(f"章节解析警告: {str(e)}")
-                continue
-        
-        return chapters
-    
-    def _extract_chapter_title(self, soup: BeautifulSoup) -> str:
-        """提取章节标题"""
-        # 尝试从h1-h3标签中提取
-        for tag in ['h1', 'h2', 'h3']:
-            title_tag = soup.find(tag)
-            if title_tag:
-                return title_tag.get_text(strip=True)
-        
-        # 如果没找到，使用第一行作为标题
-        first_line = soup.get_text(strip=True).split('\n')[0]
-        if first_line and len(first_line) < 50:
-            return first_line
-        
-        return '章节'
-    
-    def _calculate_hash(self) -> str:
-        """计算文件哈希值"""
-        with open(self.file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        return file_hash
-    
-    def get_toc(self) -> List[Dict]:
-        """获取目录结构"""
-        toc_items = []
-        
-        def parse_toc_item(item, level=0):
-            if isinstance(item, tuple):
-                section, children = item
-                toc_items.append({
-                    'title': section.title,
-                    'href': section.href,
-                    'level': level
-                })
-                for child in children:
-                    parse_toc_item(child, level + 1)
+            logger.error(f"EPUB流式解析错误: {str(e)}")
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    def parse(self) -> Dict:
+        """整本解析：与 iter_events 的结果相同，只是汇总成一个对象"""
+        result = {'chapters': []}
+        for event in self.iter_events():
+            kind = event.pop('type')
+            if kind == 'chapter':
+                result['chapters'].append(event)
             else:
-                toc_items.append({
-                    'title': item.title,
-                    'href': item.href,
-                    'level': level
-                })
-        
-        try:
-            for item in self.book.toc:
-                parse_toc_item(item)
-        except:
-            pass
-        
-        return toc_items
+                result.update(event)
+        return result
@@ -0,0 +1,148 @@
+"""
+带 Range / 条件请求的文件响应
+- ETag (大小 + 修改时间) 与 Last-Modified；If-None-Match 命中返回 304
+- 单段 Range 返回 206，If-Range (强比较) 不匹配时返回完整内容，越界返回 416
+- 多段 Range 按规范允许的方式忽略，返回完整内容
+- range_response 不限于文件，只需给出大小、ETag 和按区间读取内容的函数 (如 EPUB 中的成员)
+"""
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# 内容寻址的缓存文件永远不会变
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(Exception):
+    """请求的字节范围超出文件大小"""
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 头，返回闭区间 (start, end)
+    没有 Range、格式不识别或多段时返回 None (按完整内容处理)
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    start_text, end_text = (part.strip() for part in spec.split("-", 1))
+    try:
+        if start_text == "":
+            # bytes=-N：最后 N 个字节
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start < 0:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match 的弱比较"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def if_range_matches(header: str, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    If-Range 按 RFC 9110 13.1.5 使用强比较：
+    - 实体标签：双方都不是弱标签且完全相同 (弱标签永远不匹配)
+    - HTTP 日期：与 Last-Modified 完全相同 (精确到秒)
+    """
+    value = header.strip()
+    if value.startswith('"'):
+        return not etag.startswith("W/") and value == etag
+    if value.startswith("W/") or last_modified is None:
+        return False
+    try:
+        return int(parsedate_to_datetime(value).timestamp()) == int(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def _iter_file(path: Path, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def range_response(request: Request, size: int, etag: str, media_type: str,
+                   body: Callable[[int, int], Iterator[bytes]], last_modified: Optional[float] = None,
+                   cache_control: str = "no-cache", extra_headers: dict = None) -> Response:
+    """
+    按请求头返回 200 / 206 / 304 / 416
+    body(start, length) 产出内容的 [start, start + length) 部分
+    """
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+        **(extra_headers or {})
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range_matches(if_range, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = max(0, end - start + 1)
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    return StreamingResponse(body(start, length), status_code=status,
+                             headers=headers, media_type=media_type)
+
+
+def range_file_response(request: Request, path: Path, media_type: str,
+                        cache_control: str = "no-cache", extra_headers: dict = None) -> Response:
+    """文件的 Range / 条件请求响应"""
+    stat = path.stat()
+    return range_response(request, stat.st_size, file_etag(stat), media_type,
+                          lambda start, length: _iter_file(path, start, length),
+                          last_modified=stat.st_mtime, cache_control=cache_control, extra_headers=extra_headers)
@@ -0,0 +1,79 @@
+"""
+共享的 aiohttp 会话池 - 每个上游一个长连接会话
+- 连接复用 (keep-alive)，避免每次请求都重新建立 TCP 连接和 DNS 解析
+- 按上游配置总连接数和单主机并发上限
+- 服务启动时创建，关闭时释放
+"""
+import asyncio
+import logging
+from typing import Dict
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# 上游配置：总连接数、单主机连接数、默认超时 (秒)
+UPSTREAM_PROFILES = {
+    'easyvoice': {'limit': 32, 'limit_per_host': 16, 'timeout': 60},
+    'covers': {'limit': 16, 'limit_per_host': 4, 'timeout': 10},
+}
+
+KEEPALIVE_SECONDS = 30
+DNS_CACHE_SECONDS = 300
+
+
+class HttpSessionPool:
+    """按上游名称管理的 ClientSession 集合"""
+
+    def __init__(self, profiles: Dict[str, Dict] = None):
+        self.profiles = profiles or UPSTREAM_PROFILES
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._loops: Dict[str, asyncio.AbstractEventLoop] = {}
+
+    def _create(self, name: str) -> aiohttp.ClientSession:
+        profile = self.profiles[name]
+        connector = aiohttp.TCPConnector(
+            limit=profile['limit'],
+            limit_per_host=profile['limit_per_host'],
+            keepalive_timeout=KEEPALIVE_SECONDS,
+            ttl_dns_cache=DNS_CACHE_SECONDS
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=profile['timeout'])
+        )
+
+    def get(self, name: str) -> aiohttp.ClientSession:
+        """获取上游会话；未创建、已关闭或事件循环已更换时重新创建"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(name)
+        if session is None or session.closed or self._loops.get(name) is not loop:
+            session = self._create(name)
+            self._sessions[name] = session
+            self._loops[name] = loop
+        return session
+
+    async def start(self):
+        """预先创建所有上游会话"""
+        for name in self.profiles:
+            self.get(name)
+        logger.info(f"🔌 HTTP 会话池已就绪: {', '.join(self.profiles)}")
+
+    async def close(self):
+        """关闭所有会话并释放连接"""
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+        self._loops.clear()
+
+
+# 全局会话池实例
+_http_sessions = None
+
+def get_http_sessions():
+    """获取会话池单例"""
+    global _http_sessions
+    if _http_sessions is None:
+        _http_sessions = HttpSessionPool()
+    return _http_sessions
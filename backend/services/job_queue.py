@@ -0,0 +1,259 @@
+"""
+持久化后台任务队列
+- 任务存放在 SQLite (jobs 表)，服务重启后自动续跑
+- 按优先级调度，固定数量的 worker 控制并发
+- 失败自动重试 (指数退避)
+- 批量任务不能占满所有 worker，始终给交互任务留出空位
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy.orm import sessionmaker
+
+from database import Job, init_db
+
+logger = logging.getLogger(__name__)
+
+# 优先级 (数值越小越优先)
+PRIORITY_INTERACTIVE = 10
+PRIORITY_NORMAL = 50
+PRIORITY_BULK = 90
+
+
+class JobContext:
+    """传给任务处理函数的上下文，用于读取参数和保存断点"""
+
+    def __init__(self, queue: 'JobQueue', job: Job):
+        self._queue = queue
+        self.job_id = job.id
+        self.kind = job.kind
+        self.payload = json.loads(job.payload) if job.payload else {}
+        self.checkpoint = json.loads(job.checkpoint) if job.checkpoint else {}
+        self.attempt = job.attempts
+
+    def save_checkpoint(self, checkpoint: Dict, progress: Optional[float] = None):
+        """持久化断点，重启后处理函数从这里继续"""
+        self.checkpoint = checkpoint
+        self._queue._update(self.job_id, checkpoint=json.dumps(checkpoint, ensure_ascii=False),
+                            **({'progress': progress} if progress is not None else {}))
+
+
+JobHandler = Callable[[JobContext], Awaitable[Any]]
+
+
+def job_to_dict(job: Job) -> Dict:
+    """任务状态 (用于 API 返回)"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'priority': job.priority,
+        'progress': job.progress or 0.0,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'payload': json.loads(job.payload) if job.payload else {},
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+class JobQueue:
+    """SQLite 持久化的优先级任务队列"""
+
+    def __init__(self, workers: int = 3, retry_base_seconds: float = 5.0, poll_interval: float = 1.0,
+                 engine=None):
+        self.workers = workers
+        # 批量任务最多占用 workers - 1 个 worker
+        self.bulk_slots = max(1, workers - 1)
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_interval = poll_interval
+
+        self.handlers: Dict[str, JobHandler] = {}
+        self._Session = sessionmaker(bind=engine or init_db())
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._running_bulk = 0
+
+    def register(self, kind: str, handler: JobHandler):
+        """注册任务处理函数"""
+        self.handlers[kind] = handler
+
+    # ============ 入队与查询 ============
+
+    def enqueue(self, kind: str, payload: Optional[Dict] = None, priority: int = PRIORITY_NORMAL,
+                max_attempts: int = 3, dedupe: bool = True) -> int:
+        """
+        提交任务，返回任务 ID
+        dedupe=True 时，相同类型和参数的未完成任务直接复用
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"未知任务类型: {kind}")
+
+        payload_json = json.dumps(payload or {}, ensure_ascii=False, sort_keys=True)
+        # 参数取哈希：不同参数的长 payload 不会因截断而被当成同一个任务
+        dedupe_key = f"{kind}:{hashlib.sha256(payload_json.encode('utf-8')).hexdigest()}" if dedupe else None
+
+        session = self._Session()
+        try:
+            if dedupe:
+                existing = session.query(Job).filter(
+                    Job.dedupe_key == dedupe_key,
+                    Job.status.in_(['pending', 'running'])
+                ).first()
+                if existing:
+                    # 已有任务时提升到更高的优先级
+                    if priority < existing.priority:
+                        existing.priority = priority
+                        session.commit()
+                    return existing.id
+
+            job = Job(kind=kind, dedupe_key=dedupe_key, priority=priority,
+                      payload=payload_json, max_attempts=max_attempts)
+            session.add(job)
+            session.commit()
+            job_id = job.id
+        finally:
+            session.close()
+
+        logger.info(f"📥 任务入队: #{job_id} {kind} (优先级 {priority})")
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """查询任务状态"""
+        session = self._Session()
+        try:
+            job = session.get(Job, job_id)
+            return job_to_dict(job) if job else None
+        finally:
+            session.close()
+
+    # ============ 生命周期 ============
+
+    def start(self):
+        """恢复被中断的任务并启动 worker"""
+        session = self._Session()
+        try:
+            interrupted = session.query(Job).filter(Job.status == 'running').all()
+            for job in interrupted:
+                # 被中断的执行不计入重试次数，保留断点
+                job.status = 'pending'
+                job.attempts = max(0, job.attempts - 1)
+            session.commit()
+            if interrupted:
+                logger.info(f"♻️ 恢复 {len(interrupted)} 个被中断的任务")
+        finally:
+            session.close()
+
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"✅ 任务队列已启动: {self.workers} 个 worker")
+
+    async def stop(self):
+        """停止 worker，正在执行的任务回到 pending 等待下次启动"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ============ 调度 ============
+
+    def _update(self, job_id: int, **fields):
+        session = self._Session()
+        try:
+            session.query(Job).filter(Job.id == job_id).update(fields)
+            session.commit()
+        finally:
+            session.close()
+
+    def _claim_next(self) -> Optional[Job]:
+        """原子地领取一个可执行任务"""
+        session = self._Session()
+        try:
+            query = session.query(Job).filter(
+                Job.status == 'pending',
+                Job.run_after <= datetime.now()
+            )
+            if self._running_bulk >= self.bulk_slots:
+                query = query.filter(Job.priority < PRIORITY_BULK)
+
+            for job in query.order_by(Job.priority, Job.id).limit(5).all():
+                claimed = session.query(Job).filter(Job.id == job.id, Job.status == 'pending').update({
+                    'status': 'running',
+                    'attempts': Job.attempts + 1,
+                    'error': None
+                })
+                session.commit()
+                if claimed:
+                    session.refresh(job)
+                    session.expunge(job)
+                    return job
+            return None
+        finally:
+            session.close()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = self._claim_next()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            is_bulk = job.priority >= PRIORITY_BULK
+            if is_bulk:
+                self._running_bulk += 1
+            try:
+                await self._execute(job)
+            finally:
+                if is_bulk:
+                    self._running_bulk -= 1
+
+    async def _execute(self, job: Job):
+        handler = self.handlers.get(job.kind)
+        ctx = JobContext(self, job)
+        logger.info(f"▶️ 任务开始: #{job.id} {job.kind} (第 {job.attempts} 次)")
+
+        try:
+            if handler is None:
+                raise ValueError(f"未知任务类型: {job.kind}")
+            result = await handler(ctx)
+        except asyncio.CancelledError:
+            # 服务关闭：回到 pending，不计入重试
+            self._update(job.id, status='pending', attempts=max(0, job.attempts - 1))
+            raise
+        except Exception as e:
+            if job.attempts < job.max_attempts:
+                delay = self.retry_base_seconds * (2 ** (job.attempts - 1))
+                self._update(job.id, status='pending', error=str(e),
+                             run_after=datetime.now() + timedelta(seconds=delay))
+                logger.warning(f"⚠️ 任务失败，{delay:.0f}s 后重试: #{job.id} {job.kind}: {e}")
+            else:
+                self._update(job.id, status='failed', error=str(e), finished_at=datetime.now())
+                logger.error(f"❌ 任务失败: #{job.id} {job.kind}: {e}")
+            return
+
+        self._update(job.id, status='completed', progress=1.0, finished_at=datetime.now(),
+                     result=json.dumps(result, ensure_ascii=False) if result is not None else None)
+        logger.info(f"✅ 任务完成: #{job.id} {job.kind}")
+
+
+# 全局任务队列实例
+_job_queue = None
+
+def get_job_queue():
+    """获取任务队列单例"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,95 @@
+"""
+相同请求合并 (single-flight)
+并发的相同 TTS 请求只调用一次上游：第一个请求启动生产任务，
+后续请求订阅同一条音频流，先补发已生成的块再跟随实时输出。
+所有订阅者都离开时取消上游调用。
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次进行中的上游调用"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cond = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class StreamCoalescer:
+    """按键合并进行中的音频流"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+        """订阅 key 对应的音频流；没有进行中的调用时用 factory 启动一个"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, factory))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"🔗 合并相同的进行中请求: {key[:12]}")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                async with flight.cond:
+                    await flight.cond.wait_for(lambda: index < len(flight.chunks) or flight.done)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 没人再需要这段音频，取消上游调用 (未完成的缓存文件会被丢弃)
+                flight.task.cancel()
+
+    async def _produce(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[bytes]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                async with flight.cond:
+                    flight.cond.notify_all()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.cond:
+                flight.cond.notify_all()
+
+    def subscribers(self, key: str) -> int:
+        flight = self._flights.get(key)
+        return flight.subscribers if flight else 0
+
+    def stats(self) -> Dict:
+        return {
+            'in_flight': len(self._flights),
+            'upstream_calls': self.started,
+            'coalesced': self.coalesced
+        }
@@ -0,0 +1,207 @@
+"""
+EPUB 目录归一化 - 建索引时调整 spine 项与章节的对应关系，让单章响应大小落在上限内
+- 过大的 spine 项 (按 ZIP 中记录的 file_size 判断，如整本书放在一个 xhtml 里)
+  在标题处切开，成为带字节区间的虚拟章节 ('range': [起, 止])；
+  标题切不开时依次退到锚点、段落、任意标签，按上限尽量装满
+- 连续的很小的 spine 项 (封面、扉页、版权页等) 合并成一章 ('hrefs': [...])
+- 上限/下限可用环境变量 CHAPTER_MAX_BYTES / CHAPTER_MIN_BYTES 配置
+- 索引写入书籍 JSON 后就是章节的依据，读取章节时不再重新计算
+"""
+import bisect
+import html
+import os
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_MAX_BYTES = 256 * 1024
+DEFAULT_MIN_BYTES = 2 * 1024
+# 写入书籍 JSON 的章节索引字段
+SPINE_FIELDS = ('hrefs', 'range')
+
+_BODY_OPEN = re.compile(rb'<body\b[^>]*>', re.IGNORECASE)
+_BODY_CLOSE = re.compile(rb'</body\s*>', re.IGNORECASE)
+_HEADING = re.compile(rb'<h([1-6])\b', re.IGNORECASE)
+_HEADING_TEXT = re.compile(rb'\s*<h[1-6]\b[^>]*>(.*?)</h[1-6]\s*>', re.IGNORECASE | re.DOTALL)
+_ID = re.compile(rb'<[a-z][\w:-]*\s[^>]*?\b(?:id|name)\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+# 标题切不开时的退路，依次尝试
+_FALLBACKS = (
+    _ID,
+    re.compile(rb'<(?:p|div|section|blockquote|table|ul|ol|pre)\b', re.IGNORECASE),
+    re.compile(rb'<[a-z]', re.IGNORECASE),
+)
+_TAG = re.compile(r'<[^>]+>')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def bounds_from_env() -> Tuple[int, int]:
+    """(单章上限, 合并下限) 字节数"""
+    return (int(os.environ.get('CHAPTER_MAX_BYTES', str(DEFAULT_MAX_BYTES))),
+            int(os.environ.get('CHAPTER_MIN_BYTES', str(DEFAULT_MIN_BYTES))))
+
+
+def body_bounds(raw: bytes) -> Tuple[int, int]:
+    """<body> 内容的字节区间；没有 body 标签时为整个文件"""
+    opened = _BODY_OPEN.search(raw)
+    start = opened.end() if opened else 0
+    closed = _BODY_CLOSE.search(raw, start)
+    return start, closed.start() if closed else len(raw)
+
+
+def slice_document(raw: bytes, start: int, end: int) -> bytes:
+    """虚拟章节的 XHTML：原文件的 head + body 中 [start, end) 的部分"""
+    body_start, _ = body_bounds(raw)
+    return raw[:body_start] + raw[start:end] + b'</body></html>'
+
+
+def heading_title(raw: bytes, pos: int, limit: int = 50) -> Optional[str]:
+    """pos 处标题元素的文字"""
+    match = _HEADING_TEXT.match(raw, pos)
+    if not match:
+        return None
+    text = html.unescape(_TAG.sub('', match.group(1).decode('utf-8', errors='ignore')))
+    text = _WHITESPACE.sub(' ', text).strip()
+    return text[:limit] or None
+
+
+def anchor_ranges(raw: bytes, ranges: Sequence[Tuple[int, int]]) -> Dict[str, int]:
+    """文件中各 id/name 锚点落在第几个区间"""
+    anchors = {}
+    starts = [start for start, _ in ranges]
+    for match in _ID.finditer(raw):
+        i = bisect.bisect_right(starts, match.start()) - 1
+        if i >= 0 and match.start() < ranges[i][1]:
+            anchors.setdefault(match.group(1).decode('utf-8', errors='ignore'), i)
+    return anchors
+
+
+def _drop_tiny(start: int, cuts: List[int], end: int, min_bytes: int) -> List[int]:
+    """去掉会切出过小片段的切点 (小片段并入后一段，最后一段并入前一段)"""
+    kept, last = [], start
+    for cut in cuts:
+        if cut - last >= min_bytes:
+            kept.append(cut)
+            last = cut
+    if kept and end - kept[-1] < min_bytes:
+        kept.pop()
+    return kept
+
+
+def _greedy(candidates: List[int], start: int, end: int, max_bytes: int) -> List[int]:
+    """在候选位置中选切点：每段尽量装满但不超过上限"""
+    cuts, last, best = [], start, None
+    for pos in candidates:
+        if pos - last > max_bytes and best is not None and best > last:
+            cuts.append(best)
+            last = best
+        best = pos
+    if end - last > max_bytes and best is not None and best > last:
+        cuts.append(best)
+    return cuts
+
+
+def _pack(raw: bytes, start: int, end: int, max_bytes: int, patterns) -> List[int]:
+    if end - start <= max_bytes or not patterns:
+        return []
+    pattern, rest = patterns[0], patterns[1:]
+    candidates = [m.start() for m in pattern.finditer(raw, start, end) if m.start() > start]
+    return _refine(raw, start, _greedy(candidates, start, end, max_bytes), end,
+                   lambda a, b: _pack(raw, a, b, max_bytes, rest))
+
+
+def _refine(raw: bytes, start: int, cuts: List[int], end: int, split: Callable[[int, int], List[int]]) -> List[int]:
+    """各片段仍然超出上限的，用下一级规则继续切"""
+    result = []
+    points = [start] + cuts + [end]
+    for a, b in zip(points, points[1:]):
+        if a != start:
+            result.append(a)
+        result.extend(split(a, b))
+    return result
+
+
+def _split(raw: bytes, start: int, end: int, max_bytes: int, min_bytes: int, levels: List[int]) -> List[int]:
+    if end - start <= max_bytes:
+        return []
+    # 先在最高一级标题处切开 (每个标题一章)，切不开再用下一级
+    while levels:
+        level, levels = levels[0], levels[1:]
+        cuts = [m.start() for m in _HEADING.finditer(raw, start, end)
+                if int(m.group(1)) <= level and m.start() > start]
+        cuts = _drop_tiny(start, cuts, end, min_bytes)
+        if cuts:
+            return _refine(raw, start, cuts, end,
+                           lambda a, b: _split(raw, a, b, max_bytes, min_bytes, levels))
+    return _pack(raw, start, end, max_bytes, _FALLBACKS)
+
+
+def split_ranges(raw: bytes, max_bytes: int, min_bytes: int) -> List[Tuple[int, int]]:
+    """把一个过大的 XHTML 按 body 内容切成若干字节区间；不需要切时只有一个区间"""
+    start, end = body_bounds(raw)
+    levels = sorted({int(m.group(1)) for m in _HEADING.finditer(raw, start, end)})
+    points = [start] + _split(raw, start, end, max_bytes, min_bytes, levels) + [end]
+    return list(zip(points, points[1:]))
+
+
+def normalize_spine(items: List[Dict], sizes: List[Optional[int]], read: Callable[[int], bytes],
+                    max_bytes: int = DEFAULT_MAX_BYTES, min_bytes: int = DEFAULT_MIN_BYTES) -> List[Dict]:
+    """
+    items: spine 项 [{'id', 'href'}]；sizes: 各项在 ZIP 中的 file_size (找不到成员时为 None)
+    read: 序号 -> 该项原文 (只对过大的项调用)
+    返回章节 [{'id', 'href', ('hrefs'), ('range'), ('title')}]
+    """
+    chapters: List[Dict] = []
+    group: List[int] = []
+
+    def flush():
+        if not group:
+            return
+        first = items[group[0]]
+        chapter = {'id': first['id'], 'href': first['href']}
+        if len(group) > 1:
+            chapter['hrefs'] = [items[i]['href'] for i in group]
+        chapters.append(chapter)
+        group.clear()
+
+    for i, (item, size) in enumerate(zip(items, sizes)):
+        if size is not None and size < min_bytes:
+            # 很小的项：攒在一起，合并后不超过上限
+            if group and sum(sizes[j] for j in group) + size > max_bytes:
+                flush()
+            group.append(i)
+            continue
+        flush()
+
+        if size is None or size <= max_bytes:
+            chapters.append({'id': item['id'], 'href': item['href']})
+            continue
+
+        raw = read(i)
+        ranges = split_ranges(raw, max_bytes, min_bytes)
+        if len(ranges) == 1:
+            chapters.append({'id': item['id'], 'href': item['href']})
+            continue
+        for n, (start, end) in enumerate(ranges):
+            chapter = {'id': item['id'] if n == 0 else f"{item['id']}_{n}", 'href': item['href'],
+                       'range': [start, end]}
+            title = heading_title(raw, start)
+            if title:
+                chapter['title'] = title
+            chapters.append(chapter)
+    flush()
+    return chapters
+
+
+def chapter_entry(ch: Dict) -> Dict:
+    """写入书籍 JSON 的章节目录项 (内容为空，按需解析)"""
+    entry = {
+        'index': ch.get('index', 0),
+        'id': ch.get('id', ''),
+        'title': ch.get('title', '章节'),
+        'href': ch.get('href', ''),
+        'content': None,
+        'word_count': 0
+    }
+    for key in SPINE_FIELDS:
+        if ch.get(key):
+            entry[key] = ch[key]
+    return entry
@@ -0,0 +1,139 @@
+"""
+文本分段 - 按中英文句子边界把长文本切成适合 TTS 的片段
+结果是确定性的：同样的文本总是得到同样的分段
+"""
+import re
+from typing import List, Tuple
+
+# 句子：到中文句末标点 (含后随引号/括号)、英文句末标点 + 空白、换行或文本末尾为止
+_SENTENCE_RE = re.compile(
+    r'.+?(?:[。！？；…]+[”’」』）)\'"]*|[.!?;]+[”’)\'"]*(?=\s)|\n+|$)',
+    re.S
+)
+# 过长句子的次级切分点：逗号、顿号、冒号、空白
+_CLAUSE_RE = re.compile(r'.+?(?:[，、：,:]+|\s+|$)', re.S)
+
+DEFAULT_MAX_CHARS = 200
+DEFAULT_MIN_CHARS = 20
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """句子在原文中的位置 [start, end)，已去掉首尾空白，不含空句"""
+    spans = []
+    for match in _SENTENCE_RE.finditer(text):
+        raw = match.group(0)
+        stripped = raw.strip()
+        if stripped:
+            start = match.start() + (len(raw) - len(raw.lstrip()))
+            spans.append((start, start + len(stripped)))
+    return spans
+
+
+def split_sentences(text: str) -> List[str]:
+    """切分句子，去掉首尾空白和空句"""
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    """超长句子 text[start:end] 按分句切开，仍然超长的部分硬切；返回各片在原文中的位置"""
+    pieces = []
+    current = None
+    for match in _CLAUSE_RE.finditer(text, start, end):
+        clause_start, clause_end = match.span()
+        if clause_start == clause_end:
+            continue
+        while clause_end - clause_start > max_chars:
+            if current:
+                pieces.append(current)
+                current = None
+            pieces.append((clause_start, clause_start + max_chars))
+            clause_start += max_chars
+        if current and (current[1] - current[0]) + (clause_end - clause_start) > max_chars:
+            pieces.append(current)
+            current = None
+        current = (current[0], clause_end) if current else (clause_start, clause_end)
+    if current:
+        pieces.append(current)
+    return [_strip_span(text, s, e) for s, e in pieces if text[s:e].strip()]
+
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    piece = text[start:end]
+    start += len(piece) - len(piece.lstrip())
+    return start, start + len(piece.strip())
+
+
+def _join(left: str, right: str) -> str:
+    """拼接两段文本，英文之间补空格"""
+    if not left:
+        return right
+    if left[-1].isalnum():
+        # 没有句末标点 (如标题行)，保留换行作为停顿
+        return f"{left}\n{right}"
+    if left[-1].isascii() and right[0].isascii():
+        return f"{left} {right}"
+    return left + right
+
+
+def split_segments(text: str, max_chars: int = DEFAULT_MAX_CHARS,
+                   min_chars: int = DEFAULT_MIN_CHARS) -> List[str]:
+    """
+    把文本切成 TTS 片段
+    - 尽量在句子边界切分，相邻短句合并到不超过 max_chars
+    - 单句超过 max_chars 时在分句处继续切
+    - 短于 min_chars 的尾段并入前一段
+    """
+    return [segment for _, _, segment in split_segments_with_spans(text, max_chars, min_chars)]
+
+
+def split_segments_with_spans(text: str, max_chars: int = DEFAULT_MAX_CHARS,
+                              min_chars: int = DEFAULT_MIN_CHARS) -> List[Tuple[int, int, str]]:
+    """与 split_segments 相同的切分，同时给出每段在原文中的位置 (start, end, 片段文本)"""
+    pieces = []
+    for start, end in sentence_spans(text):
+        if end - start > max_chars:
+            pieces.extend(_split_long(text, start, end, max_chars))
+        else:
+            pieces.append((start, end))
+
+    segments = []
+    current = None
+    for start, end in pieces:
+        piece = text[start:end]
+        if current is None:
+            current = [start, end, piece]
+            continue
+        candidate = _join(current[2], piece)
+        if len(candidate) > max_chars and len(current[2]) >= min_chars:
+            segments.append(tuple(current))
+            current = [start, end, piece]
+        else:
+            current = [current[0], end, candidate]
+    if current:
+        if segments and len(current[2]) < min_chars and len(segments[-1][2]) + len(current[2]) <= max_chars + min_chars:
+            last = segments[-1]
+            segments[-1] = (last[0], current[1], _join(last[2], current[2]))
+        else:
+            segments.append(tuple(current))
+    return segments
+
+
+def group_segments(segments: List[str], max_chars: int, max_items: int = 0) -> List[List[str]]:
+    """
+    把相邻片段按总字数分组，用于批量合成 (一次上游请求合成一组)
+    max_chars <= 0 时每段单独成组；单段超过上限时也单独成组
+    """
+    groups = []
+    current = []
+    current_chars = 0
+    for segment in segments:
+        full = current and (current_chars + len(segment) > max_chars or (max_items and len(current) >= max_items))
+        if full:
+            groups.append(current)
+            current = []
+            current_chars = 0
+        current.append(segment)
+        current_chars += len(segment)
+    if current:
+        groups.append(current)
+    return groups
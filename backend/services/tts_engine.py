@@ -1,20 +1,48 @@
 import edge_tts
+import aiohttp
 import asyncio
+import base64
+import json
 from pathlib import Path
-import hashlib
 import logging
 import os
-import time
+from collections import deque
+from typing import List, Optional
 
-# 配置代理 - Edge-TTS 通过 V2Tun/V2Ray 访问 Microsoft 服务
-os.environ['HTTP_PROXY'] = 'http://127.0.0.1:10808'
-os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:10808'
+from services.audio_cache import AudioCache
+from services.audio_variants import AudioTranscoder
+from services.http_sessions import get_http_sessions
+from services.single_flight import StreamCoalescer
+from services.text_segmenter import group_segments, split_segments
+from services.tts_timings import build_timing_index, TIMINGS_SUFFIX
+from services.tts_router import TTSRouter, router_settings_from_env
+from services.tts_scheduler import (
+    PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_ORDER, QueueTimeout, get_tts_scheduler
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 缓存键中的后端标识
+BACKEND_EASYVOICE = 'easyvoice'
+BACKEND_EDGE = 'edge'
+
+# 批量合成 (EasyVoice data 多项) 时插在各段之间的分隔项：EasyVoice 把各项的音频直接拼接、
+# 没有分段标记，分隔项单独合成一次得到它的音频字节，再按它把整批音频切回各段
+BATCH_MARKER_TEXT = '分段标记'
+# 批量请求的超时按字数放宽 (会话默认 60s 只够单段)
+BATCH_TIMEOUT_BASE_SECONDS = 60
+BATCH_TIMEOUT_PER_CHAR = 0.05
+
+
+class BatchSplitError(Exception):
+    """批量音频无法按分隔项切回各段"""
+
 class TTSEngine:
-    def __init__(self):
+    STREAM_CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, audio_dir: Path = Path('data/audio'), cache_max_bytes: Optional[int] = None,
+                 scheduler=None):
         # 移植自 EasyVoice 的完整中文语音列表
         self.voices = {
             # 普通话 - 女声
@@ -46,46 +74,44 @@ class TTSEngine:
         
         
         # 音频输出目录 - 与 app.py 中的静态文件目录匹配
-        self.audio_dir = Path('data/audio')
+        self.audio_dir = Path(audio_dir)
         self.audio_dir.mkdir(parents=True, exist_ok=True)
         
-        # 启动时清理旧文件
-        self.cleanup_old_audio_files()
+        # 按容量上限做 LRU 淘汰的音频缓存 (默认 1GB)
+        if cache_max_bytes is None:
+            cache_max_bytes = int(os.environ.get('TTS_CACHE_MAX_MB', '1024')) * 1024 * 1024
+        self.cache = AudioCache(self.audio_dir, cache_max_bytes)
+        # 低码率转码版本 (与源音频一起缓存)
+        self.variants = AudioTranscoder(self.cache)
+        
+        # Edge-TTS 边界事件粒度 (WordBoundary 可同时得到词和句时间轴)
+        self.edge_boundary = os.environ.get('TTS_EDGE_BOUNDARY', 'WordBoundary')
+        
+        # Edge-TTS 代理 - 默认通过本机 V2Tun/V2Ray 访问 Microsoft 服务，设为空字符串则直连
+        self.edge_proxy = os.environ.get('EDGE_TTS_PROXY', 'http://127.0.0.1:10808') or None
+        # 设置后 Edge-TTS 请求改发到本地桩服务 (stub_tts_server.py)，用于离线测试和压测
+        self.edge_stub_url = os.environ.get('EDGE_TTS_STUB_URL') or None
+        
+        # EasyVoice API 地址
+        self.easyvoice_url = os.environ.get('EASYVOICE_API_URL', 'http://localhost:3000/api/v1/tts/generateJson')
+        # 批量合成：一次请求的总字数/段数上限，字数设为 0 则不批量
+        self.batch_max_chars = int(os.environ.get('TTS_BATCH_MAX_CHARS', '1500'))
+        self.batch_max_items = int(os.environ.get('TTS_BATCH_MAX_ITEMS', '10'))
         
         logger.info(f"TTS引擎初始化完成，支持 {len(self.voices)} 种语音")
         
-        # 熔断器状态
-        self.ev_failure_count = 0
-        self.ev_circuit_open = False
-        self.ev_circuit_open_time = 0
-        self.EV_MAX_FAILURES = 2
-        self.EV_COOLDOWN_SECONDS = 60
-
-    def cleanup_old_audio_files(self, max_age_hours=24):
-        """清理超过指定时间的音频文件"""
-        try:
-            current_time = time.time()
-            max_age_seconds = max_age_hours * 3600
-            
-            deleted_count = 0
-            total_size = 0
-            
-            for audio_file in self.audio_dir.glob('*.mp3'):
-                try:
-                    file_age = current_time - audio_file.stat().st_mtime
-                    file_size = audio_file.stat().st_size
-                    
-                    if file_age > max_age_seconds:
-                        total_size += file_size
-                        audio_file.unlink()
-                        deleted_count += 1
-                except Exception as e:
-                    logger.warning(f"删除文件失败 {audio_file}: {e}")
-            
-            if deleted_count > 0:
-                logger.info(f"🧹 清理了 {deleted_count} 个旧音频文件，释放 {total_size/1024/1024:.2f} MB")
-        except Exception as e:
-            logger.error(f"清理音频文件失败: {e}")
+        # 多后端路由 (延迟分位数、熔断试探、可选对冲)；按名称延迟取方法，便于测试替换
+        self.router = TTSRouter([
+            (BACKEND_EASYVOICE, lambda *args: self._stream_easyvoice(*args)),
+            (BACKEND_EDGE, lambda *args: self._stream_edge(*args)),
+        ], **router_settings_from_env())
+        
+        # 相同文本+参数的并发请求共享一次上游合成
+        self.flights = StreamCoalescer()
+        
+        # 上游准入调度 (全局/设备并发上限 + 优先级)
+        self.scheduler = scheduler or get_tts_scheduler()
+        self._queued_tickets = {}
 
     def get_available_voices(self):
         """获取可用的语音列表"""
@@ -98,56 +124,79 @@ class TTSEngine:
             })
         return {'voices': voice_list}
 
-    async def synthesize(self, text: str, voice_model: str = "default", rate: str = "+0%", volume: str = "+0%"):
+    def _cache_key(self, backend: str, text: str, voice: str, rate: str, volume: str) -> str:
+        """缓存键 (规范化文本 + 语音参数 + 后端的完整哈希)"""
+        return AudioCache.make_key(text, voice, rate, volume, backend)
+
+    async def _read_cached(self, path: Path):
+        """分块读出已缓存的音频"""
+        with open(path, "rb") as f:
+            while chunk := f.read(self.STREAM_CHUNK_SIZE):
+                yield chunk
+
+    def _request_key(self, text: str, voice: str, rate: str, volume: str) -> str:
+        """进行中请求的合并键 (与后端无关)"""
+        return AudioCache.make_key(text, voice, rate, volume, 'request')
+
+    def _backend_keys(self, text: str, voice: str, rate: str, volume: str):
+        return [
+            self._cache_key(BACKEND_EASYVOICE, text, voice, rate, volume),
+            self._cache_key(BACKEND_EDGE, text, voice, rate, volume)
+        ]
+
+    async def synthesize(self, text: str, voice_model: str = "default", rate: str = "+0%", volume: str = "+0%",
+                         priority: str = PRIORITY_INTERACTIVE, device_id: Optional[str] = None):
         """
-        合成语音（优先使用 EasyVoice，失败则降级）
+        合成语音并返回缓存文件路径（优先使用 EasyVoice，失败则降级）
+        与 stream_synthesize 共用同一套进行中请求合并
         """
-        # 尝试使用 EasyVoice
-        try:
-            return await self._synthesize_easyvoice(text, voice_model, rate, volume)
-        except Exception as e:
-            logger.warning(f"EasyVoice 调用失败，尝试降级到 Edge-TTS: {e}")
-            
-        # 降级到 Edge-TTS
         voice = voice_model if voice_model in self.voices else self.default_voice
+        keys = self._backend_keys(text, voice, rate, volume)
         
-        # 生成文件名
-        text_hash = hashlib.md5(f"{text}_{voice}_{rate}_{volume}".encode()).hexdigest()[:12]
-        output_filename = f"tts_{text_hash}.mp3"
-        output_path = self.audio_dir / output_filename
-        
-        # 如果文件已存在，直接返回
-        if output_path.exists():
-            logger.info(f"使用缓存的音频: {output_path.name}")
-            return output_path
+        # 命中缓存直接返回
+        cached = self.cache.lookup_any(keys)
+        if cached:
+            logger.info(f"使用缓存的音频: {cached.name}")
+            return cached
         
         try:
-            logger.info(f"正在合成语音(Edge-TTS): {text[:30]}... (语音: {voice})")
-            
-            communicate = edge_tts.Communicate(
-                text=text,
-                voice=voice,
-                rate=rate,
-                volume=volume
-            )
-            
-            await communicate.save(str(output_path))
-            return output_path
-            
+            async for _ in self._coalesced_stream(text, voice_model, rate, volume, priority, device_id):
+                pass
         except Exception as e:
             logger.error(f"语音合成失败: {str(e)}")
             raise
-
-    async def _synthesize_easyvoice(self, text: str, voice_model: str, rate: str, volume: str) -> Path:
-        """调用本地 EasyVoice 服务"""
-        import aiohttp
-        
-        # EasyVoice API 地址
-        api_url = "http://localhost:3000/api/v1/tts/generateJson"
         
-        voice = voice_model if voice_model in self.voices else self.default_voice
+        for key in keys:
+            path = self.cache.path_for(key)
+            if path.exists():
+                return path
+        raise Exception("合成完成但缓存文件不存在")
+
+    async def _stream_easyvoice(self, text: str, voice: str, rate: str, volume: str):
+        """
+        调用 EasyVoice 并边收边转发音频块
+        同时写入临时文件，完整成功后才提交为缓存
+        """
+        key = self._cache_key(BACKEND_EASYVOICE, text, voice, rate, volume)
+        logger.info(f"调用 EasyVoice API: {text[:30]}...")
+        async for chunk in self._post_easyvoice([text], voice, rate, volume, key):
+            yield chunk
+
+    async def _post_easyvoice(self, texts: List[str], voice: str, rate: str, volume: str, key: str):
+        """请求 generateJson，音频边转发边写入缓存条目 key"""
+        with self.cache.writer(key) as writer:
+            async for chunk in self._request_easyvoice(texts, voice, rate, volume):
+                writer.write(chunk)
+                yield chunk
+            
+            if writer.size == 0:
+                raise Exception("EasyVoice 返回空数据")
         
-        # 构建请求体
+        logger.info(f"EasyVoice 合成成功: {writer.path.name}, 大小: {writer.size} bytes")
+
+    async def _request_easyvoice(self, texts: List[str], voice: str, rate: str, volume: str,
+                                 timeout: Optional[aiohttp.ClientTimeout] = None):
+        """请求 generateJson (data 中每段一项)，逐块产出音频；timeout 不传时用会话的默认超时"""
         payload = {
             "data": [
                 {
@@ -156,40 +205,22 @@ class TTSEngine:
                     "rate": rate,
                     "volume": volume
                 }
+                for text in texts
             ]
         }
         
-        # 生成文件名
-        text_hash = hashlib.md5(f"ev_{text}_{voice}_{rate}_{volume}".encode()).hexdigest()[:12]
-        output_filename = f"tts_ev_{text_hash}.mp3"
-        output_path = self.audio_dir / output_filename
-        
-        if output_path.exists():
-            logger.info(f"使用缓存的音频(EasyVoice): {output_path.name}")
-            return output_path
-
-        logger.info(f"调用 EasyVoice API: {text[:30]}...")
-        
-        # 设置超时
-        timeout = aiohttp.ClientTimeout(total=60)
+        # 复用长连接会话 (默认超时 60s 在会话池中配置)
+        session = get_http_sessions().get('easyvoice')
+        options = {'timeout': timeout} if timeout is not None else {}
         
         try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(api_url, json=payload) as response:
-                    if response.status != 200:
-                        text_resp = await response.text()
-                        raise Exception(f"EasyVoice API Error: {response.status} - {text_resp}")
-                    
-                    audio_data = await response.read()
-                    
-                    if not audio_data or len(audio_data) == 0:
-                        raise Exception("EasyVoice 返回空数据")
-                    
-                    with open(output_path, "wb") as f:
-                        f.write(audio_data)
-                        
-                    logger.info(f"EasyVoice 合成成功: {output_path.name}, 大小: {len(audio_data)} bytes")
-                    return output_path
+            async with session.post(self.easyvoice_url, json=payload, **options) as response:
+                if response.status != 200:
+                    text_resp = await response.text()
+                    raise Exception(f"EasyVoice API Error: {response.status} - {text_resp}")
+                
+                async for chunk in response.content.iter_chunked(self.STREAM_CHUNK_SIZE):
+                    yield chunk
         except aiohttp.ClientConnectorError:
             logger.warning("EasyVoice 服务未连接 (可能正在重启)，降级到 Edge-TTS")
             raise
@@ -197,101 +228,280 @@ class TTSEngine:
             logger.error(f"EasyVoice 调用异常: {e}")
             raise
 
-    async def stream_synthesize(self, text: str, voice_model: str = "default", rate: str = "+0%", volume: str = "+0%"):
+    async def _stream_edge(self, text: str, voice: str, rate: str, volume: str):
+        """Edge-TTS 边生成边转发音频块，成功后提交缓存并保存词/句时间轴"""
+        key = self._cache_key(BACKEND_EDGE, text, voice, rate, volume)
+        
+        if self.edge_stub_url:
+            events = self._edge_stub_events(text, voice, rate, volume)
+        else:
+            communicate = edge_tts.Communicate(
+                text=text,
+                voice=voice,
+                rate=rate,
+                volume=volume,
+                boundary=self.edge_boundary,
+                proxy=self.edge_proxy
+            )
+            events = communicate.stream()
+        
+        chunk_count = 0
+        boundaries = []
+        with self.cache.writer(key) as writer:
+            async for chunk in events:
+                if chunk["type"] == "audio":
+                    writer.write(chunk["data"])
+                    chunk_count += 1
+                    yield chunk["data"]
+                elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                    boundaries.append(chunk)
+        
+        logger.info(f"✅ Edge-TTS 合成成功: {chunk_count} 块, 总大小: {writer.size} bytes")
+        
+        if boundaries:
+            index = build_timing_index(text, boundaries, writer.size)
+            with self.cache.sidecar_writer(key, TIMINGS_SUFFIX) as timings:
+                timings.write(json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    async def _edge_stub_events(self, text: str, voice: str, rate: str, volume: str):
+        """从本地桩服务读取与 communicate.stream() 相同格式的事件"""
+        session = get_http_sessions().get('easyvoice')
+        payload = {"text": text, "voice": voice, "rate": rate, "volume": volume, "boundary": self.edge_boundary}
+        async with session.post(self.edge_stub_url, json=payload) as response:
+            if response.status != 200:
+                raise Exception(f"Edge-TTS 桩服务错误: {response.status}")
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["type"] == "audio":
+                    event["data"] = base64.b64decode(event["data"])
+                yield event
+
+    def find_timings(self, text: str, voice_model: str = "default", rate: str = "+0%",
+                     volume: str = "+0%") -> Optional[Path]:
+        """查找某段文本已缓存音频的时间轴 (只有 Edge-TTS 合成的音频有)"""
+        voice = voice_model if voice_model in self.voices else self.default_voice
+        return self.cache.sidecar(self._cache_key(BACKEND_EDGE, text, voice, rate, volume), TIMINGS_SUFFIX)
+
+    async def stream_synthesize(self, text: str, voice_model: str = "default", rate: str = "+0%", volume: str = "+0%",
+                                priority: str = PRIORITY_INTERACTIVE, device_id: Optional[str] = None):
         """
         流式合成语音 - 优先使用 EasyVoice
+        音频块一到就转发给客户端；EasyVoice 在输出第一个字节前失败时降级到 Edge-TTS
         """
-        try:
-            # --- 熔断器检查 ---
-            if self.ev_circuit_open:
-                elapsed = time.time() - self.ev_circuit_open_time
-                if elapsed < self.EV_COOLDOWN_SECONDS:
-                    logger.warning(f"⚡ 熔断器开启中 (剩余 {int(self.EV_COOLDOWN_SECONDS - elapsed)}s)，直接使用 Edge-TTS")
-                    raise Exception("Circuit Breaker Open")
-                else:
-                    logger.info("🔄 熔断器冷却结束，尝试恢复 EasyVoice")
-                    self.ev_circuit_open = False
-                    self.ev_failure_count = 0
-
-            # --- 严格的语音验证 (成熟的机制) ---
-            # 确保传给 EasyVoice 的语音一定在白名单中，防止崩溃
-            safe_voice = voice_model
-            if voice_model not in self.voices:
-                logger.warning(f"⚠️ 语音 '{voice_model}' 不在白名单中，自动降级到默认语音 '{self.default_voice}'")
-                safe_voice = self.default_voice
-            
-            logger.info(f"🎯 尝试使用 EasyVoice (语音: {safe_voice})...")
-            
-            # 设置更短的超时，快速失败
-            output_path = await self._synthesize_easyvoice(text, safe_voice, rate, volume)
-            
-            if not output_path.exists():
-                raise Exception("EasyVoice 文件不存在")
-            
-            file_size = output_path.stat().st_size
-            if file_size == 0:
-                raise Exception("EasyVoice 文件为空")
-            
-            logger.info(f"✅ EasyVoice 成功: {file_size} bytes")
-            
-            # 成功，重置失败计数
-            self.ev_failure_count = 0
-            
-            with open(output_path, "rb") as f:
-                complete_audio = f.read()
-                if not complete_audio:
-                    raise Exception("读取音频失败")
-                yield complete_audio
+        voice = voice_model if voice_model in self.voices else self.default_voice
+        
+        # 命中缓存直接返回
+        cached = self.cache.lookup_any(self._backend_keys(text, voice, rate, volume))
+        if cached:
+            logger.info(f"使用缓存的音频: {cached.name}")
+            async for chunk in self._read_cached(cached):
+                yield chunk
             return
-            
-        except Exception as e:
-            # 记录失败
-            if str(e) != "Circuit Breaker Open":
-                self.ev_failure_count += 1
-                logger.warning(f"⚠️ EasyVoice 失败 ({self.ev_failure_count}/{self.EV_MAX_FAILURES}): {e}")
-                
-                if self.ev_failure_count >= self.EV_MAX_FAILURES:
-                    self.ev_circuit_open = True
-                    self.ev_circuit_open_time = time.time()
-                    logger.error(f"🔥 EasyVoice 连续失败，熔断器开启！将在 {self.EV_COOLDOWN_SECONDS} 秒内降级到 Edge-TTS")
-            else:
-                pass # 熔断中，不记录日志
+        
+        async for chunk in self._coalesced_stream(text, voice_model, rate, volume, priority, device_id):
+            yield chunk
+
+    def _coalesced_stream(self, text: str, voice_model: str, rate: str, volume: str,
+                          priority: str, device_id: Optional[str]):
+        """订阅进行中的相同请求；没有时排队发起一次上游合成"""
+        voice = voice_model if voice_model in self.voices else self.default_voice
+        key = self._request_key(text, voice, rate, volume)
+        
+        # 合并到一个仍在排队的低优先级请求上时，提升它的优先级
+        queued = self._queued_tickets.get(key)
+        if queued is not None:
+            self.scheduler.promote(queued, priority)
+        
+        ticket = self.scheduler.ticket(priority, device_id)
+        return self.flights.stream(key, lambda: self._scheduled_upstream(
+            key, ticket, lambda: self._stream_upstream(text, voice_model, rate, volume)))
+
+    def reprioritize(self, text: str, voice_model: str = "default", rate: str = "+0%", volume: str = "+0%",
+                     priority: str = PRIORITY_INTERACTIVE) -> bool:
+        """
+        调整仍在排队的合成请求的优先级；已开始合成或不在排队中时返回 False
+        还有其他请求在等同一段音频时只升不降
+        """
+        voice = voice_model if voice_model in self.voices else self.default_voice
+        key = self._request_key(text, voice, rate, volume)
+        ticket = self._queued_tickets.get(key)
+        if ticket is None:
+            return False
+        if PRIORITY_ORDER[priority] > PRIORITY_ORDER[ticket.priority] and self.flights.subscribers(key) > 1:
+            return False
+        return self.scheduler.reprioritize(ticket, priority)
+
+    async def _scheduled_upstream(self, key: str, ticket, upstream):
+        """拿到调度名额后再调用上游"""
+        self._queued_tickets[key] = ticket
+        try:
+            async with self.scheduler.slot(ticket):
+                self._queued_tickets.pop(key, None)
+                async for chunk in upstream():
+                    yield chunk
+        finally:
+            if self._queued_tickets.get(key) is ticket:
+                del self._queued_tickets[key]
 
+    async def _stream_upstream(self, text: str, voice_model: str, rate: str, volume: str):
+        """实际调用上游：由路由器按健康状况选择 EasyVoice / Edge-TTS"""
+        voice = voice_model if voice_model in self.voices else self.default_voice
+        
+        # --- 严格的语音验证 (成熟的机制) ---
+        # 确保传给 EasyVoice 的语音一定在白名单中，防止崩溃
+        if voice_model not in self.voices:
+            logger.warning(f"⚠️ 语音 '{voice_model}' 不在白名单中，自动降级到默认语音 '{self.default_voice}'")
+        
+        logger.info(f"🎯 合成语音 (语音: {voice}, 文本长度: {len(text)})")
+        async for chunk in self.router.stream(text, voice, rate, volume):
+            yield chunk
 
-        # 降级到 Edge-TTS
+    async def synthesize_batch(self, texts: List[str], voice_model: str = "default", rate: str = "+0%",
+                               volume: str = "+0%", priority: str = PRIORITY_INTERACTIVE,
+                               device_id: Optional[str] = None) -> List[Path]:
+        """
+        批量合成多段文本，返回各段的音频文件 (与逐段合成的缓存条目相同)
+        未缓存的段用一次 EasyVoice 请求合成，按分隔项切回各段后分别写入缓存；
+        EasyVoice 不可用、批量失败或无法切分时逐段合成 (可降级到 Edge-TTS)
+        """
         voice = voice_model if voice_model in self.voices else self.default_voice
+        missing = list(dict.fromkeys(
+            text for text in texts if not self.cache.lookup_any(self._backend_keys(text, voice, rate, volume))
+        ))
         
-        logger.info(f"🎤 使用语音模型: {voice}")
-        logger.info(f"📝 合成文本长度: {len(text)}")
+        if len(missing) > 1 and self.batch_max_chars > 0 and self.router.health[BACKEND_EASYVOICE].available():
+            request_key = self._request_key(json.dumps(missing, ensure_ascii=False), voice, rate, volume)
+            ticket = self.scheduler.ticket(priority, device_id)
+            try:
+                async for _ in self.flights.stream(request_key, lambda: self._scheduled_upstream(
+                        request_key, ticket, lambda: self._stream_easyvoice_batch(missing, voice, rate, volume))):
+                    pass
+            except QueueTimeout:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ EasyVoice 批量合成失败，改为逐段合成: {e}")
         
+        # 批量成功后各段都已缓存，这里直接命中
+        return list(await asyncio.gather(*(
+            self.synthesize(text, voice_model, rate, volume, priority=priority, device_id=device_id)
+            for text in texts
+        )))
+
+    async def _batch_marker(self, voice: str, rate: str, volume: str) -> bytes:
+        """分隔项的音频 (按语音参数缓存，与普通的单段缓存条目相同；并发的批量请求共享一次合成)"""
+        key = self._cache_key(BACKEND_EASYVOICE, BATCH_MARKER_TEXT, voice, rate, volume)
+        path = self.cache.lookup(key)
+        if path is None:
+            flight_key = AudioCache.make_key(BATCH_MARKER_TEXT, voice, rate, volume, 'batch-marker')
+            async for _ in self.flights.stream(flight_key, lambda: self._post_easyvoice(
+                    [BATCH_MARKER_TEXT], voice, rate, volume, key)):
+                pass
+            path = self.cache.path_for(key)
+        return path.read_bytes()
+
+    async def _stream_easyvoice_batch(self, texts: List[str], voice: str, rate: str, volume: str):
+        """
+        一次请求合成多段 (各段之间插入分隔项)，结果计入 EasyVoice 的健康统计
+        整批音频按分隔项的字节切开，每段写入自己的缓存条目
+        """
+        health = self.router.health[BACKEND_EASYVOICE]
+        if not health.allow_request():
+            raise Exception("EasyVoice 熔断中")
+        
+        chars = sum(len(t) for t in texts)
+        timeout = aiohttp.ClientTimeout(total=BATCH_TIMEOUT_BASE_SECONDS + chars * BATCH_TIMEOUT_PER_CHAR)
+        items = [texts[0]]
+        for text in texts[1:]:
+            items += [BATCH_MARKER_TEXT, text]
+        
+        logger.info(f"📦 批量调用 EasyVoice API: {len(texts)} 段, {chars} 字")
+        audio = bytearray()
         try:
-            audio_chunks = []
-            
-            communicate = edge_tts.Communicate(
-                text=text,
-                voice=voice,
-                rate=rate,
-                volume=volume
-            )
-            
-            logger.info("⏳ 开始生成音频...")
-            chunk_count = 0
-            
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_chunks.append(chunk["data"])
-                    chunk_count += 1
-            
-            complete_audio = b''.join(audio_chunks)
-            total_size = len(complete_audio)
-            
-            logger.info(f"✅ Edge-TTS 合成成功: {chunk_count} 块, 总大小: {total_size} bytes")
-            
-            yield complete_audio
-                    
+            marker = await self._batch_marker(voice, rate, volume)
+            async for chunk in self._request_easyvoice(items, voice, rate, volume, timeout):
+                audio += chunk
+                yield chunk
+        except asyncio.CancelledError:
+            health.release_trial()
+            raise
         except Exception as e:
-            logger.error(f"❌ Edge-TTS 合成失败: {type(e).__name__}: {str(e)}")
+            health.record_failure(str(e))
             raise
+        health.record_success()
+        
+        parts = bytes(audio).split(marker)
+        if len(parts) != len(texts) or not all(parts):
+            # 上游没有按项原样拼接 (如重新编码)，以后不再批量
+            self.batch_max_chars = 0
+            raise BatchSplitError(f"批量音频按分隔项切出 {len(parts)} 段，应为 {len(texts)} 段，已关闭批量合成")
+        for text, part in zip(texts, parts):
+            with self.cache.writer(self._cache_key(BACKEND_EASYVOICE, text, voice, rate, volume)) as writer:
+                writer.write(part)
+
+    async def stream_synthesize_chapter(self, text: str, voice_model: str = "default", rate: str = "+0%",
+                                        volume: str = "+0%", window: int = 3,
+                                        priority: str = PRIORITY_INTERACTIVE, device_id: Optional[str] = None):
+        """
+        分段流水线合成 - 用于整章朗读
+        按句子边界切分文本，第一段直接流式合成；后续段按总字数分批，每批一次 EasyVoice 请求，
+        最多 window 批并发合成到缓存，严格按原文顺序输出音频；首句延迟与段落长度无关
+        第二段单独成批，保证第一段播完前就绪
+        交互请求的后续段按预取优先级排队，不与其他用户的首句抢名额
+        """
+        async for chunk in self.stream_synthesize_segments(split_segments(text), voice_model, rate, volume,
+                                                           window, priority, device_id):
+            yield chunk
+
+    async def stream_synthesize_segments(self, segments: List[str], voice_model: str = "default",
+                                         rate: str = "+0%", volume: str = "+0%", window: int = 3,
+                                         priority: str = PRIORITY_INTERACTIVE, device_id: Optional[str] = None,
+                                         batch: bool = True):
+        """
+        按顺序流式输出已切好的各段音频 (流水线同 stream_synthesize_chapter)
+        batch=False 时每段单独合成、单独缓存 (缓存键只取决于段文本)
+        """
+        ahead_priority = PRIORITY_PREFETCH if priority == PRIORITY_INTERACTIVE else priority
+        if not segments:
+            return
+        
+        if not batch:
+            batches = [[segment] for segment in segments[1:]]
+        elif len(segments) > 1:
+            batches = [[segments[1]]] + group_segments(segments[2:], self.batch_max_chars, self.batch_max_items)
+        else:
+            batches = []
+        
+        logger.info(f"📚 分段合成: {len(segments)} 段 / {len(batches) + 1} 次请求, 并发窗口 {window}")
+        pending = deque()
+        next_index = 0
+        
+        def fill_window():
+            nonlocal next_index
+            while next_index < len(batches) and len(pending) < window:
+                pending.append(asyncio.create_task(
+                    self.synthesize_batch(batches[next_index], voice_model, rate, volume,
+                                          priority=ahead_priority, device_id=device_id)
+                ))
+                next_index += 1
+        
+        try:
+            fill_window()
+            async for chunk in self.stream_synthesize(segments[0], voice_model, rate, volume,
+                                                      priority=priority, device_id=device_id):
+                yield chunk
+            
+            while pending:
+                output_paths = await pending.popleft()
+                fill_window()
+                for output_path in output_paths:
+                    async for chunk in self._read_cached(output_path):
+                        yield chunk
+        finally:
+            # 客户端断开或出错时取消尚未完成的段
+            for task in pending:
+                task.cancel()
 
 # 全局 TTS 引擎实例
 _tts_engine = None
@@ -0,0 +1,147 @@
+"""
+按朗读位置的预测性合成 - 段 n 播放时，在后台以预取优先级把当前章节的 n+1..n+k 段合成到缓存
+- 每个设备一个窗口：位置连续前进时窗口跟着前移，不重复合成
+- 换书/换章/换语音参数或位置跳出窗口时，取消正在进行的预取，从新位置重新开始
+- 客户端只需按顺序请求各段 (或上报进度)，不需要自己做缓冲
+"""
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from services.tts_scheduler import PRIORITY_PREFETCH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 3
+# 这么久没有新位置就结束窗口 (用户已停止收听)
+DEFAULT_IDLE_TIMEOUT = 600
+
+
+class _Window:
+    def __init__(self, book_id: str, chapter: int, position: int, voice: tuple):
+        self.book_id = book_id
+        self.chapter = chapter
+        self.position = position
+        self.voice = voice
+        self.next_index = position + 1
+        self.advanced = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def same_stream(self, book_id: str, chapter: int, voice: tuple) -> bool:
+        return self.book_id == book_id and self.chapter == chapter and self.voice == voice
+
+
+class SpeculativePrefetcher:
+    """
+    synthesize: 与 TTSEngine.synthesize 相同签名的协程函数
+    load_segments: (book_id, chapter) -> 章节分段列表 (同步函数，在线程中调用)
+    """
+
+    def __init__(self, synthesize: Callable, load_segments: Callable[[str, int], List[str]],
+                 window: int = DEFAULT_WINDOW, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.synthesize = synthesize
+        self.load_segments = load_segments
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self._windows: Dict[str, _Window] = {}
+        self._stats = {'started': 0, 'jumps': 0, 'prefetched': 0, 'failed': 0}
+
+    def update(self, device_id: str, book_id: str, chapter: int, segment: int,
+               voice_model: str = "default", rate: str = "+0%", volume: str = "+0%"):
+        """设备开始播放第 segment 段 (segment = -1 表示章节开头，尚未播放任何段)"""
+        if self.window <= 0 or not device_id:
+            return
+        voice = (voice_model, rate, volume)
+        current = self._windows.get(device_id)
+
+        if current and current.same_stream(book_id, chapter, voice) and \
+                current.position <= segment <= current.position + self.window:
+            # 顺序前进：窗口前移
+            current.position = segment
+            current.advanced.set()
+            if current.task is None or current.task.done():
+                self._start(device_id, current)
+            return
+
+        if current:
+            self._stats['jumps'] += 1
+            logger.info(f"⏭️ 设备 {device_id} 位置跳转，取消预取 "
+                        f"(第{current.chapter}章第{current.position}段 -> 第{chapter}章第{segment}段)")
+            self._cancel_task(current)
+        self._start(device_id, _Window(book_id, chapter, segment, voice))
+
+    def on_progress(self, device_id: str, book_id: str, chapter: int):
+        """阅读进度上报：正在收听的设备换章时，从新章节开头重新预取"""
+        current = self._windows.get(device_id)
+        if current is None or current.book_id != book_id or current.chapter == chapter:
+            return
+        if current.task is None or current.task.done():
+            return
+        self.update(device_id, book_id, chapter, -1, *current.voice)
+
+    def cancel(self, device_id: str):
+        window = self._windows.pop(device_id, None)
+        if window:
+            self._cancel_task(window)
+
+    def _cancel_task(self, window: _Window):
+        if window.task and not window.task.done():
+            window.task.cancel()
+
+    def _start(self, device_id: str, window: _Window):
+        self._windows[device_id] = window
+        self._stats['started'] += 1
+        window.task = asyncio.create_task(self._run(device_id, window))
+
+    async def _run(self, device_id: str, window: _Window):
+        try:
+            segments = await asyncio.to_thread(self.load_segments, window.book_id, window.chapter)
+            while True:
+                window.next_index = max(window.next_index, window.position + 1)
+                if window.next_index >= len(segments):
+                    break
+                if window.next_index > window.position + self.window:
+                    # 窗口已填满，等播放位置前进
+                    window.advanced.clear()
+                    waiter = asyncio.ensure_future(window.advanced.wait())
+                    try:
+                        done, _ = await asyncio.wait([waiter], timeout=self.idle_timeout)
+                    finally:
+                        waiter.cancel()
+                    if not done:
+                        logger.info(f"💤 设备 {device_id} 长时间没有新位置，结束预取")
+                        if self._windows.get(device_id) is window:
+                            del self._windows[device_id]
+                        break
+                    continue
+
+                await self.synthesize(segments[window.next_index], *window.voice,
+                                      priority=PRIORITY_PREFETCH, device_id=device_id)
+                self._stats['prefetched'] += 1
+                window.next_index += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._stats['failed'] += 1
+            logger.warning(f"⚠️ 设备 {device_id} 预取失败，窗口停止: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'window': self.window,
+            **self._stats,
+            'devices': {
+                device_id: {
+                    'book_id': w.book_id,
+                    'chapter': w.chapter,
+                    'position': w.position,
+                    'next_index': w.next_index,
+                    'active': w.task is not None and not w.task.done()
+                }
+                for device_id, w in self._windows.items()
+            }
+        }
+
+
+def prefetch_window_from_env() -> int:
+    return int(os.environ.get('TTS_PREFETCH_WINDOW', str(DEFAULT_WINDOW)))
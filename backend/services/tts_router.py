@@ -0,0 +1,286 @@
+"""
+TTS 多后端路由
+- 按后端统计首字节延迟分位数和错误率
+- 熔断：closed -> open (冷却) -> half-open (一次试探请求) -> closed
+- 首字节超时：慢但不报错的后端不会一直卡住请求
+- 可选对冲 (hedging)：主后端超过其 p95 首字节延迟仍未出声时，同时请求下一个后端，谁先出声用谁
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+LATENCY_SAMPLES = 200
+OUTCOME_SAMPLES = 20
+
+# 对冲等待下限 (秒)，避免 p95 很小时几乎每个请求都对冲
+HEDGE_MIN_DELAY = 0.05
+
+
+class BackendHealth:
+    """单个后端的延迟/错误统计与熔断状态"""
+
+    def __init__(self, name: str, max_consecutive_failures: int = 2, max_error_rate: float = 0.5,
+                 min_samples: int = 10, cooldown: float = 60):
+        self.name = name
+        self.max_consecutive_failures = max_consecutive_failures
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.consecutive_failures = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.outcomes = deque(maxlen=OUTCOME_SAMPLES)
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def available(self) -> bool:
+        """当前是否可以向该后端发请求 (不占用试探名额)"""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.trial_in_flight
+
+    def allow_request(self) -> bool:
+        """真正发请求前调用；冷却结束后只放行一个试探请求"""
+        if not self.available():
+            return False
+        if self.state == STATE_OPEN:
+            self.state = STATE_HALF_OPEN
+            logger.info(f"🔄 {self.name} 熔断冷却结束，发送试探请求")
+        if self.state == STATE_HALF_OPEN:
+            self.trial_in_flight = True
+        return True
+
+    def record_first_byte(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def record_success(self):
+        self.requests += 1
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != STATE_CLOSED:
+            logger.info(f"✅ {self.name} 试探成功，熔断器关闭")
+        self.state = STATE_CLOSED
+        self.trial_in_flight = False
+
+    def record_failure(self, reason: str):
+        self.requests += 1
+        self.failures += 1
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        logger.warning(f"⚠️ {self.name} 失败 ({self.consecutive_failures} 次连续): {reason}")
+
+        tripped = (self.consecutive_failures >= self.max_consecutive_failures
+                   or (len(self.outcomes) >= self.min_samples and self.error_rate >= self.max_error_rate))
+        if self.state == STATE_HALF_OPEN or (self.state == STATE_CLOSED and tripped):
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+            logger.error(f"🔥 {self.name} 熔断器开启，{self.cooldown:.0f} 秒内不再使用")
+        self.trial_in_flight = False
+
+    def release_trial(self):
+        """试探请求被取消 (对冲落败或客户端离开)，不改变状态"""
+        self.trial_in_flight = False
+
+    def stats(self) -> Dict:
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            'state': self.state,
+            'requests': self.requests,
+            'failures': self.failures,
+            'error_rate': round(self.error_rate, 3),
+            'consecutive_failures': self.consecutive_failures,
+            'ttfb_p50_ms': ms(self.percentile(0.50)),
+            'ttfb_p95_ms': ms(self.percentile(0.95)),
+            'hedges_won': self.hedges_won
+        }
+
+
+class _Attempt:
+    def __init__(self, name: str, chunks: AsyncIterator[bytes], trial: bool):
+        self.name = name
+        self.chunks = chunks
+        self.trial = trial
+        self.started_at = time.monotonic()
+        self.task = asyncio.ensure_future(chunks.__anext__())
+
+
+class TTSRouter:
+    """
+    按优先顺序路由到多个流式后端
+    backends: [(名称, 返回音频块异步迭代器的函数)]，第一个是首选
+    """
+
+    def __init__(self, backends: List[tuple], hedge: bool = False, first_byte_timeout: float = 15,
+                 hedge_min_samples: int = 20, cooldown: float = 60, max_consecutive_failures: int = 2):
+        self.backends: Dict[str, Callable[..., AsyncIterator[bytes]]] = dict(backends)
+        self.order = [name for name, _ in backends]
+        self.health = {name: BackendHealth(name, max_consecutive_failures=max_consecutive_failures,
+                                           cooldown=cooldown)
+                       for name in self.order}
+        self.hedge = hedge
+        self.first_byte_timeout = first_byte_timeout
+        self.hedge_min_samples = hedge_min_samples
+        self.hedges = 0
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """主后端的 p95 首字节延迟；样本不足时不对冲"""
+        health = self.health[name]
+        if not self.hedge or len(health.latencies) < self.hedge_min_samples:
+            return None
+        return max(health.percentile(0.95), HEDGE_MIN_DELAY)
+
+    async def _discard(self, attempt: _Attempt):
+        """取消落败/超时的请求，未完成的缓存文件随之丢弃"""
+        attempt.task.cancel()
+        await asyncio.gather(attempt.task, return_exceptions=True)
+        await attempt.chunks.aclose()
+        if attempt.trial:
+            self.health[attempt.name].release_trial()
+
+    async def stream(self, *args) -> AsyncIterator[bytes]:
+        """依次/对冲尝试各后端，返回第一个出声的后端的完整音频流"""
+        candidates = [name for name in self.order if self.health[name].available()]
+        # 全部熔断时仍按顺序尝试，总比直接失败好
+        forced = not candidates
+        if forced:
+            candidates = list(self.order)
+
+        def launch() -> Optional[_Attempt]:
+            """
+            启动下一个熔断器放行的后端；都不放行 (如试探名额已被其他请求占用) 时返回 None
+            只有一开始就全部熔断时才绕过熔断器
+            """
+            while candidates:
+                name = candidates.pop(0)
+                health = self.health[name]
+                if forced or health.allow_request():
+                    trial = not forced and health.state == STATE_HALF_OPEN
+                    return _Attempt(name, self.backends[name](*args), trial=trial)
+            return None
+
+        first = launch()
+        attempts: List[_Attempt] = [first] if first else []
+        hedge_attempt: Optional[_Attempt] = None
+        winner: Optional[_Attempt] = None
+        first_chunk = None
+        last_error: Optional[BaseException] = None
+
+        try:
+            while attempts and winner is None:
+                now = time.monotonic()
+                deadlines = [a.started_at + self.first_byte_timeout for a in attempts]
+                hedge_at = None
+                if len(attempts) == 1 and candidates:
+                    delay = self._hedge_delay(attempts[0].name)
+                    if delay is not None:
+                        hedge_at = attempts[0].started_at + delay
+                        deadlines.append(hedge_at)
+
+                done, _ = await asyncio.wait([a.task for a in attempts], timeout=max(0, min(deadlines) - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+
+                for attempt in [a for a in attempts if a.task in done]:
+                    attempts.remove(attempt)
+                    error = attempt.task.exception()
+                    if error is None:
+                        winner = attempt
+                        first_chunk = attempt.task.result()
+                        break
+                    if isinstance(error, StopAsyncIteration):
+                        error = Exception(f"{attempt.name} 返回空数据")
+                    last_error = error
+                    self.health[attempt.name].record_failure(str(error))
+
+                if winner is not None:
+                    break
+
+                now = time.monotonic()
+                for attempt in [a for a in attempts if now - a.started_at >= self.first_byte_timeout]:
+                    attempts.remove(attempt)
+                    await self._discard(attempt)
+                    last_error = TimeoutError(f"{attempt.name} 首字节超时 ({self.first_byte_timeout}s)")
+                    self.health[attempt.name].record_failure(str(last_error))
+
+                if hedge_at is not None and attempts and now >= hedge_at and candidates:
+                    self.hedges += 1
+                    logger.info(f"🏇 {attempts[0].name} 超过 p95 首字节延迟，对冲请求 {candidates[0]}")
+                    hedge_attempt = launch()
+                    if hedge_attempt:
+                        attempts.append(hedge_attempt)
+                elif not attempts and candidates:
+                    logger.info(f"↪️ 降级到 {candidates[0]}")
+                    fallback = launch()
+                    if fallback:
+                        attempts.append(fallback)
+        finally:
+            for attempt in attempts:
+                if winner is not None:
+                    # 对冲落败的一方至少用了这么久还没出声，作为延迟样本的下限记下
+                    self.health[attempt.name].record_first_byte(time.monotonic() - attempt.started_at)
+                await self._discard(attempt)
+
+        if winner is None:
+            raise last_error or Exception("没有可用的 TTS 后端")
+
+        health = self.health[winner.name]
+        health.record_first_byte(time.monotonic() - winner.started_at)
+        if winner is hedge_attempt:
+            health.hedges_won += 1
+
+        try:
+            yield first_chunk
+            async for chunk in winner.chunks:
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            if winner.trial:
+                health.release_trial()
+            raise
+        except Exception as e:
+            health.record_failure(f"流中断: {e}")
+            raise
+        health.record_success()
+
+    def stats(self) -> Dict:
+        return {
+            'hedge': self.hedge,
+            'first_byte_timeout': self.first_byte_timeout,
+            'hedges': self.hedges,
+            'backends': {name: self.health[name].stats() for name in self.order}
+        }
+
+
+def router_settings_from_env() -> Dict:
+    """从环境变量读取路由配置"""
+    return {
+        'hedge': os.environ.get('TTS_HEDGE', '0') == '1',
+        'first_byte_timeout': float(os.environ.get('TTS_FIRST_BYTE_TIMEOUT', '15')),
+    }
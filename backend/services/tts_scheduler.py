@@ -0,0 +1,204 @@
+"""
+TTS 准入调度器 - 控制同时发往上游 (EasyVoice / Edge-TTS) 的合成请求
+- 全局并发上限 + 每个设备的并发上限
+- 三个优先级：interactive (正在收听) > prefetch (预取) > batch (导出/预渲染)
+- 非交互请求最多占用 max_concurrent - 1 个名额，始终给正在收听的用户留一个
+- 排队超时、取消、排队中调整优先级；统计排队深度和等待时间
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_PREFETCH = 'prefetch'
+PRIORITY_BATCH = 'batch'
+
+# 数值越小越优先
+PRIORITY_ORDER = {PRIORITY_INTERACTIVE: 0, PRIORITY_PREFETCH: 1, PRIORITY_BATCH: 2}
+
+# 各优先级默认排队超时 (秒)，None 表示一直等待
+DEFAULT_QUEUE_TIMEOUTS = {PRIORITY_INTERACTIVE: 30, PRIORITY_PREFETCH: 60, PRIORITY_BATCH: None}
+
+# 等待时间样本数 (用于计算分位数)
+WAIT_SAMPLES = 500
+
+
+class QueueTimeout(Exception):
+    """排队超时"""
+
+
+class Ticket:
+    """一个排队中的合成请求"""
+
+    def __init__(self, priority: str, device_id: Optional[str], seq: int):
+        if priority not in PRIORITY_ORDER:
+            raise ValueError(f"未知的优先级: {priority}")
+        self.priority = priority
+        self.device_id = device_id
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted: Optional[asyncio.Future] = None
+
+    @property
+    def rank(self):
+        return (PRIORITY_ORDER[self.priority], self.seq)
+
+
+class TTSScheduler:
+    def __init__(self, max_concurrent: int = 4, max_per_device: int = 2,
+                 queue_timeouts: Dict[str, Optional[float]] = None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_device = max(1, max_per_device)
+        self.queue_timeouts = dict(DEFAULT_QUEUE_TIMEOUTS, **(queue_timeouts or {}))
+        self._seq = itertools.count()
+        self._waiting: list = []
+        self._active = 0
+        self._active_background = 0
+        self._device_active: Dict[str, int] = defaultdict(int)
+        self._waits: Dict[str, deque] = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_ORDER}
+        self._counters: Dict[str, Dict[str, int]] = {
+            p: {'granted': 0, 'timeouts': 0, 'cancelled': 0} for p in PRIORITY_ORDER
+        }
+
+    def ticket(self, priority: str = PRIORITY_INTERACTIVE, device_id: Optional[str] = None) -> Ticket:
+        return Ticket(priority, device_id, next(self._seq))
+
+    @asynccontextmanager
+    async def slot(self, ticket: Ticket, timeout: Optional[float] = -1):
+        """
+        排队获取一个合成名额，退出时释放
+        timeout 为 -1 时使用该优先级的默认超时
+        """
+        await self.acquire(ticket, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, ticket: Ticket, timeout: Optional[float] = -1):
+        if timeout == -1:
+            timeout = self.queue_timeouts.get(ticket.priority)
+
+        ticket.granted = asyncio.get_running_loop().create_future()
+        self._waiting.append(ticket)
+        self._dispatch()
+        try:
+            # 不用 wait_for：名额刚好分配时它可能吞掉取消，导致名额泄漏
+            done, _ = await asyncio.wait([ticket.granted], timeout=timeout)
+            if not done:
+                raise asyncio.TimeoutError()
+        except BaseException as e:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            elif ticket.granted.done():
+                # 超时/取消与分配同时发生，名额已到手，需要还回去
+                self.release(ticket)
+            if isinstance(e, asyncio.TimeoutError):
+                self._counters[ticket.priority]['timeouts'] += 1
+                logger.warning(f"⏱️ TTS 排队超时 ({ticket.priority}, {timeout}s)")
+                raise QueueTimeout(f"TTS 排队超时 ({ticket.priority})") from None
+            self._counters[ticket.priority]['cancelled'] += 1
+            raise
+
+        self._waits[ticket.priority].append(time.monotonic() - ticket.enqueued_at)
+        self._counters[ticket.priority]['granted'] += 1
+
+    def release(self, ticket: Ticket):
+        self._active -= 1
+        if ticket.priority != PRIORITY_INTERACTIVE:
+            self._active_background -= 1
+        if ticket.device_id is not None:
+            self._device_active[ticket.device_id] -= 1
+            if self._device_active[ticket.device_id] <= 0:
+                del self._device_active[ticket.device_id]
+        self._dispatch()
+
+    def promote(self, ticket: Ticket, priority: str):
+        """提升排队中请求的优先级 (例如交互请求合并到了一个预取请求上)"""
+        if PRIORITY_ORDER[priority] >= PRIORITY_ORDER[ticket.priority]:
+            return
+        self.reprioritize(ticket, priority)
+
+    def reprioritize(self, ticket: Ticket, priority: str) -> bool:
+        """修改排队中请求的优先级 (可升可降)；已拿到名额的请求不受影响"""
+        if priority not in PRIORITY_ORDER:
+            raise ValueError(f"未知的优先级: {priority}")
+        if ticket not in self._waiting:
+            return False
+        ticket.priority = priority
+        self._dispatch()
+        return True
+
+    def _can_run(self, ticket: Ticket) -> bool:
+        if self._active >= self.max_concurrent:
+            return False
+        if ticket.priority != PRIORITY_INTERACTIVE and self._active_background >= self.max_concurrent - 1 \
+                and self.max_concurrent > 1:
+            return False
+        if ticket.device_id is not None and self._device_active.get(ticket.device_id, 0) >= self.max_per_device:
+            return False
+        return True
+
+    def _dispatch(self):
+        """按优先级分配空闲名额；被设备上限挡住的请求不阻塞其他设备"""
+        self._waiting.sort(key=lambda t: t.rank)
+        for ticket in list(self._waiting):
+            if self._active >= self.max_concurrent:
+                break
+            if not self._can_run(ticket):
+                continue
+            self._waiting.remove(ticket)
+            self._active += 1
+            if ticket.priority != PRIORITY_INTERACTIVE:
+                self._active_background += 1
+            if ticket.device_id is not None:
+                self._device_active[ticket.device_id] += 1
+            ticket.granted.set_result(True)
+
+    def stats(self) -> Dict:
+        def pct(samples, p):
+            if not samples:
+                return 0.0
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1)
+
+        queued = defaultdict(int)
+        for ticket in self._waiting:
+            queued[ticket.priority] += 1
+
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_per_device': self.max_per_device,
+            'active': self._active,
+            'queued': sum(queued.values()),
+            'devices': dict(self._device_active),
+            'priorities': {
+                p: {
+                    'queued': queued[p],
+                    'wait_p50_ms': pct(self._waits[p], 0.50),
+                    'wait_p95_ms': pct(self._waits[p], 0.95),
+                    **self._counters[p]
+                } for p in PRIORITY_ORDER
+            }
+        }
+
+
+# 全局调度器实例
+_tts_scheduler = None
+
+def get_tts_scheduler():
+    """获取 TTS 调度器单例"""
+    global _tts_scheduler
+    if _tts_scheduler is None:
+        _tts_scheduler = TTSScheduler(
+            max_concurrent=int(os.environ.get('TTS_MAX_CONCURRENT', '4')),
+            max_per_device=int(os.environ.get('TTS_MAX_PER_DEVICE', '2'))
+        )
+    return _tts_scheduler
@@ -0,0 +1,201 @@
+"""
+WebSocket 朗读会话 - 客户端把要朗读的段加入队列，服务端按顺序推送音频
+- 队首段流式合成，音频块一生成就以二进制帧推送；其后 window 段在后台合成到缓存
+- 客户端可以取消单段或清空队列 (翻页/停止播放)：取消会传递到进行中的上游调用，
+  释放调度名额，未完成的缓存文件被丢弃 (同一段还有其他请求在等时上游继续)
+- 可以调整排队中段的优先级
+
+消息 (JSON 文本帧):
+  客户端 -> 服务端
+    {"type": "enqueue", "id": "p3-1", "text": "...", "voice_model", "rate", "volume", "priority"}
+    {"type": "cancel", "id": "p3-1"}     取消单段
+    {"type": "clear"}                    取消队列中全部段
+    {"type": "reprioritize", "id": "p3-1", "priority": "interactive"}
+  服务端 -> 客户端
+    {"type": "queued", "id", "position"}
+    {"type": "start", "id"} 之后是该段的二进制音频帧，最后 {"type": "end", "id", "bytes"}
+    {"type": "cancelled", "id"} / {"type": "failed", "id", "detail"} / {"type": "error", "detail"}
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.tts_scheduler import PRIORITY_INTERACTIVE, PRIORITY_ORDER, PRIORITY_PREFETCH, QueueTimeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 2
+
+
+class SessionError(Exception):
+    """客户端消息无效"""
+
+
+class _Item:
+    def __init__(self, item_id: str, text: str, voice_model: str, rate: str, volume: str, priority: str):
+        self.id = item_id
+        self.text = text
+        self.voice_model = voice_model
+        self.rate = rate
+        self.volume = volume
+        self.priority = priority
+        # 后台合成到缓存的任务 (队首之后的段)
+        self.prefetch: Optional[asyncio.Task] = None
+        # 队首段的推送任务
+        self.stream: Optional[asyncio.Task] = None
+
+    @property
+    def params(self):
+        return self.text, self.voice_model, self.rate, self.volume
+
+
+class TTSSession:
+    def __init__(self, engine, device_id: Optional[str], send_json: Callable[[dict], Awaitable],
+                 send_bytes: Callable[[bytes], Awaitable], window: int = DEFAULT_WINDOW):
+        self.engine = engine
+        self.device_id = device_id
+        self._send_json = send_json
+        self._send_bytes = send_bytes
+        self.window = max(0, window)
+        self._queue: List[_Item] = []
+        self._items: Dict[str, _Item] = {}
+        self._wakeup = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        self._pump: Optional[asyncio.Task] = None
+        self.stats = {'enqueued': 0, 'completed': 0, 'cancelled': 0, 'failed': 0, 'bytes': 0}
+
+    def start(self):
+        self._pump = asyncio.create_task(self._run())
+
+    async def close(self):
+        """连接断开：取消所有段和推送任务"""
+        self._cancel_items(list(self._items.values()))
+        if self._pump:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+
+    async def handle(self, message: dict):
+        if not isinstance(message, dict):
+            raise SessionError("消息必须是 JSON 对象")
+        kind = message.get('type')
+        if kind == 'enqueue':
+            await self._enqueue(message)
+        elif kind == 'cancel':
+            item = self._items.get(message.get('id'))
+            if item is None:
+                raise SessionError(f"未知的段: {message.get('id')}")
+            await self._cancel([item])
+        elif kind == 'clear':
+            await self._cancel(list(self._items.values()))
+        elif kind == 'reprioritize':
+            self._reprioritize(message)
+        else:
+            raise SessionError(f"未知的消息类型: {kind}")
+
+    async def _enqueue(self, message: dict):
+        item_id = message.get('id')
+        text = message.get('text')
+        if not item_id or not text:
+            raise SessionError("enqueue 需要 id 和 text")
+        if item_id in self._items:
+            raise SessionError(f"段 id 重复: {item_id}")
+        priority = message.get('priority', PRIORITY_INTERACTIVE)
+        if priority not in PRIORITY_ORDER:
+            raise SessionError(f"未知的优先级: {priority}")
+
+        item = _Item(str(item_id), text, message.get('voice_model', 'default'),
+                     message.get('rate', '+0%'), message.get('volume', '+0%'), priority)
+        self._items[item.id] = item
+        self._queue.append(item)
+        self.stats['enqueued'] += 1
+        await self.send({'type': 'queued', 'id': item.id, 'position': len(self._queue) - 1})
+        self._fill_window()
+        self._wakeup.set()
+
+    def _reprioritize(self, message: dict):
+        item = self._items.get(message.get('id'))
+        priority = message.get('priority')
+        if item is None:
+            raise SessionError(f"未知的段: {message.get('id')}")
+        if priority not in PRIORITY_ORDER:
+            raise SessionError(f"未知的优先级: {priority}")
+        item.priority = priority
+        if item.prefetch and not item.prefetch.done():
+            self.engine.reprioritize(*item.params, priority=priority)
+
+    def _ahead_priority(self, item: _Item) -> str:
+        return PRIORITY_PREFETCH if item.priority == PRIORITY_INTERACTIVE else item.priority
+
+    def _fill_window(self):
+        """队首之后的 window 段提前合成到缓存"""
+        for item in self._queue[1:1 + self.window]:
+            if item.prefetch is None:
+                item.prefetch = asyncio.create_task(self.engine.synthesize(
+                    *item.params, priority=self._ahead_priority(item), device_id=self.device_id))
+                # 后台合成失败时由队首推送重试并报告，这里只取走异常
+                item.prefetch.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _cancel(self, items: List[_Item]):
+        self._cancel_items(items)
+        for item in items:
+            await self.send({'type': 'cancelled', 'id': item.id})
+
+    def _cancel_items(self, items: List[_Item]):
+        for item in items:
+            if self._items.pop(item.id, None) is None:
+                continue
+            if item in self._queue:
+                self._queue.remove(item)
+            # 取消订阅：没有其他请求在等同一段音频时，上游调用随之取消并释放名额
+            for task in (item.prefetch, item.stream):
+                if task and not task.done():
+                    task.cancel()
+            self.stats['cancelled'] += 1
+            logger.info(f"🛑 取消朗读段 {item.id}")
+        self._fill_window()
+
+    async def send(self, message: dict):
+        async with self._send_lock:
+            await self._send_json(message)
+
+    async def _run(self):
+        """按顺序推送各段音频"""
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            item = self._queue[0]
+            item.stream = asyncio.create_task(self._stream_item(item))
+            await asyncio.wait([item.stream])
+            if item.stream.cancelled():
+                continue
+            if self._items.pop(item.id, None) is not None:
+                self._queue.remove(item)
+                self._fill_window()
+
+    async def _stream_item(self, item: _Item):
+        size = 0
+        await self.send({'type': 'start', 'id': item.id})
+        try:
+            async for chunk in self.engine.stream_synthesize(*item.params, priority=item.priority,
+                                                             device_id=self.device_id):
+                async with self._send_lock:
+                    await self._send_bytes(chunk)
+                size += len(chunk)
+        except asyncio.CancelledError:
+            raise
+        except QueueTimeout as e:
+            self.stats['failed'] += 1
+            await self.send({'type': 'failed', 'id': item.id, 'detail': str(e), 'retry_after': 5})
+            return
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"朗读段 {item.id} 合成失败: {e}")
+            await self.send({'type': 'failed', 'id': item.id, 'detail': str(e)})
+            return
+
+        self.stats['completed'] += 1
+        self.stats['bytes'] += size
+        await self.send({'type': 'end', 'id': item.id, 'bytes': size})
@@ -0,0 +1,91 @@
+"""
+语音时间轴 - 由 Edge-TTS 的 WordBoundary / SentenceBoundary 事件生成
+与缓存音频一起保存 (tts_{key}.timings.json)，客户端可以按句子高亮、跳转，
+不必为定位再合成一次
+
+格式 (数组字段以紧凑的列表保存):
+  words:     [开始 ms, 时长 ms, 原文字符起点, 字符数, 音频字节偏移]
+  sentences: [开始 ms, 结束 ms, 原文字符起点, 字符终点, 音频字节偏移]
+字符位置为 -1 表示没能在原文中定位；字节偏移只适用于源 MP3，转码版本请按时间跳转
+"""
+from typing import Dict, List, Optional
+
+from services.text_segmenter import sentence_spans
+
+TIMINGS_SUFFIX = 'timings.json'
+TIMINGS_VERSION = 1
+
+# Edge-TTS 输出 audio-24khz-48kbitrate-mono-mp3，恒定码率
+EDGE_BYTES_PER_SECOND = 6000
+
+# 边界事件的时间单位是 100 纳秒
+_TICKS_PER_MS = 10_000
+
+
+def _byte_offset(ms: int, total_bytes: Optional[int]) -> int:
+    offset = ms * EDGE_BYTES_PER_SECOND // 1000
+    return min(offset, total_bytes) if total_bytes else offset
+
+
+def build_timing_index(text: str, boundaries: List[Dict], total_bytes: Optional[int] = None) -> Dict:
+    """
+    boundaries: Edge-TTS 流中的边界事件 {'type', 'offset', 'duration', 'text'}
+    词边界会按原文顺序定位字符位置，再按句子切分归并出句子时间轴
+    """
+    events = []
+    cursor = 0
+    for event in boundaries:
+        start_ms = event['offset'] // _TICKS_PER_MS
+        duration_ms = event['duration'] // _TICKS_PER_MS
+        token = event.get('text', '')
+        position = text.find(token, cursor) if token else -1
+        if position >= 0:
+            cursor = position + len(token)
+        events.append({
+            'type': event['type'],
+            'start_ms': start_ms,
+            'end_ms': start_ms + duration_ms,
+            'char_start': position,
+            'char_len': len(token) if position >= 0 else 0
+        })
+
+    words = [e for e in events if e['type'] == 'WordBoundary']
+    if words:
+        sentences = _group_sentences(text, words)
+    else:
+        sentences = [{'start_ms': e['start_ms'], 'end_ms': e['end_ms'], 'char_start': e['char_start'],
+                      'char_end': e['char_start'] + e['char_len'] if e['char_start'] >= 0 else -1}
+                     for e in events if e['type'] == 'SentenceBoundary']
+
+    duration_ms = (total_bytes * 1000 // EDGE_BYTES_PER_SECOND) if total_bytes else \
+        max((e['end_ms'] for e in events), default=0)
+
+    return {
+        'version': TIMINGS_VERSION,
+        'bytes_per_second': EDGE_BYTES_PER_SECOND,
+        'duration_ms': duration_ms,
+        'words': [[w['start_ms'], w['end_ms'] - w['start_ms'], w['char_start'], w['char_len'],
+                   _byte_offset(w['start_ms'], total_bytes)] for w in words],
+        'sentences': [[s['start_ms'], s['end_ms'], s['char_start'], s['char_end'],
+                       _byte_offset(s['start_ms'], total_bytes)] for s in sentences]
+    }
+
+
+def _group_sentences(text: str, words: List[Dict]) -> List[Dict]:
+    """把词按所在句子归并；定位不到的词并入前一个句子"""
+    spans = sentence_spans(text)
+    sentences = []
+    span_index = 0
+    for word in words:
+        position = word['char_start']
+        if position >= 0:
+            while span_index < len(spans) - 1 and position >= spans[span_index][1]:
+                span_index += 1
+        current = sentences[-1] if sentences else None
+        if current is None or (position >= 0 and current['span'] != span_index):
+            start, end = spans[span_index] if spans else (-1, -1)
+            sentences.append({'span': span_index, 'start_ms': word['start_ms'], 'end_ms': word['end_ms'],
+                              'char_start': start, 'char_end': end})
+        else:
+            current['end_ms'] = word['end_ms']
+    return sentences
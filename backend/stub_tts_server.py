@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地 TTS 桩服务 - 无需网络即可测试和压测 TTS 链路
+- POST /api/v1/tts/generateJson  模拟 EasyVoice (data 中多项按顺序拼接输出)
+- POST /edge/stream              模拟 Edge-TTS 流 (NDJSON：音频块 + 词边界事件)
+- GET  /stats                    已处理的请求统计
+输出合法的 MP3 帧 (MPEG-2 Layer III, 24kHz, 48kbps, 单声道，与 Edge-TTS 相同)，
+音频时长按字数估算，帧内数据由文本决定 (与真实音频一样，不同文本的字节不同)；首字节延迟、吞吐量、失败率可配置
+
+用法:
+  python stub_tts_server.py --port 3900 --profile flaky
+  EASYVOICE_API_URL=http://127.0.0.1:3900/api/v1/tts/generateJson \\
+  EDGE_TTS_STUB_URL=http://127.0.0.1:3900/edge/stream python app.py
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+
+from aiohttp import web
+
+# 一帧 144 字节 = 24ms 音频
+FRAME = b"\xff\xf3\x64\xc4" + b"\x00" * 140
+FRAME_MS = 24
+CHUNK_SIZE = 4096
+
+# 预设配置：首字节延迟 (ms)、抖动 (ms)、吞吐量 (字节/秒，0 为不限速)、
+# 首字节前失败率、中途断流率、每个字的音频时长 (ms)
+PROFILES = {
+    'fast': {'latency_ms': 20, 'jitter_ms': 5, 'throughput': 0, 'fail_rate': 0.0, 'mid_fail_rate': 0.0,
+             'ms_per_char': 200},
+    'normal': {'latency_ms': 300, 'jitter_ms': 100, 'throughput': 24000, 'fail_rate': 0.0, 'mid_fail_rate': 0.0,
+               'ms_per_char': 200},
+    'slow': {'latency_ms': 3000, 'jitter_ms': 1000, 'throughput': 8000, 'fail_rate': 0.0, 'mid_fail_rate': 0.0,
+             'ms_per_char': 200},
+    'flaky': {'latency_ms': 300, 'jitter_ms': 200, 'throughput': 24000, 'fail_rate': 0.2, 'mid_fail_rate': 0.05,
+              'ms_per_char': 200},
+    'down': {'latency_ms': 0, 'jitter_ms': 0, 'throughput': 0, 'fail_rate': 1.0, 'mid_fail_rate': 0.0,
+             'ms_per_char': 200},
+}
+
+# 英文按单词、中文按单字
+_TOKEN_RE = re.compile(r"[A-Za-z0-9']+|[^\W_A-Za-z0-9]")
+
+
+def make_audio(text: str, ms_per_char: int) -> bytes:
+    frames = max(1, -(-len(text.strip()) * int(ms_per_char) // FRAME_MS))
+    seed = hashlib.sha256(text.strip().encode('utf-8')).digest()
+    return b''.join(FRAME[:4] + hashlib.sha256(seed + i.to_bytes(4, 'big')).digest() * 4 + FRAME[132:]
+                    for i in range(frames))
+
+
+def word_boundaries(text: str, duration_ms: int):
+    """把音频时长平均分给每个词，生成与 Edge-TTS 相同格式的边界事件 (单位 100ns)"""
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return []
+    step = duration_ms / len(tokens)
+    return [{'type': 'WordBoundary', 'offset': int(i * step * 10_000), 'duration': int(step * 0.8 * 10_000),
+             'text': token} for i, token in enumerate(tokens)]
+
+
+class StubTTS:
+    def __init__(self, profile: dict):
+        self.profile = dict(profile)
+        self.stats = {'easyvoice': 0, 'edge': 0, 'items': 0, 'failed': 0, 'broken': 0}
+
+    async def _delay(self):
+        latency = self.profile['latency_ms'] + random.uniform(-1, 1) * self.profile['jitter_ms']
+        await asyncio.sleep(max(0, latency) / 1000)
+
+    def _should_fail(self) -> bool:
+        if random.random() < self.profile['fail_rate']:
+            self.stats['failed'] += 1
+            return True
+        return False
+
+    async def _pace(self, size: int):
+        if self.profile['throughput']:
+            await asyncio.sleep(size / self.profile['throughput'])
+
+    async def generate_json(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        items = body.get('data') or []
+        self.stats['easyvoice'] += 1
+        self.stats['items'] += len(items)
+        if not items:
+            return web.Response(status=400, text='No segments provided')
+
+        await self._delay()
+        if self._should_fail():
+            return web.Response(status=500, text='stub failure')
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/octet-stream',
+                                               'x-generate-tts-type': 'stream'})
+        await response.prepare(request)
+        # 与 EasyVoice 相同：各项依次合成，音频直接拼接在同一个流里
+        audio = b''.join(make_audio(item.get('text', ''), self.profile['ms_per_char']) for item in items)
+        break_at = len(audio) // 2 if random.random() < self.profile['mid_fail_rate'] else None
+        for start in range(0, len(audio), CHUNK_SIZE):
+            if break_at is not None and start >= break_at:
+                self.stats['broken'] += 1
+                request.transport.close()
+                return response
+            chunk = audio[start:start + CHUNK_SIZE]
+            await response.write(chunk)
+            await self._pace(len(chunk))
+        await response.write_eof()
+        return response
+
+    async def edge_stream(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        text = body.get('text', '')
+        self.stats['edge'] += 1
+
+        await self._delay()
+        if self._should_fail():
+            return web.Response(status=503, text='stub failure')
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        audio = make_audio(text, self.profile['ms_per_char'])
+        events = word_boundaries(text, len(audio) // len(FRAME) * FRAME_MS)
+        chunks = [audio[i:i + CHUNK_SIZE] for i in range(0, len(audio), CHUNK_SIZE)]
+        break_at = len(chunks) // 2 if random.random() < self.profile['mid_fail_rate'] else None
+
+        for i, chunk in enumerate(chunks):
+            if break_at is not None and i >= break_at and i > 0:
+                self.stats['broken'] += 1
+                request.transport.close()
+                return response
+            lines = [{'type': 'audio', 'data': base64.b64encode(chunk).decode('ascii')}]
+            # 边界事件均匀穿插在音频块之间
+            lines += events[i * len(events) // len(chunks):(i + 1) * len(events) // len(chunks)]
+            await response.write(''.join(json.dumps(line) + '\n' for line in lines).encode('utf-8'))
+            await self._pace(len(chunk))
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'profile': self.profile, **self.stats})
+
+
+def create_stub_app(profile: dict) -> web.Application:
+    stub = StubTTS(profile)
+    app = web.Application()
+    app.router.add_post('/api/v1/tts/generateJson', stub.generate_json)
+    app.router.add_post('/edge/stream', stub.edge_stream)
+    app.router.add_get('/stats', stub.get_stats)
+    return app
+
+
+async def start_stub_server(profile: dict, host: str = '127.0.0.1', port: int = 0):
+    """在当前事件循环中启动桩服务，返回 (runner, 基础 URL)"""
+    runner = web.AppRunner(create_stub_app(profile))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    actual_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{actual_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 TTS 桩服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3900)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='normal')
+    for key in PROFILES['normal']:
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=None, help='覆盖预设值')
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    for key in profile:
+        value = getattr(args, key)
+        if value is not None:
+            profile[key] = value
+
+    print(f"TTS 桩服务: http://{args.host}:{args.port}  配置: {profile}")
+    web.run_app(create_stub_app(profile), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+音频缓存测试 - 内容寻址、LRU 淘汰、索引持久化、命中率统计
+"""
+import tempfile
+from pathlib import Path
+
+from services.audio_cache import AudioCache
+
+
+def put(cache: AudioCache, key: str, size: int):
+    with cache.writer(key) as writer:
+        writer.write(b"\x00" * size)
+
+
+def test_key_normalization():
+    a = AudioCache.make_key("你好，\n 世界", "v", "+0%", "+0%", "edge")
+    b = AudioCache.make_key("  你好， 世界 ", "v", "+0%", "+0%", "edge")
+    c = AudioCache.make_key("你好， 世界", "v", "+0%", "+0%", "easyvoice")
+    assert a == b
+    assert a != c
+    assert len(a) == 64
+
+
+def test_lru_eviction_within_budget():
+    cache = AudioCache(Path(tempfile.mkdtemp()), max_bytes=300)
+    keys = [AudioCache.make_key(str(i), "v", "+0%", "+0%", "edge") for i in range(4)]
+    for key in keys[:3]:
+        put(cache, key, 100)
+
+    # 访问最早写入的条目，使其变为最近使用
+    assert cache.lookup(keys[0])
+    put(cache, keys[3], 100)
+
+    assert cache.total_bytes <= 300
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[0]) and cache.lookup(keys[2]) and cache.lookup(keys[3])
+    assert not cache.path_for(keys[1]).exists()
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 4 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.8
+
+
+def test_failed_write_is_not_cached():
+    cache = AudioCache(Path(tempfile.mkdtemp()), max_bytes=1000)
+    key = AudioCache.make_key("x", "v", "+0%", "+0%", "edge")
+    try:
+        with cache.writer(key) as writer:
+            writer.write(b"partial")
+            raise RuntimeError("upstream failed")
+    except RuntimeError:
+        pass
+    assert cache.lookup(key) is None
+    assert not list(cache.cache_dir.glob("tts_*"))
+
+
+def test_index_survives_restart():
+    cache_dir = Path(tempfile.mkdtemp())
+    cache = AudioCache(cache_dir, max_bytes=1000)
+    old, new = (AudioCache.make_key(t, "v", "+0%", "+0%", "edge") for t in ("old", "new"))
+    put(cache, old, 100)
+    put(cache, new, 100)
+    cache.lookup(old)
+    cache.flush()
+
+    # 重启后保持访问顺序：缩小预算时应淘汰 new 而不是刚访问过的 old
+    reloaded = AudioCache(cache_dir, max_bytes=150)
+    assert reloaded.lookup(old)
+    assert reloaded.lookup(new) is None
+
+
+def test_sidecars_share_entry():
+    cache_dir = Path(tempfile.mkdtemp())
+    cache = AudioCache(cache_dir, max_bytes=1000)
+    a, b = (AudioCache.make_key(t, "v", "+0%", "+0%", "edge") for t in ("a", "b"))
+    put(cache, a, 100)
+    with cache.sidecar_writer(a, "opus-24.ogg") as writer:
+        writer.write(b"\x00" * 50)
+    assert cache.total_bytes == 150
+    assert cache.sidecar(a, "opus-24.ogg") == cache.sidecar_path(a, "opus-24.ogg")
+    cache.flush()
+
+    # 重启后附属文件计入同一条目；源音频不存在的附属文件被清理
+    (cache_dir / f"tts_{b}.opus-24.ogg").write_bytes(b"orphan")
+    reloaded = AudioCache(cache_dir, max_bytes=1000)
+    assert reloaded.total_bytes == 150
+    assert not (cache_dir / f"tts_{b}.opus-24.ogg").exists()
+
+    # 淘汰源音频时附属文件一起删除
+    reloaded.max_bytes = 120
+    put(reloaded, b, 100)
+    assert not reloaded.path_for(a).exists()
+    assert not reloaded.sidecar_path(a, "opus-24.ogg").exists()
+    assert reloaded.total_bytes == 100
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("缓存键规范化", test_key_normalization),
+        ("LRU 淘汰", test_lru_eviction_within_budget),
+        ("失败写入不入缓存", test_failed_write_is_not_cached),
+        ("索引持久化", test_index_survives_restart),
+        ("附属文件随源音频计量和淘汰", test_sidecars_share_entry),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
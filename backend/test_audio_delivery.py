@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+音频分发测试 - Range / 条件请求、格式协商、转码版本缓存
+转码部分需要系统安装 ffmpeg，未安装时跳过
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from services.audio_cache import AudioCache
+from services.audio_variants import AudioTranscoder, negotiate_variant, ffmpeg_available
+from services.http_range import range_file_response
+
+DATA = bytes(range(256)) * 40  # 10240 字节
+
+
+def make_client() -> TestClient:
+    path = Path(tempfile.mkdtemp()) / "sample.mp3"
+    path.write_bytes(DATA)
+    app = FastAPI()
+
+    @app.api_route("/file", methods=["GET", "HEAD"])
+    async def serve(request: Request):
+        return range_file_response(request, path, "audio/mpeg")
+
+    return TestClient(app)
+
+
+def test_full_and_partial_content():
+    client = make_client()
+    full = client.get("/file")
+    assert full.status_code == 200
+    assert full.content == DATA
+    assert full.headers["accept-ranges"] == "bytes"
+
+    part = client.get("/file", headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206
+    assert part.content == DATA[100:200]
+    assert part.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+
+    tail = client.get("/file", headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206 and tail.content == DATA[-10:]
+
+    open_ended = client.get("/file", headers={"Range": "bytes=10000-"})
+    assert open_ended.content == DATA[10000:]
+
+    # 多段 Range 按完整内容返回
+    multi = client.get("/file", headers={"Range": "bytes=0-1,5-6"})
+    assert multi.status_code == 200 and multi.content == DATA
+
+    head = client.head("/file", headers={"Range": "bytes=0-9"})
+    assert head.status_code == 206 and head.headers["content-length"] == "10"
+
+
+def test_unsatisfiable_range():
+    client = make_client()
+    resp = client.get("/file", headers={"Range": f"bytes={len(DATA)}-"})
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_conditional_requests():
+    client = make_client()
+    etag = client.get("/file").headers["etag"]
+
+    assert client.get("/file", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/file", headers={"If-None-Match": f'W/{etag}'}).status_code == 304
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    # 文件已变化 (If-Range 不匹配) 时忽略 Range，返回完整内容
+    stale = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == DATA
+    fresh = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert fresh.status_code == 206 and fresh.content == DATA[:10]
+
+    # If-Range 是强比较：弱标签永远不匹配；日期须与 Last-Modified 完全一致
+    weak = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": f'W/{etag}'})
+    assert weak.status_code == 200 and weak.content == DATA
+    last_modified = client.head("/file").headers["last-modified"]
+    dated = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": last_modified})
+    assert dated.status_code == 206 and dated.content == DATA[:10]
+    for other in ("Thu, 01 Jan 1970 00:00:00 GMT", "not a date"):
+        assert client.get("/file", headers={"Range": "bytes=0-9", "If-Range": other}).status_code == 200
+
+
+def test_negotiate_variant():
+    assert negotiate_variant("opus-24") == "opus-24"
+    assert negotiate_variant(None, "") == "source"
+    assert negotiate_variant(None, "*/*") == "source"
+    assert negotiate_variant(None, "audio/ogg, audio/mpeg;q=0.5") == "opus-32"
+    assert negotiate_variant(None, "audio/mpeg, audio/ogg;q=0.8") == "source"
+    try:
+        negotiate_variant("flac")
+        raise AssertionError("应当拒绝未知格式")
+    except ValueError:
+        pass
+
+
+async def _transcode_once():
+    cache = AudioCache(Path(tempfile.mkdtemp()), max_bytes=10 * 1024 * 1024)
+    key = AudioCache.make_key("转码", "v", "+0%", "+0%", "edge")
+    source = cache.path_for(key)
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=2",
+        "-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3", "pipe:1", stdout=asyncio.subprocess.PIPE)
+    audio, _ = await proc.communicate()
+    with cache.writer(key) as writer:
+        writer.write(audio)
+
+    transcoder = AudioTranscoder(cache)
+    paths = await asyncio.gather(*(transcoder.ensure(key, "opus-24") for _ in range(3)))
+    assert len(set(paths)) == 1
+    assert paths[0].read_bytes()[:4] == b"OggS"
+    assert paths[0].stat().st_size < source.stat().st_size / 2
+    assert cache.total_bytes == source.stat().st_size + paths[0].stat().st_size
+
+
+def test_transcode_once():
+    if not ffmpeg_available():
+        print("   (未安装 ffmpeg，跳过)")
+        return
+    asyncio.run(_transcode_once())
+
+
+FAKE_FFMPEG = """#!{python}
+import sys
+# 先写满 stderr 管道 (远超 64KB) 再输出音频
+sys.stderr.write("警告\\n" * 100000)
+sys.stderr.flush()
+if {fail}:
+    sys.stderr.write("转码出错")
+    sys.exit(1)
+sys.stdout.buffer.write(b"OggS" + bytes(1000))
+"""
+
+
+async def _transcode_with_noisy_stderr(bin_dir: Path):
+    cache = AudioCache(Path(tempfile.mkdtemp()), max_bytes=10 * 1024 * 1024)
+    key = AudioCache.make_key("转码", "v", "+0%", "+0%", "edge")
+    with cache.writer(key) as writer:
+        writer.write(b"ID3" + bytes(100))
+    transcoder = AudioTranscoder(cache)
+
+    path = await asyncio.wait_for(transcoder.ensure(key, "opus-24"), timeout=10)
+    assert path.read_bytes() == b"OggS" + bytes(1000)
+
+    (bin_dir / "ffmpeg").write_text(FAKE_FFMPEG.format(python=sys.executable, fail=True))
+    try:
+        await asyncio.wait_for(transcoder.ensure(key, "opus-32"), timeout=10)
+        raise AssertionError("应当转码失败")
+    except RuntimeError as e:
+        assert "ffmpeg 转码失败" in str(e)
+
+
+def test_transcode_drains_stderr():
+    """ffmpeg 在 stderr 上输出大量内容时不会卡住 (用假的 ffmpeg 脚本)"""
+    bin_dir = Path(tempfile.mkdtemp())
+    script = bin_dir / "ffmpeg"
+    script.write_text(FAKE_FFMPEG.format(python=sys.executable, fail=False))
+    script.chmod(0o755)
+    old_path = os.environ["PATH"]
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{old_path}"
+    try:
+        asyncio.run(_transcode_with_noisy_stderr(bin_dir))
+    finally:
+        os.environ["PATH"] = old_path
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("完整与部分内容", test_full_and_partial_content),
+        ("越界 Range", test_unsatisfiable_range),
+        ("条件请求", test_conditional_requests),
+        ("格式协商", test_negotiate_variant),
+        ("转码版本只生成一次", test_transcode_once),
+        ("转码时持续读取 stderr", test_transcode_drains_stderr),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+有声书导出测试 - 使用本地桩合成后端，无需网络
+验证：章节拼接不重新编码、章节标记时长正确、中断后续跑不重复合成
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+
+from services.audiobook_export import AudiobookExporter, build_chapter_tag, mp3_duration, strip_id3
+
+# MPEG1 Layer III, 128kbps, 44.1kHz, 无填充: 帧长 417 字节, 1152 个采样
+FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+FRAME_SECONDS = 1152 / 44100
+
+CHAPTERS = {
+    0: "第一章的内容。只有两句话。",
+    1: "第二章。" + "这是比较长的一句话，用来产生多个分段。" * 20,
+    2: "第三章结束。",
+}
+
+
+class StubBackend:
+    """桩合成：每段输出 (字数) 个 MP3 帧，前面带一个 ID3 头"""
+
+    def __init__(self, out_dir: Path, fail_on: str = None):
+        self.out_dir = out_dir
+        self.calls = []
+        self.fail_on = fail_on
+
+    async def synthesize(self, text: str) -> Path:
+        if self.fail_on and self.fail_on in text:
+            raise RuntimeError("stub failure")
+        self.calls.append(text)
+        await asyncio.sleep(0.01)
+        path = self.out_dir / f"{len(self.calls)}.mp3"
+        path.write_bytes(b"ID3\x04\x00\x00\x00\x00\x00\x00" + FRAME * len(text))
+        return path
+
+
+def make_exporter(work_dir: Path, backend: StubBackend) -> AudiobookExporter:
+    return AudiobookExporter(
+        work_dir=work_dir,
+        title="测试书",
+        author="作者",
+        chapter_titles=["一", "二", "三"],
+        load_chapter_text=lambda i: CHAPTERS[i],
+        synthesize=backend.synthesize,
+        concurrency=3,
+    )
+
+
+def test_mp3_helpers():
+    data = b"ID3\x04\x00\x00\x00\x00\x00\x00" + FRAME * 10
+    assert strip_id3(data) == FRAME * 10
+    assert abs(mp3_duration(data) - 10 * FRAME_SECONDS) < 1e-6
+    tag = build_chapter_tag("书", "作者", [{"title": "一", "start_ms": 0, "end_ms": 100}])
+    assert tag.startswith(b"ID3\x04") and b"CHAP" in tag and b"CTOC" in tag
+
+
+def test_export_and_markers():
+    work_dir = Path(tempfile.mkdtemp())
+    backend = StubBackend(Path(tempfile.mkdtemp()))
+    result = asyncio.run(make_exporter(work_dir, backend).run())
+
+    audio = Path(result["path"]).read_bytes()
+    total_frames = sum(len(text) for text in backend.calls)
+    assert audio.count(FRAME) == total_frames
+    assert abs(mp3_duration(audio) - total_frames * FRAME_SECONDS) < 0.01
+
+    markers = result["chapters"]
+    assert [m["title"] for m in markers] == ["一", "二", "三"]
+    assert markers[0]["start_ms"] == 0
+    assert all(a["end_ms"] == b["start_ms"] for a, b in zip(markers, markers[1:]))
+    assert abs(markers[-1]["end_ms"] / 1000 - total_frames * FRAME_SECONDS) < 0.01
+
+
+def test_resume_after_failure():
+    work_dir = Path(tempfile.mkdtemp())
+    failing = StubBackend(Path(tempfile.mkdtemp()), fail_on="第三章")
+    try:
+        asyncio.run(make_exporter(work_dir, failing).run())
+        raise AssertionError("应当失败")
+    except RuntimeError:
+        pass
+
+    exporter = make_exporter(work_dir, StubBackend(Path(tempfile.mkdtemp())))
+    assert exporter.completed_chapters() == [0, 1]
+    resumed = StubBackend(Path(tempfile.mkdtemp()))
+    exporter.synthesize = resumed.synthesize
+    asyncio.run(exporter.run())
+    assert resumed.calls == ["第三章结束。"]
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("MP3 工具函数", test_mp3_helpers),
+        ("导出与章节标记", test_export_and_markers),
+        ("失败后续跑", test_resume_after_failure),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量导入测试 - ZIP 解压、按内容哈希去重 (库中已有 / 同一批内重复)、进度事件顺序、
+失败或中途断开时撤销已写入的文件、ID 不撞号、导入目录限定在根目录内
+"""
+import json
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, Book
+from services.book_ids import claim_book_id
+from services import bulk_import
+from services.bulk_import import BulkImporter, ImportRootError, file_sha256, resolve_import_directory
+
+INDEX_BOOK_FILE = bulk_import.index_book_file
+
+
+def slow_index(path: str):
+    """在子进程中运行：模拟很慢的解析"""
+    time.sleep(0.2)
+    return INDEX_BOOK_FILE(path)
+
+
+def make_epub(path: Path, title: str):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('mimetype', 'application/epub+zip')
+        zf.writestr('META-INF/container.xml', '''<?xml version="1.0"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles>
+</container>''')
+        zf.writestr('OEBPS/content.opf', f'''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" xmlns:dc="http://purl.org/dc/elements/1.1/" version="3.0">
+  <metadata><dc:title>{title}</dc:title><dc:creator>作者</dc:creator></metadata>
+  <manifest><item id="c1" href="c1.xhtml" media-type="application/xhtml+xml"/></manifest>
+  <spine><itemref idref="c1"/></spine>
+</package>''')
+        zf.writestr('OEBPS/c1.xhtml', f'<html><body><h1>{title}</h1><p>正文</p></body></html>')
+
+
+def make_library():
+    """临时的书籍/上传目录和数据库，返回 (根目录, 导入器, 会话工厂)"""
+    root = Path(tempfile.mkdtemp())
+    for name in ('books', 'uploads', 'source'):
+        (root / name).mkdir()
+    engine = create_engine(f"sqlite:///{root / 'test.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    importer = BulkImporter(root / 'books', root / 'uploads', workers=2, session_factory=Session)
+    return root, importer, Session
+
+
+def test_extract_archive():
+    root = Path(tempfile.mkdtemp())
+    make_epub(root / 'a.epub', '甲')
+    archive = root / 'upload.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(root / 'a.epub', 'nested/dir/a.epub')
+        zf.writestr('../../escape.txt', '第一章\n正文')
+        zf.writestr('notes.pdf', 'x')
+        zf.writestr('folder/', '')
+
+    staging = root / 'staging'
+    paths = BulkImporter.extract_archive(archive, staging)
+    # 只解出支持的格式，按序号重命名到暂存目录内
+    assert [p.name for p in paths] == ['00000_a.epub', '00001_escape.txt']
+    assert all(p.parent == staging for p in paths)
+    assert not (root.parent / 'escape.txt').exists()
+
+
+def test_run_dedupe_and_events():
+    root, importer, Session = make_library()
+    source = root / 'source'
+    make_epub(source / 'known.epub', '已有')
+    make_epub(source / 'new.epub', '新书')
+    (source / 'copy.epub').write_bytes((source / 'new.epub').read_bytes())
+    (source / 'broken.epub').write_bytes(b'not a zip')
+    (source / 'story.txt').write_text('第一章 开始\n正文内容\n第二章 继续\n更多内容', encoding='utf-8')
+
+    session = Session()
+    session.add(Book(title='已有', file_path='/elsewhere/known.epub', file_hash=file_sha256(str(source / 'known.epub'))))
+    session.commit()
+    session.close()
+
+    events = list(importer.run(BulkImporter.collect_directory(source)))
+    kinds = [e['event'] for e in events]
+    assert kinds == ['start'] + ['file'] * 5 + ['registering', 'done']
+    assert events[0]['total'] == 5
+    assert [e['done'] for e in events[1:6]] == [1, 2, 3, 4, 5]
+
+    statuses = {e['file']: e['status'] for e in events[1:6]}
+    assert statuses['known.epub'] == 'duplicate' and statuses['broken.epub'] == 'failed'
+    assert statuses['story.txt'] == 'indexed'
+    # 同一批内容相同的两本只导入先完成的那本
+    assert sorted((statuses['new.epub'], statuses['copy.epub'])) == ['duplicate', 'indexed']
+    assert 'error' in next(e for e in events if e.get('file') == 'broken.epub')
+
+    done = events[-1]
+    assert (done['imported'], done['duplicates'], done['failed']) == (2, 2, 1)
+    assert len(set(done['book_ids'])) == 2 and all(i.isdigit() for i in done['book_ids'])
+
+    for book_id in done['book_ids']:
+        data = json.loads((root / 'books' / f'{book_id}.json').read_text(encoding='utf-8'))
+        assert data['id'] == book_id and Path(data['originalFilePath']).exists()
+    session = Session()
+    assert session.query(Book).count() == 3
+    session.close()
+    # 复制导入时保留源文件
+    assert (source / 'new.epub').exists()
+
+
+def test_rollback_on_failure():
+    root, importer, Session = make_library()
+    source = root / 'source'
+    for i in range(3):
+        make_epub(source / f'{i}.epub', f'书{i}')
+
+    stored = []
+    original_store = importer._store
+
+    def failing_store(indexed, move, written, covered):
+        if stored:
+            raise OSError('磁盘已满')
+        stored.append(original_store(indexed, move, written, covered))
+        return stored[-1]
+
+    importer._store = failing_store
+    try:
+        list(importer.run(BulkImporter.collect_directory(source)))
+        raise AssertionError('应当抛出 OSError')
+    except OSError:
+        pass
+    assert len(stored) == 1
+    assert not list((root / 'books').iterdir()) and not list((root / 'uploads').iterdir())
+    session = Session()
+    assert session.query(Book).count() == 0
+    session.close()
+
+    # 客户端中途断开 (生成器被关闭) 时同样撤销
+    importer._store = original_store
+    stream = importer.run(BulkImporter.collect_directory(source))
+    while next(stream)['event'] != 'file':
+        pass
+    assert list((root / 'books').iterdir())
+    stream.close()
+    assert not list((root / 'books').iterdir()) and not list((root / 'uploads').iterdir())
+
+
+def test_abort_cancels_queued_files():
+    root, importer, Session = make_library()
+    importer.workers = 1
+    source = root / 'source'
+    for i in range(30):
+        make_epub(source / f'{i}.epub', f'书{i}')
+
+    bulk_import.index_book_file = slow_index
+    try:
+        stream = importer.run(BulkImporter.collect_directory(source))
+        while next(stream)['event'] != 'file':
+            pass
+        # 断开后不等剩下的 29 个文件 (约 6 秒) 解析完
+        started = time.monotonic()
+        stream.close()
+        assert time.monotonic() - started < 2
+    finally:
+        bulk_import.index_book_file = INDEX_BOOK_FILE
+    assert not list((root / 'books').iterdir()) and not list((root / 'uploads').iterdir())
+
+
+def test_claim_book_id():
+    root = Path(tempfile.mkdtemp())
+    books, uploads = root / 'books', root / 'uploads'
+    books.mkdir()
+    uploads.mkdir()
+    claimed = [claim_book_id(uploads, books, 'epub') for _ in range(50)]
+    ids = [book_id for book_id, _ in claimed]
+    assert len(set(ids)) == 50 and ids == sorted(ids, key=int)
+    assert all(path.exists() and path.name == f'{book_id}.epub' for book_id, path in claimed)
+
+    # 已被其他格式或书籍 JSON 占用的 ID 会被跳过
+    next_id = int(ids[-1]) + 1
+    (uploads / f'{next_id}.txt').touch()
+    (books / f'{next_id + 1}.json').touch()
+    book_id, _ = claim_book_id(uploads, books, 'epub')
+    assert int(book_id) >= next_id + 2
+
+
+def test_resolve_import_directory():
+    root = Path(tempfile.mkdtemp())
+    (root / 'library' / 'scifi').mkdir(parents=True)
+    outside = Path(tempfile.mkdtemp())
+    (root / 'library' / 'link').symlink_to(outside)
+
+    assert resolve_import_directory('scifi', str(root / 'library')) == (root / 'library' / 'scifi').resolve()
+    for directory, root_dir in (('../', str(root / 'library')), (str(outside), str(root / 'library')),
+                                ('link', str(root / 'library')), ('missing', str(root / 'library')),
+                                ('scifi', '')):
+        try:
+            resolve_import_directory(directory, root_dir)
+            raise AssertionError(f'应当拒绝 {directory}')
+        except ImportRootError:
+            pass
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("ZIP 解压", test_extract_archive),
+        ("去重与进度事件", test_run_dedupe_and_events),
+        ("失败撤销", test_rollback_on_failure),
+        ("断开时取消排队的文件", test_abort_cancels_queued_files),
+        ("书籍 ID 分配", test_claim_book_id),
+        ("导入目录限定", test_resolve_import_directory),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
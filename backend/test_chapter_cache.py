@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+热门章节缓存测试 - 按实际字节数计入预算、LRU 淘汰、按书籍失效、命中统计
+"""
+import json
+
+from services.chapter_cache import ChapterCache, encode_json
+
+
+def chapter(index: int, size: int) -> bytes:
+    return encode_json({'index': index, 'title': f'第{index + 1}章', 'content': '字' * size})
+
+
+def test_encode_matches_json_response():
+    from fastapi.responses import JSONResponse
+    payload = {'index': 0, 'title': '第一章', 'content': '正文\n"引号"', 'word_count': 8}
+    assert encode_json(payload) == JSONResponse(payload).body
+    assert json.loads(encode_json(payload)) == payload
+
+
+def test_budget_and_eviction():
+    cache = ChapterCache(max_bytes=8000)
+    bodies = {i: chapter(i, 300) for i in range(10)}   # 每章约 950 字节
+    for i, body in bodies.items():
+        assert cache.put('b1', i, 'text', body)
+    stats = cache.stats()
+    assert stats['bytes'] <= 8000 and stats['evictions'] == 10 - stats['entries']
+    assert stats['bytes'] == sum(len(bodies[i]) for i in range(10 - stats['entries'], 10))
+
+    # 最久未用的先淘汰；读取会刷新顺序
+    assert cache.get('b1', 0, 'text') is None
+    oldest = 10 - stats['entries']
+    assert cache.get('b1', oldest, 'text') == bodies[oldest]
+    cache.put('b2', 0, 'text', chapter(0, 300))
+    assert cache.get('b1', oldest, 'text') is not None
+    assert cache.get('b1', oldest + 1, 'text') is None
+
+    # 单章超过预算的 1/8 不缓存
+    assert not cache.put('b1', 99, 'text', chapter(99, 1000))
+    assert cache.get('b1', 99, 'text') is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 3)
+
+
+def test_invalidate():
+    cache = ChapterCache(max_bytes=100_000)
+    for fmt in ('text', 'html'):
+        for i in range(3):
+            cache.put('b1', i, fmt, chapter(i, 10))
+    cache.put('b2', 0, 'text', chapter(0, 10))
+    # 同一章重复写入只计一次
+    cache.put('b2', 0, 'text', chapter(0, 10))
+
+    cache.invalidate('b1', 1)
+    assert cache.get('b1', 1, 'text') is None and cache.get('b1', 1, 'html') is None
+    assert cache.get('b1', 2, 'html') is not None
+
+    cache.invalidate('b1')
+    stats = cache.stats()
+    assert stats['entries'] == 1 and stats['books'] == 1 and stats['invalidations'] == 6
+    assert stats['bytes'] == len(chapter(0, 10))
+
+    # 预算为 0 时关闭
+    disabled = ChapterCache(max_bytes=0)
+    assert not disabled.put('b1', 0, 'text', chapter(0, 1))
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("序列化与 JSONResponse 一致", test_encode_matches_json_response),
+        ("字节预算与 LRU 淘汰", test_budget_and_eviction),
+        ("按书籍/章节失效", test_invalidate),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+富文本章节测试 - 白名单清理 (含 SVG 动画、MathML 等绕过载荷)、空白压缩、资源与章节链接改写、
+懒解析器读取章节原文
+"""
+import tempfile
+import zipfile
+from pathlib import Path
+
+from services.chapter_html import RENDER_VERSION, asset_url_for, render_chapter_html, render_text_html
+from services.epub_lazy_parser import EpubLazyParser
+
+CHAPTER = '''<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head>
+  <title>第一章</title>
+  <link rel="stylesheet" type="text/css" href="../styles/book.css"/>
+  <style>h1 { background: url(../images/bg.png) }</style>
+  <script>alert(1)</script>
+</head>
+<body onload="steal()">
+  <!-- 注释 -->
+  <h1 id="c1">第一章   开端</h1>
+  <p>他说：<a href="c2.xhtml#s2">见下一章</a>，
+     或者<a href="#c1">回到开头</a>。</p>
+  <p><img src="../images/fig%201.png" alt="图" onerror="x()"/></p>
+  <p><a href="javascript:alert(1)">坏链接</a> <a href="https://example.com/">外链</a></p>
+  <svg xmlns:xlink="http://www.w3.org/1999/xlink"><image xlink:href="../images/cover.jpg"/><script>x()</script></svg>
+  <pre>  保留
+    缩进</pre>
+  <iframe src="https://evil.example/"></iframe>
+  <form><input name="q"/></form>
+</body>
+</html>'''
+
+
+def test_render_chapter_html():
+    spine = {'OEBPS/text/c1.xhtml': 0, 'OEBPS/text/c2.xhtml': 1}
+    result = render_chapter_html(CHAPTER, 'OEBPS/text/c1.xhtml', asset_url_for('b 1'), spine)
+    html = result['html']
+    assert result['version'] == RENDER_VERSION
+    assert result['styles'] == ['/api/books/b%201/asset/OEBPS/styles/book.css']
+
+    # 清理
+    for bad in ('<script', 'alert', 'onload', 'onerror', '<iframe', '<form', '<input', '<title', '注释', 'DOCTYPE', '<?xml'):
+        assert bad not in html, bad
+    assert '<a>坏链接</a>' in html
+
+    # 改写资源和章节链接
+    assert 'src="/api/books/b%201/asset/OEBPS/images/fig%201.png"' in html
+    assert 'xlink:href="/api/books/b%201/asset/OEBPS/images/cover.jpg"' in html
+    assert 'url("/api/books/b%201/asset/OEBPS/images/bg.png")' in html
+    assert html.startswith('<style>')
+    assert '<a data-chapter="1" href="#s2">见下一章</a>' in html
+    assert '<a href="#c1">回到开头</a>' in html
+    assert 'href="https://example.com/"' in html
+
+    # 压缩：合并空白，块级元素之间没有换行，pre 原样保留
+    assert '<h1 id="c1">第一章 开端</h1><p>他说：' in html
+    assert '</svg><pre>' in html
+    assert '\n' not in html.replace('<pre>  保留\n    缩进</pre>', '')
+
+
+def test_sanitize_bypass_payloads():
+    payloads = [
+        # SVG 动画改写 href
+        '<svg><a><animate attributeName="href" values="javascript:alert(1)"/><text>x</text></a></svg>',
+        '<svg><set attributeName="href" to="javascript:alert(1)"/></svg>',
+        '<svg><animateTransform attributeName="href" from="javascript:alert(1)"/></svg>',
+        # MathML / SVG 中的 style 在浏览器重新解析时会变成真正的标签 (mXSS)
+        '<math><mglyph><style><img src=x onerror=alert(1)></style></mglyph></math>',
+        '<svg><style><img src=x onerror=alert(1)></style></svg>',
+        '<m:math xmlns:m="http://www.w3.org/1998/Math/MathML"><m:mi>x</m:mi></m:math>',
+        '<svg><foreignObject><iframe src="javascript:alert(1)"></iframe></foreignObject></svg>',
+        '<svg><use href="data:image/svg+xml,&lt;svg onload=alert(1)&gt;"/></svg>',
+        '<details open ontoggle="alert(1)">x</details><a href=" JaVaScRiPt:alert(1)">y</a>',
+    ]
+    for payload in payloads:
+        html = render_chapter_html(f'<html><body>{payload}<p>正文</p></body></html>', 'OEBPS/c.xhtml')['html']
+        for bad in ('alert', 'javascript', '<animate', '<set', '<math', 'mglyph', '<img', 'onerror', 'ontoggle',
+                    'foreignobject', '<use', '<iframe'):
+            assert bad not in html.lower(), (payload, html)
+        assert html.endswith('<p>正文</p>'), html
+
+    # 不认识的标签去掉外壳保留内容，白名单外的属性去掉；样式中的选择符不被转义
+    html = render_chapter_html('<body><custom data-x="1" onclick="x()">保留<b title="t" align="c">粗</b></custom>'
+                               '<style>p > a { color: red }</style></body>', 'c.xhtml')['html']
+    assert html == '保留<b title="t">粗</b><style>p > a { color: red }</style>'
+
+
+def test_render_without_rewriting():
+    result = render_chapter_html(CHAPTER, 'OEBPS/text/c1.xhtml')
+    assert 'src="../images/fig%201.png"' in result['html']
+    assert '<script' not in result['html']
+    assert render_text_html('第一段 <b>\n\n第二段')['html'] == '<p>第一段 &lt;b&gt;</p><p>第二段</p>'
+
+
+def test_read_chapter_source():
+    path = Path(tempfile.mkdtemp()) / 'book.epub'
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('mimetype', 'application/epub+zip')
+        zf.writestr('META-INF/container.xml', '''<?xml version="1.0"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles>
+</container>''')
+        zf.writestr('OEBPS/content.opf', '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" xmlns:dc="http://purl.org/dc/elements/1.1/" version="3.0">
+  <metadata><dc:title>测试</dc:title></metadata>
+  <manifest>
+    <item id="c1" href="text/c1.xhtml" media-type="application/xhtml+xml"/>
+    <item id="c2" href="text/c2.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+  <spine><itemref idref="c1"/><itemref idref="c2"/></spine>
+</package>''')
+        zf.writestr('OEBPS/text/c1.xhtml', CHAPTER)
+        zf.writestr('OEBPS/text/c2.xhtml', '<html><body><h2 id="s2">第二章</h2></body></html>')
+
+    # 不合并小章节，保持 spine 一一对应
+    parser = EpubLazyParser(str(path), min_chapter_bytes=0)
+    parts, spine = parser.read_chapter_source(1)
+    assert len(parts) == 1 and parts[0][0] == 'OEBPS/text/c2.xhtml' and '第二章' in parts[0][1]
+    assert spine == {'OEBPS/text/c1.xhtml': 0, 'OEBPS/text/c2.xhtml': 1}
+    assert parser.read_chapter_source(2) is None
+
+    # 流式解析附带的 HTML 也经过清理
+    first = next(parser.iter_chapters(include_html=True))
+    assert '<script' not in first['html'] and first['content'].startswith('第一章')
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("清理、压缩与链接改写", test_render_chapter_html),
+        ("绕过清理的载荷", test_sanitize_bypass_payloads),
+        ("只清理不改写", test_render_without_rewriting),
+        ("读取章节原文", test_read_chapter_source),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
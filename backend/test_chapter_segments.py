@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+章节分段索引测试 - 按引用合成的范围解析
+验证：带位置的切分与 split_segments 一致、句子/字符范围扩展到整段、
+段 id 在文本变化后失效、索引按书籍版本重建
+"""
+from services.chapter_segments import (
+    ChapterSegmentIndex, ChapterSegments, SegmentRangeError, StaleSegmentError, MAX_SEGMENTS_PER_REQUEST
+)
+from services.text_segmenter import split_segments, split_segments_with_spans
+
+TEXT = "第一章 开端\n" + "".join(f"这是第{i}句话，用来测试按引用合成。" for i in range(40)) + "\nThe end. Really."
+
+
+def test_spans_match_segments():
+    spans = split_segments_with_spans(TEXT)
+    assert [text for _, _, text in spans] == split_segments(TEXT)
+    for start, end, text in spans:
+        # 片段文本由原文该范围内的句子拼接而成 (只有句间空白可能不同)
+        assert TEXT[start:end].replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+    assert all(spans[i][1] <= spans[i + 1][0] for i in range(len(spans) - 1))
+
+
+def test_resolve_ranges():
+    segments = ChapterSegments(3, TEXT)
+    assert len(segments.segments) > 3
+
+    # 落在第二段内部的字符范围扩展为整个第二段
+    start, end, _ = segments.segments[1]
+    assert segments.resolve(chars=[start + 2, start + 5]) == [1]
+    assert segments.resolve(chars=[start, segments.segments[2][0] + 1]) == [1, 2]
+
+    # 句子范围：第一句 (标题) 属于第 0 段
+    assert segments.resolve(sentences=[0, 1]) == [0]
+    assert segments.resolve(sentences=[0, len(segments.sentences)]) == list(range(len(segments.segments)))
+
+    ids = [segments.ids[2], segments.ids[0]]
+    assert segments.resolve(segment_ids=ids) == [2, 0]
+    assert segments.ids[2].startswith("3-2-")
+
+    for bad in ({"chars": [5, 5]}, {"sentences": [0, 10_000]}, {"chars": "abc"}, {},
+                {"segment_ids": ["9-0-00000000"]}, {"segment_ids": ["garbage"]}):
+        try:
+            segments.resolve(**bad)
+            raise AssertionError(f"应当拒绝: {bad}")
+        except SegmentRangeError:
+            pass
+
+    long_text = "".join(f"第{i}句。" * 40 for i in range(MAX_SEGMENTS_PER_REQUEST + 5))
+    long_segments = ChapterSegments(0, long_text)
+    try:
+        long_segments.resolve(chars=[0, len(long_text)])
+        raise AssertionError("应当拒绝过大的范围")
+    except SegmentRangeError:
+        pass
+
+
+def test_ids_stale_after_edit():
+    original = ChapterSegments(0, TEXT)
+    edited = ChapterSegments(0, TEXT.replace("第1句话", "第一句话"))
+    assert edited.ids[0] != original.ids[0]
+    assert edited.ids[-1] == original.ids[-1]
+    try:
+        edited.resolve(segment_ids=[original.ids[0]])
+        raise AssertionError("应当拒绝过期的段 id")
+    except StaleSegmentError:
+        pass
+
+
+def test_index_rebuilds_on_version_change():
+    books = {"b1": {"version": 1, "chapters": [TEXT, "短章。"]}}
+    loads = []
+
+    def load_text(book_id, chapter):
+        loads.append((book_id, chapter))
+        chapters = books[book_id]["chapters"]
+        return chapters[chapter] if 0 <= chapter < len(chapters) else None
+
+    index = ChapterSegmentIndex(lambda book_id: books.get(book_id, {}).get("version"), load_text, max_chapters=1)
+    first = index.get("b1", 0)
+    assert index.get("b1", 0) is first and len(loads) == 1
+
+    books["b1"]["chapters"][0] = "改过的正文。"
+    books["b1"]["version"] = 2
+    assert index.get("b1", 0).text(0) == "改过的正文。"
+
+    assert index.get("b1", 5) is None
+    assert index.get("missing", 0) is None
+    # 容量 1：读取另一章后第 0 章被淘汰
+    index.get("b1", 1)
+    index.get("b1", 0)
+    assert loads.count(("b1", 0)) == 3
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("带位置的切分", test_spans_match_segments),
+        ("范围解析", test_resolve_ranges),
+        ("段 id 随文本失效", test_ids_stale_after_edit),
+        ("索引按版本重建", test_index_rebuilds_on_version_change),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书架封面图集测试 - 坐标表与图集内容一致、相同封面集合复用图集、
+任何封面变化生成新图集、旧图集按数量上限淘汰
+需要 Pillow
+"""
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+from services.cover_atlas import CoverAtlas
+from services.cover_store import CoverStore
+
+COLORS = [(200, 30, 30), (30, 200, 30), (30, 30, 200)]
+
+
+def make_covers(store: CoverStore, colors=COLORS):
+    covers = []
+    for i, color in enumerate(colors):
+        image = Image.new('RGB', (600, 900), color)
+        path = Path(tempfile.mkdtemp()) / 'cover.png'
+        image.save(path)
+        book = {'id': str(i), **store.save(str(i), path.read_bytes())}
+        covers.append((book['id'], store.thumbnail_path(book)))
+    return covers
+
+
+def test_atlas_layout():
+    store = CoverStore(Path(tempfile.mkdtemp()))
+    atlas = CoverAtlas(Path(tempfile.mkdtemp()), tile=(60, 90), columns=2)
+    covers = make_covers(store)
+    built = atlas.get(covers, 'jpeg')
+
+    assert (built['width'], built['height'], built['columns']) == (120, 180, 2)
+    assert built['tiles'] == {'0': {'x': 0, 'y': 0}, '1': {'x': 60, 'y': 0}, '2': {'x': 0, 'y': 90}}
+    with Image.open(atlas.resolve(built['name'])) as image:
+        assert image.format == 'JPEG' and image.size == (120, 180)
+        for book_id, color in zip('012', COLORS):
+            tile = built['tiles'][book_id]
+            pixel = image.getpixel((tile['x'] + 30, tile['y'] + 45))
+            assert all(abs(a - b) < 12 for a, b in zip(pixel, color))
+    assert atlas.resolve('../x.webp') is None and atlas.resolve('abc.png') is None
+
+
+def test_atlas_cache_and_invalidation():
+    store = CoverStore(Path(tempfile.mkdtemp()))
+    atlas = CoverAtlas(Path(tempfile.mkdtemp()), tile=(60, 90), max_atlases=2)
+    covers = make_covers(store)
+
+    first = atlas.get(covers)
+    again = atlas.get(covers)
+    assert first['name'] == again['name'] and first['name'].endswith('.webp')
+    assert atlas.stats()['builds'] == 1 and atlas.stats()['hits'] == 1
+
+    # 换掉一本书的封面：新的封面文件名带来新的图集
+    changed = make_covers(store, [COLORS[0], COLORS[1], (255, 255, 0)])
+    second = atlas.get(changed)
+    assert second['name'] != first['name']
+
+    # 顺序不同也是不同的图集；超过上限时淘汰最久未用的
+    third = atlas.get(list(reversed(changed)))
+    assert atlas.stats()['atlases'] == 2
+    assert atlas.resolve(first['name']) is None
+    assert atlas.resolve(second['name']) and atlas.resolve(third['name'])
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("图集布局", test_atlas_layout),
+        ("图集缓存与失效", test_atlas_cache_and_invalidation),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
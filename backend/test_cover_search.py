@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+在线封面搜索测试 - 使用本地 Google Books / OpenLibrary 桩服务，无需网络
+验证：查询结果持久化缓存 (找到/没找到分别有过期时间，上游出错不缓存)、
+相同书名并发查询合并、按主机限速、批量匹配的并发上限
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+from services.cover_search import (
+    CoverLookupCache, CoverSearch, HostRateLimiter, LookupFailed, match_many, normalize_key
+)
+
+
+class StubCatalog:
+    """Google Books 和 OpenLibrary 桩服务 (两个独立端口，限速按主机区分)"""
+
+    def __init__(self):
+        self.google = {}        # 书名 -> 封面 URL
+        self.openlibrary = {}   # 书名 -> cover_i
+        self.calls = {'google': [], 'openlibrary': []}
+        self.fail_google = False
+        self.delay = 0.0
+
+    async def google_handler(self, request):
+        query = request.query['q']
+        self.calls['google'].append((time.monotonic(), query))
+        await asyncio.sleep(self.delay)
+        if self.fail_google:
+            return web.Response(status=503)
+        title = query.split('intitle:', 1)[1].split(' inauthor:')[0]
+        if title not in self.google:
+            return web.json_response({'totalItems': 0})
+        return web.json_response({'items': [{'volumeInfo': {'imageLinks': {'thumbnail': self.google[title]}}}]})
+
+    async def openlibrary_handler(self, request):
+        title = request.query['title']
+        self.calls['openlibrary'].append((time.monotonic(), title))
+        await asyncio.sleep(self.delay)
+        if title not in self.openlibrary:
+            return web.json_response({'docs': []})
+        return web.json_response({'docs': [{'cover_i': self.openlibrary[title]}]})
+
+    async def start(self):
+        self.runners = []
+        urls = []
+        for path, handler in (('/books/v1/volumes', self.google_handler),
+                              ('/search.json', self.openlibrary_handler)):
+            app = web.Application()
+            app.router.add_get(path, handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.runners.append(runner)
+            urls.append(f"http://127.0.0.1:{port}{path}")
+        return urls
+
+    async def stop(self):
+        for runner in self.runners:
+            await runner.cleanup()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def make_search(catalog: StubCatalog, clock=None, rates=None, cache_path=None):
+    google_url, openlibrary_url = await catalog.start()
+    cache = CoverLookupCache(cache_path or Path(tempfile.mkdtemp()) / 'lookup.json',
+                             positive_ttl=100, negative_ttl=10, clock=clock or time.time)
+    limiter = HostRateLimiter(rates or {}, default_rate=0)
+    return CoverSearch(cache, limiter, google_url=google_url, openlibrary_url=openlibrary_url,
+                       openlibrary_covers_url='http://covers.local/b/id')
+
+
+def test_normalize_key():
+    assert normalize_key('三体（刘慈欣）.epub', 'Unknown') == normalize_key('三体', '')
+    assert normalize_key('The  Hobbit!', 'J.R.R. Tolkien') == normalize_key('the hobbit', 'j r r tolkien')
+    assert normalize_key('三体', '刘慈欣') != normalize_key('三体', '')
+
+
+async def _cached_lookups():
+    catalog = StubCatalog()
+    catalog.google['三体'] = 'http://img.local/santi.jpg'
+    catalog.openlibrary['Dune'] = 42
+    clock = Clock()
+    cache_path = Path(tempfile.mkdtemp()) / 'lookup.json'
+    search = await make_search(catalog, clock=clock, cache_path=cache_path)
+    try:
+        found = await search.lookup('三体.epub', '刘慈欣')
+        assert found == {'url': 'http://img.local/santi.jpg', 'source': 'google', 'cached': False}
+        again = await search.lookup('三体', '刘慈欣')
+        assert again['cached'] and len(catalog.calls['google']) == 1
+
+        # Google 没有结果时用 OpenLibrary
+        dune = await search.lookup('Dune')
+        assert dune['url'] == 'http://covers.local/b/id/42-L.jpg' and dune['source'] == 'openlibrary'
+
+        # 没找到：缓存到负向过期时间为止
+        assert await search.lookup('不存在的书') is None
+        calls = len(catalog.calls['openlibrary'])
+        assert await search.lookup('不存在的书') is None
+        assert len(catalog.calls['openlibrary']) == calls
+        clock.now += 11
+        assert await search.lookup('不存在的书') is None
+        assert len(catalog.calls['openlibrary']) == calls + 1
+
+        # 写入只标记变化，flush 后落盘，新实例直接命中；找到的结果过期后重新查询
+        assert not cache_path.exists()
+        await asyncio.to_thread(search.cache.flush)
+        reloaded = CoverLookupCache(cache_path, positive_ttl=100, negative_ttl=10, clock=clock)
+        assert reloaded.get(normalize_key('三体', '刘慈欣'))['url'] == 'http://img.local/santi.jpg'
+        clock.now += 100
+        assert reloaded.get(normalize_key('三体', '刘慈欣')) is None
+    finally:
+        await catalog.stop()
+
+
+def test_cached_lookups():
+    asyncio.run(_cached_lookups())
+
+
+async def _errors_not_cached():
+    catalog = StubCatalog()
+    catalog.google['Emma'] = 'http://img.local/emma.jpg'
+    catalog.fail_google = True
+    search = await make_search(catalog)
+    try:
+        # Google 出错、OpenLibrary 没有结果：结果未知，不写缓存
+        try:
+            await search.lookup('Emma')
+            raise AssertionError("上游出错时应当抛 LookupFailed")
+        except LookupFailed:
+            pass
+        assert search.cache.stats()['entries'] == 0
+
+        catalog.fail_google = False
+        assert (await search.lookup('Emma'))['url'] == 'http://img.local/emma.jpg'
+
+        # 相同书名的并发查询只调用一次上游
+        catalog.delay = 0.1
+        catalog.google['Persuasion'] = 'http://img.local/p.jpg'
+        results = await asyncio.gather(*(search.lookup('Persuasion') for _ in range(5)))
+        assert all(r['url'] == 'http://img.local/p.jpg' for r in results)
+        assert sum(1 for _, q in catalog.calls['google'] if 'Persuasion' in q) == 1
+    finally:
+        await catalog.stop()
+
+
+def test_errors_not_cached():
+    asyncio.run(_errors_not_cached())
+
+
+async def _host_rate_limit():
+    limiter = HostRateLimiter({'a.local': 20.0}, default_rate=0)
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire('http://a.local/x') for _ in range(5)))
+    # 同一主机 5 次请求至少间隔 4 个 50ms
+    assert time.monotonic() - started >= 0.19
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire(f'http://b{i}.local/x') for i in range(5)))
+    # 不同主机、未限速的主机互不影响
+    assert time.monotonic() - started < 0.05
+
+    limiter.penalize('http://a.local/x', 0.2)
+    started = time.monotonic()
+    await limiter.acquire('http://a.local/y')
+    assert time.monotonic() - started >= 0.15
+
+
+def test_host_rate_limit():
+    asyncio.run(_host_rate_limit())
+
+
+async def _batch_concurrency():
+    catalog = StubCatalog()
+    catalog.delay = 0.05
+    titles = {str(i): f'书{i}' for i in range(12)}
+    for i in range(0, 12, 2):
+        catalog.google[f'书{i}'] = f'http://img.local/{i}.jpg'
+    # Google 桩服务限速 100 次/秒
+    search = await make_search(catalog)
+    search.limiter.rates[search.limiter.host_of(search.google_url)] = 100.0
+    active = peak = 0
+
+    async def match_one(book_id):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        try:
+            return await search.lookup(titles[book_id])
+        finally:
+            active -= 1
+
+    seen = []
+    try:
+        summary = await match_many(titles, match_one, concurrency=3,
+                                   on_result=lambda book_id, status, _: seen.append((book_id, status)))
+        assert summary == {'total': 12, 'matched': 6, 'missed': 6, 'failed': 0}
+        assert peak == 3
+        assert len(seen) == 12
+        # 12 次 Google 请求按 100 次/秒放行，至少跨越 11 个间隔 (单次到达时间有抖动，只看总跨度)
+        google_times = sorted(t for t, _ in catalog.calls['google'])
+        assert len(google_times) == 12
+        assert google_times[-1] - google_times[0] >= 0.1
+    finally:
+        await catalog.stop()
+
+
+def test_batch_concurrency():
+    asyncio.run(_batch_concurrency())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("缓存键规范化", test_normalize_key),
+        ("查询结果缓存", test_cached_lookups),
+        ("上游出错不缓存", test_errors_not_cached),
+        ("按主机限速", test_host_rate_limit),
+        ("批量匹配并发上限", test_batch_concurrency),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+封面衍生图测试 - 原图按实际格式保存、固定尺寸的 WebP/JPEG 缩略图、
+内联封面迁移、EPUB 封面只读取一次
+缩略图部分需要 Pillow
+"""
+import io
+import json
+import tempfile
+import zipfile
+from pathlib import Path
+
+from PIL import Image
+
+from services.cover_store import (
+    COVER_SIZES, CoverError, CoverStore, data_uri, externalize_book_cover, is_versioned_name, sniff_image_format
+)
+from services.epub_lazy_parser import EpubLazyParser
+
+
+def make_image(fmt: str, size=(1200, 1800), mode='RGB') -> bytes:
+    color = (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def make_store() -> CoverStore:
+    return CoverStore(Path(tempfile.mkdtemp()))
+
+
+def local_path(store: CoverStore, url: str) -> Path:
+    return store.resolve(url.rsplit('/', 1)[-1])
+
+
+def test_save_generates_derivatives():
+    store = make_store()
+    original = make_image('PNG', mode='RGBA')
+    fields = store.save('42', original)
+    covers = fields['covers']
+
+    # 原图按实际格式保存，不再一律当作 jpeg
+    assert covers['original'].endswith('.png')
+    assert local_path(store, covers['original']).read_bytes() == original
+    assert fields['cover'] == covers['list']['jpeg']
+
+    for size, box in COVER_SIZES.items():
+        for fmt, expected in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            path = local_path(store, covers[size][fmt])
+            assert sniff_image_format(path.read_bytes()) == ('webp' if fmt == 'webp' else 'jpg')
+            with Image.open(path) as image:
+                assert image.format == expected
+                # 保持 2:3 比例缩放到尺寸框内
+                assert image.size == box
+            assert is_versioned_name(path.name)
+
+    # 书架用的缩略图比原图小得多
+    assert local_path(store, covers['list']['webp']).stat().st_size * 10 < len(original)
+
+
+def test_replace_and_remove():
+    store = make_store()
+    first = store.save('7', make_image('JPEG'))
+    # 另一本书 (id 前缀相同) 的文件不受影响
+    other = store.save('70', make_image('JPEG'))
+    second = store.save('7', make_image('PNG', size=(600, 900)))
+
+    assert first['covers']['original'] != second['covers']['original']
+    names = {p.name for p in store.files('7')}
+    assert names == {url.rsplit('/', 1)[-1] for url in [second['covers']['original']] +
+                     [u for size in COVER_SIZES for u in second['covers'][size].values()]}
+    assert local_path(store, other['cover']) is not None
+
+    store.remove('7')
+    assert store.files('7') == []
+    assert store.files('70')
+
+    try:
+        store.save('8', b'not an image')
+        raise AssertionError("应当拒绝无法识别的图片")
+    except CoverError:
+        pass
+    assert store.resolve('../secret') is None
+
+
+def test_externalize_inline_cover():
+    store = make_store()
+    image = make_image('JPEG', size=(300, 450))
+    book = {'id': '5', 'title': '测试', 'cover': data_uri(image)}
+    before = len(json.dumps(book))
+
+    assert externalize_book_cover(store, '5', book)
+    assert book['cover'].startswith('/covers/5.')
+    assert local_path(store, book['covers']['original']).read_bytes() == image
+    assert len(json.dumps(book)) * 10 < before
+    # 已迁移的书不再处理
+    assert not externalize_book_cover(store, '5', book)
+
+    # 只有原图的旧封面补齐缩略图
+    legacy = store.covers_dir / '6.jpg'
+    legacy.write_bytes(image)
+    old = {'id': '6', 'cover': '/covers/6.jpg?t=123'}
+    assert externalize_book_cover(store, '6', old)
+    assert old['covers']['detail']['webp'].endswith('.detail.webp')
+    assert not legacy.exists()
+
+    broken = {'id': '9', 'cover': 'data:image/jpeg;base64,AAAA'}
+    assert externalize_book_cover(store, '9', broken) and broken['cover'] is None
+
+
+def test_epub_cover_read_once():
+    image = make_image('PNG', size=(100, 150))
+    path = Path(tempfile.mkdtemp()) / 'book.epub'
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('META-INF/container.xml', '''<?xml version="1.0"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>''')
+        zf.writestr('OEBPS/content.opf', '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>封面测试</dc:title></metadata>
+  <manifest>
+    <item id="img" href="images/front.png" media-type="image/png" properties="cover-image"/>
+    <item id="c1" href="c1.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+  <spine><itemref idref="c1"/></spine>
+</package>''')
+        zf.writestr('OEBPS/c1.xhtml', '<html><body><p>正文</p></body></html>')
+        zf.writestr('OEBPS/images/front.png', image)
+
+    parser = EpubLazyParser(str(path))
+    metadata = parser.parse_metadata_only()
+    # 元数据中不再内联封面
+    assert metadata['cover'] is None
+    assert metadata['cover_href'] == 'OEBPS/images/front.png'
+    assert parser.read_cover(metadata['cover_href']) == image
+    assert parser.read_cover(max_bytes=10) is None
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("生成缩略图", test_save_generates_derivatives),
+        ("更换与删除封面", test_replace_and_remove),
+        ("迁移内联封面", test_externalize_inline_cover),
+        ("EPUB 封面只读取一次", test_epub_cover_read_once),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
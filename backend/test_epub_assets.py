@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+EPUB 内嵌资源测试 - 成员路径解析、内容类型、CRC ETag、
+未压缩/压缩成员的按区间读取、Range 与条件请求
+"""
+import os
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from services.epub_assets import AssetNotFound, EpubAssetStore, normalize_member
+from services.http_range import range_response
+
+IMAGE = bytes(range(256)) * 400            # 102400 字节，未压缩存放
+STYLE = ("p { margin: 0 }\n" * 2000).encode()  # 压缩存放
+
+
+def make_epub() -> Path:
+    path = Path(tempfile.mkdtemp()) / "book.epub"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/epub+zip")
+        zf.writestr("META-INF/container.xml", '''<?xml version="1.0"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles>
+</container>''')
+        zf.writestr("OEBPS/content.opf", '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <manifest>
+    <item id="fig" href="images/fig%201.bin" media-type="image/png"/>
+    <item id="css" href="styles/book.css" media-type="text/css"/>
+    <item id="c1" href="text/c1.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+</package>''', compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("OEBPS/images/fig 1.bin", IMAGE, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("OEBPS/styles/book.css", STYLE, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("OEBPS/text/c1.xhtml", "<html/>", compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("OEBPS/fonts/serif.woff2", b"wOF2....", compress_type=zipfile.ZIP_DEFLATED)
+    return path
+
+
+def make_store(path: Path, loads=None) -> EpubAssetStore:
+    def archive_path(book_id):
+        if loads is not None:
+            loads.append(book_id)
+        return str(path) if book_id == "b1" else None
+    return EpubAssetStore(lambda book_id: 1 if book_id in ("b1", "txt") else None, archive_path)
+
+
+def test_normalize_member():
+    assert normalize_member("OEBPS/images/fig%201.bin") == "OEBPS/images/fig 1.bin"
+    assert normalize_member("OEBPS/text/../images/./a.png") == "OEBPS/images/a.png"
+    # 不能越出 ZIP 根目录
+    assert normalize_member("../../etc/passwd") == "etc/passwd"
+    assert normalize_member("") is None
+
+
+def test_lookup_and_read():
+    path = make_epub()
+    loads = []
+    store = make_store(path, loads)
+
+    archive, image = store.get("b1", "OEBPS/images/fig%201.bin")
+    # 清单中的 media-type 优先于扩展名
+    assert image.media_type == "image/png" and image.stored
+    assert image.etag == f'"{zlib.crc32(IMAGE):08x}-{len(IMAGE):x}"'
+    assert b"".join(store.iter_range(archive, image, 0, image.size)) == IMAGE
+    assert b"".join(store.iter_range(archive, image, 1000, 5000)) == IMAGE[1000:6000]
+
+    _, style = store.get("b1", "OEBPS/text/../styles/book.css")
+    assert style.media_type == "text/css" and not style.stored
+    assert b"".join(store.iter_range(archive, style, 7, 100)) == STYLE[7:107]
+
+    # 不在清单中的成员按扩展名推断
+    _, font = store.get("b1", "OEBPS/fonts/serif.woff2")
+    assert font.media_type == "font/woff2"
+    _, chapter = store.get("b1", "OEBPS/text/c1.xhtml")
+    assert chapter.active
+
+    # 书籍版本不变时不重复读取书籍 JSON
+    assert loads == ["b1"]
+
+    for book_id, member in (("b1", "OEBPS/missing.png"), ("b1", "OEBPS/images"), ("txt", "a.png"), ("nope", "a")):
+        try:
+            store.get(book_id, member)
+            raise AssertionError(f"应当找不到 {book_id}/{member}")
+        except AssetNotFound:
+            pass
+
+
+def make_client() -> TestClient:
+    store = make_store(make_epub())
+    app = FastAPI()
+
+    @app.api_route("/asset/{path:path}", methods=["GET", "HEAD"])
+    async def serve(path: str, request: Request):
+        try:
+            archive, asset = store.get("b1", path)
+        except AssetNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return range_response(request, asset.size, asset.etag, asset.media_type,
+                              lambda start, length: store.iter_range(archive, asset, start, length),
+                              last_modified=asset.last_modified)
+
+    return TestClient(app)
+
+
+def test_range_and_etag():
+    client = make_client()
+    full = client.get("/asset/OEBPS/images/fig%201.bin")
+    assert full.status_code == 200 and full.content == IMAGE
+    assert full.headers["content-type"] == "image/png"
+    etag = full.headers["etag"]
+    assert not etag.startswith("W/")
+
+    part = client.get("/asset/OEBPS/styles/book.css", headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206 and part.content == STYLE[100:200]
+    assert part.headers["content-range"] == f"bytes 100-199/{len(STYLE)}"
+
+    tail = client.get("/asset/OEBPS/images/fig%201.bin", headers={"Range": "bytes=-16"})
+    assert tail.status_code == 206 and tail.content == IMAGE[-16:]
+
+    assert client.get("/asset/OEBPS/images/fig%201.bin", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/asset/OEBPS/images/fig%201.bin",
+                      headers={"Range": f"bytes={len(IMAGE)}-"}).status_code == 416
+    assert client.get("/asset/OEBPS/none.png").status_code == 404
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("成员路径规范化", test_normalize_member),
+        ("查找与按区间读取", test_lookup_and_read),
+        ("Range 与 ETag", test_range_and_etag),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
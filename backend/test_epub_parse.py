@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+EPUB 整本/流式解析测试 - 两种模式章节数与序号一致、流式逐章产出 (第一章不等整本解析完)、
+没有标题标签时用正文第一行作标题、出错时以 error 事件结尾
+"""
+import json
+import tempfile
+import zipfile
+from pathlib import Path
+
+from services.epub_parser import EpubParser
+
+PARAGRAPH = '<p>' + '这是一段足够长的正文。' * 30 + '</p>'
+
+
+def make_epub() -> Path:
+    path = Path(tempfile.mkdtemp()) / 'book.epub'
+    spine = ['c1', 'blank', 'c2', 'c3', 'c4', 'c5']
+    bodies = {
+        'c1': '<h1>第一章</h1>' + PARAGRAPH * 2,
+        # 两个大章节之间的空白页：单独成章，正文为空，不返回
+        'blank': '<p> </p>',
+        'c2': '<h1>第二章</h1>' + PARAGRAPH * 2,
+        'c3': '<h1>第三章</h1>' + PARAGRAPH * 2,
+        # 没有 h1-h3：第一行够短时作为标题，否则保留占位标题
+        'c4': '<p>尾声</p>' + PARAGRAPH * 3,
+        'c5': PARAGRAPH * 3,
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('mimetype', 'application/epub+zip')
+        zf.writestr('META-INF/container.xml', '''<?xml version="1.0"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles>
+</container>''')
+        manifest = ''.join(f'<item id="{n}" href="{n}.xhtml" media-type="application/xhtml+xml"/>' for n in spine)
+        itemrefs = ''.join(f'<itemref idref="{n}"/>' for n in spine)
+        zf.writestr('OEBPS/content.opf', f'''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" xmlns:dc="http://purl.org/dc/elements/1.1/" version="3.0">
+  <metadata><dc:title>测试书</dc:title><dc:creator>作者</dc:creator><dc:publisher>出版社</dc:publisher></metadata>
+  <manifest>{manifest}</manifest>
+  <spine>{itemrefs}</spine>
+</package>''')
+        for name, body in bodies.items():
+            zf.writestr(f'OEBPS/{name}.xhtml', f'<html><body>{body}<script>x()</script></body></html>')
+    return path
+
+
+def test_whole_and_stream_agree():
+    path = make_epub()
+    whole = EpubParser(str(path)).parse()
+    events = [json.loads(line) for line in EpubParser(str(path)).iter_ndjson()]
+
+    assert [e['type'] for e in events] == ['metadata'] + ['chapter'] * 5 + ['done']
+    assert (whole['title'], whole['author'], whole['publisher']) == ('测试书', '作者', '出版社')
+    assert events[0]['title'] == '测试书' and events[0]['spine_items'] == 6
+
+    streamed = [{k: v for k, v in e.items() if k != 'type'} for e in events[1:-1]]
+    assert streamed == whole['chapters']
+    assert [ch['index'] for ch in whole['chapters']] == [0, 1, 2, 3, 4]
+    assert [ch['title'] for ch in whole['chapters']] == ['第一章', '第二章', '第三章', '尾声', '第 6 章']
+    assert whole['total_chapters'] == events[-1]['total_chapters'] == 5
+    assert all('<script' not in ch['html'] for ch in whole['chapters'])
+
+
+def test_first_chapter_streams_early():
+    parser = EpubParser(str(make_epub()))
+    reads = []
+    read_chapter = parser.lazy._read_chapter
+
+    def counting(zf, chapter_info, index, include_html=False):
+        reads.append(index)
+        return read_chapter(zf, chapter_info, index, include_html)
+
+    parser.lazy._read_chapter = counting
+    events = parser.iter_events()
+    assert next(events)['type'] == 'metadata' and reads == []
+    first = next(events)
+    # 第一章产出时只读了第一章
+    assert first['type'] == 'chapter' and first['title'] == '第一章' and reads == [0]
+    assert [e['type'] for e in events][-1] == 'done' and reads == [0, 1, 2, 3, 4, 5]
+
+
+def test_error_event():
+    path = Path(tempfile.mkdtemp()) / 'broken.epub'
+    path.write_bytes(b'not a zip archive')
+    events = [json.loads(line) for line in EpubParser(str(path)).iter_ndjson()]
+    assert [e['type'] for e in events] == ['metadata', 'error']
+    assert events[-1]['error']
+
+    try:
+        EpubParser(str(path)).parse()
+        raise AssertionError('整本解析应当抛出异常')
+    except zipfile.BadZipFile:
+        pass
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("整本与流式结果一致", test_whole_and_stream_agree),
+        ("第一章先行产出", test_first_chapter_streams_early),
+        ("出错时的 error 事件", test_error_event),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+共享 HTTP 会话池测试 - 同一上游复用会话与 keep-alive 连接、单主机并发上限、
+关闭后重建、事件循环更换时重建 (用本地 aiohttp 服务作为上游)
+"""
+import asyncio
+
+from aiohttp import web
+
+from services.http_sessions import HttpSessionPool
+
+PROFILES = {
+    'fast': {'limit': 8, 'limit_per_host': 2, 'timeout': 5},
+    'other': {'limit': 4, 'limit_per_host': 4, 'timeout': 5},
+}
+
+
+async def start_upstream(stats: dict):
+    """记录每个请求来自哪个客户端端口 (即哪条连接) 以及同时在处理的请求数"""
+    async def handle(request: web.Request):
+        stats['ports'].add(request.transport.get_extra_info('peername')[1])
+        stats['active'] += 1
+        stats['max_active'] = max(stats['max_active'], stats['active'])
+        try:
+            await asyncio.sleep(float(request.query.get('delay', 0)))
+            return web.Response(text='ok')
+        finally:
+            stats['active'] -= 1
+
+    app = web.Application()
+    app.router.add_get('/', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/'
+
+
+def new_stats() -> dict:
+    return {'ports': set(), 'active': 0, 'max_active': 0}
+
+
+def test_reuse_and_limits():
+    async def scenario():
+        stats = new_stats()
+        runner, url = await start_upstream(stats)
+        pool = HttpSessionPool(PROFILES)
+        try:
+            session = pool.get('fast')
+            assert pool.get('fast') is session and pool.get('other') is not session
+
+            # 顺序请求复用同一条 keep-alive 连接
+            for _ in range(20):
+                async with pool.get('fast').get(url) as resp:
+                    assert await resp.text() == 'ok'
+            assert len(stats['ports']) == 1
+
+            # 并发请求不超过单主机连接上限
+            stats.update(new_stats())
+
+            async def fetch():
+                async with pool.get('fast').get(url, params={'delay': '0.05'}) as resp:
+                    return resp.status
+
+            assert await asyncio.gather(*(fetch() for _ in range(10))) == [200] * 10
+            assert stats['max_active'] == 2 and len(stats['ports']) <= 2
+        finally:
+            await pool.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_lifecycle():
+    async def scenario():
+        pool = HttpSessionPool(PROFILES)
+        await pool.start()
+        sessions = {name: pool.get(name) for name in PROFILES}
+        assert all(not s.closed for s in sessions.values())
+
+        await pool.close()
+        assert all(s.closed for s in sessions.values())
+        # 关闭后再次获取时重新创建
+        reopened = pool.get('fast')
+        assert reopened is not sessions['fast'] and not reopened.closed
+
+        # 会话被单独关闭时也会重建
+        await reopened.close()
+        assert pool.get('fast') is not reopened
+        await pool.close()
+        return pool
+
+    pool = asyncio.run(scenario())
+
+    # 换了事件循环 (如测试或重启后) 时不复用绑定在旧循环上的会话
+    async def get_session():
+        return pool.get('fast')
+
+    async def on_new_loop(previous):
+        session = pool.get('fast')
+        assert session is not previous and not previous.closed and not session.closed
+        await pool.close()
+        await previous.close()
+
+    asyncio.run(on_new_loop(asyncio.run(get_session())))
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("会话与连接复用、并发上限", test_reuse_and_limits),
+        ("创建、关闭与重建", test_lifecycle),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+后台任务队列测试 - 去重、失败重试与指数退避、重启后按断点续跑、批量任务给交互任务留出 worker
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+from database import Base, Job
+from services.job_queue import PRIORITY_BULK, PRIORITY_INTERACTIVE, JobQueue
+
+
+def make_engine():
+    engine = create_engine(f"sqlite:///{Path(tempfile.mkdtemp()) / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+async def wait_for(queue: JobQueue, job_id: int, statuses=('completed', 'failed'), timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"任务 #{job_id} 未到达 {statuses}: {queue.get(job_id)}")
+
+
+async def noop(ctx):
+    return None
+
+
+def test_dedupe():
+    queue = JobQueue(engine=make_engine())
+    queue.register('parse', noop)
+
+    first = queue.enqueue('parse', {'book_id': '1'})
+    assert queue.enqueue('parse', {'book_id': '1'}, priority=PRIORITY_INTERACTIVE) == first
+    assert queue.get(first)['priority'] == PRIORITY_INTERACTIVE
+    assert queue.enqueue('parse', {'book_id': '2'}) != first
+    assert queue.enqueue('parse', {'book_id': '1'}, dedupe=False) != first
+
+    # 前 255 个字符相同的长参数仍是不同的任务
+    prefix = 'x' * 300
+    long_a = queue.enqueue('parse', {'ids': prefix + 'a'})
+    long_b = queue.enqueue('parse', {'ids': prefix + 'b'})
+    assert long_a != long_b
+
+    try:
+        queue.enqueue('unknown')
+        raise AssertionError('应当拒绝未注册的任务类型')
+    except ValueError:
+        pass
+
+
+def test_retry_with_backoff():
+    async def scenario():
+        queue = JobQueue(workers=1, retry_base_seconds=0.1, poll_interval=0.01, engine=make_engine())
+        attempts = []
+
+        async def flaky(ctx):
+            attempts.append((ctx.attempt, time.monotonic()))
+            if ctx.attempt < 3:
+                raise RuntimeError(f'第 {ctx.attempt} 次失败')
+            return {'ok': True}
+
+        async def broken(ctx):
+            raise RuntimeError('总是失败')
+
+        queue.register('flaky', flaky)
+        queue.register('broken', broken)
+        queue.start()
+        try:
+            job = await wait_for(queue, queue.enqueue('flaky'))
+            assert job['status'] == 'completed' and job['result'] == {'ok': True}
+            assert job['attempts'] == 3 and job['error'] is None
+            # 退避时间按 base * 2^(n-1) 增长
+            gaps = [b[1] - a[1] for a, b in zip(attempts, attempts[1:])]
+            assert gaps[0] >= 0.1 and gaps[1] >= 0.2, gaps
+
+            job = await wait_for(queue, queue.enqueue('broken', max_attempts=2))
+            assert job['status'] == 'failed' and job['attempts'] == 2
+            assert job['error'] == '总是失败' and job['finished_at']
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_resume_from_checkpoint():
+    async def scenario():
+        engine = make_engine()
+        seen = []
+        gate = asyncio.Event()
+
+        async def steps(ctx):
+            start = ctx.checkpoint.get('next', 0)
+            seen.append((ctx.attempt, start))
+            for step in range(start, 6):
+                if step == 3 and not gate.is_set():
+                    await asyncio.Event().wait()  # 卡住，等服务关闭
+                ctx.save_checkpoint({'next': step + 1}, progress=(step + 1) / 6)
+            return {'steps': 6}
+
+        queue = JobQueue(workers=1, poll_interval=0.01, engine=engine)
+        queue.register('steps', steps)
+        queue.start()
+        job_id = queue.enqueue('steps')
+        await wait_for(queue, job_id, statuses=('running',))
+        while queue.get(job_id)['progress'] < 0.5:
+            await asyncio.sleep(0.01)
+
+        # 服务关闭：回到 pending，不计入重试次数
+        await queue.stop()
+        job = queue.get(job_id)
+        assert job['status'] == 'pending' and job['attempts'] == 0 and job['progress'] == 0.5
+
+        # 进程被杀时任务停留在 running，重启时同样恢复
+        session = queue._Session()
+        session.query(Job).filter(Job.id == job_id).update({'status': 'running', 'attempts': 1})
+        session.commit()
+        session.close()
+
+        gate.set()
+        restarted = JobQueue(workers=1, poll_interval=0.01, engine=engine)
+        restarted.register('steps', steps)
+        restarted.start()
+        try:
+            job = await wait_for(restarted, job_id)
+        finally:
+            await restarted.stop()
+
+        assert job['status'] == 'completed' and job['result'] == {'steps': 6}
+        assert seen == [(1, 0), (1, 3)]
+
+    asyncio.run(scenario())
+
+
+def test_bulk_slots():
+    async def scenario():
+        queue = JobQueue(workers=2, poll_interval=0.01, engine=make_engine())
+        release = asyncio.Event()
+        running = {'bulk': 0, 'max_bulk': 0}
+
+        async def bulk(ctx):
+            running['bulk'] += 1
+            running['max_bulk'] = max(running['max_bulk'], running['bulk'])
+            await release.wait()
+            running['bulk'] -= 1
+
+        queue.register('bulk', bulk)
+        queue.register('interactive', noop)
+        queue.start()
+        try:
+            bulk_ids = [queue.enqueue('bulk', {'n': n}, priority=PRIORITY_BULK) for n in range(3)]
+            await wait_for(queue, bulk_ids[0], statuses=('running',))
+            await asyncio.sleep(0.05)
+            # 批量任务只占一个 worker，交互任务仍能立即执行
+            assert running['max_bulk'] == 1
+            job = await wait_for(queue, queue.enqueue('interactive', priority=PRIORITY_INTERACTIVE), timeout=1.0)
+            assert job['status'] == 'completed'
+            assert [queue.get(i)['status'] for i in bulk_ids[1:]] == ['pending', 'pending']
+
+            release.set()
+            for job_id in bulk_ids:
+                assert (await wait_for(queue, job_id))['status'] == 'completed'
+            assert running['max_bulk'] == 1
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("去重", test_dedupe),
+        ("失败重试与退避", test_retry_with_backoff),
+        ("重启后按断点续跑", test_resume_from_checkpoint),
+        ("批量任务留出 worker", test_bulk_slots),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
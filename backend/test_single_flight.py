@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+相同请求合并测试 - 使用本地假 EasyVoice 服务，无需网络
+验证：并发相同请求只调用一次上游、中途加入的请求拿到完整音频、
+失败同时通知所有订阅者且不写缓存、全部订阅者离开时取消上游
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+
+from aiohttp import web
+
+from services.tts_engine import TTSEngine
+
+CHUNK = b"\xff\xf3" + b"\x00" * 4094
+CHUNK_COUNT = 5
+CHUNK_DELAY = 0.1
+
+
+async def start_fake_easyvoice(mode: str = "ok"):
+    """假 EasyVoice：记录调用次数；ok 分块慢速输出，fail_mid 输出一半后断开"""
+    calls = []
+
+    async def generate(request):
+        calls.append(await request.json())
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i in range(CHUNK_COUNT):
+            if mode == "fail_mid" and i == 2:
+                request.transport.close()
+                return response
+            await response.write(CHUNK)
+            await asyncio.sleep(CHUNK_DELAY)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/v1/tts/generateJson", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/v1/tts/generateJson", calls
+
+
+def make_engine(api_url: str) -> TTSEngine:
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()))
+    engine.easyvoice_url = api_url
+    return engine
+
+
+async def collect(engine: TTSEngine, text: str) -> bytes:
+    return b"".join([c async for c in engine.stream_synthesize(text, "zh-CN-XiaoxiaoNeural")])
+
+
+async def _concurrent_requests_share_upstream():
+    runner, url, calls = await start_fake_easyvoice("ok")
+    try:
+        engine = make_engine(url)
+        results = await asyncio.gather(
+            *(collect(engine, "合并测试") for _ in range(8)),
+            engine.synthesize("合并测试", "zh-CN-XiaoxiaoNeural")
+        )
+        streams, path = results[:-1], results[-1]
+
+        assert len(calls) == 1, calls
+        assert all(audio == CHUNK * CHUNK_COUNT for audio in streams)
+        assert path.read_bytes() == CHUNK * CHUNK_COUNT
+        assert engine.flights.stats() == {"in_flight": 0, "upstream_calls": 1, "coalesced": 8}
+        assert len(list(engine.audio_dir.glob("tts_*.mp3"))) == 1
+    finally:
+        await runner.cleanup()
+
+
+async def _late_joiner_gets_full_audio():
+    runner, url, calls = await start_fake_easyvoice("ok")
+    try:
+        engine = make_engine(url)
+        first = asyncio.create_task(collect(engine, "中途加入"))
+        # 等第一个请求已经收到几块音频后再加入
+        await asyncio.sleep(CHUNK_DELAY * 2.5)
+        late = await collect(engine, "中途加入")
+
+        assert late == CHUNK * CHUNK_COUNT
+        assert await first == late
+        assert len(calls) == 1
+    finally:
+        await runner.cleanup()
+
+
+async def _failure_reaches_all_subscribers():
+    runner, url, calls = await start_fake_easyvoice("fail_mid")
+    try:
+        engine = make_engine(url)
+        results = await asyncio.gather(*(collect(engine, "失败测试") for _ in range(3)),
+                                       return_exceptions=True)
+
+        assert all(isinstance(r, Exception) for r in results), results
+        assert len(calls) == 1
+        assert not list(engine.audio_dir.glob("tts_*"))
+        assert engine.flights.stats()["in_flight"] == 0
+    finally:
+        await runner.cleanup()
+
+
+async def _abandoned_flight_is_cancelled():
+    runner, url, calls = await start_fake_easyvoice("ok")
+    try:
+        engine = make_engine(url)
+        tasks = [asyncio.create_task(collect(engine, "取消测试")) for _ in range(2)]
+        await asyncio.sleep(CHUNK_DELAY * 1.5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(CHUNK_DELAY)
+
+        assert engine.flights.stats()["in_flight"] == 0
+        assert not list(engine.audio_dir.glob("tts_*"))
+
+        # 再次请求会重新发起上游调用
+        assert await collect(engine, "取消测试") == CHUNK * CHUNK_COUNT
+        assert len(calls) == 2
+    finally:
+        await runner.cleanup()
+
+
+def test_concurrent_requests_share_upstream():
+    asyncio.run(_concurrent_requests_share_upstream())
+
+
+def test_late_joiner_gets_full_audio():
+    asyncio.run(_late_joiner_gets_full_audio())
+
+
+def test_failure_reaches_all_subscribers():
+    asyncio.run(_failure_reaches_all_subscribers())
+
+
+def test_abandoned_flight_is_cancelled():
+    asyncio.run(_abandoned_flight_is_cancelled())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("并发相同请求只调用一次上游", test_concurrent_requests_share_upstream),
+        ("中途加入拿到完整音频", test_late_joiner_gets_full_audio),
+        ("失败通知所有订阅者", test_failure_reaches_all_subscribers),
+        ("无人订阅时取消上游", test_abandoned_flight_is_cancelled),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
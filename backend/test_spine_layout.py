@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+目录归一化测试 - 过大的 spine 项按标题/锚点/段落切分成带字节区间的虚拟章节、
+连续的小项合并、按保存的目录读取章节与改写章节间链接
+"""
+import tempfile
+import zipfile
+from pathlib import Path
+
+from services import epub_lazy_parser
+from services.chapter_html import render_chapter_html
+from services.epub_lazy_parser import EpubLazyParser, SplitMemberCache
+from services.spine_layout import body_bounds, normalize_spine, slice_document, split_ranges
+
+HEAD = '<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml"><head><title>书</title></head>\n<body>\n'
+TAIL = '</body>\n</html>'
+PARAGRAPH = '<p>' + '这是一段足够长的正文。' * 20 + '</p>\n'
+
+
+def novel(chapters: int = 10, paragraphs: int = 5) -> str:
+    body = '<h1>整本小说</h1>\n'
+    for i in range(chapters):
+        body += f'<h2 id="ch{i}">第{i + 1}回</h2>\n' + f'<h3>小节</h3>\n{PARAGRAPH}' * paragraphs
+    return HEAD + body + TAIL
+
+
+def test_split_ranges():
+    raw = novel().encode('utf-8')
+    start, end = body_bounds(raw)
+    ranges = split_ranges(raw, max_bytes=8 * 1024, min_bytes=1024)
+    # 区间首尾相接、覆盖整个 body
+    assert ranges[0][0] == start and ranges[-1][1] == end
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    # 每回一章 (第一回带上书名)，不在更细的 h3 处切开
+    assert len(ranges) == 10
+    assert all(raw[a:].startswith(b'<h2') for a, _ in ranges[1:])
+    assert all(b - a <= 8 * 1024 for a, b in ranges)
+
+    # 单回超出上限时在下一级标题处继续切
+    long_chapters = novel(chapters=2, paragraphs=20).encode('utf-8')
+    ranges = split_ranges(long_chapters, max_bytes=8 * 1024, min_bytes=1024)
+    assert len(ranges) > 2 and all(b - a <= 8 * 1024 for a, b in ranges)
+    assert all(long_chapters[a:].startswith((b'<h2', b'<h3')) for a, _ in ranges[1:])
+
+    # 没有标题：按段落装满
+    plain = (HEAD + PARAGRAPH * 60 + TAIL).encode('utf-8')
+    ranges = split_ranges(plain, max_bytes=8 * 1024, min_bytes=1024)
+    assert len(ranges) > 1 and all(b - a <= 8 * 1024 for a, b in ranges)
+    assert all(plain[a:].startswith(b'<p>') for a, _ in ranges[1:])
+
+    # 切出的片段补上 head 后仍是完整文档
+    document = slice_document(plain, *ranges[1])
+    assert document.startswith(HEAD.rstrip().encode('utf-8')) and document.endswith(b'</body></html>')
+
+
+def test_normalize_spine():
+    items = [{'id': f'i{n}', 'href': f'{n}.xhtml'} for n in range(6)]
+    sizes = [300, 200, 500, 5000, 400, None]
+    chapters = normalize_spine(items, sizes, lambda i: b'', max_bytes=8 * 1024, min_bytes=1024)
+    assert chapters == [
+        {'id': 'i0', 'href': '0.xhtml', 'hrefs': ['0.xhtml', '1.xhtml', '2.xhtml']},
+        {'id': 'i3', 'href': '3.xhtml'},
+        # 单独一个小项不需要合并；找不到的成员原样保留
+        {'id': 'i4', 'href': '4.xhtml'},
+        {'id': 'i5', 'href': '5.xhtml'},
+    ]
+
+
+def make_epub() -> Path:
+    path = Path(tempfile.mkdtemp()) / 'book.epub'
+    spine = ['cover', 'title', 'toc', 'novel']
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('mimetype', 'application/epub+zip')
+        zf.writestr('META-INF/container.xml', '''<?xml version="1.0"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles>
+</container>''')
+        manifest = ''.join(f'<item id="{n}" href="text/{n}.xhtml" media-type="application/xhtml+xml"/>' for n in spine)
+        itemrefs = ''.join(f'<itemref idref="{n}"/>' for n in spine)
+        zf.writestr('OEBPS/content.opf', f'''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" xmlns:dc="http://purl.org/dc/elements/1.1/" version="3.0">
+  <metadata><dc:title>整本小说</dc:title></metadata>
+  <manifest>{manifest}</manifest>
+  <spine>{itemrefs}</spine>
+</package>''')
+        zf.writestr('OEBPS/text/cover.xhtml', HEAD + '<p>封面</p>' + TAIL)
+        zf.writestr('OEBPS/text/title.xhtml', HEAD + '<h1>扉页</h1>' + TAIL)
+        zf.writestr('OEBPS/text/toc.xhtml', HEAD + '<a href="novel.xhtml#ch5">第6回</a>' + TAIL)
+        zf.writestr('OEBPS/text/novel.xhtml', novel())
+    return path
+
+
+def test_parser_layout():
+    path = make_epub()
+    parser = EpubLazyParser(str(path), max_chapter_bytes=8 * 1024, min_chapter_bytes=1024)
+    chapters = parser.parse_metadata_only()['chapters']
+
+    front, first, sixth = chapters[0], chapters[1], chapters[6]
+    assert front['hrefs'] == ['text/cover.xhtml', 'text/title.xhtml', 'text/toc.xhtml']
+    assert len(chapters) == 11 and [ch['index'] for ch in chapters] == list(range(11))
+    assert first['range'] and first['title'] == '整本小说'
+    assert sixth['title'] == '第6回' and sixth['id'] == 'novel_5'
+
+    # 按保存的目录项读取：只有本回内容
+    parsed = parser.parse_single_chapter(6, sixth)
+    assert parsed['title'] == '第6回'
+    assert '第6回' in parsed['content'] and '第5回' not in parsed['content'] and '第7回' not in parsed['content']
+    merged = parser.parse_single_chapter(0, front)
+    assert '封面' in merged['content'] and '扉页' in merged['content']
+
+    # 旧的一一对应目录仍可读取
+    whole = EpubLazyParser(str(path)).parse_single_chapter(3, {'href': 'text/novel.xhtml'})
+    assert '第1回' in whole['content'] and '第10回' in whole['content']
+
+    # 目录页链接指向切分后的虚拟章节
+    parts, spine = parser.read_chapter_source(0, chapters)
+    assert [p for p, _ in parts] == ['OEBPS/text/cover.xhtml', 'OEBPS/text/title.xhtml', 'OEBPS/text/toc.xhtml']
+    assert spine['OEBPS/text/novel.xhtml#ch5'] == 6
+    toc = render_chapter_html(parts[2][1], parts[2][0], spine=spine, index=0)['html']
+    assert '<a data-chapter="6" href="#ch5">第6回</a>' in toc
+
+
+def test_split_member_cache():
+    path = make_epub()
+    cache = epub_lazy_parser._member_cache = SplitMemberCache(max_bytes=4 * 1024 * 1024)
+    try:
+        parser = EpubLazyParser(str(path), max_chapter_bytes=8 * 1024, min_chapter_bytes=1024)
+        chapters = parser.parse_metadata_only()['chapters']
+        # 建索引时读出的大成员留在缓存里
+        assert cache.stats()['entries'] == 1 and cache.misses == 1
+
+        # 逐个读取虚拟章节、生成链接表都不再解压整个成员
+        reader = EpubLazyParser(str(path))
+        for index in range(1, 11):
+            assert f'第{index}回' in reader.parse_single_chapter(index, chapters[index])['content']
+        for _ in range(3):
+            _, spine = reader.read_chapter_source(0, chapters)
+            assert spine['OEBPS/text/novel.xhtml#ch5'] == 6
+        assert cache.misses == 1 and cache.hits == 10 + 3
+
+        # 原始文件被替换后不再命中旧内容
+        with zipfile.ZipFile(path, 'a') as zf:
+            zf.writestr('OEBPS/extra.txt', 'x')
+        EpubLazyParser(str(path)).parse_single_chapter(1, chapters[1])
+        assert cache.misses == 2
+
+        # 超出预算时淘汰最久未用的成员；过大的成员不缓存
+        size = len(novel().encode('utf-8'))
+        small = SplitMemberCache(max_bytes=size * 9 // 2)
+        with zipfile.ZipFile(path) as zf:
+            for n in range(6):
+                small.read(('book', n), zf, 'OEBPS/text/novel.xhtml')
+            assert small.stats()['entries'] == 4 and small.stats()['bytes'] == size * 4
+            small.read(('book', 5), zf, 'OEBPS/text/novel.xhtml')
+            small.read(('book', 1), zf, 'OEBPS/text/novel.xhtml')
+            assert (small.hits, small.misses) == (1, 7)
+            tiny = SplitMemberCache(max_bytes=1024)
+            assert tiny.read(('book', 0), zf, 'OEBPS/text/novel.xhtml').startswith(b'<?xml')
+            assert tiny.stats()['entries'] == 0
+    finally:
+        epub_lazy_parser._member_cache = None
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("按标题/段落切分", test_split_ranges),
+        ("小项合并", test_normalize_spine),
+        ("解析器目录归一化", test_parser_layout),
+        ("切分成员缓存", test_split_member_cache),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
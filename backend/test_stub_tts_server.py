@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地 TTS 桩服务测试 - 无需网络
+验证：桩服务输出按字数估算的 MP3 帧、多项请求按顺序拼接、
+引擎通过桩服务合成；EasyVoice 不可用时降级到 Edge-TTS 桩并生成时间轴
+"""
+import asyncio
+import base64
+import json
+import tempfile
+from pathlib import Path
+
+import aiohttp
+
+from services.tts_engine import TTSEngine
+from stub_tts_server import PROFILES, FRAME, make_audio, start_stub_server
+
+TEXT = "你好，世界。今天天气很好！"
+
+
+def make_engine(base_url: str) -> TTSEngine:
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()))
+    engine.easyvoice_url = f"{base_url}/api/v1/tts/generateJson"
+    engine.edge_stub_url = f"{base_url}/edge/stream"
+    return engine
+
+
+async def _stub_outputs():
+    runner, base_url = await start_stub_server(PROFILES['fast'])
+    try:
+        async with aiohttp.ClientSession() as session:
+            items = [{"text": "第一段"}, {"text": "第二段内容"}]
+            async with session.post(f"{base_url}/api/v1/tts/generateJson", json={"data": items}) as resp:
+                assert resp.status == 200
+                audio = await resp.read()
+            # 多项按顺序拼接，中间没有分隔
+            assert audio == make_audio("第一段", 200) + make_audio("第二段内容", 200)
+            assert audio.startswith(FRAME[:2])
+
+            async with session.post(f"{base_url}/edge/stream", json={"text": TEXT}) as resp:
+                events = [json.loads(line) async for line in resp.content if line.strip()]
+            audio = b"".join(base64.b64decode(e["data"]) for e in events if e["type"] == "audio")
+            words = [e["text"] for e in events if e["type"] == "WordBoundary"]
+            assert audio == make_audio(TEXT, 200)
+            assert "".join(words) == "你好世界今天天气很好"
+
+            async with session.get(f"{base_url}/stats") as resp:
+                stats = await resp.json()
+            assert stats["easyvoice"] == 1 and stats["items"] == 2 and stats["edge"] == 1
+    finally:
+        await runner.cleanup()
+
+
+def test_stub_outputs():
+    asyncio.run(_stub_outputs())
+
+
+async def _engine_against_stub():
+    runner, base_url = await start_stub_server(PROFILES['fast'])
+    try:
+        engine = make_engine(base_url)
+        audio = b"".join([c async for c in engine.stream_synthesize(TEXT)])
+        assert audio == make_audio(TEXT, 200)
+        assert engine.router.health["easyvoice"].consecutive_failures == 0
+        # EasyVoice 不提供词边界，不生成时间轴
+        assert engine.find_timings(TEXT) is None
+    finally:
+        await runner.cleanup()
+
+
+def test_engine_against_stub():
+    asyncio.run(_engine_against_stub())
+
+
+async def _fallback_to_edge_stub():
+    down_runner, down_url = await start_stub_server(PROFILES['down'])
+    edge_runner, edge_url = await start_stub_server(PROFILES['fast'])
+    try:
+        engine = make_engine(down_url)
+        engine.edge_stub_url = f"{edge_url}/edge/stream"
+        audio = b"".join([c async for c in engine.stream_synthesize(TEXT)])
+        assert audio == make_audio(TEXT, 200)
+        assert engine.router.health["easyvoice"].consecutive_failures == 1
+
+        index = json.loads(engine.find_timings(TEXT).read_bytes())
+        assert len(index["words"]) == 10
+        assert len(index["sentences"]) == 2
+    finally:
+        await down_runner.cleanup()
+        await edge_runner.cleanup()
+
+
+def test_fallback_to_edge_stub():
+    asyncio.run(_fallback_to_edge_stub())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("桩服务输出", test_stub_outputs),
+        ("引擎通过桩服务合成", test_engine_against_stub),
+        ("降级到 Edge-TTS 桩", test_fallback_to_edge_stub),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量合成测试 - 使用本地 TTS 桩服务，无需网络
+验证：分段按字数分组、整章朗读的上游请求数大幅减少且音频顺序不变、
+批量音频按分隔项切回各段缓存 (再次朗读、单段请求都能命中)、批量请求的超时按字数放宽、
+无法切分或 EasyVoice 不可用时逐段降级
+"""
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+
+import aiohttp
+
+from services.text_segmenter import group_segments, split_segments
+from services.tts_engine import BACKEND_EASYVOICE, BATCH_TIMEOUT_BASE_SECONDS, TTSEngine
+from stub_tts_server import PROFILES, make_audio, start_stub_server
+
+CHAPTER = "".join(f"这是第{i}句话，用来测试批量合成的顺序。" for i in range(300))
+
+
+def make_engine(base_url: str) -> TTSEngine:
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()))
+    engine.easyvoice_url = f"{base_url}/api/v1/tts/generateJson"
+    engine.edge_stub_url = f"{base_url}/edge/stream"
+    return engine
+
+
+async def get_stats(base_url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/stats") as resp:
+            return await resp.json()
+
+
+def test_group_segments():
+    segments = ["a" * 50, "b" * 50, "c" * 150, "d" * 300, "e"]
+    assert group_segments(segments, 200) == [segments[:2], [segments[2]], [segments[3]], [segments[4]]]
+    assert group_segments(segments[:3], 0) == [[s] for s in segments[:3]]
+    assert group_segments(["a", "b", "c"], 100, max_items=2) == [["a", "b"], ["c"]]
+
+
+async def _chapter_uses_batches():
+    runner, base_url = await start_stub_server(PROFILES['fast'])
+    try:
+        engine = make_engine(base_url)
+        engine.batch_max_chars = 600
+        segments = split_segments(CHAPTER)
+        expected = b"".join(make_audio(s, 200) for s in segments)
+
+        audio = b"".join([c async for c in engine.stream_synthesize_chapter(CHAPTER, window=2)])
+        assert audio == expected
+
+        stats = await get_stats(base_url)
+        groups = group_segments(segments[2:], 600)
+        # 第一段、第二段各一次，其余按 600 字分批，另有一次合成分隔项
+        assert stats["easyvoice"] == 2 + len(groups) + 1
+        assert stats["easyvoice"] < len(segments) / 2
+        assert stats["items"] == len(segments) + sum(len(g) - 1 for g in groups) + 1
+
+        # 每段单独缓存 (不含分隔项的音频)
+        voice = engine.default_voice
+        for segment in segments:
+            cached = engine.cache.lookup(engine._cache_key(BACKEND_EASYVOICE, segment, voice, "+0%", "+0%"))
+            assert cached.read_bytes() == make_audio(segment, 200)
+
+        # 再次朗读、按不同分组朗读都命中缓存
+        audio = b"".join([c async for c in engine.stream_synthesize_chapter(CHAPTER, window=2)])
+        assert audio == expected
+        engine.batch_max_chars = 300
+        audio = b"".join([c async for c in engine.stream_synthesize_chapter(CHAPTER, window=3)])
+        assert audio == expected
+        assert (await get_stats(base_url))["easyvoice"] == stats["easyvoice"]
+    finally:
+        await runner.cleanup()
+
+
+def test_chapter_uses_batches():
+    asyncio.run(_chapter_uses_batches())
+
+
+async def _batch_falls_back_per_segment():
+    down_runner, down_url = await start_stub_server(PROFILES['down'])
+    edge_runner, edge_url = await start_stub_server(PROFILES['fast'])
+    try:
+        engine = make_engine(down_url)
+        engine.edge_stub_url = f"{edge_url}/edge/stream"
+        texts = ["第一段。", "第二段。", "第三段。"]
+
+        paths = await engine.synthesize_batch(texts)
+        assert [p.read_bytes() for p in paths] == [make_audio(t, 200) for t in texts]
+        # 逐段合成的结果单独缓存，带时间轴
+        assert all(engine.find_timings(t) is not None for t in texts)
+        assert engine.router.health["easyvoice"].consecutive_failures >= 1
+
+        stats = await get_stats(edge_url)
+        assert stats["edge"] == len(texts)
+        # 各段都已缓存时不再请求上游
+        assert await engine.synthesize_batch(texts) == paths
+        assert (await get_stats(edge_url))["edge"] == len(texts)
+    finally:
+        await down_runner.cleanup()
+        await edge_runner.cleanup()
+
+
+def test_batch_falls_back_per_segment():
+    asyncio.run(_batch_falls_back_per_segment())
+
+
+async def _batch_split_and_timeout():
+    runner, base_url = await start_stub_server(PROFILES['fast'])
+    try:
+        engine = make_engine(base_url)
+        timeouts = []
+        request = engine._request_easyvoice
+
+        def recording(texts, voice, rate, volume, timeout=None):
+            timeouts.append((len(texts), timeout))
+            return request(texts, voice, rate, volume, timeout)
+
+        engine._request_easyvoice = recording
+        texts = ["第一段。" * 50, "第二段。" * 50, "第三段。"]
+        paths = await engine.synthesize_batch(texts)
+        assert [p.read_bytes() for p in paths] == [make_audio(t, 200) for t in texts]
+        # 分隔项用会话默认超时，批量请求 (3 段 + 2 个分隔项) 按字数放宽
+        assert timeouts[0] == (1, None)
+        assert timeouts[1][0] == 5 and timeouts[1][1].total > BATCH_TIMEOUT_BASE_SECONDS
+
+        # 上游没有原样拼接 (切不开) 时逐段合成，并不再批量
+        async def unmatched(voice, rate, volume):
+            return b"not in the audio"
+
+        engine._batch_marker = unmatched
+        texts = ["第四段。", "第五段。"]
+        paths = await engine.synthesize_batch(texts)
+        assert [p.read_bytes() for p in paths] == [make_audio(t, 200) for t in texts]
+        assert engine.batch_max_chars == 0
+        assert engine.router.health["easyvoice"].consecutive_failures == 0
+        stats = await get_stats(base_url)
+        assert stats["easyvoice"] == 2 + 1 + len(texts)
+    finally:
+        await runner.cleanup()
+
+
+def test_batch_split_and_timeout():
+    asyncio.run(_batch_split_and_timeout())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("按字数分组", test_group_segments),
+        ("整章朗读批量请求", test_chapter_uses_batches),
+        ("批量失败逐段降级", test_batch_falls_back_per_segment),
+        ("按分隔项切分与批量超时", test_batch_split_and_timeout),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分段流水线合成测试 - 用假合成后端，无需网络
+验证：分段结果、输出顺序、首段延迟与文本长度无关、吞吐随并发窗口提升
+"""
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from services.text_segmenter import split_segments, split_sentences
+from services.tts_engine import TTSEngine
+
+SEGMENT_LATENCY = 0.1
+
+
+def make_engine() -> TTSEngine:
+    """每段合成耗时固定 (带少量抖动) 的假引擎，音频内容就是段落文本"""
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()))
+    # 逐段合成 (批量合成见 test_tts_batch.py)
+    engine.batch_max_chars = 0
+
+    async def fake_synthesize(text, voice_model="default", rate="+0%", volume="+0%", **kwargs):
+        await asyncio.sleep(SEGMENT_LATENCY * random.uniform(0.5, 1.5))
+        path = engine.audio_dir / f"{abs(hash(text))}.mp3"
+        path.write_bytes(text.encode())
+        return path
+
+    async def fake_stream(text, voice_model="default", rate="+0%", volume="+0%", **kwargs):
+        await asyncio.sleep(SEGMENT_LATENCY)
+        yield text.encode()
+
+    engine.synthesize = fake_synthesize
+    engine.stream_synthesize = fake_stream
+    return engine
+
+
+def make_text(sentences: int) -> str:
+    return "".join(f"这是第{i}句话，用来测试分段合成的顺序。" for i in range(sentences))
+
+
+async def _run(engine, text, window):
+    start = time.perf_counter()
+    first = None
+    audio = b""
+    async for chunk in engine.stream_synthesize_chapter(text, window=window):
+        if first is None:
+            first = time.perf_counter() - start
+        audio += chunk
+    return first, time.perf_counter() - start, audio.decode()
+
+
+def test_segments():
+    text = "第一章\n他说：“你好！”她笑了。Hello world. Is it ok? Yes.\n" + "很长的句子，" * 60 + "结束。"
+    segments = split_segments(text, max_chars=50, min_chars=5)
+    assert all(len(s) <= 55 for s in segments)
+    assert split_segments(text, max_chars=50, min_chars=5) == segments
+    assert "".join(segments).replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+    assert split_sentences("Hello world. 你好。") == ["Hello world.", "你好。"]
+
+
+def test_order_and_first_segment_latency():
+    engine = make_engine()
+    short_first, _, _ = asyncio.run(_run(engine, make_text(5), window=3))
+    long_first, _, audio = asyncio.run(_run(engine, make_text(200), window=3))
+    print(f"   首段延迟: 短文本 {short_first * 1000:.0f}ms, 长文本 {long_first * 1000:.0f}ms")
+    assert audio.replace("\n", "") == make_text(200)
+    assert long_first < short_first + 0.1
+
+
+def test_throughput_scales_with_window():
+    engine = make_engine()
+    text = make_text(60)
+    _, serial, _ = asyncio.run(_run(engine, text, window=1))
+    _, parallel, _ = asyncio.run(_run(engine, text, window=6))
+    print(f"   总耗时: 窗口1 {serial * 1000:.0f}ms, 窗口6 {parallel * 1000:.0f}ms")
+    assert parallel < serial / 2
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("分段", test_segments),
+        ("顺序与首段延迟", test_order_and_first_segment_latency),
+        ("并发窗口吞吐", test_throughput_scales_with_window),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预测性预取测试 - 用假合成函数，无需网络
+验证：播放第 n 段时以预取优先级合成 n+1..n+k 段、顺序前进不重复合成、
+位置跳转时取消进行中的预取、换章时从新章节开头预取
+"""
+import asyncio
+
+from services.tts_prefetch import SpeculativePrefetcher
+from services.tts_scheduler import PRIORITY_PREFETCH
+
+CHAPTERS = {
+    ("book", 0): [f"第0章第{i}段" for i in range(10)],
+    ("book", 1): [f"第1章第{i}段" for i in range(10)],
+}
+
+
+class FakeSynth:
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.done = []
+        self.cancelled = []
+
+    async def __call__(self, text, voice_model, rate, volume, priority, device_id):
+        assert priority == PRIORITY_PREFETCH and device_id == "dev"
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        self.done.append(text)
+
+
+def make_prefetcher(synth, window=3):
+    return SpeculativePrefetcher(synth, lambda book_id, chapter: CHAPTERS[(book_id, chapter)], window=window)
+
+
+async def _window_follows_position():
+    synth = FakeSynth()
+    prefetcher = make_prefetcher(synth)
+    prefetcher.update("dev", "book", 0, 0)
+    await asyncio.sleep(0.2)
+    assert synth.done == ["第0章第1段", "第0章第2段", "第0章第3段"]
+
+    # 顺序前进两段：只补合成窗口末尾的两段
+    prefetcher.update("dev", "book", 0, 1)
+    prefetcher.update("dev", "book", 0, 2)
+    await asyncio.sleep(0.2)
+    assert synth.done[3:] == ["第0章第4段", "第0章第5段"]
+    assert prefetcher.stats()["jumps"] == 0
+
+    # 章节末尾：窗口不越界
+    prefetcher.update("dev", "book", 0, 5)
+    await asyncio.sleep(0.2)
+    prefetcher.update("dev", "book", 0, 8)
+    await asyncio.sleep(0.2)
+    assert synth.done[-1] == "第0章第9段"
+    assert len(synth.done) == len(set(synth.done)) == 9
+    prefetcher.cancel("dev")
+
+
+def test_window_follows_position():
+    asyncio.run(_window_follows_position())
+
+
+async def _jump_cancels_window():
+    synth = FakeSynth(delay=0.5)
+    prefetcher = make_prefetcher(synth)
+    prefetcher.update("dev", "book", 0, 0)
+    await asyncio.sleep(0.05)
+
+    # 向后跳转：进行中的预取被取消，从新位置重新开始
+    prefetcher.update("dev", "book", 0, 7)
+    await asyncio.sleep(0.05)
+    assert synth.cancelled == ["第0章第1段"]
+    assert prefetcher.stats()["jumps"] == 1
+    assert prefetcher.stats()["devices"]["dev"]["position"] == 7
+
+    # 正在收听时进度上报换章：从新章节开头预取
+    prefetcher.on_progress("dev", "book", 1)
+    await asyncio.sleep(0.6)
+    assert synth.cancelled == ["第0章第1段", "第0章第8段"]
+    assert synth.done == ["第1章第0段"]
+    prefetcher.cancel("dev")
+
+
+def test_jump_cancels_window():
+    asyncio.run(_jump_cancels_window())
+
+
+async def _voice_change_and_disabled():
+    synth = FakeSynth()
+    prefetcher = make_prefetcher(synth)
+    prefetcher.update("dev", "book", 0, 0)
+    await asyncio.sleep(0.1)
+    # 换语速等同于跳转：新参数下重新预取
+    prefetcher.update("dev", "book", 0, 1, "default", "+20%")
+    await asyncio.sleep(0.1)
+    assert prefetcher.stats()["jumps"] == 1
+    assert synth.done.count("第0章第2段") == 2
+    prefetcher.cancel("dev")
+
+    disabled = make_prefetcher(synth, window=0)
+    disabled.update("dev", "book", 0, 0)
+    assert disabled.stats()["devices"] == {}
+
+
+def test_voice_change_and_disabled():
+    asyncio.run(_voice_change_and_disabled())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("窗口跟随播放位置", test_window_follows_position),
+        ("跳转取消预取", test_jump_cancels_window),
+        ("换语音参数与关闭预取", test_voice_change_and_disabled),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
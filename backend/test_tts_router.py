@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+TTS 后端路由测试 - 本地假后端注入延迟和故障，无需网络
+验证：首字节前失败降级、连续失败熔断、冷却后只放行一个试探请求、
+首字节超时、超过 p95 时对冲且取消落败方、流中断计入错误率
+"""
+import asyncio
+import time
+
+from services.tts_router import TTSRouter, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+
+
+class FakeBackend:
+    """可注入首字节延迟、首字节前失败、流中断的假后端"""
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False, fail_mid: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.fail_mid = fail_mid
+        self.calls = 0
+        self.cancelled = 0
+
+    async def stream(self, text: str):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError(f"{self.name} 不可用")
+            yield f"{self.name}:".encode()
+            if self.fail_mid:
+                raise ConnectionError(f"{self.name} 连接中断")
+            yield text.encode()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def make_router(primary: FakeBackend, fallback: FakeBackend, **kwargs) -> TTSRouter:
+    return TTSRouter([(primary.name, primary.stream), (fallback.name, fallback.stream)], **kwargs)
+
+
+async def collect(router: TTSRouter, text: str = "你好") -> bytes:
+    return b"".join([c async for c in router.stream(text)])
+
+
+async def _fallback_and_circuit_breaker():
+    primary, fallback = FakeBackend("ev", fail=True), FakeBackend("edge")
+    router = make_router(primary, fallback, cooldown=60)
+
+    assert await collect(router) == b"edge:\xe4\xbd\xa0\xe5\xa5\xbd"
+    assert await collect(router) == b"edge:\xe4\xbd\xa0\xe5\xa5\xbd"
+    assert router.health["ev"].state == STATE_OPEN
+    assert primary.calls == 2
+
+    # 熔断期间不再请求主后端
+    await collect(router)
+    assert primary.calls == 2
+    assert router.stats()["backends"]["ev"]["error_rate"] == 1.0
+
+
+async def _half_open_single_trial():
+    primary, fallback = FakeBackend("ev", fail=True), FakeBackend("edge")
+    router = make_router(primary, fallback, cooldown=0.05)
+    await collect(router)
+    await collect(router)
+    assert router.health["ev"].state == STATE_OPEN
+
+    await asyncio.sleep(0.06)
+    primary.fail = False
+    primary.delay = 0.1
+    # 冷却结束后并发两个请求：只有一个去试探主后端
+    results = await asyncio.gather(collect(router), collect(router))
+    assert sorted(r.split(b":")[0] for r in results) == [b"edge", b"ev"]
+    assert primary.calls == 3
+    assert router.health["ev"].state == STATE_CLOSED
+
+
+async def _refused_fallback_not_launched():
+    primary, fallback = FakeBackend("ev", delay=0.05, fail=True), FakeBackend("edge")
+    router = make_router(primary, fallback, cooldown=60)
+
+    async def open_fallback():
+        # 主后端请求进行中时，备用后端被其他请求打到熔断
+        await asyncio.sleep(0.01)
+        router.health["edge"].record_failure("x")
+        router.health["edge"].record_failure("x")
+
+    try:
+        await asyncio.gather(collect(router), open_fallback())
+        raise AssertionError("应当抛出异常")
+    except ConnectionError:
+        pass
+    # 熔断器拒绝的后端不再发请求
+    assert fallback.calls == 0
+    assert router.health["edge"].state == STATE_OPEN
+
+    # 一开始就全部熔断时仍按顺序尝试
+    router.health["ev"].record_failure("x")
+    primary.delay = 0
+    assert (await collect(router)).startswith(b"edge:")
+    assert primary.calls == 2 and fallback.calls == 1
+
+
+async def _failed_trial_reopens():
+    primary, fallback = FakeBackend("ev", fail=True), FakeBackend("edge")
+    router = make_router(primary, fallback, cooldown=0.05)
+    await collect(router)
+    await collect(router)
+    await asyncio.sleep(0.06)
+
+    assert router.health["ev"].available()
+    await collect(router)
+    assert router.health["ev"].state == STATE_OPEN
+    assert not router.health["ev"].trial_in_flight
+
+
+async def _first_byte_timeout():
+    primary, fallback = FakeBackend("ev", delay=5), FakeBackend("edge")
+    router = make_router(primary, fallback, first_byte_timeout=0.1)
+
+    start = time.perf_counter()
+    audio = await collect(router)
+    assert audio.startswith(b"edge:")
+    assert time.perf_counter() - start < 1
+    assert primary.cancelled == 1
+    assert router.health["ev"].failures == 1
+
+
+async def _hedge_beyond_p95():
+    primary, fallback = FakeBackend("ev", delay=0.01), FakeBackend("edge", delay=0.05)
+    router = make_router(primary, fallback, hedge=True, hedge_min_samples=10)
+
+    # 积累主后端的延迟样本
+    for _ in range(10):
+        assert (await collect(router)).startswith(b"ev:")
+    assert fallback.calls == 0
+
+    # 主后端变慢但不报错：超过 p95 后对冲，备用后端先出声，主后端请求被取消
+    primary.delay = 2
+    start = time.perf_counter()
+    audio = await collect(router)
+    elapsed = time.perf_counter() - start
+
+    assert audio.startswith(b"edge:")
+    assert elapsed < 0.5, elapsed
+    assert primary.cancelled == 1
+    stats = router.stats()
+    assert stats["hedges"] == 1
+    assert stats["backends"]["edge"]["hedges_won"] == 1
+    # 对冲落败不算失败
+    assert stats["backends"]["ev"]["failures"] == 0
+
+
+async def _hedge_primary_still_wins():
+    primary, fallback = FakeBackend("ev", delay=0.01), FakeBackend("edge", delay=1)
+    router = make_router(primary, fallback, hedge=True, hedge_min_samples=10)
+    for _ in range(10):
+        await collect(router)
+
+    primary.delay = 0.1
+    assert (await collect(router)).startswith(b"ev:")
+    assert fallback.calls == 1 and fallback.cancelled == 1
+
+
+async def _mid_stream_failure():
+    primary, fallback = FakeBackend("ev", fail_mid=True), FakeBackend("edge")
+    router = make_router(primary, fallback)
+    try:
+        await collect(router)
+        raise AssertionError("应当抛出异常")
+    except ConnectionError:
+        pass
+    # 已经输出过音频，不能再拼接备用后端
+    assert fallback.calls == 0
+    assert router.health["ev"].failures == 1
+
+
+def test_fallback_and_circuit_breaker():
+    asyncio.run(_fallback_and_circuit_breaker())
+
+
+def test_half_open_single_trial():
+    asyncio.run(_half_open_single_trial())
+
+
+def test_refused_fallback_not_launched():
+    asyncio.run(_refused_fallback_not_launched())
+
+
+def test_failed_trial_reopens():
+    asyncio.run(_failed_trial_reopens())
+
+
+def test_first_byte_timeout():
+    asyncio.run(_first_byte_timeout())
+
+
+def test_hedge_beyond_p95():
+    asyncio.run(_hedge_beyond_p95())
+
+
+def test_hedge_primary_still_wins():
+    asyncio.run(_hedge_primary_still_wins())
+
+
+def test_mid_stream_failure():
+    asyncio.run(_mid_stream_failure())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("首字节前失败降级与熔断", test_fallback_and_circuit_breaker),
+        ("冷却后只放行一个试探请求", test_half_open_single_trial),
+        ("熔断器拒绝的后端不再请求", test_refused_fallback_not_launched),
+        ("试探失败重新熔断", test_failed_trial_reopens),
+        ("首字节超时", test_first_byte_timeout),
+        ("超过 p95 时对冲", test_hedge_beyond_p95),
+        ("对冲后主后端仍先出声", test_hedge_primary_still_wins),
+        ("流中断计入错误", test_mid_stream_failure),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
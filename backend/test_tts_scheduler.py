@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+TTS 调度器测试 - 纯本地，无需网络
+验证：优先级顺序、为交互请求保留名额、设备并发上限、排队超时、取消、优先级提升
+"""
+import asyncio
+
+from services.tts_scheduler import (
+    TTSScheduler, QueueTimeout,
+    PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_BATCH
+)
+
+
+async def hold(scheduler, ticket, release: asyncio.Event, order: list = None, name: str = ""):
+    async with scheduler.slot(ticket):
+        if order is not None:
+            order.append(name)
+        await release.wait()
+
+
+async def _priority_order():
+    scheduler = TTSScheduler(max_concurrent=3, max_per_device=10)
+    order = []
+    gates = {}
+
+    def start(name, priority):
+        gates[name] = asyncio.Event()
+        return asyncio.create_task(hold(scheduler, scheduler.ticket(priority), gates[name], order, name))
+
+    tasks = [start("batch1", PRIORITY_BATCH), start("batch2", PRIORITY_BATCH), start("batch3", PRIORITY_BATCH)]
+    await asyncio.sleep(0.01)
+    # 后台请求最多占 2 个名额，第三个名额留给交互请求
+    assert order == ["batch1", "batch2"]
+    tasks.append(start("live1", PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0.01)
+    assert order[-1] == "live1"
+
+    tasks += [start("prefetch1", PRIORITY_PREFETCH), start("live2", PRIORITY_INTERACTIVE)]
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()["queued"] == 3
+
+    for name in ["batch1", "live1", "batch2", "live2", "prefetch1", "batch3"]:
+        gates[name].set()
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+
+    assert order == ["batch1", "batch2", "live1", "live2", "prefetch1", "batch3"]
+    stats = scheduler.stats()
+    assert stats["active"] == 0 and stats["queued"] == 0
+    assert stats["priorities"][PRIORITY_BATCH]["granted"] == 3
+
+
+async def _per_device_limit():
+    scheduler = TTSScheduler(max_concurrent=4, max_per_device=1)
+    order = []
+    gate = asyncio.Event()
+    tasks = [
+        asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE, "phone"), gate, order, "phone1")),
+        asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE, "phone"), gate, order, "phone2")),
+        asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE, "tablet"), gate, order, "tablet1")),
+    ]
+    await asyncio.sleep(0.01)
+    # 同一设备的第二个请求排队，不挡住其他设备
+    assert order == ["phone1", "tablet1"]
+    assert scheduler.stats()["devices"] == {"phone": 1, "tablet": 1}
+    gate.set()
+    await asyncio.gather(*tasks)
+    assert order == ["phone1", "tablet1", "phone2"]
+    assert scheduler.stats()["devices"] == {}
+
+
+async def _queue_timeout():
+    scheduler = TTSScheduler(max_concurrent=1)
+    gate = asyncio.Event()
+    busy = asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE), gate))
+    await asyncio.sleep(0.01)
+
+    try:
+        async with scheduler.slot(scheduler.ticket(PRIORITY_INTERACTIVE), timeout=0.05):
+            raise AssertionError("不应拿到名额")
+    except QueueTimeout:
+        pass
+
+    stats = scheduler.stats()
+    assert stats["queued"] == 0
+    assert stats["priorities"][PRIORITY_INTERACTIVE]["timeouts"] == 1
+    gate.set()
+    await busy
+    assert scheduler.stats()["active"] == 0
+
+
+async def _cancel_while_queued():
+    scheduler = TTSScheduler(max_concurrent=1)
+    gate = asyncio.Event()
+    busy = asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE), gate))
+    waiter = asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_PREFETCH), gate))
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()["queued"] == 1
+
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    stats = scheduler.stats()
+    assert stats["queued"] == 0
+    assert stats["priorities"][PRIORITY_PREFETCH]["cancelled"] == 1
+
+    gate.set()
+    await busy
+    # 被取消的请求没有占用名额
+    assert scheduler.stats()["active"] == 0
+
+
+async def _promote_queued_ticket():
+    scheduler = TTSScheduler(max_concurrent=2)
+    order = []
+    gate = asyncio.Event()
+    tasks = [asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE), gate, order, "live"))]
+    batch_ticket = scheduler.ticket(PRIORITY_BATCH)
+    prefetch_ticket = scheduler.ticket(PRIORITY_PREFETCH)
+    occupied = asyncio.Event()
+    tasks.append(asyncio.create_task(hold(scheduler, scheduler.ticket(PRIORITY_INTERACTIVE), occupied, order, "live2")))
+    tasks.append(asyncio.create_task(hold(scheduler, batch_ticket, gate, order, "batch")))
+    tasks.append(asyncio.create_task(hold(scheduler, prefetch_ticket, gate, order, "prefetch")))
+    await asyncio.sleep(0.01)
+
+    scheduler.promote(batch_ticket, PRIORITY_INTERACTIVE)
+    occupied.set()
+    await asyncio.sleep(0.01)
+    assert order[2] == "batch"
+    gate.set()
+    await asyncio.gather(*tasks)
+
+
+def test_priority_order():
+    asyncio.run(_priority_order())
+
+
+def test_per_device_limit():
+    asyncio.run(_per_device_limit())
+
+
+def test_queue_timeout():
+    asyncio.run(_queue_timeout())
+
+
+def test_cancel_while_queued():
+    asyncio.run(_cancel_while_queued())
+
+
+def test_promote_queued_ticket():
+    asyncio.run(_promote_queued_ticket())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("优先级顺序与交互保留名额", test_priority_order),
+        ("设备并发上限", test_per_device_limit),
+        ("排队超时", test_queue_timeout),
+        ("排队中取消", test_cancel_while_queued),
+        ("排队中提升优先级", test_promote_queued_ticket),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
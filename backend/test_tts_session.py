@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+朗读会话测试 - 使用本地 TTS 桩服务，无需网络
+验证：按入队顺序推送音频帧、取消队首段会中止上游调用并释放调度名额且不写缓存、
+清空队列、调整排队中段的优先级
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+
+from services.tts_engine import TTSEngine
+from services.tts_scheduler import TTSScheduler
+from services.tts_session import TTSSession, SessionError
+from stub_tts_server import PROFILES, make_audio, start_stub_server
+
+# 每段约 24KB 音频，按 24KB/s 输出，约 1 秒
+SLOW = dict(PROFILES['fast'], throughput=24000)
+TEXTS = [f"第{i}段朗读内容，用于测试会话。" for i in range(3)]
+
+
+class Client:
+    """收集服务端推送的消息"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_json(self, message):
+        self.messages.append(message)
+
+    async def send_bytes(self, data):
+        self.messages.append(data)
+
+    def events(self, kind):
+        return [m["id"] for m in self.messages if isinstance(m, dict) and m["type"] == kind]
+
+    def audio(self, item_id) -> bytes:
+        audio, current = b"", None
+        for m in self.messages:
+            if isinstance(m, dict):
+                current = m["id"] if m["type"] == "start" else None
+            elif current == item_id:
+                audio += m
+        return audio
+
+    async def wait_for(self, kind, item_id, timeout=5.0):
+        for _ in range(int(timeout / 0.02)):
+            if item_id in self.events(kind):
+                return
+            await asyncio.sleep(0.02)
+        raise AssertionError(f"没有收到 {kind} {item_id}: {self.messages}")
+
+
+async def make_session(profile, max_concurrent=4, window=2):
+    runner, base_url = await start_stub_server(profile)
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()),
+                       scheduler=TTSScheduler(max_concurrent=max_concurrent, max_per_device=10))
+    engine.easyvoice_url = f"{base_url}/api/v1/tts/generateJson"
+    engine.edge_stub_url = f"{base_url}/edge/stream"
+    client = Client()
+    session = TTSSession(engine, "dev", client.send_json, client.send_bytes, window=window)
+    session.start()
+    return runner, engine, session, client
+
+
+async def _ordered_delivery():
+    runner, engine, session, client = await make_session(PROFILES['fast'])
+    try:
+        for i, text in enumerate(TEXTS):
+            await session.handle({"type": "enqueue", "id": f"s{i}", "text": text})
+        await client.wait_for("end", "s2")
+
+        assert client.events("start") == ["s0", "s1", "s2"]
+        assert client.events("end") == ["s0", "s1", "s2"]
+        for i, text in enumerate(TEXTS):
+            assert client.audio(f"s{i}") == make_audio(text, 200)
+        assert session.stats["completed"] == 3
+
+        try:
+            await session.handle({"type": "enqueue", "id": "s9"})
+            raise AssertionError("应当拒绝没有文本的段")
+        except SessionError:
+            pass
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+def test_ordered_delivery():
+    asyncio.run(_ordered_delivery())
+
+
+async def _cancel_aborts_upstream():
+    runner, engine, session, client = await make_session(SLOW)
+    try:
+        await session.handle({"type": "enqueue", "id": "s0", "text": TEXTS[0]})
+        await session.handle({"type": "enqueue", "id": "s1", "text": TEXTS[1]})
+        # 等队首段开始输出音频后再取消 (模拟翻页)
+        while not client.audio("s0"):
+            await asyncio.sleep(0.02)
+        await session.handle({"type": "clear"})
+        await asyncio.sleep(0.1)
+
+        assert client.events("cancelled") == ["s0", "s1"]
+        assert "s0" not in client.events("end")
+        # 上游调用已取消：名额释放、没有进行中的请求、不写缓存
+        assert engine.scheduler.stats()["active"] == 0
+        assert engine.flights.stats()["in_flight"] == 0
+        assert engine.cache.stats()["entries"] == 0
+        assert session.stats["cancelled"] == 2
+
+        # 取消后会话仍可继续使用
+        await session.handle({"type": "enqueue", "id": "s2", "text": TEXTS[2]})
+        await client.wait_for("end", "s2")
+        assert client.audio("s2") == make_audio(TEXTS[2], 200)
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+def test_cancel_aborts_upstream():
+    asyncio.run(_cancel_aborts_upstream())
+
+
+async def _reprioritize_queued():
+    runner, engine, session, client = await make_session(SLOW, max_concurrent=1, window=1)
+    try:
+        await session.handle({"type": "enqueue", "id": "s0", "text": TEXTS[0]})
+        await asyncio.sleep(0.05)
+        await session.handle({"type": "enqueue", "id": "s1", "text": TEXTS[1], "priority": "batch"})
+        await asyncio.sleep(0.05)
+        # 唯一的名额被队首占用，下一段在排队
+        assert engine.scheduler.stats()["priorities"]["batch"]["queued"] == 1
+
+        await session.handle({"type": "reprioritize", "id": "s1", "priority": "interactive"})
+        priorities = engine.scheduler.stats()["priorities"]
+        assert priorities["batch"]["queued"] == 0 and priorities["interactive"]["queued"] == 1
+
+        await client.wait_for("end", "s1")
+        assert client.events("end") == ["s0", "s1"]
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+def test_reprioritize_queued():
+    asyncio.run(_reprioritize_queued())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("按顺序推送", test_ordered_delivery),
+        ("取消中止上游调用", test_cancel_aborts_upstream),
+        ("调整排队优先级", test_reprioritize_queued),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式 TTS 测试 - 使用本地假 EasyVoice 服务，无需网络
+验证：音频块边到边转发 (首字节时间远小于总时间)、缓存只在成功后提交、
+首字节前失败时降级到 Edge-TTS
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+from services.tts_engine import TTSEngine
+
+CHUNK = b"\xff\xf3" + b"\x00" * 4094
+CHUNK_COUNT = 5
+CHUNK_DELAY = 0.2
+
+
+async def start_fake_easyvoice(mode: str = "ok"):
+    """启动假 EasyVoice：ok 分块慢速输出，fail_mid 输出一半后断开，error 直接 500"""
+    async def generate(request):
+        await request.json()
+        if mode == "error":
+            return web.Response(status=500, text="boom")
+
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i in range(CHUNK_COUNT):
+            if mode == "fail_mid" and i == 2:
+                request.transport.close()
+                return response
+            await response.write(CHUNK)
+            await asyncio.sleep(CHUNK_DELAY)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/v1/tts/generateJson", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/v1/tts/generateJson"
+
+
+def make_engine(api_url: str) -> TTSEngine:
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()))
+    engine.easyvoice_url = api_url
+    return engine
+
+
+async def _time_to_first_audio():
+    runner, url = await start_fake_easyvoice("ok")
+    try:
+        engine = make_engine(url)
+        start = time.perf_counter()
+        first_byte = None
+        total = 0
+        async for chunk in engine.stream_synthesize("流式测试", "zh-CN-XiaoxiaoNeural"):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+                # 首块到达时缓存还未提交
+                assert not list(engine.audio_dir.glob("*.mp3"))
+            total += len(chunk)
+        elapsed = time.perf_counter() - start
+
+        print(f"   首字节: {first_byte * 1000:.0f}ms, 总耗时: {elapsed * 1000:.0f}ms, 大小: {total} bytes")
+        assert total == len(CHUNK) * CHUNK_COUNT
+        assert first_byte < elapsed / 3
+        assert len(list(engine.audio_dir.glob("tts_*.mp3"))) == 1
+        assert not list(engine.audio_dir.glob("*.part"))
+
+        # 重听同一段直接命中缓存
+        start = time.perf_counter()
+        replay = b"".join([c async for c in engine.stream_synthesize("流式测试", "zh-CN-XiaoxiaoNeural")])
+        assert len(replay) == total
+        assert time.perf_counter() - start < CHUNK_DELAY
+        assert engine.cache.stats()["hits"] == 1
+    finally:
+        await runner.cleanup()
+
+
+async def _mid_stream_failure():
+    runner, url = await start_fake_easyvoice("fail_mid")
+    try:
+        engine = make_engine(url)
+        received = 0
+        try:
+            async for chunk in engine.stream_synthesize("中断测试", "zh-CN-XiaoxiaoNeural"):
+                received += len(chunk)
+            raise AssertionError("应当抛出异常")
+        except AssertionError:
+            raise
+        except Exception as e:
+            print(f"   已收到 {received} bytes 后中断: {type(e).__name__}")
+        assert received > 0
+        assert not list(engine.audio_dir.glob("tts_*"))
+    finally:
+        await runner.cleanup()
+
+
+async def _fallback_before_first_byte():
+    runner, url = await start_fake_easyvoice("error")
+    try:
+        engine = make_engine(url)
+
+        async def fake_edge(text, voice, rate, volume):
+            yield b"edge-audio"
+
+        engine._stream_edge = fake_edge
+        audio = b"".join([c async for c in engine.stream_synthesize("降级测试")])
+        assert audio == b"edge-audio"
+        assert engine.router.health["easyvoice"].consecutive_failures == 1
+    finally:
+        await runner.cleanup()
+
+
+def test_time_to_first_audio():
+    asyncio.run(_time_to_first_audio())
+
+
+def test_mid_stream_failure_is_not_cached():
+    asyncio.run(_mid_stream_failure())
+
+
+def test_fallback_before_first_byte():
+    asyncio.run(_fallback_before_first_byte())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("首字节时间", test_time_to_first_audio),
+        ("中途失败不写缓存", test_mid_stream_failure_is_not_cached),
+        ("首字节前失败降级", test_fallback_before_first_byte),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
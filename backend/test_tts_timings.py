@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+语音时间轴测试 - 无需网络
+验证：词边界定位到原文字符、按句子归并、字节偏移按 48kbps 计算、
+Edge-TTS 合成后时间轴与音频一起缓存
+"""
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+
+import services.tts_engine as tts_engine_module
+from services.tts_engine import TTSEngine
+from services.tts_timings import build_timing_index, EDGE_BYTES_PER_SECOND
+
+TEXT = "你好，世界。今天天气很好！"
+WORDS = ["你好", "世界", "今天", "天气", "很", "好"]
+
+
+def word_events():
+    """每个词 300ms，词间隔 100ms (单位 100ns)"""
+    return [{"type": "WordBoundary", "offset": i * 4_000_000, "duration": 3_000_000, "text": w}
+            for i, w in enumerate(WORDS)]
+
+
+def test_build_word_and_sentence_index():
+    index = build_timing_index(TEXT, word_events(), total_bytes=EDGE_BYTES_PER_SECOND * 3)
+
+    assert index["duration_ms"] == 3000
+    assert index["words"][0] == [0, 300, 0, 2, 0]
+    # "世界" 在原文第 3 个字符，开始于 400ms -> 2400 字节
+    assert index["words"][1] == [400, 300, 3, 2, 2400]
+
+    assert len(index["sentences"]) == 2
+    first, second = index["sentences"]
+    assert TEXT[first[2]:first[3]] == "你好，世界。"
+    assert TEXT[second[2]:second[3]] == "今天天气很好！"
+    assert first[0] == 0 and first[1] == 700
+    assert second[0] == 800 and second[4] == 800 * EDGE_BYTES_PER_SECOND // 1000
+
+
+def test_unmatched_words_and_sentence_events():
+    events = word_events()
+    events.insert(2, {"type": "WordBoundary", "offset": 7_500_000, "duration": 100_000, "text": "不存在"})
+    index = build_timing_index(TEXT, events)
+    assert index["words"][2][2] == -1
+    assert len(index["sentences"]) == 2
+
+    sentences = [{"type": "SentenceBoundary", "offset": 0, "duration": 7_000_000, "text": "你好，世界。"}]
+    index = build_timing_index(TEXT, sentences)
+    assert index["words"] == []
+    assert index["sentences"] == [[0, 700, 0, 6, 0]]
+
+
+class FakeCommunicate:
+    """替代 edge_tts.Communicate：输出音频块和词边界事件"""
+
+    def __init__(self, text, voice, rate, volume, boundary, **kwargs):
+        assert boundary == "WordBoundary"
+        self.text = text
+
+    async def stream(self):
+        for event in word_events():
+            yield {"type": "audio", "data": b"\xff\xf3" + b"\x00" * 2398}
+            yield event
+
+
+async def _timings_cached_with_audio():
+    engine = TTSEngine(audio_dir=Path(tempfile.mkdtemp()))
+    # EasyVoice 不可用，走 Edge-TTS
+    engine.easyvoice_url = "http://127.0.0.1:1/api/v1/tts/generateJson"
+    original = tts_engine_module.edge_tts.Communicate
+    tts_engine_module.edge_tts.Communicate = FakeCommunicate
+    try:
+        audio = b"".join([c async for c in engine.stream_synthesize(TEXT)])
+    finally:
+        tts_engine_module.edge_tts.Communicate = original
+
+    path = engine.find_timings(TEXT)
+    assert path is not None and path.name.endswith(".timings.json")
+    index = json.loads(path.read_bytes())
+    assert index["duration_ms"] == len(audio) * 1000 // EDGE_BYTES_PER_SECOND
+    assert len(index["words"]) == len(WORDS)
+    assert len(index["sentences"]) == 2
+    # 时间轴计入同一缓存条目
+    assert engine.cache.total_bytes == len(audio) + path.stat().st_size
+
+
+def test_timings_cached_with_audio():
+    asyncio.run(_timings_cached_with_audio())
+
+
+if __name__ == "__main__":
+    for name, fn in [
+        ("词与句时间轴", test_build_word_and_sentence_index),
+        ("未定位的词与句边界事件", test_unmatched_words_and_sentence_events),
+        ("时间轴随音频缓存", test_timings_cached_with_audio),
+    ]:
+        print(f"▶ {name}")
+        fn()
+        print("✅ 通过")
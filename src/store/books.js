@@ -172,8 +172,11 @@ export const useBooksStore = defineStore('books', {
                     lastReadAt: new Date().toISOString()
                 }
 
-                // 保存到后端
-                await axios.post(`${API_BASE}/books/save`, newBook)
+                // 保存到后端 (内联封面由后端转存为缩略图，换成返回的 URL)
+                const saved = await axios.post(`${API_BASE}/books/save`, newBook)
+                if (saved.data && saved.data.cover) {
+                    newBook.cover = saved.data.cover
+                }
 
                 // 添加到本地列表
                 this.books.unshift(newBook)